@@ -0,0 +1,418 @@
+# ab_significance.py
+#
+# Sequential A/B significance over the metric views, with automatic promotion or rollback:
+#   python ab_significance.py --tests ab_tests.json --log-dir events --interval 60
+
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from version_store import page_key
+
+
+# Conversion metrics are "share of exposed users with the event"; "revenue" is revenue per exposed user
+DEFAULT_METRICS = ("add_to_cart", "purchase", "signup", "revenue")
+# Expected mean per exposed user of each metric; the mixture of the
+# sequential test is tuned for tau_relative times this, fixed in advance
+DEFAULT_BASELINES = {"add_to_cart": 0.08, "purchase": 0.03, "signup": 0.05, "revenue": 2.0}
+EXPOSURE_EVENT = "page_view"
+
+
+@dataclass
+class ABTest:
+    """A running test: a page served by the variant server and the stored version it compares"""
+    url_path: str
+    version_id: int
+    repo_owner: str
+    repo_name: str
+    file_path: str
+    primary_metric: str = "purchase"
+    since_ms: Optional[int] = None
+    experiment: Optional[str] = None
+    split: float = 0.5
+
+    def bucketing(self) -> Tuple[str, float]:
+        """(experiment, split) the variant server buckets this page with; see VariantServer.add_version"""
+        return self.experiment or page_key(self.repo_owner, self.repo_name, self.file_path), self.split
+
+
+@dataclass
+class ArmCounts:
+    """Per-test, per-metric sufficient statistics, one row per (test, metric)"""
+    labels: List[Tuple[str, str]]
+    n_a: np.ndarray
+    sum_a: np.ndarray
+    sq_a: np.ndarray
+    n_b: np.ndarray
+    sum_b: np.ndarray
+    sq_b: np.ndarray
+    exact: Optional[np.ndarray] = None  # rows whose user counts are exact; None means all
+
+
+@dataclass
+class TestResult:
+    """Outcome of one (test, metric) row"""
+    url_path: str
+    metric: str
+    visitors_a: int
+    visitors_b: int
+    mean_a: float
+    mean_b: float
+    lift: float
+    p_value: float
+    prob_better: float
+    significant: bool
+
+
+@dataclass
+class PageDecision:
+    """What to do with a test: "promote", "rollback" or "continue" """
+    test: ABTest
+    action: str
+    reason: str
+    results: List[TestResult] = field(default_factory=list)
+    published: bool = False  # set by run_once once the winner is pushed
+
+    def summary(self) -> str:
+        lines = [f"🧪 {self.test.url_path} (version {self.test.version_id}): {self.action.upper()} - {self.reason}"]
+        for result in self.results:
+            marker = "✅" if result.significant else "  "
+            lines.append(f"   {marker} {result.metric:<12} A {result.mean_a:.4f}  B {result.mean_b:.4f}  "
+                         f"lift {result.lift:+.1%}  p {result.p_value:.4f}  P(B>A) {result.prob_better:.3f}")
+        return "\n".join(lines)
+
+
+def _normal_cdf(x: np.ndarray) -> np.ndarray:
+    """Standard normal CDF (Abramowitz-Stegun 7.1.26 erf, error below 1.5e-7)"""
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def sequential_test(counts: ArmCounts, tau) -> Dict[str, np.ndarray]:
+    """
+    Mixture sequential probability ratio test (mSPRT) for every row at once
+
+    For each row the difference of means theta = mean_b - mean_a is
+    estimated with variance V from the plug-in per-arm variances. Against a
+    N(0, tau^2) mixture over theta the likelihood ratio is
+
+        sqrt(V / (V + tau^2)) * exp(theta^2 tau^2 / (2 V (V + tau^2)))
+
+    and 1 / ratio is an always-valid p-value: it may be checked after every
+    batch of traffic without inflating the false-positive rate, as long as
+    the running minimum is kept (SequentialEngine does that) and tau is
+    fixed before the data is seen: a tau derived from the observed means
+    moves with them and voids that guarantee. P(B > A) is the
+    normal-approximation posterior under a flat prior.
+
+    Args:
+        counts: Statistics of every row
+        tau: Absolute effect size the test is tuned for, one value or one per row
+
+    Returns:
+        Dict of arrays: mean_a, mean_b, lift, p_value, prob_better
+    """
+    n_a = np.maximum(counts.n_a, 1.0)
+    n_b = np.maximum(counts.n_b, 1.0)
+    mean_a = counts.sum_a / n_a
+    mean_b = counts.sum_b / n_b
+    var_a = np.maximum(counts.sq_a / n_a - mean_a ** 2, 0.0)
+    var_b = np.maximum(counts.sq_b / n_b - mean_b ** 2, 0.0)
+    variance = np.maximum(var_a / n_a + var_b / n_b, 1e-12)
+
+    theta = mean_b - mean_a
+    tau_sq = np.broadcast_to(np.asarray(tau, dtype=float) ** 2, theta.shape)
+    log_ratio = 0.5 * np.log(variance / (variance + tau_sq)) + \
+        theta ** 2 * tau_sq / (2.0 * variance * (variance + tau_sq))
+    p_value = np.minimum(np.exp(-log_ratio), 1.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = np.where(mean_a > 0, theta / mean_a, 0.0)
+    return {
+        "mean_a": mean_a,
+        "mean_b": mean_b,
+        "lift": lift,
+        "p_value": p_value,
+        "prob_better": _normal_cdf(theta / np.sqrt(variance)),
+    }
+
+
+def collect_counts(views, tests: List[ABTest], metrics: Tuple[str, ...] = DEFAULT_METRICS) -> ArmCounts:
+    """
+    Gather per-arm statistics for every (test, metric) from MetricViews
+
+    Exposures are the users with a page_view in each variant. A conversion
+    metric counts the exposed users with that event, so its second moment
+    equals its sum; revenue uses the purchase revenue and its sum of squares
+    (event-level, which treats each order as one visitor's revenue).
+
+    User counts come from the exact visitor sets MetricViews keeps for
+    experiment pages, never from the sketches: their error does not shrink
+    with traffic, so on a large enough A/A test it alone reaches
+    significance. Rows without exact visitors (views saved before they were
+    kept) are marked in ArmCounts.exact and never decided.
+    """
+    rows_count = len(tests) * len(metrics)
+    stats = np.zeros((6, rows_count))
+    exact = np.ones(rows_count, dtype=bool)
+    labels = []
+    for test_index, test in enumerate(tests):
+        arms = []
+        for variant in ("original", "enhanced"):
+            table = views.rows(test.url_path, variant, since_ms=test.since_ms)
+            exposed = views.users(test.url_path, variant, EXPOSURE_EVENT, since_ms=test.since_ms)
+            arms.append((variant, table, exposed))
+        for metric_index, metric in enumerate(metrics):
+            row = test_index * len(metrics) + metric_index
+            labels.append((test.url_path, metric))
+            for arm, (variant, table, exposed) in enumerate(arms):
+                if metric == "revenue":
+                    total = sum(entry.total_revenue for entry in table.values())
+                    squares = sum(entry.revenue_sq for entry in table.values())
+                else:
+                    converted = views.users(test.url_path, variant, metric, since_ms=test.since_ms)
+                    if exposed is None or converted is None:
+                        exact[row] = False
+                        total = squares = 0
+                    else:
+                        total = squares = len(converted & exposed)
+                if exposed is None:
+                    exact[row] = False
+                n = len(exposed) if exposed is not None else 0
+                stats[arm * 3:arm * 3 + 3, row] = (n, total, squares)
+    return ArmCounts(labels, *stats, exact=exact)
+
+
+class SequentialEngine:
+    """
+    Evaluates every running test in one vectorized pass and acts on the outcome
+
+    A page is rolled back as soon as any metric is significantly worse in
+    the enhanced variant, and promoted when its primary metric is
+    significantly better and nothing is significantly worse. Nothing is
+    decided before both arms have min_visitors. The running minimum of each
+    row's p-value is kept between evaluations, which is what makes
+    re-evaluating every minute safe.
+
+    Each metric's test is tuned for an effect of tau_relative times its
+    configured baseline (the expected mean per exposed user, see
+    DEFAULT_BASELINES).
+    """
+
+    def __init__(self,
+                 alpha: float = 0.05,
+                 tau_relative: float = 0.1,
+                 min_visitors: int = 200,
+                 metrics: Tuple[str, ...] = DEFAULT_METRICS,
+                 baselines: Optional[Dict[str, float]] = None):
+        self.alpha = alpha
+        self.tau_relative = tau_relative
+        self.min_visitors = min_visitors
+        self.metrics = tuple(metrics)
+        self.baselines = dict(DEFAULT_BASELINES, **(baselines or {}))
+        missing = [metric for metric in self.metrics if metric not in self.baselines]
+        if missing:
+            raise ValueError(f"No baseline for metric(s) {', '.join(missing)}")
+        self.tau = np.array([tau_relative * self.baselines[metric] for metric in self.metrics])
+        self._min_p_values: Dict[Tuple[int, str], float] = {}
+
+    def evaluate_counts(self, tests: List[ABTest], counts: ArmCounts) -> List[PageDecision]:
+        """Decisions for tests from already collected counts"""
+        stats = sequential_test(counts, np.tile(self.tau, len(tests)))
+        keys = [(test.version_id, metric) for test in tests for metric in self.metrics]
+        previous = np.fromiter((self._min_p_values.get(key, 1.0) for key in keys), float, len(keys))
+        enough = (counts.n_a >= self.min_visitors) & (counts.n_b >= self.min_visitors)
+        if counts.exact is not None:
+            enough &= counts.exact
+        p_value = np.where(enough, np.minimum(previous, stats["p_value"]), previous)
+        self._min_p_values.update(zip(keys, p_value.tolist()))
+
+        significant = p_value <= self.alpha
+        better = significant & (stats["mean_b"] > stats["mean_a"])
+        worse = significant & (stats["mean_b"] < stats["mean_a"])
+
+        decisions = []
+        width = len(self.metrics)
+        for test_index, test in enumerate(tests):
+            rows = range(test_index * width, (test_index + 1) * width)
+            results = [
+                TestResult(test.url_path, self.metrics[row - test_index * width], int(counts.n_a[row]),
+                           int(counts.n_b[row]), float(stats["mean_a"][row]), float(stats["mean_b"][row]),
+                           float(stats["lift"][row]), float(p_value[row]), float(stats["prob_better"][row]),
+                           bool(significant[row]))
+                for row in rows
+            ]
+            worse_metrics = [result.metric for result, row in zip(results, rows) if worse[row]]
+            primary_row = test_index * width + self.metrics.index(test.primary_metric) \
+                if test.primary_metric in self.metrics else None
+            if worse_metrics:
+                decisions.append(PageDecision(test, "rollback", f"worse on {', '.join(worse_metrics)}", results))
+            elif primary_row is not None and better[primary_row]:
+                decisions.append(PageDecision(test, "promote", f"better on {test.primary_metric}", results))
+            else:
+                decisions.append(PageDecision(test, "continue", "not significant yet", results))
+        return decisions
+
+    def evaluate(self, views, tests: List[ABTest]) -> List[PageDecision]:
+        """Decisions for every test from MetricViews"""
+        return self.evaluate_counts(tests, collect_counts(views, tests, self.metrics))
+
+    def act(self,
+            decision: PageDecision,
+            enhancer,
+            store,
+            github_token: str,
+            github_user: str,
+            server=None) -> bool:
+        """
+        Publish the winner of a decided test
+
+        "promote" pushes the tested version's enhanced page from a fresh
+        working copy (RunPlanner.push_page, which optimizes it as publish
+        does); "rollback" restores the page it replaced with
+        VersionStore.rollback. When the in-process VariantServer is given,
+        every visitor is switched to the winner right away.
+
+        Returns:
+            bool: Whether the push succeeded (False for "continue")
+        """
+        test = decision.test
+        if decision.action == "promote":
+            from run_planner import RunPlanner
+
+            print(f"🏆 Promoting version {test.version_id} of {test.url_path}")
+            with RunPlanner(enhancer, github_token, github_user, test.repo_owner, test.repo_name,
+                            test.file_path) as planner:
+                success = planner.push_page(
+                    store.get_version(test.version_id).enhanced_html,
+                    f"Promote A/B winner: version {test.version_id} ({decision.reason})"
+                )
+        elif decision.action == "rollback":
+            success = store.rollback(enhancer, test.version_id, github_token, github_user,
+                                     test.repo_owner, test.repo_name, test.file_path, restore="original")
+        else:
+            return False
+
+        if success and server is not None and test.url_path in server.pages:
+            server.pages[test.url_path].split = 1.0 if decision.action == "promote" else 0.0
+        return success
+
+    def run_once(self, views, tests: List[ABTest], enhancer, store, github_token: str, github_user: str,
+                 server=None) -> List[PageDecision]:
+        """
+        Evaluate all tests and act on decided ones
+
+        A failing push is reported and does not stop the other tests; its
+        decision is left unpublished so the test is retried next round.
+
+        Returns:
+            The decisions; those with published set can be dropped
+        """
+        start = time.perf_counter()
+        decisions = self.evaluate(views, tests)
+        print(f"📊 Evaluated {len(tests)} tests x {len(self.metrics)} metrics "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for decision in decisions:
+            if decision.action != "continue":
+                print(decision.summary())
+                try:
+                    decision.published = self.act(decision, enhancer, store, github_token, github_user, server)
+                except Exception as e:
+                    print(f"❌ Could not {decision.action} {decision.test.url_path}: {e}")
+                if not decision.published:
+                    print(f"🔁 {decision.test.url_path} stays in the test and is retried next round")
+        return decisions
+
+
+def load_tests(path: str) -> List[ABTest]:
+    """Tests from a JSON list of ABTest fields"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [ABTest(**entry) for entry in json.load(f)]
+
+
+def start_at_deploy(tests: List[ABTest], store) -> int:
+    """
+    Start the window of every test without a since_ms at its version's first
+    recorded deploy (see webhook_receiver.py); returns how many were started
+    """
+    started = 0
+    for test in tests:
+        if test.since_ms is None:
+            deployed_at = store.deployed_at(test.version_id)
+            if deployed_at is not None:
+                test.since_ms = int(deployed_at * 1000)
+                started += 1
+    return started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential A/B significance with automatic promotion")
+    parser.add_argument("--tests", required=True, help="JSON list of tests (ABTest fields)")
+    parser.add_argument("--log-dir", default="events")
+    parser.add_argument("--views", default="metric_views.pkl")
+    parser.add_argument("--store", default="html_versions.db")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between evaluations; 0 = once")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--baseline", action="append", default=[], metavar="METRIC=MEAN",
+                        help="Expected mean per exposed user of a metric (repeatable; defaults: "
+                             + ", ".join(f"{metric}={mean}" for metric, mean in DEFAULT_BASELINES.items()) + ")")
+    parser.add_argument("--dry-run", action="store_true", help="Report decisions without pushing")
+    args = parser.parse_args()
+
+    from event_collector import EventLog
+    from metric_views import MetricViews
+    from version_store import VersionStore
+
+    tests = load_tests(args.tests)
+    views = MetricViews.load(args.views)
+    for test in tests:
+        if test.url_path not in views.experiments:
+            # Events already folded in for this page stay under variant ""
+            views.experiments[test.url_path] = test.bucketing()
+    log = EventLog(args.log_dir, read_only=True)
+    store = VersionStore(args.store)
+    baselines = {}
+    for entry in args.baseline:
+        metric, _, mean = entry.partition("=")
+        baselines[metric] = float(mean)
+    engine = SequentialEngine(alpha=args.alpha, baselines=baselines)
+    enhancer = None
+    if not args.dry_run:
+        from Claude_Morph_Edit_HTML_GH_or_Upload import create_enhancer_from_env
+        enhancer = create_enhancer_from_env()
+    github_token = os.getenv("GITHUB_TOKEN", "")
+    github_user = os.getenv("GITHUB_USER", "")
+
+    try:
+        while tests:
+            start_at_deploy(tests, store)
+            views.catch_up(log)
+            views.save(args.views)
+            if args.dry_run:
+                decisions = engine.evaluate(views, tests)
+                for decision in decisions:
+                    print(decision.summary())
+            else:
+                decisions = engine.run_once(views, tests, enhancer, store, github_token, github_user)
+                published = {id(decision.test) for decision in decisions if decision.published}
+                tests = [test for test in tests if id(test) not in published]
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
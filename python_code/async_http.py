@@ -0,0 +1,150 @@
+# async_http.py
+
+import asyncio
+import inspect
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import parse_qsl
+
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+_REASONS = {status.value: status.phrase for status in HTTPStatus}
+
+
+class Request:
+    """A parsed HTTP/1.1 request"""
+
+    __slots__ = ("method", "path", "query", "headers", "body", "version")
+
+    def __init__(self, method: str, path: str, query: Dict[str, str],
+                 headers: Dict[str, str], body: bytes, version: str):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.version = version
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def cookies(self) -> Dict[str, str]:
+        jar = {}
+        for part in self.headers.get("cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name:
+                jar[name] = value
+        return jar
+
+
+class Response:
+    """An HTTP response; body is sent as-is"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int = 200, body: bytes = b"",
+                 headers: Optional[Iterable[Tuple[str, str]]] = None):
+        self.status = status
+        self.body = body
+        self.headers = list(headers or [])
+
+    def encode(self, keep_alive: bool, head_only: bool = False) -> bytes:
+        lines = [f"HTTP/1.1 {self.status} {_REASONS.get(self.status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in self.headers)
+        if self.status not in (204, 304):
+            lines.append(f"Content-Length: {len(self.body)}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        return head if head_only else head + self.body
+
+
+Handler = Callable[[Request], Union[Response, Awaitable[Response]]]
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Read one request from a keep-alive connection; None when the client is done"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("Request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise ValueError(f"Malformed request line: {lines[0]!r}")
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    path, _, query_string = target.partition("?")
+    body = b""
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    if length:
+        body = await reader.readexactly(length)
+    return Request(method.upper(), path, dict(parse_qsl(query_string)), headers, body, version)
+
+
+async def _serve_connection(handler: Handler, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except ValueError as e:
+                writer.write(Response(400, str(e).encode()).encode(keep_alive=False))
+                break
+            if request is None:
+                break
+
+            try:
+                response = handler(request)
+                if inspect.isawaitable(response):
+                    response = await response
+            except Exception as e:
+                print(f"Handler error for {request.method} {request.path}: {e}")
+                response = Response(500, b"Internal Server Error")
+
+            keep_alive = request.keep_alive
+            writer.write(response.encode(keep_alive, head_only=request.method == "HEAD"))
+            if writer.transport.get_write_buffer_size() > 256 * 1024:
+                await writer.drain()
+            if not keep_alive:
+                break
+        await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        # Cancelled on server shutdown; end the connection quietly
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(handler: Handler, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+    """Start serving handler over HTTP/1.1 with keep-alive"""
+    return await asyncio.start_server(
+        lambda reader, writer: _serve_connection(handler, reader, writer),
+        host, port, limit=MAX_HEADER_BYTES, backlog=1024
+    )
+
+
+def install_fast_event_loop() -> bool:
+    """Use uvloop when it is installed; returns whether it was"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    uvloop.install()
+    return True
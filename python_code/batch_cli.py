@@ -0,0 +1,664 @@
+# batch_cli.py
+#
+# Non-interactive batch runs from a YAML/JSON manifest, for cron and CI:
+#   python batch_cli.py sites.yaml --concurrency 4 --results results.json
+#   python batch_cli.py sites.yaml --dry-run --max-run-usd 0.25 --tenant-budget-usd 5
+#   python batch_cli.py sites.yaml --backend queue --db jobs.db
+#
+# Credentials come from the environment: ANTHROPIC_API_KEY, MORPH_API_KEY,
+# and GITHUB_TOKEN / GITHUB_USER for the github backend.
+#
+# Every page is estimated (cost_estimator.py) before its first LLM call and
+# checked against the budgets: over the per-run budget it is downscaled or
+# rejected, over its tenant's budget it is deferred.
+#
+# Exit codes: 0 every page succeeded or was deferred (with --dry-run: every
+# page's inputs were found and none would be rejected), 1 at least one page
+# failed or was rejected, 2 invalid manifest, arguments, credentials or
+# missing dependencies, 130 interrupted.
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from cost_estimator import QUEUE, REJECT, AdmissionController, Budget, SpendLedger
+from version_store import page_key
+
+BACKENDS = ("github", "local", "queue")
+
+EXIT_OK = 0
+EXIT_PAGE_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+class ManifestError(ValueError):
+    """The manifest is malformed or refers to inputs that don't exist"""
+
+
+@dataclass
+class PageSpec:
+    """One page of the manifest, with its defaults resolved"""
+    site: str
+    repo_owner: str
+    repo_name: str
+    file_path: str
+    csv: Any  # a path, or {"path" | "inline" | "event_log": ...}
+    html: Optional[str] = None  # local source page, for the local backend
+    optimize: bool = False
+    route_assets: bool = False  # github backend: CSS goes to the stylesheet the page shares
+    templates: bool = False  # local backend: one analysis per page template of the site
+    tenant: str = ""  # whose budget the page counts against; defaults to the site
+
+    @property
+    def key(self) -> str:
+        return page_key(self.repo_owner, self.repo_name, self.file_path)
+
+
+@dataclass
+class PageResult:
+    """Machine-readable outcome of one page"""
+    site: str
+    page: str
+    status: str  # "ok", "push_failed", "failed", "planned", "queued", "deferred" or "rejected"
+    elapsed_seconds: float = 0.0
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    instructions: Optional[str] = None
+    output: Optional[str] = None
+    job_id: Optional[int] = None
+    error: Optional[str] = None
+    estimate: Optional[Dict[str, Any]] = None  # cost_estimator.RunEstimate.to_dict()
+    admission: Optional[str] = None
+    retry_after_seconds: Optional[float] = None  # deferred: when the tenant's budget has room again
+    template: Optional[str] = None  # template_clusters fingerprint the page was analyzed with
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("ok", "planned", "queued", "deferred")
+
+
+@dataclass
+class Manifest:
+    pages: List[PageSpec]
+    backend: Optional[str] = None
+
+
+def load_manifest(path: str) -> Manifest:
+    """
+    Read a manifest of sites and pages
+
+    backend: github                     # optional; --backend overrides it
+    optimize: false                     # optional default for every page
+    route_assets: false                 # optional; put CSS edits into shared stylesheets (site_graph.py)
+    templates: false                    # optional; local backend: one analysis per page template (template_clusters.py)
+    sites:
+      - name: acme                      # optional, defaults to owner/repo
+        tenant: acme-inc                # optional budget owner, defaults to the name
+        repo_owner: acme
+        repo_name: shop
+        csv: metrics/acme.csv           # default CSV source of the site's pages
+        optimize: false
+        pages:
+          - file_path: index.html
+          - file_path: pricing.html
+            csv: {event_log: events, page: /pricing.html, since_hours: 168}
+          - file_path: about.html
+            html: site/about.html       # source page for the local backend
+
+    A CSV source is a file path, or a mapping with one of "path", "inline"
+    or "event_log" (plus optional "page" and "since_hours"). Relative paths
+    are resolved against the manifest's directory.
+
+    Raises:
+        ManifestError: When the manifest cannot be used
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except OSError as e:
+        raise ManifestError(f"Cannot read manifest: {e}")
+
+    if path.endswith(".json"):
+        data = _parse_json(text)
+    elif yaml is not None:
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ManifestError(f"Invalid YAML: {e}")
+    elif text.lstrip().startswith("{"):
+        data = _parse_json(text)
+    else:
+        raise ManifestError("PyYAML is needed for YAML manifests (pip install pyyaml); or use a .json manifest")
+
+    if not isinstance(data, dict) or not isinstance(data.get("sites"), list) or not data["sites"]:
+        raise ManifestError("The manifest needs a non-empty 'sites' list")
+    if data.get("backend") is not None and data["backend"] not in BACKENDS:
+        raise ManifestError(f"Unknown backend {data['backend']!r}; choose one of {', '.join(BACKENDS)}")
+
+    base = os.path.dirname(os.path.abspath(path))
+    pages: List[PageSpec] = []
+    for index, site in enumerate(data["sites"]):
+        if not isinstance(site, dict):
+            raise ManifestError(f"sites[{index}] is not a mapping")
+        missing = [name for name in ("repo_owner", "repo_name") if not site.get(name)]
+        if missing:
+            raise ManifestError(f"sites[{index}] is missing {', '.join(missing)}")
+        name = site.get("name") or f"{site['repo_owner']}/{site['repo_name']}"
+        if not isinstance(site.get("pages"), list) or not site["pages"]:
+            raise ManifestError(f"Site {name} has no pages")
+        for page_index, page in enumerate(site["pages"]):
+            if isinstance(page, str):
+                page = {"file_path": page}
+            if not isinstance(page, dict) or not page.get("file_path"):
+                raise ManifestError(f"Site {name}, page {page_index}: 'file_path' is required")
+            csv_source = page.get("csv", site.get("csv"))
+            if csv_source is None:
+                raise ManifestError(f"Site {name}, page {page['file_path']}: no CSV source")
+            html = page.get("html")
+            pages.append(PageSpec(
+                site=name,
+                repo_owner=site["repo_owner"],
+                repo_name=site["repo_name"],
+                file_path=page["file_path"],
+                csv=_resolve_csv_source(csv_source, base, f"{name}/{page['file_path']}"),
+                html=os.path.join(base, html) if html else None,
+                optimize=bool(page.get("optimize", site.get("optimize", data.get("optimize", False)))),
+                route_assets=bool(page.get("route_assets",
+                                           site.get("route_assets", data.get("route_assets", False)))),
+                templates=bool(site.get("templates", data.get("templates", False))),
+                tenant=str(site.get("tenant") or name),
+            ))
+
+    seen = set()
+    for spec in pages:
+        if spec.key in seen:
+            raise ManifestError(f"{spec.key} is listed twice")
+        seen.add(spec.key)
+    return Manifest(pages, data.get("backend"))
+
+
+def _parse_json(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ManifestError(f"Invalid JSON: {e}")
+
+
+def _resolve_csv_source(source: Any, base: str, where: str) -> Any:
+    if isinstance(source, str):
+        return {"path": os.path.join(base, source)}
+    if not isinstance(source, dict) or sum(name in source for name in ("path", "inline", "event_log")) != 1:
+        raise ManifestError(f"{where}: a CSV source needs exactly one of path, inline or event_log")
+    source = dict(source)
+    for name in ("path", "event_log"):
+        if name in source:
+            source[name] = os.path.join(base, source[name])
+    return source
+
+
+def read_csv_source(source: Dict[str, Any]) -> str:
+    """The CSV text of a resolved source"""
+    if "inline" in source:
+        return source["inline"]
+    if "path" in source:
+        with open(source["path"], "r", encoding="utf-8") as f:
+            return f.read()
+
+    from event_collector import EventLog, events_to_csv
+
+    if not os.path.isdir(source["event_log"]):
+        raise FileNotFoundError(f"No event log at {source['event_log']}")
+    since_ms = None
+    if source.get("since_hours") is not None:
+        since_ms = int((time.time() - float(source["since_hours"]) * 3600) * 1000)
+    log = EventLog(source["event_log"], read_only=True)
+    try:
+        return events_to_csv(log, since_ms=since_ms, page=source.get("page"))
+    finally:
+        log.close()
+
+
+class BatchRunner:
+    """
+    Runs the pages of a manifest in parallel on one backend
+
+    github: fetch, analyze, merge and push each page (RunPlanner). Pages of
+        the same repository run one after another, so each clone sees the
+        commit pushed for the page before it; repositories run in parallel.
+    local: enhance each page's local html file and write the result to out_dir;
+        the pages of a site with templates run together, one analysis per
+        template cluster (template_clusters.py) merged into every member
+    queue: submit an "enhance" job per page to a job_queue.JobQueue
+
+    With an AdmissionController, each page is estimated once its inputs are
+    known (for github, after the fetch) and only runs when admitted; pages
+    whose HTML isn't local are estimated at assume_html_chars. An
+    element_index.ElementIndex, a process_pool.StagePool and a
+    version_store.VersionStore (which records what the github backend
+    pushes) are shared by the pages' enhancers (queue workers take their own
+    index and store, see job_queue.py worker --index-db --versions-db).
+    """
+
+    def __init__(self,
+                 backend: str,
+                 concurrency: int = 4,
+                 dry_run: bool = False,
+                 out_dir: str = "enhanced",
+                 queue=None,
+                 idempotency_suffix: Optional[str] = None,
+                 admission: Optional[AdmissionController] = None,
+                 assume_html_chars: int = 60000,
+                 element_index=None,
+                 stage_pool=None,
+                 version_store=None):
+        self.backend = backend
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.out_dir = out_dir
+        self.queue = queue
+        self.idempotency_suffix = idempotency_suffix
+        self.admission = admission
+        self.assume_html_chars = assume_html_chars
+        self.element_index = element_index
+        self.stage_pool = stage_pool
+        self.version_store = version_store
+        self.github_token = os.getenv("GITHUB_TOKEN", "")
+        self.github_user = os.getenv("GITHUB_USER", "")
+
+    def check_credentials(self) -> List[str]:
+        """Environment variables the backend needs that are not set"""
+        needed = []
+        if self.backend in ("github", "local"):
+            needed.append("ANTHROPIC_API_KEY")
+        if self.backend == "github":
+            needed += ["GITHUB_TOKEN", "GITHUB_USER"]
+        return [name for name in needed if not os.getenv(name)]
+
+    def run(self, pages: List[PageSpec], on_result=None) -> List[PageResult]:
+        """Run every page; results come back in manifest order"""
+        groups: Dict[str, List[PageSpec]] = {}
+        for spec in pages:
+            if self.backend == "github":
+                group = f"{spec.repo_owner}/{spec.repo_name}"
+            elif self.backend == "local" and spec.templates and not self.dry_run:
+                group = f"templates:{spec.site}"
+            else:
+                group = spec.key
+            groups.setdefault(group, []).append(spec)
+
+        results: Dict[str, PageResult] = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="batch") as executor:
+            futures = [executor.submit(self._run_group, group) for group in groups.values()]
+            for future in as_completed(futures):
+                for spec, result in future.result():
+                    results[spec.key] = result
+                    if on_result is not None:
+                        on_result(result)
+        return [results[spec.key] for spec in pages]
+
+    def _run_group(self, group: List[PageSpec]) -> List[tuple]:
+        if self.backend == "local" and group[0].templates and not self.dry_run and len(group) > 1:
+            return self._run_templates(group)
+        return [(spec, self._run_page(spec)) for spec in group]
+
+    def _run_templates(self, group: List[PageSpec]) -> List[tuple]:
+        """Run a site's pages one template cluster at a time (local backend)"""
+        from template_clusters import ClusterEdit, aggregate_metrics, cluster_pages, merge_into_members
+
+        results = {spec.key: PageResult(spec.site, spec.key, "failed") for spec in group}
+        specs = {spec.key: spec for spec in group}
+        pages: Dict[str, str] = {}
+        csvs: Dict[str, str] = {}
+        for spec in group:
+            try:
+                if not spec.html:
+                    raise ManifestError("The local backend needs an 'html' source for every page")
+                csvs[spec.key] = read_csv_source(spec.csv)
+                with open(spec.html, "r", encoding="utf-8") as f:
+                    pages[spec.key] = f.read()
+            except Exception as e:
+                results[spec.key].error = str(e) or e.__class__.__name__
+
+        for cluster in cluster_pages(pages):
+            started = time.perf_counter()
+            first = specs[cluster.representative]
+            lead = results[first.key]
+            try:
+                admitted = self._admit(first, aggregate_metrics(csvs[key] for key in cluster.pages),
+                                       pages[first.key], lead)
+                if admitted is not None:
+                    csv_content, analysis_html_chars = admitted
+                    enhancer = self._enhancer(first)
+                    if analysis_html_chars:
+                        enhancer.analysis_html_chars = analysis_html_chars
+                    edit = ClusterEdit(cluster)
+                    edit.instructions, edit.code_edit = enhancer.analyze_engagement_with_claude(
+                        csv_content, pages[first.key], page=first.key
+                    )
+                    merge_into_members(enhancer, edit, pages, cluster.pages)
+                    print(edit.summary())
+            except Exception as e:
+                lead.status = "failed"
+                lead.error = str(e) or e.__class__.__name__
+                admitted = None
+            elapsed = round(time.perf_counter() - started, 3)
+            for key in cluster.pages:
+                result = results[key]
+                result.template = cluster.fingerprint
+                result.elapsed_seconds = elapsed
+                if key != first.key:
+                    # Admitted with the representative; its estimate covers the cluster's one analysis
+                    result.admission = lead.admission
+                if admitted is None:
+                    if key != first.key:
+                        result.status, result.error = lead.status, lead.error
+                        result.retry_after_seconds = lead.retry_after_seconds
+                    continue
+                result.instructions = edit.instructions
+                if key in edit.skipped:
+                    result.error = edit.skipped[key]
+                    continue
+                output = os.path.join(self.out_dir, key)
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                enhancer.save_enhanced_html(enhancer.optimize_for_publish(edit.pages[key], specs[key].file_path),
+                                            output)
+                result.output = output
+                result.status = "ok"
+        return [(spec, results[spec.key]) for spec in group]
+
+    def _run_page(self, spec: PageSpec) -> PageResult:
+        result = PageResult(spec.site, spec.key, "failed")
+        started = time.perf_counter()
+        stage_started: Dict[str, float] = {}
+
+        def on_stage(stage: str) -> None:
+            stage_started[stage] = time.perf_counter()
+
+        try:
+            on_stage("csv")
+            csv_content = read_csv_source(spec.csv)
+            if self.dry_run:
+                self._plan(spec, result)
+                self._admit(spec, csv_content, self._local_html(spec), result)
+            elif self.backend == "queue":
+                self._enqueue(spec, csv_content, result)
+            elif self.backend == "local":
+                self._run_local(spec, csv_content, result, on_stage)
+            else:
+                self._run_github(spec, csv_content, result, on_stage)
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e) or e.__class__.__name__
+        finished = time.perf_counter()
+        result.elapsed_seconds = round(finished - started, 3)
+        ends = sorted(stage_started.values())[1:] + [finished]
+        for (stage, start), end in zip(sorted(stage_started.items(), key=lambda item: item[1]), ends):
+            result.stage_seconds[stage] = round(end - start, 3)
+        return result
+
+    def _plan(self, spec: PageSpec, result: PageResult) -> None:
+        if self.backend == "local":
+            if not spec.html:
+                raise ManifestError("The local backend needs an 'html' source for every page")
+            if not os.path.isfile(spec.html):
+                raise FileNotFoundError(f"No such file: {spec.html}")
+            result.output = os.path.join(self.out_dir, spec.key)
+        result.status = "planned"
+
+    def _local_html(self, spec: PageSpec) -> Optional[str]:
+        if not spec.html or not os.path.isfile(spec.html):
+            return None
+        with open(spec.html, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _admit(self, spec: PageSpec, csv_content: str, html_content: Optional[str],
+               result: PageResult, defer: bool = True) -> Optional[tuple]:
+        """
+        Estimate the page and apply the budgets
+
+        Returns:
+            (csv_content, analysis_html_chars) to run with, possibly downscaled,
+            or None when the page was rejected or deferred (result says why)
+        """
+        if self.admission is None:
+            return csv_content, None
+        html_size = self.assume_html_chars if html_content is None else None
+        admission = self.admission.admit(spec.tenant, csv_content, html_content, html_size)
+        result.estimate = admission.estimate.to_dict()
+        result.admission = admission.summary()
+        if not admission.admitted:
+            result.output = None
+        if admission.action == REJECT:
+            result.status = "rejected"
+            result.error = admission.reason
+            return None
+        if admission.action == QUEUE:
+            result.retry_after_seconds = round(admission.retry_after)
+            if defer:
+                result.status = "deferred"
+                return None
+            # A delayed job spends when it starts; book it then
+            self.admission.ledger.charge(spec.tenant, admission.estimate.cost_usd,
+                                         now=time.time() + admission.retry_after)
+        shrunk = admission.requested is not None and admission.html_chars < admission.requested.html_chars
+        return admission.csv_content, admission.html_chars if shrunk else None
+
+    def _enhancer(self, spec: PageSpec):
+        from Claude_Morph_Edit_HTML_GH_or_Upload import HTMLEnhancer
+        from page_optimizer import PageOptimizer
+
+        # One per page: the enhancer remembers the last commit it pushed
+        return HTMLEnhancer(
+            anthropic_api_key=os.getenv("ANTHROPIC_API_KEY", ""),
+            morph_api_key=os.getenv("MORPH_API_KEY") or "DUMMY",
+            optimizer=PageOptimizer() if spec.optimize else None,
+            element_index=self.element_index,
+            route_assets=spec.route_assets,
+            stage_pool=self.stage_pool,
+            version_store=self.version_store
+        )
+
+    def _enqueue(self, spec: PageSpec, csv_content: str, result: PageResult) -> None:
+        admitted = self._admit(spec, csv_content, self._local_html(spec), result, defer=False)
+        if admitted is None:
+            return
+        csv_content, analysis_html_chars = admitted
+        payload = {"csv_content": csv_content,
+                   "target": {"repo_owner": spec.repo_owner, "repo_name": spec.repo_name, "file_path": spec.file_path}}
+        if analysis_html_chars:
+            payload["analysis_html_chars"] = analysis_html_chars
+        key = f"{spec.key}@{self.idempotency_suffix}" if self.idempotency_suffix else None
+        result.job_id = self.queue.enqueue("enhance", payload, idempotency_key=key,
+                                           delay_seconds=result.retry_after_seconds or 0.0)
+        result.status = "queued"
+
+    def _run_local(self, spec: PageSpec, csv_content: str, result: PageResult, on_stage) -> None:
+        if not spec.html:
+            raise ManifestError("The local backend needs an 'html' source for every page")
+        with open(spec.html, "r", encoding="utf-8") as f:
+            html_content = f.read()
+        admitted = self._admit(spec, csv_content, html_content, result)
+        if admitted is None:
+            return
+        csv_content, analysis_html_chars = admitted
+        enhancer = self._enhancer(spec)
+        if analysis_html_chars:
+            enhancer.analysis_html_chars = analysis_html_chars
+        on_stage("analyze")
+        enhanced_html, result.instructions = enhancer.process_content(csv_content, html_content, spec.key)
+        on_stage("write")
+        output = os.path.join(self.out_dir, spec.key)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        enhancer.save_enhanced_html(enhancer.optimize_for_publish(enhanced_html, spec.file_path), output)
+        result.output = output
+        result.status = "ok"
+
+    def _run_github(self, spec: PageSpec, csv_content: str, result: PageResult, on_stage) -> None:
+        from run_planner import RunPlanner
+
+        enhancer = self._enhancer(spec)
+        with RunPlanner(enhancer, self.github_token, self.github_user, spec.repo_owner, spec.repo_name,
+                        spec.file_path, on_stage=on_stage) as planner:
+            planner.start()
+            current_html = planner.read_current_html()
+            admitted = self._admit(spec, csv_content, current_html, result)
+            if admitted is None:
+                return
+            csv_content, analysis_html_chars = admitted
+            if analysis_html_chars:
+                enhancer.analysis_html_chars = analysis_html_chars
+            _, result.instructions, push_success = planner.run(csv_content, current_html)
+        result.output = enhancer.last_commit_sha if push_success else None
+        result.status = "ok" if push_success else "push_failed"
+        if not push_success:
+            result.error = "GitHub push failed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run enhancements for every page of a manifest")
+    parser.add_argument("manifest", help="YAML or JSON manifest of sites, pages and CSV sources")
+    parser.add_argument("--backend", choices=BACKENDS, help="Overrides the manifest's backend (default github)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pages (github: repositories) run at once")
+    parser.add_argument("--dry-run", action="store_true", help="Validate the manifest and inputs without running")
+    parser.add_argument("--results", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--out-dir", default="enhanced", help="Output directory of the local backend")
+    parser.add_argument("--db", default="jobs.db", help="Job queue database of the queue backend")
+    parser.add_argument("--key", help="Queue backend: idempotency key suffix, e.g. the date of the run")
+    parser.add_argument("--max-run-usd", type=float, help="Estimated cost limit of one page; larger runs are "
+                                                          "downscaled or rejected")
+    parser.add_argument("--max-run-tokens", type=int, help="Estimated token limit of one page")
+    parser.add_argument("--tenant-budget-usd", type=float, help="Estimated spend limit per tenant per window; "
+                                                                "pages over it are deferred")
+    parser.add_argument("--budget-window-hours", type=float, default=24.0, help="Window of --tenant-budget-usd")
+    parser.add_argument("--ledger", help="JSON file of past spend per tenant, shared by batch runs "
+                                         "(a dry run reads it but records nothing)")
+    parser.add_argument("--assume-html-kb", type=float, default=60.0,
+                        help="Page size assumed when estimating pages whose HTML isn't local")
+    parser.add_argument("--index-db", help="ElementIndex of the pages' elements and the edits that changed them "
+                                           "(github and local backends)")
+    parser.add_argument("--store", help="VersionStore that records every page the github backend pushes "
+                                        "(for rollback and deploy windows, see webhook_receiver.py)")
+    parser.add_argument("--stage-workers", type=int, default=0,
+                        help="Worker processes for the CPU-bound HTML stages of the github and local "
+                             "backends (0: run them on the page threads)")
+    args = parser.parse_args()
+
+    try:
+        manifest = load_manifest(args.manifest)
+    except ManifestError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(EXIT_USAGE)
+    pages = manifest.pages
+    backend = args.backend or manifest.backend or "github"
+
+    queue = None
+    if backend == "queue" and not args.dry_run:
+        from job_queue import JobQueue
+
+        queue = JobQueue(args.db)
+    try:
+        ledger = SpendLedger(args.ledger)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot read the spend ledger: {e}", file=sys.stderr)
+        sys.exit(EXIT_USAGE)
+    budget = Budget(run_usd=args.max_run_usd, run_tokens=args.max_run_tokens,
+                    tenant_usd=args.tenant_budget_usd, window_seconds=args.budget_window_hours * 3600)
+    admission = AdmissionController(budget=budget, ledger=ledger.copy() if args.dry_run else ledger)
+    element_index = None
+    if args.index_db and backend in ("github", "local") and not args.dry_run:
+        from element_index import ElementIndex
+
+        element_index = ElementIndex(args.index_db)
+    stage_pool = None
+    if args.stage_workers > 0 and backend in ("github", "local") and not args.dry_run:
+        from process_pool import StagePool
+
+        stage_pool = StagePool(args.stage_workers)
+    version_store = None
+    if args.store and backend == "github" and not args.dry_run:
+        from version_store import VersionStore
+
+        version_store = VersionStore(args.store)
+    runner = BatchRunner(backend, args.concurrency, args.dry_run, args.out_dir, queue, args.key,
+                         admission, int(args.assume_html_kb * 1024), element_index, stage_pool, version_store)
+    missing = runner.check_credentials()
+    if missing and not args.dry_run:
+        print(f"❌ Missing environment variables: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(EXIT_USAGE)
+    if missing:
+        print(f"⚠️ Not set (needed for a real run): {', '.join(missing)}", file=sys.stderr)
+    if backend in ("github", "local") and not args.dry_run:
+        try:
+            # Imported once here, not concurrently by the first pages
+            import Claude_Morph_Edit_HTML_GH_or_Upload  # noqa: F401
+        except ImportError as e:
+            print(f"❌ {e}; install the requirements to run the {backend} backend", file=sys.stderr)
+            sys.exit(EXIT_USAGE)
+
+    def report(result: PageResult) -> None:
+        icon = "✅" if result.ok else "❌"
+        detail = result.error or result.output or result.status
+        print(f"{icon} {result.page} ({result.elapsed_seconds:.1f}s): {detail}", file=sys.stderr)
+        if result.admission:
+            print(f"   💵 {result.admission}", file=sys.stderr)
+
+    print(f"🚀 {len(pages)} page(s) on the {backend} backend"
+          f"{' (dry run)' if args.dry_run else ''}, concurrency {args.concurrency}", file=sys.stderr)
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        # The enhancer logs to stdout; keep stdout for the JSON results
+        with contextlib.redirect_stdout(sys.stderr):
+            results = runner.run(pages, on_result=report)
+    except KeyboardInterrupt:
+        print("\n👋 Interrupted", file=sys.stderr)
+        sys.exit(EXIT_INTERRUPTED)
+    finally:
+        if queue is not None:
+            queue.close()
+        if stage_pool is not None:
+            stage_pool.close()
+        if version_store is not None:
+            version_store.close()
+
+    failed = sum(1 for result in results if not result.ok)
+    spending = [result.estimate for result in results
+                if result.estimate and result.status not in ("rejected", "deferred")]
+    document = {
+        "manifest": os.path.abspath(args.manifest),
+        "backend": backend,
+        "dry_run": args.dry_run,
+        "started_at": started_at,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "pages": [asdict(result) for result in results],
+        "summary": {"pages": len(results), "succeeded": len(results) - failed, "failed": failed,
+                    "deferred": sum(1 for result in results if result.status == "deferred"),
+                    "estimated_tokens": sum(estimate["tokens"] for estimate in spending),
+                    "estimated_cost_usd": round(sum(estimate["cost_usd"] for estimate in spending), 4)},
+    }
+    if args.dry_run and missing:
+        document["missing_credentials"] = missing
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    print(f"🏁 {len(results) - failed} succeeded, {failed} failed; "
+          f"estimated ${document['summary']['estimated_cost_usd']:.2f}", file=sys.stderr)
+    sys.exit(EXIT_PAGE_FAILED if failed else EXIT_OK)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_edit_coalescer.py
+#
+# Merges (each one a Morph call, a commit and a deploy) for bursty edit
+# traffic through EditCoalescer at several debounce windows. Bursts of 1-6
+# analyses of one page arrive within BURST_MS of each other, bursts are
+# BURST_GAP_MS apart, over a handful of pages; the stand-in flush takes as
+# long as a merge and push would, scaled down:
+#   python benchmarks/bench_edit_coalescer.py [bursts] [windows in ms...]
+
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from edit_coalescer import EditCoalescer
+
+PAGES = ["acme/shop/index.html", "acme/shop/pricing.html", "acme/blog/index.html"]
+BURST_MS = 40
+BURST_GAP_MS = 400
+FLUSH_MS = 30
+EDITS = [
+    ("Make the CTA bigger", ".btn.primary { padding: 1.2rem 2rem; font-size: 1.2rem; }"),
+    ("Make the CTA stand out", ".btn.primary { background: #0a7d32; padding: 1rem 1.6rem; }"),
+    ("Bigger hero heading", ".hero h1 { font-size: 3rem; }"),
+    ("Rewrite the CTA", '<a id="cta" class="btn primary" href="/shop">Shop the sale</a>'),
+    ("Tighter product grid", ".grid { gap: 1rem; }"),
+]
+
+
+def traffic(bursts: int, seed: int = 7):
+    """(offset seconds, page, instructions, code_edit), in arrival order"""
+    rng = random.Random(seed)
+    arrivals = []
+    for burst in range(bursts):
+        page = rng.choice(PAGES)
+        start = burst * BURST_GAP_MS / 1000
+        for _ in range(rng.randint(1, 6)):
+            instructions, code_edit = rng.choice(EDITS)
+            arrivals.append((start + rng.uniform(0, BURST_MS / 1000), page, instructions, code_edit))
+    return sorted(arrivals)
+
+
+def run(arrivals, window_ms: float) -> dict:
+    lock = threading.Lock()
+    conflicts = [0]
+
+    def flush(page, coalesced):
+        time.sleep(FLUSH_MS / 1000)
+        with lock:
+            conflicts[0] += len(coalesced.conflicts)
+        return time.perf_counter()
+
+    coalescer = EditCoalescer(flush, window_seconds=window_ms / 1000, max_wait_seconds=max(window_ms, 1) * 5 / 1000)
+    started = time.perf_counter()
+    submitted = []
+    for offset, page, instructions, code_edit in arrivals:
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        submitted.append((time.perf_counter(), coalescer.submit(page, instructions, code_edit)))
+    coalescer.close()
+    latency = [future.result() - at for at, future in submitted]
+    return {"merges": coalescer.merges, "edits": coalescer.edits, "conflicts": conflicts[0],
+            "latency_ms": 1000 * sum(latency) / len(latency), "max_latency_ms": 1000 * max(latency)}
+
+
+def main():
+    bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    windows = [float(window) for window in sys.argv[2:]] or [0, 50, 100, 200]
+    arrivals = traffic(bursts)
+    print(f"{len(arrivals)} edits in {bursts} bursts over {len(PAGES)} pages "
+          f"(bursts {BURST_MS} ms wide, {BURST_GAP_MS} ms apart; flush {FLUSH_MS} ms)")
+    print(f"{'window':>8}  {'merges':>6}  {'per edit':>8}  {'conflicts':>9}  {'mean wait':>9}  {'max wait':>8}")
+    for window in windows:
+        with contextlib.redirect_stdout(io.StringIO()):  # the per-flush summaries
+            stats = run(arrivals, window)
+        print(f"{window:6.0f}ms  {stats['merges']:6d}  {stats['merges'] / stats['edits']:8.2f}  "
+              f"{stats['conflicts']:9d}  {stats['latency_ms']:7.0f}ms  {stats['max_latency_ms']:6.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench_element_index.py
+#
+# Indexing cost of a large page: first (full) parse, an unchanged page, and
+# an incremental update after a one-element edit plus a new <style> in <head>;
+# checks the incremental index matches a full parse of the edited page:
+#   python benchmarks/bench_element_index.py [copies] [iterations]
+#
+# Exits with status 1 when the incremental and the full index differ.
+
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from element_index import ElementIndex
+from page_budget import measure_page
+
+SAMPLE_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "Sample_Customer_HTML", "index.html")
+TOOLBAR = '<div class="toolbar glass" id="catalog">'
+
+
+def large_page(copies: int) -> str:
+    """The sample page with its catalog toolbar repeated, each copy with its own id"""
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        html = f.read()
+    start = html.index(TOOLBAR)
+    end = html.index("<!-- Product Grid -->")
+    toolbar = html[start:end]
+    copies_html = "".join(toolbar.replace('id="catalog"', f'id="catalog-{n}"').replace('id="q"', f'id="q-{n}"')
+                          for n in range(copies))
+    return html[:start] + copies_html + html[end:]
+
+
+def timed(function, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    original = large_page(copies)
+    edited = original.replace("Shop the collection", "Shop the new collection", 1).replace(
+        "</head>", "<style>\n.btn.primary { padding: 1.2rem 2rem; }\n</style>\n</head>", 1
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        def fresh() -> ElementIndex:
+            return ElementIndex(os.path.join(directory, f"{time.perf_counter_ns()}.db"))
+
+        full_ms = timed(lambda: fresh().index(original), iterations)
+        measure_ms = timed(lambda: measure_page(original), iterations)
+
+        store = ElementIndex(os.path.join(directory, "shared.db"))
+        before = store.index(original, "acme/shop/index.html")
+        cached_ms = timed(lambda: store.index(original), iterations * 20)
+        reopened_ms = timed(lambda: ElementIndex(store.path).index(original), iterations)
+
+        def incremental():
+            updater = fresh()
+            updater.index(original, "acme/shop/index.html")
+            start = time.perf_counter()
+            result = updater.index(edited, "acme/shop/index.html")
+            return result, (time.perf_counter() - start) * 1000
+
+        runs = [incremental() for _ in range(iterations)]
+        after = runs[-1][0]
+        incremental_ms = sum(ms for _, ms in runs) / len(runs)
+        full = fresh().index(edited)
+        changes = store.record_edit("acme/shop/index.html", before, store.index(edited), "Bigger primary CTA")
+
+    print(f"Page: {len(original):,} chars, {len(before.elements)} indexed elements, {iterations} iterations")
+    print(f"full index (first sight):  {full_ms:8.2f} ms/op   (measure_page alone: {measure_ms:.2f} ms)")
+    print(f"unchanged page, in memory: {cached_ms:8.2f} ms/op")
+    print(f"unchanged page, from disk: {reopened_ms:8.2f} ms/op")
+    print(f"edited page, incremental:  {incremental_ms:8.2f} ms/op   ({after.parse}, "
+          f"{after.parsed_chars:,} chars parsed)")
+    print(f"edit touched: {', '.join(f'{c.change} {c.kind} {c.selector}' for c in changes)}")
+
+    same = ([asdict(element) for element in after.elements] == [asdict(element) for element in full.elements]
+            and after.metrics == full.metrics)
+    if after.parse != "incremental" or not same:
+        print("❌ Incremental index differs from a full parse of the edited page")
+        sys.exit(1)
+    print("✅ Incremental index matches a full parse")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench_event_collector.py
+#
+# Measures event collector throughput: beacon parsing, durable (fsync'd)
+# batch appends at several batch sizes, and scanning the log back:
+#   python benchmarks/bench_event_collector.py [events]
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from event_collector import EventLog, events_to_csv, parse_beacon
+
+EVENT_NAMES = ["page_view", "scroll", "click", "add_to_cart", "purchase"]
+
+
+def make_beacons(total, per_beacon=10):
+    rng = random.Random(7)
+    beacons = []
+    for _ in range(total // per_beacon):
+        visitor = f"{rng.getrandbits(64):016x}"
+        page = rng.choice(["/", "/index.html", "/pricing.html"])
+        events = []
+        for _ in range(per_beacon):
+            name = rng.choice(EVENT_NAMES)
+            events.append({"event": name, "visitor": visitor, "page": page,
+                           "revenue": round(rng.uniform(5, 200), 2) if name == "purchase" else 0})
+        beacons.append(json.dumps(events).encode("utf-8"))
+    return beacons
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    beacons = make_beacons(total)
+
+    start = time.perf_counter()
+    events = []
+    for body in beacons:
+        events.extend(parse_beacon(body, int(time.time() * 1000)))
+    elapsed = time.perf_counter() - start
+    print(f"parse_beacon:  {len(events) / elapsed:>12,.0f} events/s")
+
+    for batch_size in (100, 1000, 5000):
+        directory = tempfile.mkdtemp(prefix="events-bench-")
+        try:
+            log = EventLog(directory, segment_bytes=4 * 1024 * 1024)
+            start = time.perf_counter()
+            for position in range(0, len(events), batch_size):
+                log.append(events[position:position + batch_size])
+            elapsed = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            print(f"append batch={batch_size:<5} {len(events) / elapsed:>12,.0f} events/s "
+                  f"(fsync per batch, {size / len(events):.1f} bytes/event, {len(log.segments())} segments)")
+
+            start = time.perf_counter()
+            scanned = sum(len(batch["event"]) for _, batch in log.scan())
+            elapsed = time.perf_counter() - start
+            print(f"  scan:        {scanned / elapsed:>12,.0f} events/s")
+            log.close()
+        finally:
+            shutil.rmtree(directory)
+
+    directory = tempfile.mkdtemp(prefix="events-bench-")
+    try:
+        log = EventLog(directory)
+        log.append(events)
+        start = time.perf_counter()
+        csv_content = events_to_csv(log)
+        print(f"events_to_csv: {len(events) / (time.perf_counter() - start):>12,.0f} events/s")
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+    print()
+    print(csv_content)
+
+
+if __name__ == "__main__":
+    main()
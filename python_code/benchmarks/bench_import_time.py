@@ -0,0 +1,98 @@
+# bench_import_time.py
+#
+# Cold-start cost of the enhancer core, and which integrations an upload-only
+# run loads (it must never import GitPython):
+#   python benchmarks/bench_import_time.py [runs]
+#
+# Exits with status 1 when the core or an upload-only run imports git.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CORE = "Claude_Morph_Edit_HTML_GH_or_Upload"
+INTEGRATIONS = ("anthropic", "openai", "requests", "git")
+
+# An upload-only run with stand-in providers registered through the plugin
+# registry, so it can run offline; the real providers would import their SDKs
+UPLOAD_RUN = f"""
+import json, sys
+import plugins
+
+class CannedAnalyzer:
+    def __init__(self, api_key):
+        pass
+    def complete(self, prompt):
+        return "INSTRUCTION: Make the call to action bigger\\nCODE_EDIT:\\n```\\n.btn {{ padding: 20px; }}\\n```"
+
+class EchoMerger:
+    def __init__(self, api_key):
+        pass
+    def merge(self, instructions, original_html, code_edit):
+        return original_html.replace("</head>", "<style>" + code_edit + "</style></head>")
+
+plugins.register("analyzer", "canned", CannedAnalyzer)
+plugins.register("merger", "echo", EchoMerger)
+
+from {CORE} import HTMLEnhancer
+
+enhancer = HTMLEnhancer("unused", "unused", analyzer="canned", merger="echo")
+html = open(sys.argv[1], encoding="utf-8").read()
+enhancer.process_content("Event name,Event count\\nclick,10\\n", html)
+print(json.dumps([name for name in {INTEGRATIONS!r} if name in sys.modules]), file=sys.stderr)
+"""
+
+
+def python(code: str, *args: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code, *args]
+    return subprocess.run(command, cwd=CODE_DIR, capture_output=True, text=True)
+
+
+def import_ms(module: str, runs: int) -> float:
+    """Median cumulative import time of a module in a fresh interpreter"""
+    samples = []
+    for _ in range(runs):
+        result = python(f"import {module}", importtime=True)
+        if result.returncode != 0:
+            return float("nan")
+        for line in result.stderr.splitlines():
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                samples.append(int(fields[1]) / 1000)
+    return statistics.median(samples) if samples else float("nan")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    python(f"import {CORE}")  # write the bytecode caches first
+
+    print(f"Cold import, median of {runs} fresh interpreters:")
+    print(f"  {CORE:<40} {import_ms(CORE, runs):7.1f} ms")
+    for name in INTEGRATIONS:
+        elapsed = import_ms(name, runs)
+        shown = "not installed" if elapsed != elapsed else f"{elapsed:7.1f} ms  (deferred until first use)"
+        print(f"  {name:<40} {shown}")
+
+    core_loads = python(f"import sys, json, {CORE}; print(json.dumps([n for n in {INTEGRATIONS!r} if n in sys.modules]))")
+    loaded_by_core = json.loads(core_loads.stdout or "[]")
+    sample = os.path.join(CODE_DIR, "..", "Sample_Customer_HTML", "index.html")
+    upload = python(UPLOAD_RUN, sample)
+    if upload.returncode != 0:
+        print(upload.stderr)
+        sys.exit(1)
+    loaded_by_upload = json.loads(upload.stderr.strip().splitlines()[-1])
+
+    print()
+    print(f"Integrations loaded by importing the core: {loaded_by_core or 'none'}")
+    print(f"Integrations loaded by an upload-only run:  {loaded_by_upload or 'none'}")
+    if "git" in loaded_by_core or "git" in loaded_by_upload:
+        print("❌ GitPython was imported outside the GitHub workflow")
+        sys.exit(1)
+    print("✅ GitPython is only loaded by the GitHub publisher")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# bench_job_queue.py
+#
+# Measures job queue throughput as worker processes are added. Each job
+# sleeps for a fixed time, standing in for a provider call; a second run
+# with empty jobs shows the queue's own ceiling:
+#   python benchmarks/bench_job_queue.py [job_seconds]
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from job_queue import JobQueue, Worker
+
+
+def _work(job):
+    time.sleep(job.payload["seconds"])
+    return job.id
+
+
+def _worker(db_path):
+    Worker(JobQueue(db_path), {"work": _work}, poll_interval=0.01).run(exit_when_idle=True)
+
+
+def run(processes, jobs, seconds):
+    directory = tempfile.mkdtemp(prefix="jobs-bench-")
+    try:
+        db_path = os.path.join(directory, "jobs.db")
+        queue = JobQueue(db_path)
+        for index in range(jobs):
+            queue.enqueue("work", {"seconds": seconds}, idempotency_key=f"bench-{index}")
+
+        start = time.perf_counter()
+        workers = [multiprocessing.Process(target=_worker, args=(db_path,)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        counts = queue.counts()
+        queue.close()
+        return counts["done"] / elapsed, counts
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+    baseline = None
+    print(f"Jobs of {seconds * 1000:.0f} ms each:")
+    for processes in (1, 2, 4, 8, 16):
+        jobs = 40 * processes
+        rate, counts = run(processes, jobs, seconds)
+        baseline = baseline or rate
+        print(f"  {processes:>2} workers: {rate:7.1f} jobs/s  (x{rate / baseline:.1f}, {counts['done']}/{jobs} done)")
+
+    print("Empty jobs (queue overhead only):")
+    for processes in (1, 4):
+        rate, _ = run(processes, 2000, 0.0)
+        print(f"  {processes:>2} workers: {rate:7.0f} jobs/s")
+
+
+if __name__ == "__main__":
+    main()
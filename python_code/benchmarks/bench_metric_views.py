@@ -0,0 +1,63 @@
+# bench_metric_views.py
+#
+# Measures incremental metric views: events/s folded in, and window query
+# latency as the history grows (it should stay flat):
+#   python benchmarks/bench_metric_views.py [events_per_day]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from metric_views import MetricViews
+
+DAY_MS = 86400 * 1000
+EVENT_NAMES = ["page_view", "scroll", "click", "add_to_cart", "purchase"]
+
+
+def day_batch(rng, day, events_per_day, start_ms):
+    columns = {"ts_ms": [], "event": [], "visitor": [], "page": [], "revenue": []}
+    for i in range(events_per_day):
+        name = rng.choice(EVENT_NAMES)
+        columns["ts_ms"].append(start_ms + day * DAY_MS + i * DAY_MS // events_per_day)
+        columns["event"].append(name)
+        columns["visitor"].append(f"{rng.getrandbits(40):010x}")
+        columns["page"].append("/index.html")
+        columns["revenue"].append(round(rng.uniform(5, 200), 2) if name == "purchase" else 0.0)
+    return columns
+
+
+def main():
+    events_per_day = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(3)
+    start_ms = 1_750_000_000_000 // DAY_MS * DAY_MS
+    views = MetricViews(experiments={"/index.html": ("/index.html", 0.5)})
+
+    day = 0
+    apply_seconds = 0.0
+    for history_days in (30, 180, 720):
+        while day < history_days:
+            batch = day_batch(rng, day, events_per_day, start_ms)
+            start = time.perf_counter()
+            views.apply_batch(batch)
+            apply_seconds += time.perf_counter() - start
+            day += 1
+
+        queries = 200
+        start = time.perf_counter()
+        for _ in range(queries):
+            first = rng.randrange(history_days)
+            last = rng.randrange(first, history_days)
+            views.rows("/index.html", "enhanced", start_ms + first * DAY_MS, start_ms + (last + 1) * DAY_MS)
+        query_ms = (time.perf_counter() - start) * 1000 / queries
+        print(f"{history_days:>4} days of history: window query {query_ms:.2f} ms "
+              f"(random windows, 5 event keys), apply {views.events_applied / apply_seconds:,.0f} events/s")
+
+    print()
+    print(views.to_csv("/index.html", "enhanced", since_ms=start_ms + (day - 7) * DAY_MS))
+
+
+if __name__ == "__main__":
+    main()
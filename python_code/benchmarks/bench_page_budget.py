@@ -0,0 +1,47 @@
+# bench_page_budget.py
+#
+# Times the page budget gate on the sample customer page:
+#   python benchmarks/bench_page_budget.py [iterations]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from page_budget import check_page_budget, measure_page
+
+SAMPLE_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "Sample_Customer_HTML", "index.html")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        original = f.read()
+
+    # A typical fallback merge: one more <style> block in <head>, plus a heavier hero
+    enhanced = original.replace(
+        "</head>", "<style>\n.btn.primary { padding: 1.2rem 2rem; font-size: 1.25rem; }\n</style>\n</head>", 1
+    ).replace('<div class="cta">', '<div class="cta"><div><div><img src="badge.png" alt="">', 1)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        measure_page(original)
+    measure_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        report = check_page_budget(original, enhanced)
+    check_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    print(f"Sample page: {len(original.encode('utf-8'))} bytes, {iterations} iterations")
+    print(f"measure_page:      {measure_ms:.2f} ms/op")
+    print(f"check_page_budget: {check_ms:.2f} ms/op (parses both documents)")
+    print()
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_process_pool.py
+#
+# Throughput of the CPU-bound HTML stages (style compaction, optimization,
+# before/after measurement) for a batch of pages enhanced on parallel
+# threads: threads alone (the GIL serializes them) against a StagePool of
+# 1 to N worker processes:
+#   python benchmarks/bench_process_pool.py [pages] [workers...]
+#
+# Workers default to 1, 2, 4, ... up to the CPU count. Exits with status 1
+# when a pool's output differs from the in-process stages.
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from css_compactor import compact_html_styles
+from page_budget import measure_page
+from page_optimizer import PageOptimizer
+from process_pool import StagePool
+
+SAMPLE_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "Sample_Customer_HTML", "index.html")
+GRID = '<section class="grid" id="grid" aria-live="polite"></section>'
+
+
+def page(n: int) -> str:
+    """The sample page with a rendered product grid and an extra <style> block, about 100 KB"""
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        html = f.read()
+    cards = "".join(f'<article class="card glass" data-id="{k}"><img src="img/{k}.jpg" alt="Product {k}">'
+                    f'<h3>Product {k} of page {n}</h3><p>Hand-made, ships in 2 days.</p>'
+                    f'<a class="btn primary" href="/p/{k}">Buy</a></article>' for k in range(400))
+    style = "<style>\n.card { padding: 1rem; }\n.btn.primary { padding: 1.2rem 2rem; }\n</style>\n"
+    return html.replace(GRID, GRID.replace("</section>", cards + "</section>")).replace("</head>", style + "</head>", 1)
+
+
+def pipeline(html: str, optimizer: PageOptimizer, pool) -> tuple:
+    if pool is None:
+        compacted, _ = compact_html_styles(html)
+        optimized, _ = optimizer.optimize(compacted, "index.html")
+        metrics = [measure_page(html), measure_page(compacted)]
+    else:
+        compacted, _ = pool.compact_styles(html)
+        optimized, _ = pool.optimize(optimizer, compacted, "index.html")
+        metrics = pool.measure(html, compacted)
+    return optimized, metrics
+
+
+def timed(pages, threads: int, pool) -> tuple:
+    optimizer = PageOptimizer()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda html: pipeline(html, optimizer, pool), pages))
+    return time.perf_counter() - start, results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    cpus = os.cpu_count() or 1
+    workers = [int(n) for n in sys.argv[2:]] or sorted({1 << k for k in range(cpus.bit_length()) if 1 << k <= cpus} | {cpus})
+    pages = [page(n) for n in range(count)]
+    print(f"{count} pages of {len(pages[0]) / 1024:.0f} KB, {cpus} CPU(s)")
+
+    baseline, expected = timed(pages, max(workers), None)
+    print(f"threads only ({max(workers)} threads): {baseline:6.2f}s  {count / baseline:6.1f} pages/s")
+
+    failed = False
+    single = None
+    for n in workers:
+        with StagePool(n) as pool:
+            pool.warm()
+            elapsed, results = timed(pages, n, pool)
+        single = single or elapsed
+        print(f"{n:3d} worker(s):             {elapsed:6.2f}s  {count / elapsed:6.1f} pages/s  "
+              f"x{single / elapsed:.2f} vs 1 worker")
+        if results != expected:
+            print(f"❌ {n} worker(s): results differ from the in-process stages")
+            failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ Same results in and out of process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_stream_rewriter.py
+#
+# Peak memory of adding a <style> block to pages of growing size (the sample
+# page plus a large inline data-URI image): the in-memory path (read the
+# file, fallback_merge, write) against the streamed one (fallback_merge_file).
+# Each run is a fresh interpreter; peak RSS (Linux /proc) is reported above
+# the interpreter's own baseline, with the Python heap peak from tracemalloc:
+#   python benchmarks/bench_stream_rewriter.py [sizes in MB...]
+#
+# Exits with status 1 when the outputs differ or streaming memory grows with
+# the page.
+
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SAMPLE_HTML = os.path.join(CODE_DIR, "..", "Sample_Customer_HTML", "index.html")
+CSS = ".btn.primary { padding: 1.2rem 2rem; }"
+
+RUN = """
+import json, sys, time, tracemalloc
+from stream_rewriter import fallback_merge, fallback_merge_file
+
+def status(name):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(name))
+
+mode, source, output, css = sys.argv[1:5]
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")  # restart the peak (VmHWM) from here
+baseline = status("VmRSS")
+tracemalloc.start()
+start = time.perf_counter()
+if mode == "memory":
+    with open(source, "r", encoding="utf-8") as f:
+        html = f.read()
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(fallback_merge(html, css))
+else:
+    fallback_merge_file(source, output, css)
+elapsed = time.perf_counter() - start
+heap = tracemalloc.get_traced_memory()[1]
+rss = status("VmHWM") - baseline
+print(json.dumps({"ms": elapsed * 1000, "heap_mb": heap / 2**20, "rss_mb": rss / 1024}))
+"""
+
+
+def write_page(path: str, megabytes: float) -> None:
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        sample = f.read()
+    payload = base64.b64encode(os.urandom(int(megabytes * 2**20 * 3 / 4))).decode()
+    image = f'<img alt="inline" src="data:image/png;base64,{payload}">'
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sample.replace("</main>", image + "\n</main>", 1))
+
+
+def measure(mode: str, source: str, output: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", RUN, mode, source, output, CSS],
+                            cwd=CODE_DIR, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main():
+    sizes = [float(size) for size in sys.argv[1:]] or [4, 16, 64]
+    failed = False
+    streamed_rss = []
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'page':>8}  {'path':<9} {'time':>9}  {'peak RSS':>10}  {'heap peak':>10}")
+        for size in sizes:
+            source = os.path.join(directory, "page.html")
+            write_page(source, size)
+            outputs = {}
+            for mode in ("memory", "streamed"):
+                outputs[mode] = os.path.join(directory, f"{mode}.html")
+                stats = measure(mode, source, outputs[mode])
+                if mode == "streamed":
+                    streamed_rss.append(stats["rss_mb"])
+                print(f"{size:6.0f}MB  {mode:<9} {stats['ms']:7.1f}ms  {stats['rss_mb']:8.1f}MB  "
+                      f"{stats['heap_mb']:8.2f}MB")
+            with open(outputs["memory"], "rb") as f, open(outputs["streamed"], "rb") as g:
+                if f.read() != g.read():
+                    print(f"❌ {size:.0f}MB: streamed output differs from the in-memory one")
+                    failed = True
+
+    if max(streamed_rss) - min(streamed_rss) > 8:
+        print("❌ Streaming peak memory grows with the page size")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✅ Same output; streaming memory stays flat")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench_template_clusters.py
+#
+# Template clustering of a generated site: pages built from the sample page
+# in three templates (product listing, article, landing) with their own text,
+# card counts and article bodies. Reports the fingerprinting cost and the
+# analysis calls of an enhancement with stand-in providers, per page and per
+# template cluster:
+#   python benchmarks/bench_template_clusters.py [pages]
+#
+# Exits with status 1 when the pages don't fall into exactly three clusters.
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import plugins
+from template_clusters import cluster_pages, enhance_clusters
+
+SAMPLE_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "Sample_Customer_HTML", "index.html")
+GRID = '<section class="grid" id="grid" aria-live="polite"></section>'
+WORDS = "fresh bold simple quiet bright modern classic warm clear smart".split()
+
+calls = {"analyze": 0, "merge": 0}
+
+
+class CountingAnalyzer:
+    def __init__(self, api_key):
+        pass
+
+    def complete(self, prompt):
+        calls["analyze"] += 1
+        return "INSTRUCTION: Make the call to action bigger\nCODE_EDIT:\n```\n.btn { padding: 20px; }\n```"
+
+
+class CountingMerger:
+    def __init__(self, api_key):
+        pass
+
+    def merge(self, instructions, original_html, code_edit):
+        calls["merge"] += 1
+        return original_html.replace("</head>", "<style>" + code_edit + "</style></head>", 1)
+
+
+def sentence(rng: random.Random, words: int = 8) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def article_body(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(3, 12)):
+        kind = rng.choice(("p", "p", "h2", "ul", "img", "blockquote"))
+        if kind == "ul":
+            parts.append("<ul>" + "".join(f"<li>{sentence(rng, 3)}</li>" for _ in range(rng.randint(2, 5))) + "</ul>")
+        elif kind == "img":
+            parts.append(f'<figure><img src="img/{rng.randint(1, 99)}.jpg" alt="{sentence(rng, 2)}"></figure>')
+        else:
+            parts.append(f"<{kind}>{sentence(rng, rng.randint(4, 30))}</{kind}>")
+    return '<section class="post-body">' + "\n".join(parts) + "</section>"
+
+
+def generate_site(pages: int, seed: int = 7) -> dict:
+    """Page name -> HTML, a third of the pages in each template"""
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        sample = f.read()
+    rng = random.Random(seed)
+    site = {}
+    for n in range(pages):
+        html = sample.replace("Shop the collection", sentence(rng, 4))
+        template = n % 3
+        if template == 0:
+            cards = "".join(f'<article class="card glass" data-id="{k}"><h3>{sentence(rng, 2)}</h3>'
+                            f'<p>{sentence(rng)}</p><a class="btn primary" href="#p{k}">Buy</a></article>'
+                            for k in range(rng.randint(1, 24)))
+            site[f"products/list-{n}.html"] = html.replace(GRID, GRID.replace("</section>", cards + "</section>"))
+        elif template == 1:
+            site[f"blog/post-{n}.html"] = html.replace(GRID, article_body(rng))
+        else:
+            site[f"landing/offer-{n}.html"] = html
+    return site
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    site = generate_site(pages)
+    size = sum(len(html) for html in site.values())
+
+    start = time.perf_counter()
+    clusters = cluster_pages(site)
+    cluster_ms = (time.perf_counter() - start) * 1000
+
+    plugins.register("analyzer", "counting", CountingAnalyzer)
+    plugins.register("merger", "counting", CountingMerger)
+    from Claude_Morph_Edit_HTML_GH_or_Upload import HTMLEnhancer
+
+    enhancer = HTMLEnhancer("unused", "unused", analyzer="counting", merger="counting")
+    csv_for = {page: f"Event name,Event count\nclick,{index + 1}\n" for index, page in enumerate(site)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        edits = enhance_clusters(enhancer, site, csv_for, clusters)
+    enhanced = sum(len(edit.pages) for edit in edits)
+
+    print(f"Site: {len(site)} pages, {size / 1e6:.1f} MB")
+    print(f"clustering:  {cluster_ms:8.1f} ms  ({cluster_ms / len(site):.2f} ms/page, "
+          f"{size / 1e6 / (cluster_ms / 1000):.1f} MB/s)")
+    for cluster in clusters:
+        print(f"  {cluster.fingerprint}  {len(cluster.pages):4d} page(s)  e.g. {cluster.representative}")
+    print(f"analysis calls: {calls['analyze']} (one per page would be {len(site)}); "
+          f"merge calls: {calls['merge']}; pages enhanced: {enhanced}")
+
+    if len(clusters) != 3 or calls["analyze"] != 3:
+        print("❌ Expected the three templates to give three clusters and three analyses")
+        sys.exit(1)
+    print("✅ One analysis per template")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# load_test_variant_server.py
+#
+# Load-tests the variant server with keep-alive visitors and reports throughput
+# and latency percentiles:
+#   python benchmarks/load_test_variant_server.py [--connections 50] [--duration 10]
+#
+# Without --url, a server with the sample page as both variants is started in a
+# separate process (one core), so the client does not compete with it.
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SAMPLE_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                           "Sample_Customer_HTML", "index.html")
+
+
+def _run_server(port: int) -> None:
+    from async_http import install_fast_event_loop
+    from variant_server import VariantServer
+
+    with open(SAMPLE_HTML, "r", encoding="utf-8") as f:
+        original = f.read()
+    enhanced = original.replace("</head>", "<style>.cta { padding: 2rem; }</style>\n</head>", 1)
+    server = VariantServer()
+    server.add_page("/index.html", original, enhanced)
+    install_fast_event_loop()
+    asyncio.run(server.serve("127.0.0.1", port))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _visitor(host, port, path, accept_encoding, deadline, latencies, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    cookie = ""
+    try:
+        while time.perf_counter() < deadline:
+            request = (f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: {accept_encoding}\r\n"
+                       f"{cookie}\r\n").encode("latin-1")
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                name = name.lower()
+                if name == b"content-length":
+                    length = int(value)
+                elif name == b"set-cookie":
+                    cookie = "Cookie: " + value.split(b";")[0].strip().decode("latin-1") + "\r\n"
+                elif name == b"x-variant":
+                    variant = value.strip().decode("latin-1")
+                    counts[variant] = counts.get(variant, 0) + 1
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            counts["bytes"] = counts.get("bytes", 0) + len(head) + length
+    finally:
+        writer.close()
+
+
+async def _load(host, port, path, connections, duration, accept_encoding):
+    latencies, counts = [], {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _visitor(host, port, path, accept_encoding, deadline, latencies, counts)
+        for _ in range(connections)
+    ))
+    return latencies, counts, time.perf_counter() - start
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the variant server")
+    parser.add_argument("--url", help="Existing server URL (default: start one on the sample page)")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--accept-encoding", default="gzip, br")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, path = parts.hostname, parts.port or 80, parts.path or "/"
+    else:
+        host, port, path = "127.0.0.1", _free_port(), "/index.html"
+        server = multiprocessing.Process(target=_run_server, args=(port,), daemon=True)
+        server.start()
+        for _ in range(100):
+            try:
+                socket.create_connection((host, port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+    try:
+        latencies, counts, elapsed = asyncio.run(
+            _load(host, port, path, args.connections, args.duration, args.accept_encoding)
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    print(f"{len(latencies)} requests over {args.connections} keep-alive connections in {elapsed:.1f}s")
+    print(f"Throughput: {len(latencies) / elapsed:,.0f} req/s, "
+          f"{counts.get('bytes', 0) / elapsed / 1e6:.1f} MB/s")
+    print(f"Latency: p50 {_percentile(ms, 0.50):.2f} ms, p90 {_percentile(ms, 0.90):.2f} ms, "
+          f"p99 {_percentile(ms, 0.99):.2f} ms, p99.9 {_percentile(ms, 0.999):.2f} ms, max {ms[-1]:.2f} ms")
+    print(f"Variants: original {counts.get('original', 0)}, enhanced {counts.get('enhanced', 0)}")
+
+
+if __name__ == "__main__":
+    main()
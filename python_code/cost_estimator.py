@@ -0,0 +1,526 @@
+# cost_estimator.py
+#
+# Pre-flight estimate of a run's tokens, cost and latency, before any LLM call:
+#   python cost_estimator.py metrics.csv index.html [--max-run-usd 0.25]
+#
+# AdmissionController turns the estimate into a decision against per-run and
+# per-tenant budgets: admit, downscale (summarize/window the CSV, shrink the
+# page excerpt sent for analysis), queue until the tenant's budget frees up,
+# or reject. batch_cli.py --dry-run prints the estimate for a whole manifest.
+
+import argparse
+import csv
+import functools
+import io
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Claude_Morph_Edit_HTML_GH_or_Upload import ANALYSIS_HTML_CHARS, build_analysis_prompt
+
+# Defaults of llm_providers.py (not imported here: it loads the SDKs)
+DEFAULT_ANALYZER_MODEL = "claude-3-5-sonnet-20241022"
+DEFAULT_MERGER_MODEL = "morph-v3-large"
+ANALYSIS_MAX_TOKENS = 1500
+
+# Average characters per token of markup, for pages whose size is known but
+# whose content isn't (a github page in a dry run)
+HTML_CHARS_PER_TOKEN = 3.2
+
+# Tags wrapped around the merge request (llm_providers.MorphMerger)
+MERGE_WRAPPER_TOKENS = 16
+
+ADMIT, DOWNSCALE, QUEUE, REJECT = "admit", "downscale", "queue", "reject"
+
+
+# --- tokenizer ---------------------------------------------------------------
+
+# A local stand-in for the providers' BPE tokenizers: common words are one
+# token (with their leading space), long words one per ~6 letters, digits one
+# per 3, whitespace runs one, punctuation one per 3 characters and non-ASCII
+# one per character. Counts are approximate, so CostEstimator pads them with
+# a safety margin; pass a real tokenizer as CostEstimator(count=...) if one
+# is installed.
+_WORDS = re.compile(r"[A-Za-z]+")
+_DIGITS = re.compile(r"[0-9]+")
+_SPACES = re.compile(r"\s+")
+_LONG_SPACES = re.compile(r"\s{16,}")
+_SPACE_BEFORE_WORD = re.compile(r"(?<!\s) (?=[A-Za-z])")
+_PUNCTUATION = re.compile(r"[!-/:-@\[-`{-~]+")
+_WIDE = re.compile(r"[^\x00-\x7f]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count of text, without a provider tokenizer or network call"""
+    return (sum((len(word) + 5) // 6 for word in _WORDS.findall(text))
+            + sum((len(digits) + 2) // 3 for digits in _DIGITS.findall(text))
+            + len(_SPACES.findall(text)) - len(_SPACE_BEFORE_WORD.findall(text))
+            + sum(len(spaces) // 16 for spaces in _LONG_SPACES.findall(text))
+            + sum((len(run) + 2) // 3 for run in _PUNCTUATION.findall(text))
+            + len(_WIDE.findall(text)))
+
+
+# --- estimates ---------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ModelProfile:
+    """List prices and typical speed of a model"""
+    input_per_mtok: float  # USD per million input tokens
+    output_per_mtok: float  # USD per million output tokens
+    output_tokens_per_second: float
+    first_token_seconds: float
+    input_tokens_per_second: float = 20000.0
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_per_mtok + output_tokens * self.output_per_mtok) / 1_000_000
+
+    def seconds(self, input_tokens: int, output_tokens: int) -> float:
+        return (self.first_token_seconds + input_tokens / self.input_tokens_per_second
+                + output_tokens / self.output_tokens_per_second)
+
+
+# Override or extend through CostEstimator(profiles=...) when prices change
+MODEL_PROFILES: Dict[str, ModelProfile] = {
+    "claude-3-5-sonnet-20241022": ModelProfile(3.0, 15.0, 60.0, 1.0),
+    "claude-3-5-haiku-20241022": ModelProfile(0.8, 4.0, 120.0, 0.6),
+    "morph-v3-large": ModelProfile(0.9, 1.9, 2500.0, 0.4),
+    "morph-v3-fast": ModelProfile(0.8, 1.2, 4500.0, 0.3),
+}
+
+
+@dataclass
+class StageEstimate:
+    """Predicted size, cost and duration of one LLM call"""
+    stage: str
+    model: str
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+    seconds: float
+
+
+@dataclass
+class RunEstimate:
+    """Predicted analyze + merge calls of one run; output tokens are upper bounds"""
+    stages: List[StageEstimate]
+    csv_tokens: int
+    html_tokens: int
+    html_chars: int  # characters of the page sent for analysis
+    assumed_html: bool = False  # html_tokens comes from an assumed page size
+
+    @property
+    def tokens(self) -> int:
+        return sum(stage.input_tokens + stage.output_tokens for stage in self.stages)
+
+    @property
+    def cost_usd(self) -> float:
+        return sum(stage.cost_usd for stage in self.stages)
+
+    @property
+    def seconds(self) -> float:
+        return sum(stage.seconds for stage in self.stages)
+
+    def stage(self, name: str) -> StageEstimate:
+        return next(stage for stage in self.stages if stage.stage == name)
+
+    def summary(self) -> str:
+        stages = "; ".join(f"{stage.stage} {stage.input_tokens:,} in / {stage.output_tokens:,} out"
+                           for stage in self.stages)
+        assumed = ", assumed page size" if self.assumed_html else ""
+        return f"~{self.tokens:,} tokens, ${self.cost_usd:.3f}, ~{self.seconds:.0f}s ({stages}{assumed})"
+
+    def to_dict(self) -> Dict:
+        document = asdict(self)
+        document.update(tokens=self.tokens, cost_usd=round(self.cost_usd, 5), seconds=round(self.seconds, 1))
+        for stage in document["stages"]:
+            stage["cost_usd"] = round(stage["cost_usd"], 5)
+            stage["seconds"] = round(stage["seconds"], 1)
+        return document
+
+
+class CostEstimator:
+    """
+    Predicts the analyze and merge calls of a run from its inputs
+
+    analyze sends the analysis prompt (CSV plus the first html_chars of the
+    page) and returns at most analysis_max_tokens. merge sends the whole page
+    plus the analyzer's instruction and edit, and gets the whole page back.
+    Counted input tokens are scaled by safety_margin to cover the tokenizer's
+    error; output bounds are not.
+    """
+
+    def __init__(self,
+                 analyzer_model: str = DEFAULT_ANALYZER_MODEL,
+                 merger_model: str = DEFAULT_MERGER_MODEL,
+                 analysis_max_tokens: int = ANALYSIS_MAX_TOKENS,
+                 safety_margin: float = 1.15,
+                 count: Callable[[str], int] = count_tokens,
+                 profiles: Optional[Dict[str, ModelProfile]] = None):
+        self.profiles = dict(MODEL_PROFILES, **(profiles or {}))
+        for model in (analyzer_model, merger_model):
+            if model not in self.profiles:
+                raise KeyError(f"No price profile for {model!r}; pass one in profiles")
+        self.analyzer_model = analyzer_model
+        self.merger_model = merger_model
+        self.analysis_max_tokens = analysis_max_tokens
+        self.safety_margin = safety_margin
+        # Downscaling re-estimates the same inputs; remember the last few counts
+        self.count = functools.lru_cache(maxsize=16)(count)
+        self.prompt_tokens = count(build_analysis_prompt("", ""))
+
+    def _margin(self, tokens: int) -> int:
+        return math.ceil(tokens * self.safety_margin)
+
+    def _stage(self, stage: str, model: str, input_tokens: int, output_tokens: int) -> StageEstimate:
+        profile = self.profiles[model]
+        return StageEstimate(stage, model, input_tokens, output_tokens,
+                             profile.cost(input_tokens, output_tokens), profile.seconds(input_tokens, output_tokens))
+
+    def estimate(self,
+                 csv_content: str,
+                 html_content: Optional[str] = None,
+                 html_chars: int = ANALYSIS_HTML_CHARS,
+                 html_size: Optional[int] = None) -> RunEstimate:
+        """
+        Estimate a run
+
+        Args:
+            csv_content: Engagement data as it will be sent
+            html_content: The page; when it isn't at hand, give html_size instead
+            html_chars: Characters of the page included in the analysis prompt
+            html_size: Assumed page size in characters, used without html_content
+        """
+        csv_tokens = self._margin(self.count(csv_content))
+        if html_content is not None:
+            html_tokens = self._margin(self.count(html_content))
+            if len(html_content) <= html_chars:
+                window_tokens = html_tokens
+            else:
+                window_tokens = self._margin(self.count(html_content[:html_chars]))
+        elif html_size is not None:
+            html_tokens = self._margin(math.ceil(html_size / HTML_CHARS_PER_TOKEN))
+            window_tokens = self._margin(math.ceil(min(html_size, html_chars) / HTML_CHARS_PER_TOKEN))
+        else:
+            raise ValueError("estimate() needs html_content or html_size")
+
+        analysis = self._stage("analyze", self.analyzer_model,
+                               self.prompt_tokens + csv_tokens + window_tokens, self.analysis_max_tokens)
+        # The instruction and edit fed to the merge are the analyzer's output
+        merge = self._stage("merge", self.merger_model,
+                            MERGE_WRAPPER_TOKENS + html_tokens + self.analysis_max_tokens,
+                            html_tokens + self.analysis_max_tokens)
+        return RunEstimate([analysis, merge], csv_tokens, html_tokens, html_chars, html_content is None)
+
+
+# --- downscaling -------------------------------------------------------------
+
+def summarize_event_csv(csv_content: str) -> Optional[str]:
+    """
+    A GA-style event table reduced to one row per event name (rows of the same
+    event, e.g. one per day, are added up) with its count, users and revenue,
+    busiest events first; None when the CSV isn't one or is already as small
+    """
+    lines = [line for line in csv_content.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    reader = csv.DictReader(io.StringIO("\n".join(lines)))
+    if "Event name" not in (reader.fieldnames or []):
+        return None
+    columns = ("Event count", "Total users", "Total revenue")
+    totals: Dict[str, List[float]] = {}
+    for record in reader:
+        name = (record.get("Event name") or "").strip()
+        if not name:
+            continue
+        row = totals.setdefault(name, [0.0] * len(columns))
+        for index, column in enumerate(columns):
+            try:
+                row[index] += float((record.get(column) or "0").replace(",", ""))
+            except ValueError:
+                pass
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["Event name", *columns])
+    for name, row in sorted(totals.items(), key=lambda item: -item[1][0]):
+        writer.writerow([name] + [f"{value:g}" for value in row])
+    summary = out.getvalue()
+    return summary if totals and len(summary) < len(csv_content) else None
+
+
+def window_csv(csv_content: str, max_tokens: int, count: Callable[[str], int] = count_tokens) -> str:
+    """
+    The first rows of a CSV that fit in max_tokens; the header row is always
+    kept and a closing comment line says how many rows were left out
+    """
+    lines = [line for line in csv_content.splitlines() if line.strip()]
+    kept: List[str] = []
+    used = 0
+    header_seen = False
+    for index, line in enumerate(lines):
+        is_header = not header_seen and not line.lstrip().startswith("#")
+        header_seen = header_seen or is_header
+        tokens = count(line) + 1
+        if used + tokens > max_tokens and not is_header:
+            dropped = sum(1 for rest in lines[index:] if not rest.lstrip().startswith("#"))
+            kept.append(f"# {dropped:,} more rows not shown")
+            break
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept) + "\n"
+
+
+# --- admission ---------------------------------------------------------------
+
+@dataclass
+class Budget:
+    """Spending limits; None means unlimited"""
+    run_usd: Optional[float] = None
+    run_tokens: Optional[int] = None
+    tenant_usd: Optional[float] = None  # per tenant, over window_seconds
+    window_seconds: float = 86400.0
+    min_html_chars: int = 8000  # downscaling never sends less of the page than this
+    min_csv_tokens: int = 400  # ...or less of the CSV than this
+
+    @property
+    def run_usd_limit(self) -> Optional[float]:
+        limits = [limit for limit in (self.run_usd, self.tenant_usd) if limit is not None]
+        return min(limits) if limits else None
+
+    def run_overage(self, estimate: RunEstimate) -> Optional[str]:
+        """Why the estimate doesn't fit the per-run limits, or None when it does; no run may
+        cost more than its tenant's whole budget either"""
+        if self.run_usd is not None and estimate.cost_usd > self.run_usd:
+            return f"${estimate.cost_usd:.3f} > ${self.run_usd:.3f} per run"
+        if self.tenant_usd is not None and estimate.cost_usd > self.tenant_usd:
+            return f"${estimate.cost_usd:.3f} > the tenant's whole budget of ${self.tenant_usd:.3f}"
+        if self.run_tokens is not None and estimate.tokens > self.run_tokens:
+            return f"{estimate.tokens:,} > {self.run_tokens:,} tokens per run"
+        return None
+
+
+class SpendLedger:
+    """
+    Estimated spend per tenant, kept for keep_seconds; persisted to a JSON
+    file when a path is given, so budgets hold across batch runs
+    """
+
+    def __init__(self, path: Optional[str] = None, keep_seconds: float = 31 * 86400):
+        self.path = path
+        self.keep_seconds = keep_seconds
+        self._entries: Dict[str, List[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = {tenant: [tuple(entry) for entry in entries]
+                                 for tenant, entries in json.load(f).items()}
+
+    def spent(self, tenant: str, window_seconds: float, now: Optional[float] = None) -> float:
+        since = (now or time.time()) - window_seconds
+        with self._lock:
+            return sum(usd for at, usd in self._entries.get(tenant, []) if at > since)
+
+    def charge(self, tenant: str, usd: float, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        with self._lock:
+            entries = [entry for entry in self._entries.get(tenant, []) if entry[0] > now - self.keep_seconds]
+            entries.append((now, usd))
+            self._entries[tenant] = entries
+            if self.path:
+                temporary = f"{self.path}.tmp"
+                with open(temporary, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f)
+                os.replace(temporary, self.path)
+
+    def available_in(self, tenant: str, usd: float, limit: float, window_seconds: float,
+                     now: Optional[float] = None) -> float:
+        """Seconds until usd more fits under limit, as older spend leaves the window"""
+        now = now or time.time()
+        with self._lock:
+            entries = sorted(entry for entry in self._entries.get(tenant, []) if entry[0] > now - window_seconds)
+        spent = sum(amount for _, amount in entries)
+        if spent + usd <= limit:
+            return 0.0
+        for at, amount in entries:
+            spent -= amount
+            if spent + usd <= limit:
+                return max(0.0, at + window_seconds - now)
+        return math.inf
+
+    def copy(self) -> "SpendLedger":
+        """An in-memory copy, for dry runs that must not record spend"""
+        ledger = SpendLedger(keep_seconds=self.keep_seconds)
+        with self._lock:
+            ledger._entries = {tenant: list(entries) for tenant, entries in self._entries.items()}
+        return ledger
+
+
+@dataclass
+class Admission:
+    """The decision on one run, with the inputs to run it with"""
+    action: str  # ADMIT, DOWNSCALE, QUEUE or REJECT
+    estimate: RunEstimate
+    csv_content: str
+    html_chars: int
+    reason: str = ""
+    retry_after: float = 0.0  # QUEUE: seconds until the tenant's budget has room
+    requested: Optional[RunEstimate] = None  # DOWNSCALE: the estimate before downscaling
+
+    @property
+    def admitted(self) -> bool:
+        return self.action in (ADMIT, DOWNSCALE)
+
+    def summary(self) -> str:
+        if self.action == ADMIT:
+            return f"admitted: {self.estimate.summary()}"
+        if self.action == DOWNSCALE:
+            return (f"downscaled ({self.reason}): ${self.requested.cost_usd:.3f} → {self.estimate.summary()}")
+        if self.action == QUEUE:
+            return f"over budget ({self.reason}), can start in {self.retry_after / 60:.0f} min: {self.estimate.summary()}"
+        return f"rejected ({self.reason}): {self.estimate.summary()}"
+
+
+class AdmissionController:
+    """
+    Decides, from a run's estimate, whether it may start
+
+    Over the per-run budget, the analysis input is downscaled step by step:
+    the CSV is summarized to one row per event, the page excerpt is halved
+    down to min_html_chars, then the CSV is windowed down to min_csv_tokens.
+    A run that still doesn't fit is rejected (the merge always needs the whole
+    page). A run that fits but would take its tenant over the window budget
+    is queued until enough earlier spend leaves the window. Admitted runs are
+    charged to the ledger at their estimate.
+    """
+
+    def __init__(self, estimator: Optional[CostEstimator] = None,
+                 budget: Optional[Budget] = None,
+                 ledger: Optional[SpendLedger] = None):
+        self.estimator = estimator or CostEstimator()
+        self.budget = budget or Budget()
+        self.ledger = ledger or SpendLedger()
+        self._lock = threading.Lock()
+
+    def admit(self, tenant: str, csv_content: str, html_content: Optional[str] = None,
+              html_size: Optional[int] = None, html_chars: int = ANALYSIS_HTML_CHARS) -> Admission:
+        """
+        Decide on a run and, when it is admitted, charge its estimate to the tenant
+
+        Args:
+            tenant: Whose budget the run counts against
+            csv_content: Engagement data of the run
+            html_content: The page; or html_size, its assumed size in characters
+            html_chars: Characters of the page the run would send for analysis
+        """
+        estimate = self.estimator.estimate(csv_content, html_content, html_chars, html_size)
+        admission = Admission(ADMIT, estimate, csv_content, html_chars)
+        overage = self.budget.run_overage(estimate)
+        if overage:
+            admission = self._downscale(csv_content, html_content, html_size, estimate)
+            if admission.action == REJECT:
+                return admission
+
+        cost = admission.estimate.cost_usd
+        limit = self.budget.tenant_usd
+        with self._lock:
+            if limit is not None:
+                window = self.budget.window_seconds
+                spent = self.ledger.spent(tenant, window)
+                if spent + cost > limit:
+                    admission.action = QUEUE
+                    admission.reason = f"{tenant} spent ${spent:.2f} of ${limit:.2f}"
+                    admission.retry_after = self.ledger.available_in(tenant, cost, limit, window)
+                    return admission
+            self.ledger.charge(tenant, cost)
+        return admission
+
+    def _csv_room(self, estimate: RunEstimate) -> int:
+        """Tokens (as counted, before the safety margin) the CSV could use within the per-run limits"""
+        cut = 0
+        usd = self.budget.run_usd_limit
+        if usd is not None and estimate.cost_usd > usd:
+            price = self.estimator.profiles[self.estimator.analyzer_model].input_per_mtok / 1_000_000
+            cut = math.ceil((estimate.cost_usd - usd) / price)
+        if self.budget.run_tokens is not None:
+            cut = max(cut, estimate.tokens - self.budget.run_tokens)
+        return int((estimate.csv_tokens - cut) / self.estimator.safety_margin)
+
+    def _downscale(self, csv_content: str, html_content: Optional[str], html_size: Optional[int],
+                   requested: RunEstimate) -> Admission:
+        budget = self.budget
+        estimator = self.estimator
+        csv_text, html_chars, estimate = csv_content, requested.html_chars, requested
+        summarized, windowed_to = False, None
+
+        def retry() -> Optional[Admission]:
+            nonlocal estimate
+            estimate = estimator.estimate(csv_text, html_content, html_chars, html_size)
+            if budget.run_overage(estimate):
+                return None
+            steps = ["CSV summarized"] if summarized else []
+            if html_chars < requested.html_chars:
+                steps.append(f"page excerpt {html_chars:,} chars")
+            if windowed_to is not None:
+                steps.append(f"CSV windowed to {windowed_to:,} tokens")
+            return Admission(DOWNSCALE, estimate, csv_text, html_chars, ", ".join(steps), requested=requested)
+
+        summary = summarize_event_csv(csv_text)
+        if summary is not None:
+            csv_text, summarized = summary, True
+            if (admission := retry()) is not None:
+                return admission
+        while html_chars > budget.min_html_chars:
+            html_chars = max(budget.min_html_chars, html_chars // 2)
+            if (admission := retry()) is not None:
+                return admission
+        full_csv = csv_text
+        csv_tokens = max(budget.min_csv_tokens, self._csv_room(estimate))
+        while True:
+            windowed_to = csv_tokens
+            csv_text = window_csv(full_csv, csv_tokens, estimator.count)
+            if (admission := retry()) is not None:
+                return admission
+            if csv_tokens == budget.min_csv_tokens:
+                break
+            csv_tokens = max(budget.min_csv_tokens, csv_tokens * 9 // 10)
+        merge = estimate.stage("merge")
+        return Admission(REJECT, estimate, csv_content, requested.html_chars,
+                         f"still {budget.run_overage(estimate)} at the smallest analysis input; the merge alone "
+                         f"takes {merge.input_tokens + merge.output_tokens:,} tokens, ${merge.cost_usd:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the tokens, cost and latency of an enhancement run")
+    parser.add_argument("csv", help="Engagement CSV")
+    parser.add_argument("html", help="The page to enhance")
+    parser.add_argument("--max-run-usd", type=float, help="Per-run cost budget")
+    parser.add_argument("--max-run-tokens", type=int, help="Per-run token budget")
+    parser.add_argument("--json", action="store_true", help="Print the estimate as JSON")
+    args = parser.parse_args()
+
+    with open(args.csv, "r", encoding="utf-8") as f:
+        csv_content = f.read()
+    with open(args.html, "r", encoding="utf-8") as f:
+        html_content = f.read()
+    controller = AdmissionController(budget=Budget(run_usd=args.max_run_usd, run_tokens=args.max_run_tokens))
+    admission = controller.admit("cli", csv_content, html_content)
+
+    if args.json:
+        json.dump({"action": admission.action, "reason": admission.reason,
+                   "html_chars": admission.html_chars, "estimate": admission.estimate.to_dict()},
+                  sys.stdout, indent=2)
+        print()
+    else:
+        for stage in admission.estimate.stages:
+            print(f"  {stage.stage:<8} {stage.model:<28} {stage.input_tokens:>8,} in {stage.output_tokens:>8,} out"
+                  f"  ${stage.cost_usd:.4f}  ~{stage.seconds:.1f}s")
+        icon = "✅" if admission.admitted else "❌"
+        print(f"{icon} {admission.summary()}")
+    sys.exit(0 if admission.admitted else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,742 @@
+# css_compactor.py
+
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from html_dom import Node, parse_html
+
+
+# Grouping at-rules whose contents are ordinary style rules we can compact
+_GROUPING_AT_RULES = ("@media", "@supports", "@container", "@layer", "@document")
+
+# Value features that old browsers lack; an earlier declaration of the same
+# property without them is a deliberate fallback, not dead code
+_MODERN_VALUE_TOKENS = ("color-mix(", "clamp(", "min(", "max(", "oklab", "oklch", "lab(", "lch(",
+                        "env(", "dvh", "svh", "lvh", "cqw", "cqh", "fit-content(", "subgrid")
+_VENDOR_PREFIXES = ("-webkit-", "-moz-", "-ms-", "-o-")
+
+# Elements the HTML parser creates when their tags are left out, so a page
+# always has them even when its source does not
+IMPLIED_TAGS = frozenset(("html", "head", "body", "tbody"))
+
+# Type, id and class parts of a compound selector
+_SIMPLE_TOKEN = re.compile(r"([#.]?)(-?[_a-zA-Z][\w-]*|\*)")
+
+
+@dataclass
+class Declaration:
+    name: str
+    value: str
+    important: bool = False
+
+    def css(self) -> str:
+        return f"{self.name}: {self.value}{' !important' if self.important else ''}"
+
+
+@dataclass
+class Rule:
+    selectors: List[str]
+    declarations: List[Declaration]
+    # Preludes of the enclosing grouping at-rules, outermost first
+    context: Tuple[str, ...] = ()
+    # Source span of the top-level statement it was parsed from
+    span: Optional[Tuple[int, int]] = field(default=None, compare=False)
+
+    @property
+    def key(self) -> Tuple[Tuple[str, ...], str]:
+        return self.context, ", ".join(self.selectors)
+
+
+@dataclass
+class RawBlock:
+    """A statement or at-rule we keep verbatim (@import, @font-face, @keyframes, ...)"""
+    text: str
+    context: Tuple[str, ...] = ()
+    span: Optional[Tuple[int, int]] = field(default=None, compare=False)
+
+
+@dataclass
+class CompactionReport:
+    """What one compaction pass did to a document's inline stylesheets"""
+    bytes_before: int = 0
+    bytes_after: int = 0
+    style_blocks_merged: int = 0
+    rules_before: int = 0
+    rules_after: int = 0
+    declarations_dropped: int = 0
+    selectors_pruned: int = 0
+    rules_rewritten: int = 0  # statements written back in compact form; the rest keep their source text
+    pruning_skipped: bool = False
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def summary(self) -> str:
+        text = (f"🧹 Style compaction: {self.bytes_saved} bytes saved "
+                f"({self.bytes_before} -> {self.bytes_after}), "
+                f"{self.style_blocks_merged} <style> blocks merged, "
+                f"rules {self.rules_before} -> {self.rules_after}, "
+                f"{self.declarations_dropped} overridden declarations dropped, "
+                f"{self.selectors_pruned} unmatched selectors pruned, "
+                f"{self.rules_rewritten} statements rewritten")
+        if self.pruning_skipped:
+            text += " (unmatched-selector pruning skipped: page loads external scripts)"
+        return text
+
+
+# --- Parsing ---
+
+def _strip_comments(css: str) -> str:
+    """Blank out comments, keeping every other character at its offset"""
+    out, i, n = [], 0, len(css)
+    while i < n:
+        ch = css[i]
+        if ch in "\"'":
+            j = i + 1
+            while j < n and css[j] != ch:
+                j += 2 if css[j] == "\\" else 1
+            out.append(css[i:j + 1])
+            i = j + 1
+        elif css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            out.append(" " * (end - i))
+            i = end
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    """Split on separator outside strings, brackets and parentheses"""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Collapse runs of whitespace to one space, leaving quoted strings alone"""
+    out, quote, pending_space = [], None, False
+    for i, ch in enumerate(text):
+        if quote:
+            out.append(ch)
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch.isspace():
+            pending_space = True
+        else:
+            if pending_space and out:
+                out.append(" ")
+            pending_space = False
+            out.append(ch)
+            if ch in "\"'":
+                quote = ch
+    return "".join(out)
+
+
+def _find_block_end(css: str, open_index: int) -> int:
+    """Index of the brace closing the block opened at open_index"""
+    depth, quote = 0, None
+    for i in range(open_index, len(css)):
+        ch = css[i]
+        if quote:
+            if ch == quote and css[i - 1] != "\\":
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(css)
+
+
+def parse_declarations(block: str) -> List[Declaration]:
+    declarations = []
+    for item in _split_top_level(block, ";"):
+        name, colon, value = item.partition(":")
+        if not colon:
+            continue
+        value = _collapse_whitespace(value)
+        important = bool(re.search(r"!\s*important\s*$", value, re.IGNORECASE))
+        if important:
+            value = re.sub(r"\s*!\s*important\s*$", "", value, flags=re.IGNORECASE)
+        name = name.strip()
+        declarations.append(Declaration(name if name.startswith("--") else name.lower(), value, important))
+    return declarations
+
+
+def parse_stylesheet(css: str, context: Tuple[str, ...] = (),
+                     span: Optional[Tuple[int, int]] = None, offset: int = 0) -> List[object]:
+    """
+    Parse CSS into a flat, ordered list of Rule and RawBlock items
+
+    Each item's span is the (start, end) offset in css of the top-level
+    statement it came from, so callers can copy untouched statements verbatim.
+    """
+    css = _strip_comments(css) if not context else css
+    items: List[object] = []
+    i, n = 0, len(css)
+    while i < n:
+        brace = css.find("{", i)
+        semicolon = css.find(";", i)
+        prelude_end = brace if brace != -1 else n
+        start = i + len(css[i:prelude_end]) - len(css[i:prelude_end].lstrip())
+        if css[i:prelude_end].lstrip().startswith("@") and semicolon != -1 and semicolon < prelude_end:
+            # Block-less at-rule such as @import or @charset
+            items.append(RawBlock(css[i:semicolon + 1].strip(), context,
+                                  span or (offset + start, offset + semicolon + 1)))
+            i = semicolon + 1
+            continue
+        if brace == -1:
+            break
+        prelude = _collapse_whitespace(css[i:brace])
+        end = _find_block_end(css, brace)
+        body = css[brace + 1:end]
+        statement = span or (offset + start, offset + min(end + 1, n))
+        if prelude.startswith("@"):
+            if prelude.lower().startswith(_GROUPING_AT_RULES):
+                items.extend(parse_stylesheet(body, context + (prelude,), statement, offset + brace + 1))
+            else:
+                items.append(RawBlock(f"{prelude} {{{body.strip()}}}", context, statement))
+        elif prelude:
+            selectors = _split_top_level(prelude, ",")
+            items.append(Rule(selectors, parse_declarations(body), context, statement))
+        i = end + 1
+    return items
+
+
+# --- Selector matching against the DOM ---
+
+class DomIndex:
+    """
+    Which tags, ids and classes a page (or part of one) can contain
+
+    implied_tags are taken to be present even when no parsed element has them;
+    pass IMPLIED_TAGS when elements are a whole document, whose source may
+    leave out <html>, <body> or <tbody>.
+    """
+
+    def __init__(self, elements: Iterable[Node], implied_tags: Iterable[str] = ()):
+        self.elements = list(elements)
+        self.tags = {node.tag for node in self.elements}
+        self.implied_tags = frozenset(implied_tags) - self.tags
+        self.ids = {node.id for node in self.elements if node.id}
+        self.classes = {name for node in self.elements for name in node.classes}
+        # Any identifier that scripts or inline handlers mention may be added at runtime
+        self.script_words: Set[str] = set()
+        for node in self.elements:
+            if node.tag == "script":
+                self.script_words.update(re.findall(r"[A-Za-z_][\w-]*", "".join(node.text)))
+            for name, value in node.attrs.items():
+                if name.startswith("on") and value:
+                    self.script_words.update(re.findall(r"[A-Za-z_][\w-]*", value))
+
+    def compound_may_match(self, compound: str) -> bool:
+        parts = compound_parts(compound)
+        if parts is None:
+            return True
+        tag, ids, classes = parts
+        dynamic = [name for name in ids + classes if name in self.script_words]
+        if tag in self.implied_tags and not ids and not classes:
+            return True
+        if tag and tag not in self.tags and tag not in self.implied_tags and tag not in self.script_words:
+            return False
+        if any(name not in self.ids and name not in self.script_words for name in ids):
+            return False
+        if any(name not in self.classes and name not in self.script_words for name in classes):
+            return False
+        if dynamic:
+            return True
+        for node in self.elements:
+            if tag and node.tag != tag:
+                continue
+            if ids and node.id not in ids:
+                continue
+            if classes and not set(classes).issubset(node.classes):
+                continue
+            return True
+        return not (tag or ids or classes)
+
+    def selector_may_match(self, selector: str) -> bool:
+        return all(self.compound_may_match(compound) for compound in split_compounds(selector))
+
+
+def compound_parts(compound: str) -> Optional[Tuple[Optional[str], List[str], List[str]]]:
+    """
+    The (tag, ids, classes) a compound selector requires of an element, or
+    None when it may match whatever the element's names (:is(), :root,
+    pseudo-elements, ...)
+    """
+    if re.search(r":(is|where|has|matches|host|nth-[\w-]+)\(", compound):
+        return None
+    if compound.startswith(":root") or compound.startswith("::"):
+        return None
+    # Attribute and pseudo selectors depend on runtime state; only check names
+    bare = re.sub(r"\[[^\]]*\]", "", compound)
+    bare = re.sub(r":not\([^)]*\)", "", bare)
+    bare = re.split(r"::?", bare, maxsplit=1)[0]
+
+    tag, ids, classes = None, [], []
+    for prefix, name in _SIMPLE_TOKEN.findall(bare):
+        if prefix == "#":
+            ids.append(name)
+        elif prefix == ".":
+            classes.append(name)
+        elif name != "*":
+            tag = name.lower()
+    return tag, ids, classes
+
+
+def split_compounds(selector: str) -> List[str]:
+    """Split a complex selector on its combinators, ignoring those inside [] and ()"""
+    compounds, current, depth, quote = [], [], 0, None
+    for ch in selector.strip():
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif depth == 0 and (ch.isspace() or ch in ">+~"):
+            if current:
+                compounds.append("".join(current))
+                current = []
+            continue
+        current.append(ch)
+    if current:
+        compounds.append("".join(current))
+    return compounds
+
+
+# --- Compaction ---
+
+_SIDES = ("top", "right", "bottom", "left")
+_CORNERS = ("top-left", "top-right", "bottom-right", "bottom-left")
+_LOGICAL_SIDES = ("block-start", "block-end", "inline-start", "inline-end")
+_LOGICAL_CORNERS = ("start-start", "start-end", "end-start", "end-end")
+
+
+def _box_shorthands(name: str, physical: Tuple[str, ...], logical: Dict[str, str]) -> Dict[str, Tuple[str, ...]]:
+    """A four-sided shorthand, its block/inline shorthands and their longhands"""
+    table = {name: physical + (logical["block"], logical["inline"])}
+    for axis in ("block", "inline"):
+        table[logical[axis]] = (logical[f"{axis}-start"], logical[f"{axis}-end"])
+    for side in _LOGICAL_SIDES:
+        # Which physical side a logical one sets depends on the writing mode
+        table[logical[side]] = physical
+    return table
+
+
+def _shorthand_table() -> Dict[str, Tuple[str, ...]]:
+    table: Dict[str, Tuple[str, ...]] = {}
+    for name in ("margin", "padding", "scroll-margin", "scroll-padding"):
+        logical = {part: f"{name}-{part}" for part in ("block", "inline") + _LOGICAL_SIDES}
+        table.update(_box_shorthands(name, tuple(f"{name}-{side}" for side in _SIDES), logical))
+    logical = {part: f"inset-{part}" for part in ("block", "inline") + _LOGICAL_SIDES}
+    table.update(_box_shorthands("inset", _SIDES, logical))
+    for part in ("width", "style", "color"):
+        logical = {side: f"border-{side}-{part}" for side in _LOGICAL_SIDES}
+        logical.update({axis: f"border-{axis}-{part}" for axis in ("block", "inline")})
+        table.update(_box_shorthands(f"border-{part}", tuple(f"border-{side}-{part}" for side in _SIDES), logical))
+    for side in _SIDES + _LOGICAL_SIDES + ("block", "inline"):
+        table[f"border-{side}"] = tuple(f"border-{side}-{part}" for part in ("width", "style", "color"))
+    table["border"] = ("border-width", "border-style", "border-color", "border-image",
+                       "border-block", "border-inline") + tuple(f"border-{side}" for side in _SIDES)
+    table["border-radius"] = tuple(f"border-{corner}-radius" for corner in _CORNERS)
+    for corner in _LOGICAL_CORNERS:
+        table[f"border-{corner}-radius"] = table["border-radius"]
+    for name in ("width", "height"):
+        for size in ("", "min-", "max-"):
+            table[f"{size}{'inline' if name == 'width' else 'block'}-size"] = (f"{size}width", f"{size}height")
+    table.update({
+        "background": ("background-color", "background-image", "background-position", "background-size",
+                       "background-repeat", "background-attachment", "background-origin", "background-clip"),
+        "background-position": ("background-position-x", "background-position-y"),
+        "border-image": ("border-image-source", "border-image-slice", "border-image-width",
+                         "border-image-outset", "border-image-repeat"),
+        "outline": ("outline-color", "outline-style", "outline-width"),
+        "font": ("font-style", "font-variant", "font-weight", "font-stretch", "font-size", "line-height",
+                 "font-family", "font-size-adjust", "font-kerning", "font-feature-settings",
+                 "font-language-override", "font-optical-sizing", "font-variation-settings"),
+        "font-variant": ("font-variant-caps", "font-variant-ligatures", "font-variant-numeric",
+                         "font-variant-east-asian", "font-variant-alternates", "font-variant-position"),
+        "font-synthesis": ("font-synthesis-weight", "font-synthesis-style", "font-synthesis-small-caps"),
+        "list-style": ("list-style-type", "list-style-position", "list-style-image"),
+        "flex": ("flex-grow", "flex-shrink", "flex-basis"),
+        "flex-flow": ("flex-direction", "flex-wrap"),
+        "grid": ("grid-template", "grid-auto-rows", "grid-auto-columns", "grid-auto-flow"),
+        "grid-template": ("grid-template-rows", "grid-template-columns", "grid-template-areas"),
+        "grid-area": ("grid-row", "grid-column"),
+        "grid-row": ("grid-row-start", "grid-row-end"),
+        "grid-column": ("grid-column-start", "grid-column-end"),
+        "gap": ("row-gap", "column-gap"),
+        "grid-gap": ("row-gap", "column-gap"),
+        "grid-row-gap": ("row-gap",),
+        "grid-column-gap": ("column-gap",),
+        "place-items": ("align-items", "justify-items"),
+        "place-content": ("align-content", "justify-content"),
+        "place-self": ("align-self", "justify-self"),
+        "overflow": ("overflow-x", "overflow-y"),
+        "overflow-block": ("overflow-x", "overflow-y"),
+        "overflow-inline": ("overflow-x", "overflow-y"),
+        "overscroll-behavior": ("overscroll-behavior-x", "overscroll-behavior-y"),
+        "overscroll-behavior-block": ("overscroll-behavior-x", "overscroll-behavior-y"),
+        "overscroll-behavior-inline": ("overscroll-behavior-x", "overscroll-behavior-y"),
+        "transition": ("transition-property", "transition-duration", "transition-timing-function",
+                       "transition-delay", "transition-behavior"),
+        "animation": ("animation-name", "animation-duration", "animation-timing-function", "animation-delay",
+                      "animation-iteration-count", "animation-direction", "animation-fill-mode",
+                      "animation-play-state", "animation-timeline", "animation-composition"),
+        "text-decoration": ("text-decoration-line", "text-decoration-style", "text-decoration-color",
+                            "text-decoration-thickness"),
+        "text-emphasis": ("text-emphasis-style", "text-emphasis-color"),
+        "text-stroke": ("text-stroke-width", "text-stroke-color"),
+        "white-space": ("white-space-collapse", "text-wrap-mode"),
+        "text-wrap": ("text-wrap-mode", "text-wrap-style"),
+        "columns": ("column-width", "column-count"),
+        "column-rule": ("column-rule-width", "column-rule-style", "column-rule-color"),
+        "mask": ("mask-image", "mask-mode", "mask-repeat", "mask-position", "mask-clip", "mask-origin",
+                 "mask-size", "mask-composite", "mask-border"),
+        "mask-border": ("mask-border-source", "mask-border-slice", "mask-border-width", "mask-border-outset",
+                        "mask-border-repeat", "mask-border-mode"),
+        "offset": ("offset-position", "offset-path", "offset-distance", "offset-rotate", "offset-anchor"),
+        "contain-intrinsic-size": ("contain-intrinsic-width", "contain-intrinsic-height"),
+        "container": ("container-name", "container-type"),
+        "marker": ("marker-start", "marker-mid", "marker-end"),
+    })
+    return table
+
+
+# Shorthand properties and the properties they set (which may be shorthands themselves)
+_SHORTHANDS = _shorthand_table()
+
+
+@lru_cache(maxsize=None)
+def _longhands(name: str) -> frozenset:
+    """Every longhand a property sets, vendor prefix removed; a longhand sets itself"""
+    for prefix in _VENDOR_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    parts = _SHORTHANDS.get(name)
+    if not parts:
+        return frozenset((name,))
+    return frozenset(longhand for part in parts for longhand in _longhands(part))
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """
+    True if two properties can set the same thing, so their order matters
+
+    Shorthands are expanded through _SHORTHANDS (font / line-height, inset /
+    top, border-color / border-top-color, logical / physical sides), and
+    names that extend one another (margin / margin-top) are treated as
+    related even when the table does not list them.
+    """
+    if a.startswith("--") or b.startswith("--"):
+        return a == b
+    if a == b or "all" in (a, b) or a.startswith(b + "-") or b.startswith(a + "-"):
+        return True
+    return not _longhands(a).isdisjoint(_longhands(b))
+
+
+def _is_fallback(earlier: Declaration, later: Declaration) -> bool:
+    if earlier.value == later.value:
+        return False
+    if any(prefix in value for value in (earlier.value, later.value) for prefix in _VENDOR_PREFIXES):
+        return True
+    return (any(token in later.value for token in _MODERN_VALUE_TOKENS)
+            and not any(token in earlier.value for token in _MODERN_VALUE_TOKENS))
+
+
+def _add_declaration(declarations: List[Declaration], new: Declaration) -> int:
+    """Append new, dropping what it fully overrides; returns the number dropped"""
+    dropped = 0
+    kept = []
+    for existing in declarations:
+        if existing.name == new.name and not _is_fallback(existing, new):
+            if existing.important and not new.important:
+                # The earlier !important one still wins; the new one is dead
+                return 1
+            dropped += 1
+            continue
+        kept.append(existing)
+    kept.append(new)
+    declarations[:] = kept
+    return dropped
+
+
+def _drop_overridden(rules: List[Rule]) -> int:
+    """
+    Drop declarations that a later rule with the same selector always overrides
+
+    Same context and selector means same specificity and same elements, so the
+    later declaration of a property wins whatever sits in between.
+    """
+    dropped = 0
+    later_props = {}
+    for rule in reversed(rules):
+        seen = later_props.setdefault(rule.key, {})
+        kept = []
+        for declaration in reversed(rule.declarations):
+            later = seen.get(declaration.name)
+            if later is not None and not (declaration.important and not later.important) \
+                    and not _is_fallback(declaration, later):
+                dropped += 1
+                continue
+            kept.append(declaration)
+            if later is None or declaration.important or not later.important:
+                seen[declaration.name] = declaration
+        rule.declarations = kept[::-1]
+    return dropped
+
+
+def compact_rules(items: List[object], dom: Optional[DomIndex] = None,
+                  report: Optional[CompactionReport] = None) -> List[object]:
+    """
+    Merge duplicate selectors and drop dead declarations and rules
+
+    Declarations from a repeated selector are hoisted into its previous
+    occurrence only when no rule in between, and no declaration left behind
+    in the repeated rule, sets an overlapping property (see _overlaps), so
+    the cascade result is unchanged.
+    """
+    report = report or CompactionReport()
+    rules: List[object] = []
+
+    for item in items:
+        if not isinstance(item, Rule):
+            rules.append(item)
+            continue
+        report.rules_before += 1
+
+        selectors = item.selectors
+        if dom is not None:
+            selectors = [selector for selector in selectors if dom.selector_may_match(selector)]
+            report.selectors_pruned += len(item.selectors) - len(selectors)
+            if not selectors:
+                continue
+
+        declarations: List[Declaration] = []
+        for declaration in item.declarations:
+            report.declarations_dropped += _add_declaration(declarations, declaration)
+        rules.append(Rule(selectors, declarations, item.context, item.span))
+
+    report.declarations_dropped += _drop_overridden([item for item in rules if isinstance(item, Rule)])
+
+    output: List[object] = []
+    last_index = {}
+    for rule in rules:
+        if not isinstance(rule, Rule):
+            output.append(rule)
+            continue
+        if rule.key in last_index:
+            target_index = last_index[rule.key]
+            target = output[target_index]
+            between = [other for other in output[target_index + 1:] if isinstance(other, Rule)]
+            residual = []
+            for declaration in rule.declarations:
+                if any(_overlaps(declaration.name, set_before.name)
+                       for other in between for set_before in other.declarations) \
+                        or any(_overlaps(declaration.name, left.name) for left in residual):
+                    residual.append(declaration)
+                else:
+                    report.declarations_dropped += _add_declaration(target.declarations, declaration)
+            rule.declarations = residual
+
+        if rule.declarations:
+            last_index[rule.key] = len(output)
+            output.append(rule)
+
+    report.rules_after = sum(1 for item in output if isinstance(item, Rule))
+    return output
+
+
+def serialize_stylesheet(items: Iterable[object], minify: bool = False) -> str:
+    """Write rules back as CSS, reopening at-rules as needed; one rule per line unless minified"""
+    lines: List[str] = []
+    current: Tuple[str, ...] = ()
+    indent_unit, newline = ("", "") if minify else ("  ", "\n")
+    for item in items:
+        context = item.context
+        shared = 0
+        while shared < min(len(current), len(context)) and current[shared] == context[shared]:
+            shared += 1
+        for level in range(len(current), shared, -1):
+            lines.append(indent_unit * (level - 1) + "}")
+        for level in range(shared, len(context)):
+            lines.append(indent_unit * level + f"{context[level]}{'{' if minify else ' {'}")
+        current = context
+
+        indent = indent_unit * len(context)
+        if isinstance(item, Rule):
+            if minify:
+                body = ";".join(f"{d.name}:{d.value}{'!important' if d.important else ''}"
+                                for d in item.declarations)
+                lines.append(f"{','.join(item.selectors)}{{{body}}}")
+            else:
+                body = "; ".join(declaration.css() for declaration in item.declarations)
+                lines.append(f"{indent}{', '.join(item.selectors)} {{ {body}; }}")
+        else:
+            lines.append(indent + item.text)
+    for level in range(len(current), 0, -1):
+        lines.append(indent_unit * (level - 1) + "}")
+    return newline.join(lines)
+
+
+def minify_css(css: str) -> str:
+    """Minify a stylesheet without changing which rules apply"""
+    return serialize_stylesheet(parse_stylesheet(css), minify=True)
+
+
+def _compactable_style_blocks(html: str, root: Node) -> List[Node]:
+    """
+    Inline <style> blocks that can be merged into the first one
+
+    Stops at the first stylesheet <link> after the first block, because moving
+    rules across it would change which rules win.
+    """
+    blocks: List[Node] = []
+    for node in root.iter():
+        if node.tag == "style":
+            media = (node.get("media") or "all").strip().lower()
+            style_type = (node.get("type") or "text/css").strip().lower()
+            if media not in ("all", "") or style_type != "text/css":
+                continue
+            if any(ancestor.tag in ("template", "noscript", "svg") for ancestor in node.ancestors()):
+                continue
+            blocks.append(node)
+        elif blocks and node.tag == "link" and "stylesheet" in (node.get("rel") or "").lower().split():
+            break
+    return blocks
+
+
+def _style_body(html: str, block: Node) -> str:
+    """The source text between a <style> block's tags"""
+    close = html.rfind("</", block.tag_end, block.end)
+    return html[block.tag_end:close if close != -1 else block.end]
+
+
+def _splice_stylesheet(css: str, items: List[object], compacted: List[object],
+                       report: CompactionReport) -> str:
+    """
+    Write compacted items back into css, statement by statement
+
+    A top-level statement whose items all came through compaction unchanged
+    keeps its source text, comments and formatting included; only statements
+    that lost or gained declarations, selectors or rules are rewritten, so a
+    merge that touched one rule changes one rule's lines.
+    """
+    before: Dict[Tuple[int, int], List[object]] = {}
+    after: Dict[Tuple[int, int], List[object]] = {}
+    for item in items:
+        before.setdefault(item.span, []).append(item)
+    for item in compacted:
+        after.setdefault(item.span, []).append(item)
+
+    pieces, cursor = [], 0
+    for span, originals in before.items():
+        start, end = span
+        gap = css[cursor:start]
+        kept = after.get(span, [])
+        if kept == originals:
+            pieces.append(gap + css[start:end])
+        else:
+            report.rules_rewritten += 1
+            line_start = css.rfind("\n", 0, start) + 1
+            indent = css[line_start:start] if not css[line_start:start].strip() else ""
+            if kept:
+                text = serialize_stylesheet(kept).replace("\n", "\n" + indent)
+                pieces.append(gap + text)
+            elif "\n" in gap and not gap[gap.rfind("\n"):].strip():
+                # Take the statement's line break and indent with it
+                pieces.append(gap[:gap.rfind("\n")])
+            else:
+                pieces.append(gap)
+        cursor = end
+    pieces.append(css[cursor:])
+    return "".join(pieces)
+
+
+def compact_html_styles(html: str, prune_unmatched: Optional[bool] = None) -> Tuple[str, CompactionReport]:
+    """
+    Consolidate a page's inline <style> blocks into one compacted block
+
+    Statements compaction leaves alone keep their source text; only merged,
+    trimmed or dropped rules are rewritten.
+
+    Args:
+        html: The document source
+        prune_unmatched: Drop rules whose selectors match nothing in the DOM.
+            Defaults to on unless the page loads external scripts, which could
+            add classes we cannot see.
+
+    Returns:
+        Tuple of (new_html, CompactionReport)
+    """
+    root = parse_html(html)
+    blocks = _compactable_style_blocks(html, root)
+    report = CompactionReport()
+    if not blocks:
+        return html, report
+
+    external_scripts = any(node.get("src") for node in root.find_all("script"))
+    if prune_unmatched is None:
+        prune_unmatched = not external_scripts
+        report.pruning_skipped = external_scripts
+    dom = DomIndex(root.iter(), IMPLIED_TAGS) if prune_unmatched else None
+
+    bodies = [_style_body(html, block) for block in blocks]
+    # Later blocks' rules continue on the line after the first block's last rule,
+    # and the first block's </style> keeps its own line and indentation
+    parts = [body if index == 0 else body.lstrip("\r\n") for index, body in enumerate(bodies)]
+    closing = bodies[0][len(bodies[0].rstrip()):]
+    css = "\n".join(part.rstrip() for part in parts) + closing
+    items = parse_stylesheet(css)
+    compacted = _splice_stylesheet(css, items, compact_rules(items, dom, report), report)
+    report.style_blocks_merged = len(blocks)
+
+    pieces, cursor = [], 0
+    for index, block in enumerate(blocks):
+        start, end = block.start, block.end
+        if index:
+            # Take the now-empty line with it
+            line_start = html.rfind("\n", 0, start) + 1
+            if not html[line_start:start].strip():
+                start = line_start
+            if html[end:end + 1] == "\n" and start == line_start:
+                end += 1
+            pieces.append(html[cursor:start])
+        else:
+            pieces.append(html[cursor:block.tag_end])
+            pieces.append(compacted)
+            pieces.append(html[block.tag_end + len(_style_body(html, block)):end])
+        cursor = end
+    pieces.append(html[cursor:])
+    new_html = "".join(pieces)
+
+    report.bytes_before = len(html.encode("utf-8"))
+    report.bytes_after = len(new_html.encode("utf-8"))
+    return new_html, report
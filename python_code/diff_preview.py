@@ -0,0 +1,330 @@
+# diff_preview.py
+
+import bisect
+import difflib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from css_compactor import Rule, compound_parts, parse_stylesheet, split_compounds
+from html_dom import Node, css_selector_for, parse_html
+from minimal_diff import align_tokens, tokenize
+
+# Elements that make a natural unit of review on their own
+_SECTION_TAGS = {"section", "header", "footer", "nav", "main", "article", "aside", "form", "table", "ul", "ol"}
+
+# Head elements kept in the region documents, so fragments render with the page's styles
+_HEAD_ASSETS = ("style", "link", "meta", "base")
+
+# Combinators outside attribute selectors; the last compound is the selector's subject
+_COMBINATOR = re.compile(r"\s*[>+~]\s*(?![^\[]*\])|\s+(?![^\[]*\])")
+
+_MARK_STYLE = (
+    "<style>"
+    "[data-diff-mark=markup]{outline:3px solid #f59e0b!important;outline-offset:2px}"
+    "[data-diff-mark=style]{outline:2px dashed #3b82f6!important;outline-offset:2px}"
+    "</style>"
+)
+
+
+@dataclass
+class ChangedRegion:
+    """A part of the page that changed, with the source of both sides"""
+    selector: str
+    kind: str  # "changed", "added", "removed" or "restyled"
+    original: str
+    enhanced: str
+    # Insert positions of highlight attributes in each fragment: (offset, mark)
+    original_marks: List[Tuple[int, str]] = field(default_factory=list)
+    enhanced_marks: List[Tuple[int, str]] = field(default_factory=list)
+
+    def marked(self, side: str) -> str:
+        """The fragment of one side ("original" or "enhanced") with changed elements highlighted"""
+        source = self.original if side == "original" else self.enhanced
+        marks: Dict[int, str] = {}
+        for offset, mark in (self.original_marks if side == "original" else self.enhanced_marks):
+            if marks.get(offset) != "markup":
+                marks[offset] = mark
+        for offset, mark in sorted(marks.items(), reverse=True):
+            source = f'{source[:offset]} data-diff-mark="{mark}"{source[offset:]}'
+        return source
+
+    def unified_diff(self) -> str:
+        return "\n".join(difflib.unified_diff(
+            self.original.splitlines(), self.enhanced.splitlines(), "original", "enhanced", lineterm="", n=2
+        ))
+
+
+@dataclass
+class DiffPreview:
+    """DOM-level differences between an original and an enhanced page"""
+    regions: List[ChangedRegion]
+    head_diff: str
+    tokens_changed: int
+    page_wide_rules: List[str]
+    regions_omitted: int = 0
+    original_assets: str = ""
+    enhanced_assets: str = ""
+
+    @property
+    def changed(self) -> bool:
+        return self.tokens_changed > 0
+
+    def summary(self) -> str:
+        text = f"🔍 {len(self.regions)} changed region(s), {self.tokens_changed} tokens changed"
+        if self.regions_omitted:
+            text += f", {self.regions_omitted} more region(s) not shown"
+        if self.head_diff:
+            text += ", <head> changed"
+        if self.page_wide_rules:
+            text += f"; page-wide style changes: {', '.join(self.page_wide_rules[:5])}"
+        return text
+
+    def region_document(self, region: ChangedRegion, side: str) -> str:
+        """A standalone document that renders just one side of a region with the page's styles"""
+        assets = self.original_assets if side == "original" else self.enhanced_assets
+        return (f"<!DOCTYPE html><html><head>{assets}{_MARK_STYLE}</head>"
+                f"<body>{region.marked(side)}</body></html>")
+
+
+class _Side:
+    """One document with its tokens, tree and token offsets"""
+
+    def __init__(self, html: str, max_region_chars: int = 20_000):
+        self.html = html
+        self.max_region_chars = max_region_chars
+        self.tokens = tokenize(html)
+        self.starts: List[int] = []
+        position = 0
+        for raw, _ in self.tokens:
+            self.starts.append(position)
+            position += len(raw)
+        self.starts.append(position)
+        self.root = parse_html(html)
+        self.nodes = list(self.root.iter())
+        self.node_starts = [node.start for node in self.nodes]
+        self.body = self.root.find("body")
+        self.head = self.root.find("head")
+
+    def token_at(self, offset: int) -> int:
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    def container(self, start: int, end: int) -> Node:
+        """The deepest element whose span contains [start, end), or strictly contains start when empty"""
+        node = self.root
+        while True:
+            for child in node.children:
+                inside = child.start < start < child.end if start == end else child.start <= start and end <= child.end
+                if inside:
+                    node = child
+                    break
+            else:
+                return node
+
+    def starting_in(self, start: int, end: int) -> List[Node]:
+        """Elements whose start tag begins in [start, end)"""
+        return self.nodes[bisect.bisect_left(self.node_starts, start):bisect.bisect_left(self.node_starts, end)]
+
+    def in_head(self, node: Node) -> bool:
+        return node is self.head or (self.head is not None and any(a is self.head for a in node.ancestors()))
+
+    def region_root(self, node: Node) -> Optional[Node]:
+        """
+        The section-level element a change belongs to; None for changes in <head>
+
+        Climbing stops below an ancestor longer than max_region_chars, so a
+        change inside a large <main> is shown as its own smaller element.
+        """
+        if self.in_head(node):
+            return None
+        if node.tag in ("#document", "html", "body"):
+            return self.body or node
+        while node.parent is not None and node.parent.tag not in ("body", "html", "#document") \
+                and node.tag not in _SECTION_TAGS and node.parent.end - node.parent.start <= self.max_region_chars:
+            node = node.parent
+        return node
+
+    def assets(self) -> str:
+        if self.head is None:
+            return ""
+        return "".join(self.html[child.start:child.end] for child in self.head.children if child.tag in _HEAD_ASSETS)
+
+    def head_source(self) -> str:
+        return self.html[self.head.start:self.head.end] if self.head is not None else ""
+
+
+def _style_rules(side: _Side) -> Set[Tuple]:
+    css = "\n".join("".join(node.text) for node in side.root.find_all("style"))
+    return {
+        (item.key, tuple(sorted(d.css() for d in item.declarations)))
+        for item in parse_stylesheet(css) if isinstance(item, Rule)
+    }
+
+
+def _compound_matches(parts: Optional[Tuple], node: Node) -> bool:
+    if parts is None:
+        return True
+    tag, ids, classes = parts
+    return (not tag or node.tag == tag) and all(node.id == name for name in ids) \
+        and set(classes).issubset(node.classes)
+
+
+class _ElementIndex:
+    """Body elements by tag, id and class, built once for every selector"""
+
+    def __init__(self, elements: List[Node]):
+        self.elements = elements
+        self.by_key: Dict[str, List[Node]] = {}
+        for element in elements:
+            keys = [element.tag] + ([f"#{element.id}"] if element.id else []) + [f".{name}" for name in element.classes]
+            for key in keys:
+                self.by_key.setdefault(key, []).append(element)
+
+    def candidates(self, parts: Optional[Tuple]) -> List[Node]:
+        """Elements that may match a compound: the shortest list among its names"""
+        if parts is None:
+            return self.elements
+        tag, ids, classes = parts
+        keys = ([tag] if tag else []) + [f"#{name}" for name in ids] + [f".{name}" for name in classes]
+        if not keys:
+            return self.elements
+        return min((self.by_key.get(key, []) for key in keys), key=len)
+
+
+def _restyled_elements(old: _Side, new: _Side, page_wide_limit: int) -> Tuple[List[Node], List[str]]:
+    """Body elements matched by style rules that were added or changed, and selectors too broad to mark"""
+    changed = _style_rules(new) - _style_rules(old)
+    if not changed or new.body is None:
+        return [], []
+    index = _ElementIndex(list(new.body.iter()))
+    restyled: Dict[int, Node] = {}
+    page_wide: List[str] = []
+    for (context, selectors), _ in changed:
+        for selector in selectors.split(", "):
+            # The subject has to match the element itself, every other
+            # compound the element or one of its ancestors
+            subject = compound_parts(_COMBINATOR.split(selector.strip())[-1])
+            others = [compound_parts(compound) for compound in split_compounds(selector)]
+            if _compound_matches(subject, new.body):
+                page_wide.append(selector)
+                continue
+            matches = []
+            for element in index.candidates(subject):
+                if not _compound_matches(subject, element):
+                    continue
+                lineage = [element, *element.ancestors()]
+                if all(any(_compound_matches(parts, node) for node in lineage) for parts in others):
+                    matches.append(element)
+                    if len(matches) > page_wide_limit:
+                        break
+            if len(matches) > page_wide_limit:
+                page_wide.append(selector)
+                continue
+            restyled.update((id(element), element) for element in matches)
+    return list(restyled.values()), sorted(set(page_wide))
+
+
+def _map_offset(opcodes: List[Tuple], new: _Side, old: _Side, offset: int, at_end: bool) -> int:
+    """Character offset in the original that corresponds to an offset in the enhanced page"""
+    token = new.token_at(offset) if offset < new.starts[-1] else len(new.tokens)
+    for op, old_start, old_end, new_start, new_end in opcodes:
+        if new_start <= token < new_end or (token == new_end == len(new.tokens)):
+            if op == "equal":
+                return old.starts[old_start + token - new_start] if token < new_end else old.starts[old_end]
+            return old.starts[old_end if at_end else old_start]
+    return old.starts[-1]
+
+
+def build_preview(original: str, enhanced: str, max_regions: int = 12, page_wide_limit: int = 25,
+                  max_region_chars: int = 20_000) -> DiffPreview:
+    """
+    Compute the DOM-level differences between two versions of a page
+
+    Both pages are tokenized and aligned as in minimal_diff (align_tokens), so
+    formatting-only differences don't count. Every changed token range is attributed to the
+    section-level element that contains it (a direct child of <body>, or the
+    nearest section, header, nav, form, list, ...), and style rules that were
+    added or changed mark the body elements they may match. A region holds
+    the source of that element on both sides, with the changed elements marked
+    for highlighting; changes inside <head> are reported as a text diff.
+
+    Args:
+        original: The page before enhancement
+        enhanced: The page after enhancement
+        max_regions: Regions kept, in document order; the rest are only counted
+        page_wide_limit: Changed rules matching more elements than this are
+            listed as page-wide instead of highlighted
+        max_region_chars: Regions grow to the section-level element only
+            while it is at most this long; larger ones stop at the smallest
+            changed element's widest ancestor below the limit
+
+    Returns:
+        A DiffPreview
+    """
+    old, new = _Side(original, max_region_chars), _Side(enhanced, max_region_chars)
+    opcodes = align_tokens([key for _, key in old.tokens], [key for _, key in new.tokens])
+
+    roots: Dict[int, Node] = {}
+    marks: List[Tuple[str, Node, str]] = []  # (side, element, mark)
+    tokens_changed = 0
+    for op, old_start, old_end, new_start, new_end in opcodes:
+        if op == "equal":
+            continue
+        tokens_changed += max(old_end - old_start, new_end - new_start)
+        for side_name, side, start, end in (("original", old, old.starts[old_start], old.starts[old_end]),
+                                            ("enhanced", new, new.starts[new_start], new.starts[new_end])):
+            if start == end:
+                continue  # a pure insertion or removal is highlighted on the side that has it
+            elements = side.starting_in(start, end) or [side.container(start, end)]
+            marks.extend((side_name, element, "markup") for element in elements)
+        # Regions are elements of the enhanced page; a removal lands in the element that held it
+        elements = new.starting_in(new.starts[new_start], new.starts[new_end]) \
+            or [new.container(new.starts[new_start], new.starts[new_end])]
+        for element in elements:
+            root = new.region_root(element)
+            if root is not None:
+                roots[id(root)] = root
+
+    restyled, page_wide = _restyled_elements(old, new, page_wide_limit)
+    for element in restyled:
+        marks.append(("enhanced", element, "style"))
+        root = new.region_root(element)
+        if root is not None:
+            roots[id(root)] = root
+
+    # Keep the outermost roots, in document order
+    ordered = sorted(roots.values(), key=lambda node: (node.start, -node.end))
+    kept: List[Node] = []
+    for root in ordered:
+        if kept and root.end <= kept[-1].end:
+            continue
+        kept.append(root)
+    omitted = max(len(kept) - max_regions, 0)
+    kept = kept[:max_regions]
+
+    regions = []
+    for root in kept:
+        old_start = _map_offset(opcodes, new, old, root.start, at_end=False)
+        old_end = max(_map_offset(opcodes, new, old, root.end, at_end=True), old_start)
+        region = ChangedRegion(css_selector_for(root), "changed",
+                               original[old_start:old_end], enhanced[root.start:root.end])
+        for side_name, element, mark in marks:
+            span = (old_start, old_end) if side_name == "original" else (root.start, root.end)
+            if element.tag in ("#document", "html", "body") or not span[0] <= element.start < span[1]:
+                continue
+            target = region.original_marks if side_name == "original" else region.enhanced_marks
+            target.append((element.start - span[0] + 1 + len(element.tag), mark))
+
+        if not region.original.strip():
+            region.kind = "added"
+        elif not region.enhanced_marks and region.original_marks:
+            region.kind = "removed"
+        elif all(mark == "style" for _, mark in region.enhanced_marks) and not region.original_marks:
+            region.kind = "restyled"
+        regions.append(region)
+
+    old_head, new_head = old.head_source(), new.head_source()
+    head_diff = "" if old_head == new_head else "\n".join(difflib.unified_diff(
+        old_head.splitlines(), new_head.splitlines(), "original <head>", "enhanced <head>", lineterm="", n=2
+    ))
+    return DiffPreview(regions, head_diff, tokens_changed, page_wide, omitted, old.assets(), new.assets())
@@ -0,0 +1,376 @@
+# edit_coalescer.py
+#
+# Coalesces the edits of analyses that finish close together for the same
+# page (scheduled and manual runs, different metric focuses) into one merge
+# and one commit:
+#   python edit_coalescer.py page.html edit1.txt edit2.txt [-o merged.html]
+#
+# Edits are combined CSS rule by rule and HTML element by element. Two
+# edits conflict when they give the same selector's property different
+# values, or rewrite the same element differently; the later edit wins, the
+# conflict is reported and the earlier edit's instruction is marked as
+# superseded (or left out when nothing of it is left). EditCoalescer buffers a page's edits for a short
+# debounce window before handing them on; job_queue.py does the same for
+# queued merge jobs (see enhancer_handlers' coalesce_seconds).
+
+import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from css_compactor import Rule, compact_rules, parse_stylesheet, serialize_stylesheet
+from html_dom import parse_fragment
+from site_graph import split_code_edit
+
+
+# Bare tags a page has once, so two edits of one are edits of the same element
+_UNIQUE_TAGS = ("title", "h1", "header", "nav", "main", "footer")
+# Elements an edit adds rather than rewrites; several edits may each add one
+_ADDED_TAGS = ("script", "link", "meta", "style")
+EDIT_SEPARATOR = "<!-- ... existing code ... -->"
+
+
+@dataclass
+class PendingEdit:
+    """One analysis' edit of a page, waiting to be merged"""
+    instructions: str
+    code_edit: str
+    source: str = ""  # what produced it, e.g. "scheduled" or a job id
+    metrics: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class Conflict:
+    """Two edits that change the same thing differently; the later one wins"""
+    target: str  # "selector { property }" or an element selector
+    kept: int  # index of the winning edit
+    dropped: int  # index of the overridden edit
+    kept_value: str
+    dropped_value: str
+
+    def summary(self) -> str:
+        return (f"{self.target}: edit {self.kept + 1} ({self.kept_value[:40]!r}) overrides "
+                f"edit {self.dropped + 1} ({self.dropped_value[:40]!r})")
+
+
+@dataclass
+class CoalescedEdit:
+    """The edits of a page combined into one instruction and one code edit"""
+    instructions: str
+    code_edit: str
+    edits: List[PendingEdit]
+    conflicts: List[Conflict] = field(default_factory=list)
+    superseded: List[int] = field(default_factory=list)  # edits wholly overridden, left out of instructions
+
+    @property
+    def metrics(self) -> Optional[str]:
+        """The most recent edit's metrics"""
+        return next((edit.metrics for edit in reversed(self.edits) if edit.metrics is not None), None)
+
+    def summary(self) -> str:
+        lines = [f"🧩 {len(self.edits)} edit(s) coalesced into one merge, {len(self.conflicts)} conflict(s)"]
+        if self.superseded:
+            lines[0] += f", edit(s) {', '.join(str(index + 1) for index in self.superseded)} superseded"
+        lines.extend(f"   ⚠️ {conflict.summary()}" for conflict in self.conflicts)
+        return "\n".join(lines)
+
+
+def _css_conflicts(rule_lists: List[List[object]]) -> Tuple[List[Conflict], Dict[int, bool]]:
+    """
+    Properties that two edits set differently on the same selector (in the
+    same at-rules), and for each edit with CSS whether later edits set
+    every property it sets
+    """
+    conflicts = []
+    seen: Dict[Tuple, Tuple[int, str]] = {}
+    owned: Dict[int, set] = {}
+    overridden: Dict[int, bool] = {}
+    for index, items in enumerate(rule_lists):
+        for rule in items:
+            if not isinstance(rule, Rule):
+                overridden[index] = False  # at-rules are never taken over
+                continue
+            overridden.setdefault(index, True)
+            for selector in rule.selectors:
+                for declaration in rule.declarations:
+                    key = (rule.context, selector, declaration.name)
+                    value = declaration.css().split(":", 1)[1].strip()
+                    earlier = seen.get(key)
+                    if earlier is not None and earlier[0] != index:
+                        if earlier[1] != value:
+                            target = " ".join(rule.context + (f"{selector} {{ {declaration.name} }}",))
+                            conflicts.append(Conflict(target, index, earlier[0], value, earlier[1]))
+                        owned[earlier[0]].discard(key)
+                    seen[key] = (index, value)
+                    owned.setdefault(index, set()).add(key)
+    return conflicts, {index: flag and not owned.get(index) for index, flag in overridden.items()}
+
+
+def _html_target(node) -> Optional[str]:
+    """What a top-level element of an HTML edit replaces, or None when it can't be told"""
+    if node.id:
+        return f"#{node.id}"
+    if node.classes:
+        return node.tag + "".join(f".{name}" for name in node.classes)
+    return node.tag if node.tag in _UNIQUE_TAGS else None
+
+
+def _html_pieces(page_edit: str) -> List[Tuple[Optional[str], bool, str]]:
+    """
+    An HTML edit cut into its top-level elements: (target, identified, snippet)
+
+    An element _html_target can't place (no id or class, a tag a page has
+    many of) gets its tag as an unidentified target: two edits of such
+    elements may be edits of the same one.
+    """
+    root, _ = parse_fragment(page_edit)
+    if not root.children:
+        return [(None, False, page_edit.strip())] if page_edit.strip() else []
+    pieces = []
+    for node in root.children:
+        target = _html_target(node)
+        snippet = page_edit[node.start:node.end].strip()
+        if target is None and node.tag not in _ADDED_TAGS:
+            pieces.append((f"{node.tag} (no id or class)", False, snippet))
+        else:
+            pieces.append((target, target is not None, snippet))
+    return pieces
+
+
+def coalesce(edits: List[PendingEdit]) -> CoalescedEdit:
+    """
+    Combine a page's edits, oldest first, into one edit
+
+    CSS from every edit goes into one stylesheet in edit order, compacted, so
+    a later edit's declaration replaces an earlier one's. HTML edits are
+    kept element by element; an element rewritten by several edits keeps the
+    latest rewrite, and identical rewrites are merged. Elements without an
+    id or class that several edits rewrite can't be told apart, so the
+    latest edit's ones are kept and the overlap is reported as a conflict.
+
+    Instructions are numbered in edit order. An edit whose changes were all
+    overridden by later edits is left out of them; one overridden in part
+    is told which of its changes were superseded.
+    """
+    if len(edits) == 1:
+        return CoalescedEdit(edits[0].instructions, edits[0].code_edit, list(edits))
+
+    rule_lists = []
+    html: List[Tuple[Optional[str], bool, str, int]] = []
+    for index, edit in enumerate(edits):
+        css, page_edit = split_code_edit(edit.code_edit)
+        rule_lists.append(parse_stylesheet(css) if css else [])
+        html.extend((target, identified, snippet, index) for target, identified, snippet in _html_pieces(page_edit))
+    conflicts, css_overridden = _css_conflicts(rule_lists)
+
+    # target -> (its latest snippet, the edit it came from)
+    latest: Dict[str, Tuple[str, int]] = {}
+    for target, _, snippet, index in html:
+        if target is None:
+            continue
+        earlier = latest.get(target)
+        if earlier is not None and earlier[1] != index and earlier[0] != snippet:
+            conflicts.append(Conflict(target, index, earlier[1], snippet, earlier[0]))
+        latest[target] = (snippet, index)
+    kept: List[str] = []
+    html_overridden: Dict[int, bool] = {}
+    for target, identified, snippet, index in html:
+        # An unidentified target keeps every element of the edit that won it
+        superseded = target is not None and (latest[target][1] != index if not identified
+                                             else latest[target] != (snippet, index))
+        if target is None or latest[target][1] == index:
+            html_overridden[index] = False
+        else:
+            html_overridden.setdefault(index, True)
+        if superseded:
+            continue
+        if snippet not in kept:
+            kept.append(snippet)
+
+    stylesheet = serialize_stylesheet(compact_rules([item for items in rule_lists for item in items]))
+    if kept:
+        parts = ([f"<style>\n{stylesheet}\n</style>"] if stylesheet else []) + kept
+        code_edit = f"\n{EDIT_SEPARATOR}\n".join(parts)
+    else:
+        code_edit = stylesheet
+
+    superseded = [
+        index for index in range(len(edits))
+        if (index in css_overridden or index in html_overridden)
+        and css_overridden.get(index, True) and html_overridden.get(index, True)
+    ]
+    lines = []
+    for index, edit in enumerate(edits):
+        if index in superseded:
+            continue
+        line = f"{len(lines) + 1}. {edit.instructions.strip()}"
+        overridden = sorted({conflict.target for conflict in conflicts if conflict.dropped == index})
+        if overridden:
+            line += f"\n   (Superseded by a later change for: {'; '.join(overridden)})"
+        lines.append(line)
+    instructions = "Apply these changes together:\n" + "\n".join(lines)
+    return CoalescedEdit(instructions, code_edit, list(edits), conflicts, superseded)
+
+
+@dataclass
+class _Buffer:
+    edits: List[PendingEdit] = field(default_factory=list)
+    futures: List[Future] = field(default_factory=list)
+    first_at: float = 0.0
+    due_at: float = 0.0
+
+
+class EditCoalescer:
+    """
+    Per-page debounce buffer in front of a merge-and-publish step
+
+    Each submit() for a page pushes its flush back to window_seconds after
+    the submit, but never later than max_wait_seconds after the page's first
+    buffered edit. The page's edits are then coalesced and passed to
+    flush(page, CoalescedEdit) once, and every submitter's future gets the
+    flush's result. Flushes of different pages run in parallel; flushes of
+    one page never overlap.
+    """
+
+    def __init__(self, flush: Callable[[str, CoalescedEdit], Any], window_seconds: float = 5.0,
+                 max_wait_seconds: float = 30.0, max_workers: int = 4):
+        self.flush = flush
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.merges = 0
+        self.edits = 0
+        self._buffers: Dict[str, _Buffer] = {}
+        self._page_locks: Dict[str, threading.Lock] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="coalesce")
+        self._timer = threading.Thread(target=self._run, name="coalesce-timer", daemon=True)
+        self._timer.start()
+
+    def submit(self, page: str, instructions: str, code_edit: str, source: str = "",
+               metrics: Optional[str] = None) -> "Future[Any]":
+        """Buffer an edit of page; the future resolves to the result of the flush that merged it"""
+        future: "Future[Any]" = Future()
+        now = time.time()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("EditCoalescer is closed")
+            buffer = self._buffers.get(page)
+            if buffer is None:
+                buffer = self._buffers[page] = _Buffer(first_at=now)
+            buffer.edits.append(PendingEdit(instructions, code_edit, source, metrics, now))
+            buffer.futures.append(future)
+            buffer.due_at = min(now + self.window_seconds, buffer.first_at + self.max_wait_seconds)
+            self.edits += 1
+            self._condition.notify()
+        return future
+
+    def _run(self) -> None:
+        with self._condition:
+            while True:
+                now = time.time()
+                due = [page for page, buffer in self._buffers.items() if buffer.due_at <= now or self._closed]
+                for page in due:
+                    self._executor.submit(self._flush, page, self._buffers.pop(page))
+                if self._closed and not self._buffers:
+                    return
+                timeout = min((buffer.due_at for buffer in self._buffers.values()), default=now + 3600) - now
+                self._condition.wait(max(timeout, 0.0))
+
+    def _flush(self, page: str, buffer: _Buffer) -> None:
+        with self._condition:
+            lock = self._page_locks.setdefault(page, threading.Lock())
+        with lock:
+            try:
+                coalesced = coalesce(buffer.edits)
+                print(coalesced.summary())
+                result = self.flush(page, coalesced)
+                self.merges += 1
+            except BaseException as e:
+                for future in buffer.futures:
+                    future.set_exception(e)
+                return
+        for future in buffer.futures:
+            future.set_result(result)
+
+    def flush_now(self) -> None:
+        """Make every buffered page due now"""
+        with self._condition:
+            for buffer in self._buffers.values():
+                buffer.due_at = 0.0
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Flush what is buffered and wait for every flush to finish"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._timer.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "EditCoalescer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def github_flush(enhancer, github_token: str, github_user: str,
+                 targets: Dict[str, Tuple[str, str, str]]) -> Callable[[str, CoalescedEdit], Tuple[str, bool]]:
+    """
+    A flush that merges into the page as it is now on GitHub and pushes one commit
+
+    Args:
+        targets: page key -> (repo_owner, repo_name, file_path)
+
+    Returns:
+        flush(page, coalesced) -> (enhanced_html, push_success), see RunPlanner.apply
+    """
+    from run_planner import RunPlanner
+
+    def flush(page: str, coalesced: CoalescedEdit) -> Tuple[str, bool]:
+        with RunPlanner(enhancer, github_token, github_user, *targets[page]) as run:
+            return run.apply(coalesced.instructions, coalesced.code_edit, metrics=coalesced.metrics)
+
+    return flush
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coalesce several analyses' edits of a page into one merge")
+    parser.add_argument("page", help="HTML file")
+    parser.add_argument("edits", nargs="+", help="Code edit files, oldest first (first line 'INSTRUCTION: ...' optional)")
+    parser.add_argument("-o", "--output", help="Write the merged page here (fallback merge, no Morph call)")
+    args = parser.parse_args()
+
+    edits = []
+    for path in args.edits:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        instructions = path
+        if text.startswith("INSTRUCTION:"):
+            first, _, text = text.partition("\n")
+            instructions = first[len("INSTRUCTION:"):].strip()
+        edits.append(PendingEdit(instructions, text.strip(), source=path))
+    coalesced = coalesce(edits)
+    print(coalesced.summary())
+    print(coalesced.instructions)
+    print("\n" + "="*50 + "\n")
+    print(coalesced.code_edit)
+    if args.output:
+        from stream_rewriter import fallback_merge
+
+        css, page_edit = split_code_edit(coalesced.code_edit)
+        if page_edit:
+            print("⚠️ The HTML part of the edit needs Morph; only the CSS was merged")
+        with open(args.page, "r", encoding="utf-8") as f:
+            html = f.read()
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(fallback_merge(html, css) if css else html)
+        print(f"✅ {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,774 @@
+# element_index.py
+#
+# Persistent per-page index of the elements enhancements work on (hero, CTAs,
+# forms, images, headings, sections), keyed by content hash:
+#   python element_index.py index.html [--db element_index.db] [--page acme/shop/index.html] [--kind cta]
+#
+# A page that was indexed before costs a hash and a lookup, no parsing. A
+# changed page is updated from its previous version: the top-level blocks of
+# <head> and of the content root that are still present verbatim are reused,
+# and only the text between them is parsed.
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, List, Optional, Tuple
+
+from html_dom import VOID_ELEMENTS, Node, css_selector_for, parse_fragment, parse_html
+from page_budget import PageMetrics, measure_nodes
+
+
+KINDS = ("hero", "cta", "form", "heading", "image", "section")
+
+_HERO_MARKS = ("hero", "banner", "jumbotron", "masthead")
+_HERO_TAGS = {"section", "div", "header", "main", "article"}
+_CTA_MARKS = {"btn", "button", "cta"}
+_KEPT_ATTRS = ("id", "class", "href", "src", "alt", "type", "action", "method", "role", "width", "height", "loading")
+_FORM_CONTROLS = ("input", "select", "textarea")
+_TEXT_CHARS = 120
+
+# A changed region larger than this share of the page is parsed as a whole page
+_MAX_INCREMENTAL_SHARE = 0.5
+# Blocks larger than this are split into their children
+_OPEN_BLOCK_CHARS = 4096
+# Blocks looked ahead for the end of a changed region
+_RESYNC_LOOKAHEAD = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    hash       TEXT PRIMARY KEY,
+    html       BLOB NOT NULL,
+    data       BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    page       TEXT PRIMARY KEY,
+    hash       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edits (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    page        TEXT NOT NULL,
+    instruction TEXT,
+    before_hash TEXT NOT NULL,
+    after_hash  TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS touches (
+    edit_id  INTEGER NOT NULL,
+    page     TEXT NOT NULL,
+    selector TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    change   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS touches_by_page ON touches (page, selector);
+"""
+
+
+@dataclass
+class Element:
+    """An indexed element; start/end are character offsets of its source in the page"""
+    selector: str
+    kind: str
+    tag: str
+    text: str
+    attrs: Dict[str, str]
+    start: int
+    end: int
+    depth: int
+    fingerprint: str  # hash of the element's source; changes whenever it is edited
+    fields: int = 0  # form controls, for forms
+
+
+_ELEMENT_FIELDS = tuple(item.name for item in fields(Element))
+
+
+@dataclass
+class Touch:
+    """Earlier edits that changed an element"""
+    edits: int
+    last_instruction: str
+    last_at: float
+
+
+@dataclass
+class ElementChange:
+    """One element an edit added, changed or removed"""
+    selector: str
+    kind: str
+    change: str  # "added", "changed" or "removed"
+    text: str = ""
+
+
+@dataclass
+class _Segment:
+    """
+    A piece of the page source: a top-level block of a container (tag is set)
+    or the text around blocks. container is "head" or "body" (the content
+    root) for pieces inside one, None for the document's own structure.
+    """
+    start: int
+    end: int
+    container: Optional[str]
+    tag: str = ""
+    id: Optional[str] = None
+    classes: List[str] = field(default_factory=list)
+    selector: str = ""
+    elements: List[Element] = field(default_factory=list)
+    metrics: Optional[PageMetrics] = None
+    opens: Optional[str] = None  # structure only: the start tag of an opened block, the container it starts
+
+    def shifted(self, delta: int) -> "_Segment":
+        if not delta:
+            return self
+        elements = [Element(e.selector, e.kind, e.tag, e.text, e.attrs, e.start + delta, e.end + delta, e.depth,
+                            e.fingerprint, e.fields) for e in self.elements]
+        return replace(self, start=self.start + delta, end=self.end + delta, elements=elements)
+
+
+@dataclass
+class _Snapshot:
+    segments: List[_Segment]
+    containers: Dict[str, Dict]  # name -> depth, selector ("prefix"), parent container, tag, id, classes
+    rest: PageMetrics  # metrics of everything outside the blocks
+    metrics: PageMetrics
+
+    def to_bytes(self) -> bytes:
+        # Rows rather than asdict(): this is on the path of every update
+        document = {
+            "segments": [[segment.start, segment.end, segment.container, segment.tag, segment.id,
+                          segment.classes, segment.selector,
+                          [[getattr(element, name) for name in _ELEMENT_FIELDS] for element in segment.elements],
+                          vars(segment.metrics) if segment.metrics else None, segment.opens]
+                         for segment in self.segments],
+            "containers": self.containers,
+            "rest": vars(self.rest),
+            "metrics": vars(self.metrics),
+        }
+        return zlib.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "_Snapshot":
+        document = json.loads(zlib.decompress(data).decode("utf-8"))
+        segments = []
+        for start, end, container, tag, node_id, classes, selector, elements, metrics, opens in document["segments"]:
+            segments.append(_Segment(start, end, container, tag, node_id, classes, selector,
+                                     [Element(*values) for values in elements],
+                                     PageMetrics(**metrics) if metrics else None, opens))
+        return cls(segments, document["containers"], PageMetrics(**document["rest"]),
+                   PageMetrics(**document["metrics"]))
+
+
+@dataclass
+class PageIndex:
+    """What the index knows about one version of a page"""
+    content_hash: str
+    size: int
+    elements: List[Element]
+    metrics: PageMetrics  # page_budget measurements, without parsing again
+    parse: str  # "none" (indexed before), "incremental" or "full"
+    parsed_chars: int = 0
+    seconds: float = 0.0
+    page: Optional[str] = None
+    touches: Dict[str, Touch] = field(default_factory=dict)  # by selector, when page is known
+    content: Tuple[int, int] = (0, 0)  # source span of the page's content (the body's blocks)
+
+    def of_kind(self, kind: str) -> List[Element]:
+        return [element for element in self.elements if element.kind == kind]
+
+    def find(self, selector: str) -> Optional[Element]:
+        return next((element for element in self.elements if element.selector == selector), None)
+
+    @property
+    def hero(self) -> Optional[Element]:
+        """The marked hero, or else the first section with the page's <h1>"""
+        heroes = self.of_kind("hero")
+        if heroes:
+            return heroes[0]
+        h1 = next((element for element in self.elements if element.tag == "h1"), None)
+        if h1 is None:
+            return None
+        return next((element for element in self.of_kind("section")
+                     if element.start <= h1.start < element.end), None)
+
+    def in_hero(self, element: Element) -> bool:
+        hero = self.hero
+        return hero is not None and hero.start <= element.start < hero.end
+
+    def position(self, element: Element) -> float:
+        """How far into the page's content the element starts, 0..1 (a rough fold indicator)"""
+        start, end = self.content if self.content[1] else (0, self.size)
+        return min(max((element.start - start) / (end - start), 0.0), 1.0) if end > start else 0.0
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{len(self.of_kind(kind))} {kind}" for kind in KINDS if self.of_kind(kind))
+        if self.parse == "none":
+            how = "indexed before, nothing parsed"
+        elif self.parse == "incremental":
+            how = f"updated incrementally, {self.parsed_chars:,} of {self.size:,} chars parsed"
+        else:
+            how = f"parsed {self.size:,} chars"
+        return f"🗂️ Element index: {counts or 'no elements'} ({how}, {self.seconds * 1000:.1f} ms)"
+
+    def prompt_inventory(self, limit: int = 40) -> str:
+        """Elements worth targeting, one line each, for the analysis prompt"""
+        order = {kind: index for index, kind in enumerate(KINDS)}
+        hero = self.hero
+        wanted = [element for element in self.elements if element.kind != "section" or element is hero]
+        wanted.sort(key=lambda element: (order[element.kind], element.start))
+        lines = []
+        for element in wanted[:limit]:
+            if element.kind == "image":
+                size = (f"{element.attrs['width']}x{element.attrs['height']}"
+                        if element.attrs.get("width") and element.attrs.get("height") else "no size")
+                detail = f'alt="{element.text[:60]}", {size}'
+            elif element.kind == "form":
+                detail = f"{element.fields} fields"
+            else:
+                detail = f'"{element.text[:60]}"'
+            where = "hero" if element is not hero and self.in_hero(element) else f"{self.position(element):.0%} down"
+            line = f"- {element.kind} `{element.selector}` {detail} ({where})"
+            touch = self.touches.get(element.selector)
+            if touch is not None:
+                line += f"; changed by {touch.edits} earlier run(s), last: {touch.last_instruction[:80]!r}"
+            lines.append(line)
+        if len(wanted) > limit:
+            lines.append(f"- ... {len(wanted) - limit} more")
+        return "\n".join(lines)
+
+
+# --- building ----------------------------------------------------------------
+
+def _kind(node: Node) -> Optional[str]:
+    marks = " ".join([node.id or ""] + node.classes).lower()
+    tag = node.tag
+    if tag in ("a", "button", "input"):
+        tokens = set(re.split(r"[\s_-]+", marks))
+        if (tag == "button" or (tag == "input" and (node.get("type") or "").lower() in ("submit", "button"))
+                or node.get("role") == "button" or tokens & _CTA_MARKS):
+            return "cta"
+        return None
+    if tag in _HERO_TAGS and any(mark in marks for mark in _HERO_MARKS):
+        return "hero"
+    if tag == "form":
+        return "form"
+    if tag == "img":
+        return "image"
+    if tag in ("h1", "h2", "h3"):
+        return "heading"
+    return None
+
+
+def _element(node: Node, kind: str, source: str, offset: int, depth_offset: int) -> Element:
+    if node.tag == "img":
+        text = node.get("alt") or ""
+    elif node.tag == "input":
+        text = node.get("value") or ""
+    else:
+        text = node.text_content()[:_TEXT_CHARS]
+    attrs = {name: node.get(name) for name in _KEPT_ATTRS if node.get(name) is not None}
+    fields = sum(1 for _ in node.find_all(*_FORM_CONTROLS)) if node.tag == "form" else 0
+    return Element(
+        selector=css_selector_for(node),
+        kind=kind,
+        tag=node.tag,
+        text=text,
+        attrs=attrs,
+        start=node.start + offset,
+        end=node.end + offset,
+        depth=node.depth + depth_offset,
+        fingerprint=hashlib.sha1(source[node.start:node.end].encode("utf-8")).hexdigest()[:16],
+        fields=fields,
+    )
+
+
+def _block(node: Node, source: str, offset: int, container: str, depth_offset: int) -> _Segment:
+    """A top-level block of a container; offset/depth_offset place a fragment's nodes in the page"""
+    nodes = [node] + list(node.iter())
+    segment = _Segment(node.start + offset, node.end + offset, container, node.tag, node.id, node.classes,
+                       css_selector_for(node))
+    segment.metrics = measure_nodes(nodes, PageMetrics(), in_head=container == "head", depth_offset=depth_offset)
+    if container != "head":
+        hero_end = -1
+        for candidate in nodes:
+            kind = _kind(candidate)
+            if kind == "hero":
+                # Wrappers inside a hero (.hero-content, ...) are part of it
+                if candidate.start < hero_end:
+                    kind = None
+                else:
+                    hero_end = candidate.end
+            kind = kind or ("section" if candidate is node else None)
+            if kind:
+                segment.elements.append(_element(candidate, kind, source, offset, depth_offset))
+    return segment
+
+
+def _closed(node: Node, source: str) -> bool:
+    """The element's span ends with its own end tag (or it has none), so it can be cut out as a block"""
+    if node.end == node.tag_end:
+        return node.tag in VOID_ELEMENTS or source[node.start:node.end].rstrip().endswith("/>")
+    return source[node.end - len(node.tag) - 3:node.end].lower() == f"</{node.tag}>"
+
+
+def _container_segments(children: List[Node], source: str, start: int, end: int, offset: int,
+                         container: str, depth_offset: int) -> Optional[List[_Segment]]:
+    """Blocks and the text between them for the children of a container spanning [start, end)"""
+    segments = []
+    position = start
+    for child in children:
+        if child.start < position or child.end > end or not _closed(child, source):
+            return None
+        if child.start > position:
+            segments.append(_Segment(position + offset, child.start + offset, container))
+        segments.append(_block(child, source, offset, container, depth_offset))
+        position = child.end
+    if position < end:
+        segments.append(_Segment(position + offset, end + offset, container))
+    return segments
+
+
+def _opened(node: Node) -> bool:
+    """Whether a block of the content is large enough to be split into its children"""
+    return node.end - node.start > _OPEN_BLOCK_CHARS and bool(node.children) and not _kind(node)
+
+
+def _content_root(root: Node) -> Node:
+    """<body> (or the document), descending through wrappers that hold a single element"""
+    node = root.find("body") or root.find("html") or root
+    while len(node.children) == 1 and node.children[0].children and not _kind(node.children[0]):
+        node = node.children[0]
+    return node
+
+
+def _contains(outer: Node, inner: Node) -> bool:
+    node: Optional[Node] = inner
+    while node is not None:
+        if node is outer:
+            return True
+        node = node.parent
+    return False
+
+
+def _inner_span(node: Node, source: str) -> Optional[Tuple[int, int]]:
+    if node.tag == "#document":
+        return 0, len(source)
+    if not _closed(node, source) or node.end == node.tag_end:
+        return None
+    return node.tag_end, node.end - len(node.tag) - 3
+
+
+def _compose_metrics(total_bytes: int, rest: PageMetrics, segments: List[_Segment]) -> PageMetrics:
+    metrics = replace(rest, total_bytes=total_bytes)
+    for segment in segments:
+        if segment.metrics is None:
+            continue
+        for name, value in vars(segment.metrics).items():
+            if name == "dom_depth":
+                metrics.dom_depth = max(metrics.dom_depth, value)
+            elif name != "total_bytes":
+                setattr(metrics, name, getattr(metrics, name) + value)
+    return metrics
+
+
+def _selector(tag: str, node_id: Optional[str], classes: List[str], nth: int, same_tag: int, prefix: str) -> str:
+    """css_selector_for's selector for a child of the element selected by prefix"""
+    if node_id:
+        return f"#{node_id}"
+    part = tag + "".join(f".{name}" for name in classes)
+    if same_tag > 1 and not classes:
+        part += f":nth-of-type({nth})"
+    return f"{prefix} > {part}" if prefix else part
+
+
+def _assign_selectors(segments: List[_Segment], containers: Dict[str, Dict]) -> None:
+    """
+    Give blocks (and opened blocks, see _full_snapshot) the selectors
+    css_selector_for would give them in the whole page, rewriting their
+    elements' selectors to match
+    """
+    for name, info in containers.items():
+        if name == "head":
+            continue
+        children = [segment for segment in segments
+                    if (segment.tag and segment.container == name)
+                    or (segment.opens and containers[segment.opens]["parent"] == name)]
+        tags = [segment.tag or containers[segment.opens]["tag"] for segment in children]
+        seen: Dict[str, int] = {}
+        for segment, tag in zip(children, tags):
+            seen[tag] = seen.get(tag, 0) + 1
+            if segment.opens:
+                opened = containers[segment.opens]
+                opened["prefix"] = _selector(tag, opened["id"], opened["classes"], seen[tag], tags.count(tag),
+                                             info["prefix"])
+                continue
+            selector = _selector(tag, segment.id, segment.classes, seen[tag], tags.count(tag), info["prefix"])
+            if selector == segment.selector:
+                continue
+            old = segment.selector
+            for index, element in enumerate(segment.elements):
+                if element.selector == old:
+                    segment.elements[index] = replace(element, selector=selector)
+                elif element.selector.startswith(old + " > "):
+                    segment.elements[index] = replace(element, selector=selector + element.selector[len(old):])
+            segment.selector = selector
+
+
+def _full_snapshot(html: str) -> _Snapshot:
+    root = parse_html(html)
+    head = root.find("head")
+    body = _content_root(root)
+    if head is not None and (_contains(body, head) or _contains(head, body)):
+        body = None
+    segments: List[_Segment] = []
+    containers: Dict[str, Dict] = {}
+    block_nodes = set()
+    # Large blocks of the content are opened: their children become blocks of
+    # their own, so an edit inside <main> doesn't mean parsing all of <main>
+    queue = [("head", head, None), ("body", body, None)]
+    while queue:
+        name, node, parent = queue.pop(0)
+        if node is None:
+            continue
+        span = _inner_span(node, html)
+        pieces = span and _container_segments(node.children, html, span[0], span[1], 0, name, 0)
+        if pieces is None:
+            continue
+        if parent is not None:
+            segments[:] = [segment for segment in segments if segment.start != node.start or not segment.tag]
+            segments.append(_Segment(node.start, node.tag_end, None, opens=name))
+            segments.append(_Segment(span[1], node.end, None))
+            block_nodes.discard(id(node))
+        containers[name] = {"depth": node.depth, "prefix": css_selector_for(node) if node is not root else "",
+                            "parent": parent, "tag": node.tag, "id": node.id, "classes": node.classes,
+                            "chars": node.end - node.start}
+        segments.extend(pieces)
+        block_nodes.update(id(child) for child in node.children)
+        if name != "head":
+            queue.extend((f"{name}/{index}", child, name) for index, child in enumerate(node.children)
+                         if _opened(child))
+    if "body" not in containers:
+        containers["body"] = {"depth": 0, "prefix": "", "parent": None, "tag": "#document", "id": None,
+                              "classes": []}
+
+    # Everything outside the blocks is the document's own structure
+    segments.sort(key=lambda segment: segment.start)
+    filled, position = [], 0
+    for segment in segments:
+        if segment.start > position:
+            filled.append(_Segment(position, segment.start, None))
+        filled.append(segment)
+        position = segment.end
+    if position < len(html):
+        filled.append(_Segment(position, len(html), None))
+
+    rest_nodes, stack = [], list(reversed(root.children))
+    while stack:
+        node = stack.pop()
+        if id(node) in block_nodes:
+            continue
+        rest_nodes.append(node)
+        stack.extend(reversed(node.children))
+    rest = measure_nodes(rest_nodes, PageMetrics())
+    return _Snapshot(filled, containers, rest, _compose_metrics(len(html.encode("utf-8")), rest, filled))
+
+
+def _incremental_snapshot(base: _Snapshot, base_html: str, html: str) -> Optional[Tuple[_Snapshot, int]]:
+    """
+    Update a snapshot for a new version of its page, parsing only what changed
+
+    Segments still present verbatim and in order are reused; each run of
+    changed segments must lie inside one container and its new text must be
+    a balanced run of sibling elements. Blocks must also stay on the same
+    side of _OPEN_BLOCK_CHARS as in a whole-page parse: a new block large
+    enough to be opened, or an opened block an edit shrank to that size or
+    less, is not updated in place. Returns None when any of that doesn't hold
+    (a whole-page parse is needed), else the snapshot and the chars parsed.
+    """
+    old = base.segments
+    containers = {name: dict(info) for name, info in base.containers.items()}
+    segments: List[_Segment] = []
+    position = index = parsed = 0
+    while index < len(old):
+        segment = old[index]
+        text = base_html[segment.start:segment.end]
+        if html.startswith(text, position):
+            segments.append(segment.shifted(position - segment.start))
+            position += len(text)
+            index += 1
+            continue
+
+        if segment.container is None and segments and not segments[-1].tag and segments[-1].container:
+            # Text added at the end of a container: the whitespace before its
+            # end tag matched, the end tag didn't; the container's last piece changed
+            index -= 1
+            position -= len(base_html[old[index].start:old[index].end])
+            segments.pop()
+            segment = old[index]
+
+        # A changed run: it ends where a later block or document structure shows up again
+        resume, found = len(old), len(html)
+        for ahead in range(index, min(len(old), index + _RESYNC_LOOKAHEAD)):
+            if old[ahead].tag or old[ahead].container is None:
+                at = html.find(base_html[old[ahead].start:old[ahead].end], position)
+                if at != -1:
+                    resume, found = ahead, at
+                    break
+        container = segment.container
+        if container is None or any(item.container != container for item in old[index:resume]):
+            return None
+        fragment = html[position:found]
+        root, balanced = parse_fragment(fragment)
+        if not balanced:
+            return None
+        if container != "head" and any(_opened(child) for child in root.children):
+            return None
+        pieces = _container_segments(root.children, fragment, 0, len(fragment), position, container,
+                                     base.containers[container]["depth"])
+        if pieces is None:
+            return None
+        # The run's container and the opened blocks around it grow or shrink with it
+        replaced = (old[resume].start if resume < len(old) else len(base_html)) - old[index].start
+        name = container
+        while name is not None:
+            info = containers[name]
+            if "chars" not in info:
+                return None  # a snapshot from before sizes were kept
+            info["chars"] += len(fragment) - replaced
+            if info["parent"] is not None and info["chars"] <= _OPEN_BLOCK_CHARS:
+                return None
+            name = info["parent"]
+        segments.extend(pieces)
+        parsed += len(fragment)
+        if parsed > _MAX_INCREMENTAL_SHARE * len(html):
+            return None
+        position, index = found, resume
+    if position != len(html):
+        return None
+
+    _assign_selectors(segments, containers)
+    metrics = _compose_metrics(len(html.encode("utf-8")), base.rest, segments)
+    return _Snapshot(segments, containers, base.rest, metrics), parsed
+
+
+def _page_index(digest: str, html_size: int, snapshot: _Snapshot, parse: str, parsed: int = 0,
+                seconds: float = 0.0) -> PageIndex:
+    elements = [element for segment in snapshot.segments for element in segment.elements]
+    content = [segment for segment in snapshot.segments if segment.container not in (None, "head")]
+    span = (content[0].start, content[-1].end) if content else (0, html_size)
+    return PageIndex(digest, html_size, elements, replace(snapshot.metrics), parse, parsed, seconds,
+                     content=span)
+
+
+def _by_selector(page_index: PageIndex) -> Dict[Tuple[str, int], Element]:
+    # Selectors aren't unique (siblings with the same classes): key by (selector, occurrence)
+    seen: Dict[str, int] = {}
+    keyed = {}
+    for element in page_index.elements:
+        seen[element.selector] = seen.get(element.selector, 0) + 1
+        keyed[(element.selector, seen[element.selector])] = element
+    return keyed
+
+
+def diff_indexes(before: PageIndex, after: PageIndex) -> List[ElementChange]:
+    """Elements added, changed or removed between two versions of a page, matched by selector"""
+    old, new = _by_selector(before), _by_selector(after)
+    changes = []
+    for key, element in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append(ElementChange(element.selector, element.kind, "added", element.text[:60]))
+        elif previous.fingerprint != element.fingerprint:
+            changes.append(ElementChange(element.selector, element.kind, "changed", element.text[:60]))
+    for key, element in old.items():
+        if key not in new:
+            changes.append(ElementChange(element.selector, element.kind, "removed", element.text[:60]))
+    return changes
+
+
+# --- store -------------------------------------------------------------------
+
+class ElementIndex:
+    """
+    SQLite-backed element index shared by runs and processes
+
+    Snapshots are stored by content hash with the page source (compressed),
+    which later versions are updated against. pages remembers each page's
+    latest indexed version; edits and touches remember which elements each
+    recorded edit changed. Recently used snapshots are cached in memory.
+    """
+
+    def __init__(self, path: str = "element_index.db", cache_size: int = 32):
+        self.path = path
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, Tuple[_Snapshot, str]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _remember(self, digest: str, snapshot: _Snapshot, html: str) -> None:
+        self._cache[digest] = (snapshot, html)
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _snapshot(self, digest: str) -> Optional[Tuple[_Snapshot, str]]:
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                return cached
+            row = self._conn.execute("SELECT data, html FROM snapshots WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        snapshot, html = _Snapshot.from_bytes(row[0]), zlib.decompress(row[1]).decode("utf-8")
+        with self._lock:
+            self._remember(digest, snapshot, html)
+        return snapshot, html
+
+    def index(self, html: str, page: Optional[str] = None, base: Optional[PageIndex] = None) -> PageIndex:
+        """
+        The index of a page's content
+
+        Args:
+            html: The page source
+            page: Its version_store.page_key; loads the elements' edit history and
+                makes this the version the page's next change is updated from
+            base: An earlier version to update from (default: the page's latest)
+        """
+        started = time.perf_counter()
+        digest = hashlib.sha256(html.encode("utf-8")).hexdigest()
+        found = self._snapshot(digest)
+        if found is not None:
+            result = _page_index(digest, len(html), found[0], "none")
+        else:
+            base_hash = base.content_hash if base is not None else self._page_hash(page)
+            updated = None
+            previous = self._snapshot(base_hash) if base_hash else None
+            if previous is not None:
+                updated = _incremental_snapshot(previous[0], previous[1], html)
+            if updated is not None:
+                snapshot, parsed = updated
+                parse = "incremental"
+            else:
+                snapshot, parsed, parse = _full_snapshot(html), len(html), "full"
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO snapshots (hash, html, data, created_at) VALUES (?, ?, ?, ?)",
+                    (digest, zlib.compress(html.encode("utf-8")), snapshot.to_bytes(), time.time())
+                )
+                self._conn.commit()
+                self._remember(digest, snapshot, html)
+            result = _page_index(digest, len(html), snapshot, parse, parsed)
+
+        if page is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO pages (page, hash, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (page) DO UPDATE SET hash = excluded.hash, updated_at = excluded.updated_at",
+                    (page, digest, time.time())
+                )
+                self._conn.commit()
+            result.page = page
+            result.touches = self.touches(page)
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def _page_hash(self, page: Optional[str]) -> Optional[str]:
+        if page is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM pages WHERE page = ?", (page,)).fetchone()
+        return row[0] if row else None
+
+    def record_edit(self, page: str, before: PageIndex, after: PageIndex, instruction: str) -> List[ElementChange]:
+        """Store which elements an edit of the page changed; returns them"""
+        changes = diff_indexes(before, after)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO edits (page, instruction, before_hash, after_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+                (page, instruction, before.content_hash, after.content_hash, time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO touches (edit_id, page, selector, kind, change) VALUES (?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, page, change.selector, change.kind, change.change) for change in changes]
+            )
+            self._conn.commit()
+        return changes
+
+    def touches(self, page: str) -> Dict[str, Touch]:
+        """Elements of a page changed by recorded edits, by selector"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT selector, COUNT(*), MAX(edit_id) FROM touches WHERE page = ? GROUP BY selector", (page,)
+            ).fetchall()
+            edits = dict((row[0], row[1:]) for row in self._conn.execute(
+                "SELECT id, instruction, created_at FROM edits WHERE page = ?", (page,)
+            ))
+        return {selector: Touch(count, edits[last][0] or "", edits[last][1]) for selector, count, last in rows}
+
+    def forget(self, page: str) -> bool:
+        """
+        Drop a page's latest indexed version, e.g. after the page was edited
+        outside the pipeline; its next index is a full parse of what is live.
+        The page's edit history is kept. Returns whether the page was indexed.
+        """
+        with self._lock:
+            digest = self._page_hash(page)
+            if digest is None:
+                return False
+            self._conn.execute("DELETE FROM pages WHERE page = ?", (page,))
+            self._conn.commit()
+            self._cache.pop(digest, None)
+            return True
+
+    def prune(self, older_than_seconds: float = 30 * 86400) -> int:
+        """Drop old snapshots that are no page's latest version; returns how many"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM snapshots WHERE created_at < ? AND hash NOT IN (SELECT hash FROM pages)",
+                (time.time() - older_than_seconds,)
+            )
+            self._conn.commit()
+            self._cache.clear()
+            return cursor.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the elements of an HTML page")
+    parser.add_argument("html", help="The page")
+    parser.add_argument("--db", default="element_index.db", help="Index database")
+    parser.add_argument("--page", help="Page key (owner/repo/path) to keep history under")
+    parser.add_argument("--kind", choices=KINDS, help="Only list elements of this kind")
+    args = parser.parse_args()
+
+    with open(args.html, "r", encoding="utf-8") as f:
+        html = f.read()
+    store = ElementIndex(args.db)
+    try:
+        page_index = store.index(html, args.page)
+    finally:
+        store.close()
+    print(page_index.summary())
+    if args.kind:
+        for element in page_index.of_kind(args.kind):
+            print(f"  {element.selector}  {element.text[:60]!r}  [{element.start}:{element.end}]")
+    else:
+        print(page_index.prompt_inventory())
+    metrics = page_index.metrics
+    print(f"📏 {metrics.total_bytes:,} bytes, {metrics.dom_nodes} nodes, depth {metrics.dom_depth}")
+
+
+if __name__ == "__main__":
+    main()
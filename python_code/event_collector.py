@@ -0,0 +1,489 @@
+# event_collector.py
+#
+# First-party event ingestion for managed pages:
+#   python event_collector.py serve --log-dir events --port 8090
+#   python event_collector.py export --log-dir events --since-hours 168 > metrics.csv
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from async_http import Request, Response, install_fast_event_loop, start_server
+
+
+# Column order of the log; one event is a tuple in this order
+COLUMNS = ("ts_ms", "event", "visitor", "page", "revenue")
+Event = Tuple[int, str, str, str, float]
+
+# (segment number, byte offset in that segment); readers resume from one
+LogOffset = Tuple[int, int]
+
+_MAGIC = b"EVB1"
+_RECORD_HEADER = struct.Struct("<4sII")  # magic, payload length, crc32 of payload
+_U32 = struct.Struct("<I")
+_EVENT_NAME = re.compile(r"^[a-z][a-z0-9_]{0,39}$")
+
+
+def _to_le(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _encode_strings(values: List[str]) -> bytes:
+    """Dictionary-encode a string column: distinct values once, then one code per row"""
+    index: Dict[str, int] = {}
+    codes = array("I", [index.setdefault(value, len(index)) for value in values])
+    dictionary = json.dumps(list(index), separators=(",", ":")).encode("utf-8")
+    return _U32.pack(len(dictionary)) + dictionary + _to_le(codes)
+
+
+def _decode_strings(data: bytes) -> List[str]:
+    (length,) = _U32.unpack_from(data)
+    dictionary = json.loads(data[4:4 + length].decode("utf-8"))
+    return [dictionary[code] for code in _from_le("I", data[4 + length:])]
+
+
+def encode_batch(events: List[Event]) -> bytes:
+    """One log record: header, then the zlib-compressed columns of the batch"""
+    ts_ms, names, visitors, pages, revenue = zip(*events)
+    chunks = [
+        _to_le(array("q", ts_ms)),
+        _encode_strings(names),
+        _encode_strings(visitors),
+        _encode_strings(pages),
+        _to_le(array("d", revenue)),
+    ]
+    payload = zlib.compress(
+        _U32.pack(len(events)) + b"".join(_U32.pack(len(chunk)) + chunk for chunk in chunks), 1
+    )
+    return _RECORD_HEADER.pack(_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_batch(payload: bytes) -> Dict[str, list]:
+    """Columns of one record payload, keyed by COLUMNS"""
+    raw = zlib.decompress(payload)
+    position = 4
+    chunks = []
+    for _ in COLUMNS:
+        (length,) = _U32.unpack_from(raw, position)
+        chunks.append(raw[position + 4:position + 4 + length])
+        position += 4 + length
+    return {
+        "ts_ms": _from_le("q", chunks[0]).tolist(),
+        "event": _decode_strings(chunks[1]),
+        "visitor": _decode_strings(chunks[2]),
+        "page": _decode_strings(chunks[3]),
+        "revenue": _from_le("d", chunks[4]).tolist(),
+    }
+
+
+class EventLog:
+    """
+    Append-only, segment-rotated columnar event log
+
+    Each append writes one record (a whole batch, stored column by column)
+    and fsyncs it before returning, so a batch is either fully on disk or,
+    after a crash, a torn tail that the checksum rejects; the torn tail is
+    truncated when the log is reopened for writing. Segments are rotated once
+    they reach segment_bytes and are never rewritten, so readers can follow
+    the log from any LogOffset.
+
+    Only the collector may open the log for writing. Everything else (exports,
+    metric views, A/B tests) opens it with read_only=True: nothing is created,
+    appended or truncated, and a tail the collector is still writing is
+    simply not read yet.
+    """
+
+    def __init__(self, directory: str = "events", segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True,
+                 read_only: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._file = None
+        if read_only:
+            if not os.path.isdir(directory):
+                raise FileNotFoundError(f"No event log at {directory}")
+            return
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        self._file = open(self._segment_path(self._segment), "ab")
+        self._recover_tail()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"events-{segment:08d}.seg")
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(name[7:15]) for name in os.listdir(self.directory)
+            if name.startswith("events-") and name.endswith(".seg")
+        )
+
+    def _recover_tail(self) -> None:
+        valid_end = 0
+        for offset, _ in self._records(self._segment, 0):
+            valid_end = offset
+        size = os.path.getsize(self._segment_path(self._segment))
+        if size > valid_end:
+            print(f"⚠️ Truncating {size - valid_end} bytes of torn tail from segment {self._segment}")
+            self._file.truncate(valid_end)
+            self._file.seek(valid_end)
+
+    def _records(self, segment: int, start: int) -> Iterator[Tuple[int, bytes]]:
+        """(end offset, payload) of each complete record of a segment from start"""
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(start)
+            position = start
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                magic, length, crc = _RECORD_HEADER.unpack(header)
+                if magic != _MAGIC:
+                    return
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                position += _RECORD_HEADER.size + length
+                yield position, payload
+
+    def append(self, events: List[Event]) -> LogOffset:
+        """Durably append a batch; returns the offset just past it"""
+        if self.read_only:
+            raise io.UnsupportedOperation(f"Event log {self.directory} is open read-only")
+        if not events:
+            return self.end_offset()
+        record = encode_batch(events)
+        with self._lock:
+            if self._file.tell() and self._file.tell() + len(record) > self.segment_bytes:
+                self._file.close()
+                self._segment += 1
+                self._file = open(self._segment_path(self._segment), "ab")
+            self._file.write(record)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            return self._segment, self._file.tell()
+
+    def end_offset(self) -> LogOffset:
+        if self.read_only:
+            # The end of the last complete record, wherever a writer is
+            segments = self.segments()
+            if not segments:
+                return 1, 0
+            end = 0
+            for end, _ in self._records(segments[-1], 0):
+                pass
+            return segments[-1], end
+        with self._lock:
+            return self._segment, self._file.tell()
+
+    def scan(self, start: Optional[LogOffset] = None) -> Iterator[Tuple[LogOffset, Dict[str, list]]]:
+        """
+        Read batches from start (default: the beginning of the log)
+
+        Yields:
+            (offset just past the batch, columns of the batch)
+        """
+        first_segment, first_offset = start or (0, 0)
+        for segment in self.segments():
+            if segment < first_segment:
+                continue
+            offset = first_offset if segment == first_segment else 0
+            for end, payload in self._records(segment, offset):
+                yield (segment, end), decode_batch(payload)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+
+def parse_beacon(body: bytes, received_ms: int, max_events: int = 500) -> List[Event]:
+    """
+    Events from a beacon body
+
+    The body is one JSON event, a JSON array of events, or newline-delimited
+    JSON. An event needs "event" (a lowercase snake_case name) and may have
+    "visitor", "page" and "revenue". Malformed events are dropped; the
+    server's receive time is used as the timestamp.
+    """
+    text = body.decode("utf-8", errors="replace").strip()
+    if not text:
+        return []
+    try:
+        items = json.loads(text)
+    except ValueError:
+        items = []
+        for line in text.splitlines():
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+    if isinstance(items, dict):
+        items = [items]
+
+    events = []
+    for item in items[:max_events]:
+        if not isinstance(item, dict):
+            continue
+        name = str(item.get("event", ""))
+        if not _EVENT_NAME.match(name):
+            continue
+        try:
+            revenue = float(item.get("revenue") or 0.0)
+        except (TypeError, ValueError):
+            revenue = 0.0
+        events.append((received_ms, name, str(item.get("visitor", ""))[:64],
+                       str(item.get("page", ""))[:512], revenue))
+    return events
+
+
+def beacon_snippet(endpoint: str, cookie_name: str = "ab_vid", page: Optional[str] = None) -> str:
+    """
+    Script tag for a managed page that reports page_view, scroll, click and custom events
+
+    The visitor id is read from the variant server's cookie so events can be
+    attributed to a variant; call window.abTrack("add_to_cart") or
+    window.abTrack("purchase", 49.90) from the page for commerce events.
+    Events report page, when given, instead of location.pathname, so a page
+    served at several paths ("/" and "/index.html") is counted under one.
+    """
+    page_expression = json.dumps(page).replace("<", "\\u003c") if page else "location.pathname"
+    return f"""<script>
+(function () {{
+  var m = document.cookie.match(/(?:^|; ){cookie_name}=([^;]+)/), q = [], scrolled = false;
+  var vid = m ? m[1] : (localStorage.abVid = localStorage.abVid || Math.random().toString(16).slice(2));
+  function send() {{ if (q.length) {{ navigator.sendBeacon("{endpoint}", JSON.stringify(q)); q = []; }} }}
+  window.abTrack = function (name, revenue) {{
+    q.push({{event: name, visitor: vid, page: {page_expression}, revenue: revenue || 0}});
+    if (name === "purchase" || q.length >= 20) send();
+  }};
+  abTrack("page_view");
+  addEventListener("scroll", function () {{
+    if (!scrolled && scrollY + innerHeight >= document.body.scrollHeight * 0.5) {{ scrolled = true; abTrack("scroll"); }}
+  }}, {{passive: true}});
+  addEventListener("click", function (e) {{ if (e.target.closest("a,button")) abTrack("click"); }});
+  addEventListener("visibilitychange", function () {{ if (document.visibilityState === "hidden") send(); }});
+  setInterval(send, 5000);
+}})();
+</script>"""
+
+
+class EventCollector:
+    """
+    Beacon endpoint in front of an EventLog
+
+    POST /collect buffers events in memory and answers 204 right away.
+    Buffered events are group-committed: one record and one fsync per
+    batch_size events or per flush_interval, whichever comes first, written
+    off the event loop. When views (e.g. metric_views.MetricViews) are given,
+    each batch is folded into them right after it is on disk.
+    """
+
+    def __init__(self, log: EventLog, batch_size: int = 5000, flush_interval: float = 0.25,
+                 max_events_per_request: int = 500, views=None):
+        self.log = log
+        self.views = views
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_events_per_request = max_events_per_request
+        self.received = 0
+        self._buffer: List[Event] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Future] = None
+
+    def ingest(self, body: bytes) -> int:
+        """Parse and buffer a beacon body; returns the number of events accepted"""
+        events = parse_beacon(body, int(time.time() * 1000), self.max_events_per_request)
+        self._buffer.extend(events)
+        self.received += len(events)
+        return len(events)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: List[Event]) -> None:
+        offset = self.log.append(batch)
+        if self.views is not None:
+            self.views.apply_batch(dict(zip(COLUMNS, zip(*batch))), offset)
+
+    async def handle(self, request: Request) -> Response:
+        cors = [("Access-Control-Allow-Origin", "*")]
+        if request.path != "/collect":
+            return Response(404, b"Not Found")
+        if request.method == "OPTIONS":
+            return Response(204, b"", cors + [("Access-Control-Allow-Methods", "POST"),
+                                              ("Access-Control-Allow-Headers", "Content-Type")])
+        if request.method != "POST":
+            return Response(405, b"Method Not Allowed", [("Allow", "POST, OPTIONS")])
+
+        self.ingest(request.body)
+        if len(self._buffer) >= self.batch_size:
+            if len(self._buffer) >= 4 * self.batch_size:
+                await self.flush()  # the disk is behind; push back on clients
+            elif not self._flush_lock.locked():
+                self._flush_task = asyncio.ensure_future(self.flush())
+        return Response(204, b"", cors)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8090) -> None:
+        """Serve until cancelled, flushing what is buffered on the way out"""
+        server = await start_server(self.handle, host, port)
+        flusher = asyncio.ensure_future(self._flush_periodically())
+        print(f"📡 Collecting events on http://{host}:{port}/collect into {self.log.directory}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            await self.flush()
+
+
+@dataclass
+class EventTotals:
+    """Aggregate of one event name, as in the GA "Events: Event name" export"""
+    count: int = 0
+    revenue: float = 0.0
+    visitors: set = field(default_factory=set)
+    first_ms: Optional[int] = None
+
+
+def aggregate_events(log: EventLog,
+                     since_ms: Optional[int] = None,
+                     until_ms: Optional[int] = None,
+                     page: Optional[str] = None) -> Dict[str, EventTotals]:
+    """Per event name totals over a time range, optionally for one page"""
+    totals: Dict[str, EventTotals] = {}
+    for _, batch in log.scan():
+        for ts_ms, name, visitor, event_page, revenue in zip(*(batch[column] for column in COLUMNS)):
+            if since_ms is not None and ts_ms < since_ms:
+                continue
+            if until_ms is not None and ts_ms >= until_ms:
+                continue
+            if page is not None and event_page != page:
+                continue
+            entry = totals.get(name)
+            if entry is None:
+                entry = totals[name] = EventTotals()
+            entry.count += 1
+            entry.revenue += revenue
+            entry.visitors.add(visitor)
+            if entry.first_ms is None or ts_ms < entry.first_ms:
+                entry.first_ms = ts_ms
+    return totals
+
+
+def format_events_csv(rows: List[Tuple[str, int, int, float]],
+                      source: str,
+                      since_ms: Optional[int] = None,
+                      until_ms: Optional[int] = None,
+                      segment: str = "All pages",
+                      first_ms: Optional[int] = None) -> str:
+    """
+    Render (event name, event count, total users, total revenue) rows in the
+    layout of a GA "Events: Event name" CSV export
+
+    until_ms is exclusive, so the end date is that of the millisecond before
+    it. Without since_ms the start date is that of the earliest event in the
+    rows (first_ms), or the end date when there are none.
+    """
+    now_ms = int(time.time() * 1000)
+    last_ms = (until_ms or now_ms) - 1
+    start_ms = since_ms if since_ms is not None else first_ms if first_ms is not None else last_ms
+    start = time.strftime("%Y%m%d", time.gmtime(start_ms / 1000))
+    end = time.strftime("%Y%m%d", time.gmtime(max(last_ms, start_ms) / 1000))
+    lines = [
+        "# ----------------------------------------",
+        "# Events: Event name",
+        f"# Source: {source}",
+        f"# Page: {segment}",
+        "# ----------------------------------------",
+        "# ",
+        "# All Users",
+        f"# Start date: {start}",
+        f"# End date: {end}",
+        "Event name,Event count,Total users,Event count per active user,Total revenue",
+    ]
+    for name, count, users, revenue in sorted(rows, key=lambda row: -row[1]):
+        per_user = round(count / users, 2) if users else 0
+        lines.append(f"{name},{count},{users},{per_user},{round(revenue, 2)}")
+    return "\n".join(lines)
+
+
+def events_to_csv(log: EventLog,
+                  since_ms: Optional[int] = None,
+                  until_ms: Optional[int] = None,
+                  page: Optional[str] = None) -> str:
+    """
+    Summarize the log in the layout of a GA "Events: Event name" CSV export
+
+    The result can be passed anywhere the pipeline takes csv_content.
+    """
+    totals = aggregate_events(log, since_ms, until_ms, page)
+    rows = [(name, entry.count, len(entry.visitors), entry.revenue) for name, entry in totals.items()]
+    first_ms = min((entry.first_ms for entry in totals.values()), default=None)
+    return format_events_csv(rows, f"first-party event log ({log.directory})", since_ms, until_ms,
+                             page or "All pages", first_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First-party event collector")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Run the beacon endpoint")
+    serve.add_argument("--log-dir", default="events")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8090)
+    export = commands.add_parser("export", help="Print the log as an analysis CSV")
+    export.add_argument("--log-dir", default="events")
+    export.add_argument("--since-hours", type=float, help="Only events from the last N hours")
+    export.add_argument("--page", help="Only events of this page path")
+    args = parser.parse_args()
+
+    log = EventLog(args.log_dir, read_only=args.command == "export")
+    try:
+        if args.command == "serve":
+            install_fast_event_loop()
+            try:
+                asyncio.run(EventCollector(log).serve(args.host, args.port))
+            except KeyboardInterrupt:
+                pass
+        else:
+            since_ms = int((time.time() - args.since_hours * 3600) * 1000) if args.since_hours else None
+            print(events_to_csv(log, since_ms=since_ms, page=args.page))
+    finally:
+        log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# html_dom.py
+
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Elements that never have children or an end tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+}
+
+# Start tags that implicitly close an open element of the given kind
+_IMPLIED_END = {
+    "p": {"address", "article", "aside", "blockquote", "div", "dl", "fieldset",
+          "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr",
+          "main", "nav", "ol", "p", "pre", "section", "table", "ul"},
+    "li": {"li"},
+    "option": {"option", "optgroup"},
+    "tr": {"tr"},
+    "td": {"td", "th", "tr"},
+    "th": {"td", "th", "tr"},
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+}
+
+
+class Node:
+    """An element (or the document root) in a parsed HTML tree"""
+
+    __slots__ = ("tag", "attrs", "children", "parent", "depth", "start", "tag_end", "end", "text")
+
+    def __init__(self, tag: str, attrs: Optional[Dict[str, Optional[str]]] = None,
+                 parent: Optional["Node"] = None, start: int = 0):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.children: List["Node"] = []
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        # Character offsets of the element's source span in the document;
+        # tag_end is just past the start tag
+        self.start = start
+        self.tag_end = start
+        self.end = start
+        # Text directly inside this element, in document order
+        self.text: List[str] = []
+
+    def __repr__(self) -> str:
+        return f"<Node {self.tag} depth={self.depth} children={len(self.children)}>"
+
+    def has(self, name: str) -> bool:
+        return name in self.attrs
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.attrs.get(name, default)
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.attrs.get("id")
+
+    @property
+    def classes(self) -> List[str]:
+        return (self.attrs.get("class") or "").split()
+
+    def iter(self) -> Iterator["Node"]:
+        """Yield every element below this node in document order"""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def find_all(self, *tags: str) -> List["Node"]:
+        wanted = set(tags)
+        return [node for node in self.iter() if node.tag in wanted]
+
+    def find(self, tag: str) -> Optional["Node"]:
+        for node in self.iter():
+            if node.tag == tag:
+                return node
+        return None
+
+    def text_content(self) -> str:
+        parts = list(self.text)
+        for node in self.iter():
+            parts.extend(node.text)
+        return " ".join(" ".join(parts).split())
+
+    def ancestors(self) -> Iterator["Node"]:
+        node = self.parent
+        while node is not None and node.tag != "#document":
+            yield node
+            node = node.parent
+
+
+class _TreeBuilder(HTMLParser):
+    """Builds a Node tree with a forgiving subset of the HTML5 tree rules"""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document")
+        self.root.end = len(html)
+        self.stack = [self.root]
+        self.nodes = 0
+        self.stray_end_tags = 0
+        # Offset of each line start, to turn getpos() into a character offset
+        self._line_starts = [0]
+        position = html.find("\n")
+        while position != -1:
+            self._line_starts.append(position + 1)
+            position = html.find("\n", position + 1)
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def _close_implied(self, tag: str) -> None:
+        current = self.stack[-1]
+        closes = _IMPLIED_END.get(current.tag)
+        if closes and tag in closes and len(self.stack) > 1:
+            current.end = self._offset()
+            self.stack.pop()
+
+    def handle_starttag(self, tag, attrs):
+        self._close_implied(tag)
+        start = self._offset()
+        node = Node(tag, dict(attrs), self.stack[-1], start)
+        node.tag_end = node.end = start + len(self.get_starttag_text() or "")
+        self.stack[-1].children.append(node)
+        self.nodes += 1
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        start = self._offset()
+        node = Node(tag, dict(attrs), self.stack[-1], start)
+        node.tag_end = node.end = start + len(self.get_starttag_text() or "")
+        self.stack[-1].children.append(node)
+        self.nodes += 1
+
+    def handle_endtag(self, tag):
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                end = self._offset() + len(tag) + 3
+                for node in self.stack[index:]:
+                    node.end = end
+                del self.stack[index:]
+                return
+        # Stray end tag with no open element: ignored, as browsers do
+        self.stray_end_tags += 1
+
+    def handle_data(self, data):
+        if data:
+            self.stack[-1].text.append(data)
+
+
+def parse_html(html: str) -> Node:
+    """Parse an HTML document into a Node tree rooted at a '#document' node"""
+    builder = _TreeBuilder(html)
+    builder.feed(html)
+    builder.close()
+    for node in builder.stack[1:]:
+        node.end = len(html)
+    return builder.root
+
+
+def parse_fragment(html: str) -> Tuple[Node, bool]:
+    """
+    Parse a run of sibling elements cut out of a larger document
+
+    Returns:
+        (root, balanced): the '#document' root whose children are the fragment's
+        top-level elements, and whether every element opened in the fragment
+        was closed in it and no end tag closed anything outside it; only a
+        balanced fragment parses the same way in place as on its own
+    """
+    builder = _TreeBuilder(html)
+    builder.feed(html)
+    builder.close()
+    balanced = len(builder.stack) == 1 and not builder.stray_end_tags
+    for node in builder.stack[1:]:
+        node.end = len(html)
+    return builder.root, balanced
+
+
+def format_start_tag(tag: str, attrs: Dict[str, Optional[str]]) -> str:
+    """Serialize a start tag, writing boolean attributes without a value"""
+    parts = [tag]
+    for name, value in attrs.items():
+        if value is None:
+            parts.append(name)
+        else:
+            parts.append(f'{name}="{value.replace("&", "&amp;").replace(chr(34), "&quot;")}"')
+    return "<" + " ".join(parts) + ">"
+
+
+def css_selector_for(node: Node) -> str:
+    """Build a short, reasonably stable CSS selector for an element"""
+    if node.id:
+        return f"#{node.id}"
+    parts = []
+    current: Optional[Node] = node
+    while current is not None and current.tag != "#document":
+        if current.id:
+            parts.append(f"#{current.id}")
+            break
+        part = current.tag + "".join(f".{name}" for name in current.classes)
+        siblings = [child for child in current.parent.children if child.tag == current.tag] \
+            if current.parent is not None else [current]
+        if len(siblings) > 1 and not current.classes:
+            part += f":nth-of-type({siblings.index(current) + 1})"
+        parts.append(part)
+        current = current.parent
+    return " > ".join(reversed(parts))
@@ -0,0 +1,608 @@
+# job_queue.py
+#
+# Durable, multi-process job queue for enhancement runs:
+#   python job_queue.py enqueue enhance --csv metrics.csv --owner me --repo site --file index.html
+#   python job_queue.py worker --processes 4
+#   python job_queue.py status
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from run_planner import RunPlanner
+from version_store import page_key
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind            TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    priority        INTEGER NOT NULL DEFAULT 0,
+    state           TEXT NOT NULL DEFAULT 'queued',
+    idempotency_key TEXT UNIQUE,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    max_attempts    INTEGER NOT NULL DEFAULT 5,
+    run_after       REAL NOT NULL,
+    lease_owner     TEXT,
+    lease_expires   REAL,
+    result          TEXT,
+    last_error      TEXT,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority DESC, run_after, id);
+CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (state, lease_expires);
+"""
+
+# queued -> running -> done, or back to queued on a retryable failure / expired lease, or dead
+JOB_STATES = ("queued", "running", "done", "dead")
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help; the job is dead-lettered at once"""
+
+
+@dataclass
+class Job:
+    """A claimed job, as seen by a handler"""
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    priority: int
+    attempts: int
+    max_attempts: int
+    idempotency_key: Optional[str]
+    queue: "JobQueue" = None
+
+    @property
+    def key(self) -> str:
+        return self.idempotency_key or f"job-{self.id}"
+
+    def follow_up(self, kind: str, payload: Dict[str, Any], delay_seconds: float = 0.0) -> int:
+        """
+        Enqueue the next stage of this job
+
+        The follow-up's idempotency key is derived from this job's, so a
+        retried stage never enqueues its next stage twice.
+        """
+        return self.queue.enqueue(kind, payload, priority=self.priority, idempotency_key=f"{self.key}/{kind}",
+                                  delay_seconds=delay_seconds)
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue, safe to share between processes and hosts
+
+    Workers claim the highest-priority ready job in one write transaction
+    and hold a lease on it that they renew with heartbeats. A job whose
+    lease expires (its worker died) is handed to another worker. Completion
+    and failure are fenced on the lease owner, so a worker that lost its
+    lease cannot overwrite the new owner's outcome. Failed jobs are retried
+    with exponential backoff and dead-lettered after max_attempts.
+    Enqueueing with an idempotency key that already exists returns the
+    existing job.
+
+    WAL mode needs shared memory between the processes; when the database
+    file is shared between hosts over a network filesystem, pass wal=False.
+    """
+
+    def __init__(self, path: str = "jobs.db", wal: bool = True, retry_base_seconds: float = 5.0,
+                 retry_max_seconds: float = 600.0):
+        self.path = path
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL" if wal else "PRAGMA journal_mode=DELETE")
+        self._conn.execute("PRAGMA synchronous=NORMAL" if wal else "PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run operation inside one IMMEDIATE transaction (a single writer at a time)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # --- Producers ---
+
+    def enqueue(self,
+                kind: str,
+                payload: Dict[str, Any],
+                priority: int = 0,
+                idempotency_key: Optional[str] = None,
+                max_attempts: int = 5,
+                delay_seconds: float = 0.0) -> int:
+        """
+        Add a job
+
+        Args:
+            kind: Handler name, e.g. "analyze"
+            payload: JSON-serializable job input
+            priority: Higher runs first
+            idempotency_key: Enqueueing the same key again returns the existing job
+            max_attempts: Attempts before the job is dead-lettered
+            delay_seconds: Don't start before this many seconds from now
+
+        Returns:
+            int: The job id
+        """
+        now = time.time()
+        data = json.dumps(payload)
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, priority, idempotency_key, max_attempts, run_after, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (idempotency_key) DO NOTHING RETURNING id",
+                (kind, data, priority, idempotency_key, max_attempts, now + delay_seconds, now, now)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                row = conn.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+            return row[0]
+
+        return self._write(insert)
+
+    # --- Workers ---
+
+    def claim(self, worker_id: str, lease_seconds: float = 300.0,
+              kinds: Optional[Sequence[str]] = None) -> Optional[Job]:
+        """Lease the highest-priority ready job, or None when nothing is ready"""
+        now = time.time()
+        kind_filter, kind_args = "", ()
+        if kinds:
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            kind_args = tuple(kinds)
+
+        def take(conn):
+            # Jobs whose worker stopped heartbeating go back to the queue, or to the dead letters
+            conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END, "
+                "last_error = 'lease expired', lease_owner = NULL, updated_at = ? "
+                "WHERE state = 'running' AND lease_expires < ?", (now, now)
+            )
+            return conn.execute(
+                "UPDATE jobs SET state = 'running', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE state = 'queued' AND run_after <= ?" + kind_filter +
+                " ORDER BY priority DESC, run_after, id LIMIT 1) "
+                "RETURNING id, kind, payload, priority, attempts, max_attempts, idempotency_key",
+                (worker_id, now + lease_seconds, now, now) + kind_args
+            ).fetchone()
+
+        row = self._write(take)
+        if row is None:
+            return None
+        job_id, kind, payload, priority, attempts, max_attempts, key = row
+        return Job(job_id, kind, json.loads(payload), priority, attempts, max_attempts, key, queue=self)
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float = 300.0) -> bool:
+        """Extend a lease; False means the lease was lost and the result will be discarded"""
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+            (now + lease_seconds, now, job_id, worker_id)
+        ).rowcount == 1)
+
+    def complete(self, job_id: int, worker_id: str, result: Any = None) -> bool:
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = 'done', result = ?, lease_owner = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+            (json.dumps(result), now, job_id, worker_id)
+        ).rowcount == 1)
+
+    def fail(self, job: Job, worker_id: str, error: str, permanent: bool = False) -> str:
+        """
+        Record a failed attempt
+
+        Returns:
+            str: "queued" (will be retried), "dead" or "lost" (lease no longer held)
+        """
+        now = time.time()
+        state = "dead" if permanent or job.attempts >= job.max_attempts else "queued"
+        backoff = min(self.retry_base_seconds * 2 ** (job.attempts - 1), self.retry_max_seconds)
+        run_after = now + backoff * random.uniform(0.5, 1.0)
+        updated = self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = ?, last_error = ?, run_after = ?, lease_owner = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ? AND state = 'running'",
+            (state, error[:4000], run_after, now, job.id, worker_id)
+        ).rowcount)
+        return state if updated else "lost"
+
+    def supersede(self, target: Dict[str, str], reason: str,
+                  kinds: Sequence[str] = ("enhance", "analyze", "merge", "publish")) -> int:
+        """
+        Dead-letter the queued pipeline jobs of a page, e.g. after the page
+        changed under them: their payloads carry its old content and results
+
+        Running jobs are left to finish. Returns how many jobs were superseded.
+        """
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            f"UPDATE jobs SET state = 'dead', last_error = ?, updated_at = ? "
+            f"WHERE state = 'queued' AND kind IN ({', '.join('?' * len(kinds))}) "
+            "AND json_extract(payload, '$.target.repo_owner') = ? "
+            "AND json_extract(payload, '$.target.repo_name') = ? "
+            "AND json_extract(payload, '$.target.file_path') = ?",
+            (f"superseded: {reason}"[:4000], now, *kinds,
+             target["repo_owner"], target["repo_name"], target["file_path"])
+        ).rowcount)
+
+    def absorb(self, job: Job) -> Dict[str, Any]:
+        """
+        Take over the other queued jobs of job's kind for the same target,
+        due or not (see edit_coalescer.py)
+
+        They are completed as coalesced into job, and their payloads (without
+        the target) are added to job's payload["coalesced"] in the same
+        transaction, so a retry of job still has them.
+
+        Returns:
+            job's payload, updated
+        """
+        target = job.payload["target"]
+        now = time.time()
+
+        def take(conn):
+            rows = conn.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'queued' AND kind = ? AND id != ? "
+                "AND json_extract(payload, '$.target.repo_owner') = ? "
+                "AND json_extract(payload, '$.target.repo_name') = ? "
+                "AND json_extract(payload, '$.target.file_path') = ? ORDER BY id",
+                (job.kind, job.id, target["repo_owner"], target["repo_name"], target["file_path"])
+            ).fetchall()
+            if not rows:
+                return job.payload
+            absorbed = []
+            for job_id, data in rows:
+                sibling = json.loads(data)
+                sibling.pop("target", None)
+                # A retried job may have absorbed others itself
+                absorbed.extend(sibling.pop("coalesced", []))
+                absorbed.append(dict(sibling, job_id=job_id))
+            payload = dict(job.payload, coalesced=job.payload.get("coalesced", []) + absorbed)
+            conn.executemany(
+                "UPDATE jobs SET state = 'done', result = ?, updated_at = ? WHERE id = ?",
+                [(json.dumps({"coalesced_into": job.id}), now, job_id) for job_id, _ in rows]
+            )
+            conn.execute("UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(payload), now, job.id))
+            return payload
+
+        job.payload = self._write(take)
+        return job.payload
+
+    # --- Inspection ---
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        record = dict(zip(columns, row))
+        record["payload"] = json.loads(record["payload"])
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return record
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in JOB_STATES}
+        counts.update(rows)
+        return counts
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, attempts, last_error, updated_at FROM jobs WHERE state = 'dead' "
+                "ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(("id", "kind", "attempts", "last_error", "updated_at"), row)) for row in rows]
+
+    def requeue(self, job_id: int) -> bool:
+        """Give a dead-lettered job a fresh set of attempts"""
+        now = time.time()
+        return self._write(lambda conn: conn.execute(
+            "UPDATE jobs SET state = 'queued', attempts = 0, run_after = ?, updated_at = ? "
+            "WHERE id = ? AND state = 'dead'", (now, now, job_id)
+        ).rowcount == 1)
+
+
+Handler = Callable[[Job], Any]
+
+
+class Worker:
+    """
+    Runs jobs from a JobQueue with the given handlers, one at a time
+
+    While a handler runs, a background thread renews the lease every third
+    of lease_seconds. A handler returns a JSON-serializable result; raising
+    PermanentJobError dead-letters the job, any other exception retries it.
+    """
+
+    def __init__(self,
+                 queue: JobQueue,
+                 handlers: Dict[str, Handler],
+                 worker_id: Optional[str] = None,
+                 lease_seconds: float = 300.0,
+                 poll_interval: float = 1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.processed = 0
+
+    def _keep_leased(self, job: Job, done: threading.Event) -> None:
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job.id, self.worker_id, self.lease_seconds):
+                print(f"⚠️ Lost the lease on job {job.id}; its result will be discarded")
+                return
+
+    def run_once(self) -> bool:
+        """Run one job if one is ready; returns whether one ran"""
+        job = self.queue.claim(self.worker_id, self.lease_seconds, kinds=list(self.handlers))
+        if job is None:
+            return False
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_leased, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handlers[job.kind](job)
+        except PermanentJobError as e:
+            state = self.queue.fail(job, self.worker_id, f"{type(e).__name__}: {e}", permanent=True)
+            print(f"❌ Job {job.id} ({job.kind}) failed permanently: {e}")
+        except Exception as e:
+            state = self.queue.fail(job, self.worker_id, f"{type(e).__name__}: {e}")
+            print(f"⚠️ Job {job.id} ({job.kind}) attempt {job.attempts} failed ({state}): {e}")
+        else:
+            if not self.queue.complete(job.id, self.worker_id, result):
+                print(f"⚠️ Job {job.id} finished after its lease was lost; result discarded")
+        finally:
+            done.set()
+            heartbeat.join()
+        self.processed += 1
+        return True
+
+    def run(self, stop: Optional[threading.Event] = None, max_jobs: Optional[int] = None,
+            exit_when_idle: bool = False) -> int:
+        """Process jobs until stopped; returns the number processed"""
+        stop = stop or threading.Event()
+        while not stop.is_set() and (max_jobs is None or self.processed < max_jobs):
+            if not self.run_once():
+                if exit_when_idle:
+                    break
+                stop.wait(self.poll_interval * random.uniform(0.5, 1.5))
+        return self.processed
+
+
+def enhancer_handlers(enhancer, github_token: str = "", github_user: str = "",
+                      coalesce_seconds: float = 0.0) -> Dict[str, Handler]:
+    """
+    Handlers that run the HTMLEnhancer pipeline as separately retried stages
+
+    enhance -> analyze -> merge -> publish, each stage enqueueing the next
+    with the previous stage's output; rollback publishes a stored version.
+    A "target" payload entry ({repo_owner, repo_name, file_path}) says where
+    to publish; without one the pipeline stops after merge. GitHub
+    credentials come from the worker, never from the database.
+
+    With coalesce_seconds, a merge waits that long after its analysis, and
+    then takes over every other queued merge of the same page: their edits
+    are combined (edit_coalescer.coalesce) into one merge and one commit.
+    """
+
+    def planner(target: Dict[str, str]) -> RunPlanner:
+        return RunPlanner(enhancer, github_token, github_user,
+                          target["repo_owner"], target["repo_name"], target["file_path"])
+
+    def enhance(job: Job):
+        payload = job.payload
+        html_content = payload.get("html_content")
+        if html_content is None:
+            with planner(payload["target"]) as run:
+                html_content = run.read_current_html()
+        job.follow_up("analyze", dict(payload, html_content=html_content))
+
+    def analyze(job: Job):
+        payload = job.payload
+        instructions, code_edit = enhancer.analyze_engagement_with_claude(
+            payload["csv_content"], payload["html_content"], payload.get("analysis_html_chars"),
+            _page(payload)
+        )
+        job.follow_up("merge", dict(payload, instructions=instructions, code_edit=code_edit),
+                      delay_seconds=coalesce_seconds if payload.get("target") else 0.0)
+        return {"instructions": instructions}
+
+    def merge(job: Job):
+        payload = job.payload
+        if coalesce_seconds and payload.get("target"):
+            payload = _coalesced(job.queue.absorb(job), job.id)
+        enhanced_html = enhancer.merge_with_morph(payload["instructions"], payload["html_content"],
+                                                  payload["code_edit"])
+        enhanced_html = enhancer.finalize_html(enhanced_html)
+        enhancer.record_index_edit(_page(payload), payload["html_content"], enhanced_html, payload["instructions"])
+        if payload.get("target"):
+            job.follow_up("publish", dict(payload, enhanced_html=enhanced_html))
+            return {"enhanced_bytes": len(enhanced_html)}
+        return {"enhanced_html": enhanced_html}
+
+    def publish(job: Job):
+        payload = job.payload
+        target = payload["target"]
+        with planner(target) as run:
+            # publish() also enforces the budget, but a blocked page must not be retried
+            report = enhancer.check_page_budget(payload["html_content"], payload["enhanced_html"])
+            if report.blocked:
+                raise PermanentJobError(f"Enhanced page exceeds its page budget: {'; '.join(report.violations)}")
+            if not run.publish(payload["html_content"], payload["enhanced_html"], payload["instructions"]):
+                raise Exception("GitHub push failed")
+        if enhancer.version_store is not None:
+            enhancer.version_store.record_version(
+                page_key(target["repo_owner"], target["repo_name"], target["file_path"]),
+                original_html=payload["html_content"],
+                enhanced_html=payload["enhanced_html"],
+                instruction=payload["instructions"],
+                code_edit=payload["code_edit"],
+                metrics=payload.get("csv_content"),
+                commit_sha=enhancer.last_commit_sha
+            )
+        return {"commit_sha": enhancer.last_commit_sha}
+
+    def rollback(job: Job):
+        payload = job.payload
+        target = payload["target"]
+        if enhancer.version_store is None:
+            raise PermanentJobError("rollback needs an enhancer with a version_store")
+        if not enhancer.version_store.rollback(enhancer, payload["version_id"], github_token, github_user,
+                                               target["repo_owner"], target["repo_name"], target["file_path"],
+                                               restore=payload.get("restore", "original")):
+            raise Exception("GitHub push failed")
+        return {"commit_sha": enhancer.last_commit_sha}
+
+    return {"enhance": enhance, "analyze": analyze, "merge": merge, "publish": publish, "rollback": rollback}
+
+
+def _coalesced(payload: Dict[str, Any], job_id: int) -> Dict[str, Any]:
+    """A merge payload with the edits it absorbed combined into its own, merged into the newest page read"""
+    absorbed = payload.get("coalesced")
+    if not absorbed:
+        return payload
+    from edit_coalescer import PendingEdit, coalesce
+
+    stages = sorted([dict(payload, job_id=job_id)] + absorbed, key=lambda stage: stage["job_id"])
+    combined = coalesce([PendingEdit(stage["instructions"], stage["code_edit"], f"job {stage['job_id']}",
+                                     stage.get("csv_content")) for stage in stages])
+    print(combined.summary())
+    newest = stages[-1]
+    merged = dict(payload, instructions=combined.instructions, code_edit=combined.code_edit,
+                  html_content=newest["html_content"], csv_content=combined.metrics,
+                  coalesced_jobs=[stage["job_id"] for stage in stages])
+    merged.pop("coalesced")
+    return merged
+
+
+def _page(payload: Dict[str, Any]) -> Optional[str]:
+    """The page key of a pipeline payload's target, if it has one"""
+    target = payload.get("target")
+    return page_key(target["repo_owner"], target["repo_name"], target["file_path"]) if target else None
+
+
+def _worker_process(db_path: str, wal: bool, versions_db: Optional[str], index_db: Optional[str] = None,
+                    coalesce_seconds: float = 0.0) -> None:
+    from Claude_Morph_Edit_HTML_GH_or_Upload import create_enhancer_from_env
+
+    enhancer = create_enhancer_from_env()
+    if versions_db:
+        from version_store import VersionStore
+
+        enhancer.version_store = VersionStore(versions_db)
+    if index_db:
+        from element_index import ElementIndex
+
+        enhancer.element_index = ElementIndex(index_db)
+    handlers = enhancer_handlers(enhancer, os.getenv("GITHUB_TOKEN", ""), os.getenv("GITHUB_USER", ""),
+                                 coalesce_seconds)
+    worker = Worker(JobQueue(db_path, wal=wal), handlers)
+    print(f"👷 Worker {worker.worker_id} started")
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable job queue for enhancement runs")
+    parser.add_argument("--db", default="jobs.db")
+    parser.add_argument("--no-wal", action="store_true", help="For a database shared over a network filesystem")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue an enhancement or a rollback")
+    enqueue.add_argument("kind", choices=["enhance", "rollback"])
+    enqueue.add_argument("--owner", required=True)
+    enqueue.add_argument("--repo", required=True)
+    enqueue.add_argument("--file", required=True)
+    enqueue.add_argument("--csv", help="Metrics CSV for enhance")
+    enqueue.add_argument("--version-id", type=int, help="Version for rollback")
+    enqueue.add_argument("--priority", type=int, default=0)
+    enqueue.add_argument("--key", help="Idempotency key")
+
+    worker = commands.add_parser("worker", help="Run worker processes (GITHUB_TOKEN / GITHUB_USER from env)")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--versions-db", help="VersionStore to record published versions in")
+    worker.add_argument("--index-db", help="ElementIndex of the pages' elements and the edits that changed them")
+    worker.add_argument("--coalesce-seconds", type=float, default=0.0,
+                        help="Hold each merge this long and fold the page's other queued merges into it "
+                             "(one merge and one commit per burst)")
+
+    commands.add_parser("status", help="Job counts and dead letters")
+    requeue = commands.add_parser("requeue", help="Retry a dead-lettered job")
+    requeue.add_argument("job_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        processes = [multiprocessing.Process(target=_worker_process,
+                                             args=(args.db, not args.no_wal, args.versions_db, args.index_db,
+                                                   args.coalesce_seconds))
+                     for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    queue = JobQueue(args.db, wal=not args.no_wal)
+    try:
+        if args.command == "enqueue":
+            target = {"repo_owner": args.owner, "repo_name": args.repo, "file_path": args.file}
+            if args.kind == "enhance":
+                if not args.csv:
+                    parser.error("enhance needs --csv")
+                with open(args.csv, "r", encoding="utf-8") as f:
+                    payload = {"csv_content": f.read(), "target": target}
+            else:
+                if args.version_id is None:
+                    parser.error("rollback needs --version-id")
+                payload = {"version_id": args.version_id, "target": target}
+            job_id = queue.enqueue(args.kind, payload, priority=args.priority, idempotency_key=args.key)
+            print(f"📥 Job {job_id} queued")
+        elif args.command == "status":
+            print(json.dumps(queue.counts()))
+            for letter in queue.dead_letters():
+                print(f"💀 {letter['id']} {letter['kind']} after {letter['attempts']} attempts: {letter['last_error']}")
+        elif args.command == "requeue":
+            print("Requeued" if queue.requeue(args.job_id) else "Not a dead-lettered job")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
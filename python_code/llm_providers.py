@@ -0,0 +1,41 @@
+# llm_providers.py
+#
+# Analyzer and merger plugins (see plugins.py); imported on first use only.
+
+from anthropic import Anthropic
+from openai import OpenAI
+
+
+class AnthropicAnalyzer:
+    """Analysis prompts answered by Claude"""
+
+    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20241022", max_tokens: int = 1500):
+        self.client = Anthropic(api_key=api_key)
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def complete(self, prompt: str) -> str:
+        msg = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return "".join([b.text for b in msg.content if hasattr(b, "text")])
+
+
+class MorphMerger:
+    """Applies a code edit to a document with Morph's fast-apply model"""
+
+    def __init__(self, api_key: str, model: str = "morph-v3-large", base_url: str = "https://api.morphllm.com/v1"):
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.model = model
+
+    def merge(self, instructions: str, original_html: str, code_edit: str) -> str:
+        resp = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{
+                "role": "user",
+                "content": f"<instruction>{instructions}</instruction>\n<code>{original_html}</code>\n<update>{code_edit}</update>"
+            }],
+        )
+        return resp.choices[0].message.content
@@ -0,0 +1,520 @@
+# metric_views.py
+#
+# Incrementally maintained metric rollups over the first-party event log:
+#   python metric_views.py --log-dir events --state metric_views.pkl --since-days 7
+
+import argparse
+import bisect
+import hashlib
+import math
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache, reduce
+from typing import Dict, List, Optional, Tuple
+
+from event_collector import COLUMNS, EventLog, LogOffset, format_events_csv
+from variant_server import assign_variant
+
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+def hll_position(value: str, precision: int) -> Tuple[int, int]:
+    """HyperLogLog register index and rank of a value"""
+    x = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+    width = 64 - precision
+    return x >> width, width - (x & ((1 << width) - 1)).bit_length() + 1
+
+
+def hll_estimate(registers: bytes) -> int:
+    """Distinct-count estimate from HyperLogLog registers, with small-range correction"""
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(_INVERSE_POWERS[rank] for rank in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
+
+
+@lru_cache(maxsize=None)
+def _high_bits(size: int) -> int:
+    return int.from_bytes(b"\x80" * size, "little")
+
+
+def register_max(first: bytes, second: bytes) -> bytearray:
+    """
+    Register-wise max of two sketches, computed on whole big integers
+
+    Ranks are below 128, so (a | 0x80) - b never borrows across bytes and
+    its high bit is set exactly where a >= b; that bit becomes a byte mask
+    selecting a or b.
+    """
+    size = len(first)
+    high = _high_bits(size)
+    a = int.from_bytes(first, "little")
+    b = int.from_bytes(second, "little")
+    mask = ((((a | high) - b) & high) >> 7) * 0xFF
+    return bytearray((b ^ ((a ^ b) & mask)).to_bytes(size, "little"))
+
+
+def _union(first: Optional[bytearray], second: Optional[bytearray]) -> Optional[bytearray]:
+    """Register-wise max; always a new array, so table entries never share storage"""
+    if first is None:
+        return bytearray(second) if second is not None else None
+    if second is None:
+        return bytearray(first)
+    return register_max(first, second)
+
+
+class _Series:
+    """
+    Rollup of one (page, variant, event) key, one entry per time bucket
+
+    Counts, revenue and squared revenue are kept as prefix sums, so any
+    bucket range is two lookups. Users are kept as an idempotent sparse table of HyperLogLog
+    sketches: table[k][i] is the union of buckets i .. i + 2**k - 1, so any
+    range is the union of two (possibly overlapping) entries.
+
+    Series of pages under an experiment also keep the exact set of visitors
+    per bucket, since a significance test cannot use counts with a fixed 2%
+    error.
+
+    Buckets before first have expired: their sketches and visitors are
+    dropped and only the prefix sums (three numbers a bucket) remain.
+    """
+
+    __slots__ = ("count_prefix", "revenue_prefix", "revenue_sq_prefix", "table", "visitors", "first")
+
+    def __init__(self, exact: bool = False):
+        self.count_prefix: List[int] = [0]
+        self.revenue_prefix: List[float] = [0.0]
+        self.revenue_sq_prefix: List[float] = [0.0]
+        self.table: List[List[Optional[bytearray]]] = [[]]
+        self.visitors: Optional[Dict[int, set]] = {} if exact else None
+        self.first = 0
+
+    def __len__(self) -> int:
+        return len(self.table[0])
+
+    def extend(self, last: int) -> None:
+        """Add empty buckets up to and including bucket last"""
+        while len(self) <= last:
+            bucket = len(self)
+            self.count_prefix.append(self.count_prefix[-1])
+            self.revenue_prefix.append(self.revenue_prefix[-1])
+            self.revenue_sq_prefix.append(self.revenue_sq_prefix[-1])
+            self.table[0].append(None)
+            level = 1
+            while (1 << level) <= bucket + 1:
+                if len(self.table) <= level:
+                    self.table.append([])
+                start = bucket - (1 << level) + 1
+                half = 1 << (level - 1)
+                if start < getattr(self, "first", 0):
+                    self.table[level].append(None)
+                else:
+                    self.table[level].append(_union(self.table[level - 1][start],
+                                                     self.table[level - 1][start + half]))
+                level += 1
+
+    def add(self, bucket: int, count: int, revenue: float, revenue_sq: float,
+            ranks: Dict[int, int], precision: int) -> None:
+        """Fold a batch's contribution to one bucket into the prefix sums and every covering sketch"""
+        for position in range(bucket + 1, len(self.count_prefix)):
+            self.count_prefix[position] += count
+            self.revenue_prefix[position] += revenue
+            self.revenue_sq_prefix[position] += revenue_sq
+        first = getattr(self, "first", 0)
+        for level, entries in enumerate(self.table):
+            for start in range(max(first, bucket - (1 << level) + 1), min(bucket, len(entries) - 1) + 1):
+                registers = entries[start]
+                if registers is None:
+                    registers = entries[start] = bytearray(1 << precision)
+                for index, rank in ranks.items():
+                    if registers[index] < rank:
+                        registers[index] = rank
+
+    def expire(self, first: int) -> None:
+        """Drop the sketches and visitors of every bucket before first"""
+        previous = getattr(self, "first", 0)
+        if first <= previous:
+            return
+        for entries in self.table:
+            for start in range(previous, min(first, len(entries))):
+                entries[start] = None
+        visitors = getattr(self, "visitors", None)
+        if visitors:
+            for bucket in [bucket for bucket in visitors if bucket < first]:
+                del visitors[bucket]
+        self.first = first
+
+    def add_visitors(self, bucket: int, visitors: set) -> None:
+        """Record the visitors seen in one bucket (series with exact visitors only)"""
+        self.visitors.setdefault(bucket, set()).update(visitors)
+
+    def window_visitors(self, first: int, last: int) -> Optional[set]:
+        """Exact visitors seen in buckets first .. last, or None when the series does not keep them"""
+        visitors = getattr(self, "visitors", None)
+        if visitors is None:
+            return None
+        if last - first + 1 < len(visitors):
+            sets = [visitors[bucket] for bucket in range(first, last + 1) if bucket in visitors]
+        else:
+            sets = [seen for bucket, seen in visitors.items() if first <= bucket <= last]
+        return set().union(*sets)
+
+    def window(self, first: int, last: int) -> Tuple[int, float, float, List[bytearray]]:
+        """Count, revenue, squared revenue and the (at most two) sketches covering buckets first .. last"""
+        count = self.count_prefix[last + 1] - self.count_prefix[first]
+        revenue = self.revenue_prefix[last + 1] - self.revenue_prefix[first]
+        revenue_sq = self.revenue_sq_prefix[last + 1] - self.revenue_sq_prefix[first]
+        level = (last - first + 1).bit_length() - 1
+        entries = self.table[level]
+        sketches = [entries[first], entries[last - (1 << level) + 1]]
+        return count, revenue, revenue_sq, [registers for registers in sketches if registers is not None]
+
+
+@dataclass
+class MetricRow:
+    """One row of the GA "Events: Event name" table"""
+    event: str
+    event_count: int
+    total_users: int
+    total_revenue: float
+    revenue_sq: float = 0.0  # sum of squared event revenues, for variance estimates
+
+    @property
+    def count_per_user(self) -> float:
+        return round(self.event_count / self.total_users, 2) if self.total_users else 0.0
+
+
+class MetricViews:
+    """
+    Incremental rollups per page, variant, event and time bucket
+
+    Batches from the event log are folded in as they arrive (apply_batch,
+    or catch_up from the last applied log offset), so history is never
+    re-read. A window query costs a fixed amount of work per key, whatever
+    the length of the history: two prefix-sum lookups and one union of two
+    HyperLogLog sketches (about 2% error on user counts at the default
+    precision). Windows are aligned to whole buckets. For pages under an
+    experiment the exact visitors are kept as well (see users), at the cost
+    of memory per visitor.
+
+    Variants are recomputed from the visitor id with assign_variant, using
+    the same (experiment, split) the variant server was given for the
+    page; pages without an experiment get the variant "".
+
+    Memory per busy key is about buckets * log2(buckets) * 2**precision
+    bytes, plus the visitor ids of experiment pages; pick bucket_seconds as
+    the finest window alignment you need. With retention_days, older
+    buckets expire whenever a new one starts (see expire), which bounds
+    both; windows then start at the oldest bucket kept.
+    """
+
+    def __init__(self,
+                 bucket_seconds: int = 86400,
+                 precision: int = 11,
+                 experiments: Optional[Dict[str, Tuple[str, float]]] = None,
+                 retention_days: Optional[float] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"precision must be between 4 and 16, not {precision}")
+        self.bucket_seconds = bucket_seconds
+        self.precision = precision
+        self.experiments = dict(experiments or {})
+        self.retention_days = retention_days
+        self.origin: Optional[int] = None
+        self.last_bucket = 0
+        self.first_kept = 0
+        self.offset: Optional[LogOffset] = None
+        self.events_applied = 0
+        self.series: Dict[Tuple[str, str, str], _Series] = {}
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def variant_of(self, page: str, visitor: str) -> str:
+        experiment = self.experiments.get(page)
+        return assign_variant(visitor, *experiment) if experiment else ""
+
+    def _bucket_range(self, since_ms: Optional[int], until_ms: Optional[int]) -> Tuple[int, int]:
+        bucket_ms = self.bucket_seconds * 1000
+        first = 0 if since_ms is None else since_ms // bucket_ms - self.origin
+        last = 2 ** 62 if until_ms is None else (until_ms - 1) // bucket_ms - self.origin
+        return max(first, getattr(self, "first_kept", 0)), last
+
+    # --- Maintenance ---
+
+    def apply_batch(self, columns: Dict[str, list], offset: Optional[LogOffset] = None) -> int:
+        """
+        Fold one batch of events (columns keyed by event_collector.COLUMNS) into the views
+
+        Args:
+            columns: The batch, e.g. as yielded by EventLog.scan
+            offset: Log offset just past the batch, remembered for catch_up
+
+        Returns:
+            int: Number of events applied
+        """
+        bucket_ms = self.bucket_seconds * 1000
+        positions: Dict[str, Tuple[int, int]] = {}
+        variants: Dict[Tuple[str, str], str] = {}
+        pending: Dict[Tuple[Tuple[str, str, str], int], list] = {}
+        rows = list(zip(*(columns[column] for column in COLUMNS)))
+        if not rows:
+            return 0
+
+        with self._lock:
+            if self.origin is None:
+                self.origin = min(row[0] for row in rows) // bucket_ms
+            first_kept = getattr(self, "first_kept", 0)
+            newest = self.last_bucket
+            for ts_ms, event, visitor, page, revenue in rows:
+                # Events older than the first bucket kept (clock skew, late
+                # beacons) land in that bucket
+                bucket = max(ts_ms // bucket_ms - self.origin, first_kept)
+                variant = variants.get((page, visitor))
+                if variant is None:
+                    variant = variants[(page, visitor)] = self.variant_of(page, visitor)
+                key = (page, variant, event)
+                entry = pending.get((key, bucket))
+                if entry is None:
+                    entry = pending[(key, bucket)] = [0, 0.0, 0.0, {}, set() if variant else None]
+                entry[0] += 1
+                entry[1] += revenue
+                entry[2] += revenue * revenue
+                position = positions.get(visitor)
+                if position is None:
+                    position = positions[visitor] = hll_position(visitor, self.precision)
+                ranks = entry[3]
+                if ranks.get(position[0], 0) < position[1]:
+                    ranks[position[0]] = position[1]
+                if entry[4] is not None:
+                    entry[4].add(visitor)
+
+            for (key, bucket), (count, revenue, revenue_sq, ranks, visitors) in pending.items():
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = _Series(exact=visitors is not None)
+                    series.expire(first_kept)
+                series.extend(bucket)
+                self.last_bucket = max(self.last_bucket, bucket)
+                series.add(bucket, count, revenue, revenue_sq, ranks, self.precision)
+                if visitors is not None and getattr(series, "visitors", None) is not None:
+                    series.add_visitors(bucket, visitors)
+            if offset is not None:
+                self.offset = offset
+            self.events_applied += len(rows)
+            if self.last_bucket > newest:
+                self.expire()
+        return len(rows)
+
+    def catch_up(self, log: EventLog) -> int:
+        """Apply every batch written to the log since the last applied offset"""
+        applied = 0
+        for offset, batch in log.scan(self.offset):
+            applied += self.apply_batch(batch, offset)
+        return applied
+
+    def expire(self, before_ms: Optional[int] = None) -> int:
+        """
+        Drop the sketches and exact visitors of buckets wholly before before_ms
+
+        Args:
+            before_ms: Cutoff (default: retention_days before the end of the
+                newest bucket; nothing expires without retention_days)
+
+        Returns:
+            int: Number of buckets expired
+        """
+        with self._lock:
+            if self.origin is None:
+                return 0
+            bucket_ms = self.bucket_seconds * 1000
+            if before_ms is None:
+                retention_days = getattr(self, "retention_days", None)
+                if retention_days is None:
+                    return 0
+                before_ms = (self.origin + self.last_bucket + 1) * bucket_ms - int(retention_days * 86400 * 1000)
+            first_kept = min(max(before_ms // bucket_ms - self.origin, 0), self.last_bucket)
+            previous = getattr(self, "first_kept", 0)
+            if first_kept <= previous:
+                return 0
+            for series in self.series.values():
+                series.expire(first_kept)
+            self.first_kept = first_kept
+            return first_kept - previous
+
+    # --- Queries ---
+
+    def rows(self,
+             page: Optional[str] = None,
+             variant: Optional[str] = None,
+             since_ms: Optional[int] = None,
+             until_ms: Optional[int] = None) -> Dict[str, MetricRow]:
+        """
+        GA-style rows per event name for a window
+
+        Args:
+            page: Only this page (default: all pages)
+            variant: Only this variant (default: all variants)
+            since_ms: Window start, inclusive (default: the first event)
+            until_ms: Window end, exclusive (default: now)
+
+        Windows start no earlier than the oldest bucket kept (see expire).
+        """
+        totals: Dict[str, list] = {}
+        with self._lock:
+            if self.origin is None:
+                return {}
+            first, last = self._bucket_range(since_ms, until_ms)
+            for (key_page, key_variant, event), series in self.series.items():
+                if (page is not None and key_page != page) or (variant is not None and key_variant != variant):
+                    continue
+                series_last = min(last, len(series) - 1)
+                if series_last < first:
+                    continue
+                count, revenue, revenue_sq, sketches = series.window(first, series_last)
+                if not count:
+                    continue
+                entry = totals.setdefault(event, [0, 0.0, 0.0, []])
+                entry[0] += count
+                entry[1] += revenue
+                entry[2] += revenue_sq
+                entry[3].extend(sketches)
+
+        return {
+            # A sketch can overestimate; there are never more users than events
+            event: MetricRow(event, count, min(hll_estimate(reduce(register_max, sketches)), count),
+                             revenue, revenue_sq)
+            for event, (count, revenue, revenue_sq, sketches) in totals.items()
+        }
+
+    def users(self,
+              page: str,
+              variant: str,
+              event: str,
+              since_ms: Optional[int] = None,
+              until_ms: Optional[int] = None) -> Optional[set]:
+        """
+        Exact set of visitors with the event in a window, for pages under an experiment
+
+        Returns:
+            Optional[set]: The visitors (empty when there were none), or None
+            when the series only has sketches, e.g. views saved before exact
+            visitors were kept
+        """
+        with self._lock:
+            series = self.series.get((page, variant, event))
+            if self.origin is None or series is None:
+                return set()
+            first, last = self._bucket_range(since_ms, until_ms)
+            last = min(last, len(series) - 1)
+            if last < first:
+                return set() if getattr(series, "visitors", None) is not None else None
+            return series.window_visitors(first, last)
+
+    def to_csv(self,
+               page: Optional[str] = None,
+               variant: Optional[str] = None,
+               since_ms: Optional[int] = None,
+               until_ms: Optional[int] = None) -> str:
+        """The window as a GA "Events: Event name" CSV, ready for the analysis step"""
+        rows = [(row.event, row.event_count, row.total_users, row.total_revenue)
+                for row in self.rows(page, variant, since_ms, until_ms).values()]
+        first_ms = None
+        if self.origin is not None:
+            bucket_ms = self.bucket_seconds * 1000
+            if until_ms is None:
+                until_ms = (self.origin + self.last_bucket + 1) * bucket_ms
+            if since_ms is not None:
+                since_ms = max(since_ms, (self.origin + getattr(self, "first_kept", 0)) * bucket_ms)
+            else:
+                first = self._first_bucket(page, variant)
+                first_ms = (self.origin + first) * bucket_ms if first is not None else None
+        segment = page or "All pages"
+        if variant is not None:
+            segment += f" (variant: {variant or 'none'})"
+        return format_events_csv(rows, "first-party metric views", since_ms, until_ms, segment, first_ms)
+
+    def _first_bucket(self, page: Optional[str], variant: Optional[str]) -> Optional[int]:
+        """Earliest bucket with events for a page and variant (None: any), or None"""
+        first = None
+        with self._lock:
+            for (key_page, key_variant, _), series in self.series.items():
+                if (page is not None and key_page != page) or (variant is not None and key_variant != variant):
+                    continue
+                # count_prefix[bucket + 1] is the first prefix sum above that of the oldest bucket kept
+                kept = min(getattr(self, "first_kept", 0), len(series))
+                bucket = bisect.bisect_right(series.count_prefix, series.count_prefix[kept]) - 1
+                if bucket < len(series) and (first is None or bucket < first):
+                    first = bucket
+        return first
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        """Write the views and their log offset atomically"""
+        with self._lock:
+            data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "MetricViews":
+        """Views saved by save(), or new views built with kwargs when there are none"""
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental metric views over the event log")
+    parser.add_argument("--log-dir", default="events")
+    parser.add_argument("--state", default="metric_views.pkl", help="Where the views are kept between runs")
+    parser.add_argument("--bucket-seconds", type=int, default=86400, help="Used when creating new views")
+    parser.add_argument("--experiment", nargs=3, action="append", default=[],
+                        metavar=("PAGE", "EXPERIMENT", "SPLIT"),
+                        help="Attribute PAGE's events to variants; used when creating new views")
+    parser.add_argument("--retention-days", type=float,
+                        help="Expire sketches and visitors older than N days (keep it above the longest A/B test)")
+    parser.add_argument("--since-days", type=float, help="Only the last N days")
+    parser.add_argument("--page")
+    parser.add_argument("--variant")
+    args = parser.parse_args()
+
+    views = MetricViews.load(args.state, bucket_seconds=args.bucket_seconds, experiments={
+        page: (experiment, float(split)) for page, experiment, split in args.experiment
+    })
+    if args.retention_days is not None:
+        views.retention_days = args.retention_days
+    log = EventLog(args.log_dir, read_only=True)
+    try:
+        start = time.perf_counter()
+        applied = views.catch_up(log)
+        print(f"# Applied {applied} new events in {time.perf_counter() - start:.2f}s")
+    finally:
+        log.close()
+    views.save(args.state)
+
+    since_ms = int((time.time() - args.since_days * 86400) * 1000) if args.since_days else None
+    print(views.to_csv(args.page, args.variant, since_ms=since_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# minimal_diff.py
+
+import bisect
+import difflib
+import html as html_lib
+import re
+from dataclasses import dataclass
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+
+_TAG = re.compile(
+    r"<!--.*?-->"
+    r"|<![^>]*>"
+    r"|</?[a-zA-Z][^>\"']*(?:\"[^\"]*\"[^>\"']*|'[^']*'[^>\"']*)*>",
+    re.DOTALL,
+)
+_ATTR = re.compile(r"""([^\s"'>/=]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+))?""")
+_TAG_NAME = re.compile(r"</?([a-zA-Z][\w:-]*)")
+
+# Elements whose content is not HTML and is compared line by line
+_RAW_TEXT_ELEMENTS = ("script", "style", "textarea")
+
+
+@dataclass
+class DiffReport:
+    """Size of the change against the current file, before and after minimizing"""
+    lines_changed_before: int = 0
+    lines_changed_after: int = 0
+    tokens_kept: int = 0
+    tokens_changed: int = 0
+
+    def summary(self) -> str:
+        return (f"✂️ Minimal diff: {self.lines_changed_before} -> {self.lines_changed_after} changed lines "
+                f"({self.tokens_changed} tokens changed, {self.tokens_kept} kept with original formatting)")
+
+
+def _normalize_tag(token: str) -> str:
+    if token.startswith("<!--"):
+        return token
+    if token.startswith("<!"):
+        return " ".join(token.lower().split())
+    name = _TAG_NAME.match(token).group(1).lower()
+    if token.startswith("</"):
+        return f"</{name}>"
+    body = token[len(name) + 1:].rstrip(">").rstrip("/")
+    attrs = []
+    for attr_name, value in _ATTR.findall(body):
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attrs.append((attr_name.lower(), html_lib.unescape(value)))
+    return f"<{name} " + " ".join(f"{key}={value!r}" for key, value in sorted(attrs)) + ">"
+
+
+def tokenize(document: str) -> List[Tuple[str, str]]:
+    """
+    Split a document into (raw, key) tokens
+
+    raw is the exact source text; key is a normalized form that is equal for
+    tokens that mean the same thing (attribute order and quoting, runs of
+    whitespace, entity spelling). The raw pieces concatenate back to the
+    original document.
+    """
+    tokens: List[Tuple[str, str]] = []
+    position = 0
+    preformatted = 0
+    length = len(document)
+    while position < length:
+        match = _TAG.search(document, position)
+        text_end = match.start() if match else length
+        if text_end > position:
+            text = document[position:text_end]
+            key = text if preformatted else " ".join(html_lib.unescape(text).split()) or " "
+            tokens.append((text, "#" + key))
+        if not match:
+            break
+
+        raw = match.group(0)
+        key = _normalize_tag(raw)
+        tokens.append((raw, key))
+        position = match.end()
+
+        name_match = _TAG_NAME.match(raw)
+        name = name_match.group(1).lower() if name_match else ""
+        if name == "pre":
+            preformatted += -1 if raw.startswith("</") else 1
+            preformatted = max(preformatted, 0)
+        if name in _RAW_TEXT_ELEMENTS and not raw.startswith("</") and not raw.endswith("/>"):
+            close = re.compile(rf"</{name}\s*>", re.IGNORECASE).search(document, position)
+            content_end = close.start() if close else length
+            for line in document[position:content_end].splitlines(keepends=True):
+                tokens.append((line, "~" + line.strip()))
+            position = content_end
+    return tokens
+
+
+# Gaps with nothing left to anchor on go to SequenceMatcher only up to this
+# many len(old) * len(new) cells; it is quadratic on repeated tokens, so a
+# larger gap is emitted as one replacement instead
+MAX_MATCHER_CELLS = 40_000
+
+
+def _anchors(old_keys: Sequence[str], new_keys: Sequence[str]) -> List[Tuple[int, int]]:
+    """
+    Positions of equal tokens to split an alignment at, in order on both sides
+
+    Keys that occur the same number of times on each side are paired
+    occurrence by occurrence (for keys that occur once this is patience
+    diff's unique anchor), and the longest run of pairs that is in order on
+    both sides is kept. Repeated markup such as the cards of a product grid
+    occurs as often on both sides unless it was edited, so it anchors too.
+    """
+    old_counts, new_counts = Counter(old_keys), Counter(new_keys)
+    new_positions: Dict[str, List[int]] = {}
+    for j, key in enumerate(new_keys):
+        if old_counts[key] == new_counts[key]:
+            new_positions.setdefault(key, []).append(j)
+    seen: Counter = Counter()
+    candidates = []
+    for i, key in enumerate(old_keys):
+        positions = new_positions.get(key)
+        if positions is not None:
+            candidates.append((i, positions[seen[key]]))
+            seen[key] += 1
+
+    # Longest increasing run of new positions, in old order
+    tails: List[int] = []
+    tail_index: List[int] = []
+    previous = [-1] * len(candidates)
+    for index, (_, j) in enumerate(candidates):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[position] = j
+            tail_index[position] = index
+        previous[index] = tail_index[position - 1] if position else -1
+    anchors = []
+    index = tail_index[-1] if tail_index else -1
+    while index != -1:
+        anchors.append(candidates[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def align_tokens(old_keys: Sequence[str], new_keys: Sequence[str]) -> List[Tuple[str, int, int, int, int]]:
+    """
+    difflib-style opcodes for two key sequences, fast on long documents
+
+    The common prefix and suffix are matched first, then the rest is split
+    at anchors (see _anchors) and every gap between them is aligned the same
+    way. Only a gap with no anchors reaches SequenceMatcher, which is
+    quadratic on tokens such as </p> that occur thousands of times in a large
+    page, and only up to MAX_MATCHER_CELLS; a bigger one becomes a single
+    replacement.
+    """
+    opcodes: List[Tuple[str, int, int, int, int]] = []
+
+    def add(op: str, i1: int, i2: int, j1: int, j2: int) -> None:
+        if i1 == i2 and j1 == j2:
+            return
+        if opcodes and opcodes[-1][0] == op == "equal":
+            opcodes[-1] = ("equal", opcodes[-1][1], i2, opcodes[-1][3], j2)
+        else:
+            opcodes.append((op, i1, i2, j1, j2))
+
+    # Work items are ("gap" | "equal", i1, i2, j1, j2), popped in document order
+    stack = [("gap", 0, len(old_keys), 0, len(new_keys))]
+    while stack:
+        kind, i1, i2, j1, j2 = stack.pop()
+        if kind == "equal":
+            add("equal", i1, i2, j1, j2)
+            continue
+        prefix = 0
+        while i1 + prefix < i2 and j1 + prefix < j2 and old_keys[i1 + prefix] == new_keys[j1 + prefix]:
+            prefix += 1
+        add("equal", i1, i1 + prefix, j1, j1 + prefix)
+        i1, j1 = i1 + prefix, j1 + prefix
+        suffix = 0
+        while i1 < i2 - suffix and j1 < j2 - suffix and old_keys[i2 - suffix - 1] == new_keys[j2 - suffix - 1]:
+            suffix += 1
+        stack.append(("equal", i2 - suffix, i2, j2 - suffix, j2))
+        i2, j2 = i2 - suffix, j2 - suffix
+
+        if i1 == i2 or j1 == j2:
+            add("delete" if i1 < i2 else "insert", i1, i2, j1, j2)
+            continue
+        anchors = _anchors(old_keys[i1:i2], new_keys[j1:j2])
+        if anchors:
+            # Anchors and the gaps between them, pushed last-first
+            cursors = [(i2, j2)]
+            for old_anchor, new_anchor in reversed(anchors):
+                old_anchor, new_anchor = i1 + old_anchor, j1 + new_anchor
+                stack.append(("gap", old_anchor + 1, cursors[-1][0], new_anchor + 1, cursors[-1][1]))
+                stack.append(("equal", old_anchor, old_anchor + 1, new_anchor, new_anchor + 1))
+                cursors.append((old_anchor, new_anchor))
+            stack.append(("gap", i1, cursors[-1][0], j1, cursors[-1][1]))
+        elif (i2 - i1) * (j2 - j1) <= MAX_MATCHER_CELLS:
+            matcher = difflib.SequenceMatcher(None, old_keys[i1:i2], new_keys[j1:j2], autojunk=False)
+            for op, a1, a2, b1, b2 in matcher.get_opcodes():
+                add(op, i1 + a1, i1 + a2, j1 + b1, j1 + b2)
+        else:
+            add("replace", i1, i2, j1, j2)
+    return opcodes
+
+
+def _changed_lines(old: str, new: str) -> int:
+    return sum(i2 - i1 + j2 - j1 for op, i1, i2, j1, j2 in align_tokens(old.splitlines(), new.splitlines())
+               if op != "equal")
+
+
+def minimize_diff(original: str, enhanced: str) -> Tuple[str, DiffReport]:
+    """
+    Rewrite enhanced so that everything it shares with original keeps the original's exact text
+
+    The two documents are aligned token by token on their normalized keys
+    with align_tokens, which stays fast on large pages of repeated markup.
+    Unchanged tokens are emitted from original (its whitespace, attribute
+    order and quoting), and only real changes come from enhanced, so the
+    commit diff shows just the semantic edit.
+
+    Returns:
+        Tuple of (minimized_html, DiffReport)
+    """
+    old_tokens = tokenize(original)
+    new_tokens = tokenize(enhanced)
+    opcodes = align_tokens([key for _, key in old_tokens], [key for _, key in new_tokens])
+
+    report = DiffReport()
+    pieces: List[str] = []
+    for op, old_start, old_end, new_start, new_end in opcodes:
+        if op == "equal":
+            pieces.extend(raw for raw, _ in old_tokens[old_start:old_end])
+            report.tokens_kept += old_end - old_start
+        else:
+            replaced = old_tokens[old_start:old_end] if op == "replace" else []
+            for index, (raw, key) in enumerate(new_tokens[new_start:new_end]):
+                if key.startswith("~") and index < len(replaced) and replaced[index][1].startswith("~"):
+                    # An edited stylesheet/script line keeps the indentation of the line it replaces
+                    old_raw = replaced[index][0]
+                    indent = old_raw[:len(old_raw) - len(old_raw.lstrip())]
+                    raw = indent + raw.lstrip()
+                pieces.append(raw)
+            report.tokens_changed += max(old_end - old_start, new_end - new_start)
+    minimized = "".join(pieces)
+
+    report.lines_changed_before = _changed_lines(original, enhanced)
+    report.lines_changed_after = _changed_lines(original, minimized)
+    return minimized, report
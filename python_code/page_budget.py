@@ -0,0 +1,185 @@
+# page_budget.py
+
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional
+
+from html_dom import Node, parse_html
+
+
+# Script types that the browser does not execute, so they never block rendering
+_NON_JS_SCRIPT_TYPES = {"application/ld+json", "application/json", "text/template", "text/x-template", "importmap"}
+
+
+@dataclass
+class PageMetrics:
+    """Static page-weight and render-cost measurements for one HTML document"""
+    total_bytes: int = 0
+    dom_nodes: int = 0
+    dom_depth: int = 0
+    render_blocking_resources: int = 0
+    head_inline_blocks: int = 0
+    inline_css_bytes: int = 0
+    unsized_images: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class PageBudget:
+    """
+    Limits an enhanced page must stay within before it is pushed
+
+    Growth limits are relative to the original page, so a site that is already
+    heavy is not blocked for staying heavy, only for getting heavier. Set any
+    limit to None to disable it. With mode "flag" violations are reported but
+    the push still goes ahead; with mode "block" the push is skipped.
+    """
+    max_total_bytes: Optional[int] = None
+    max_bytes_growth: Optional[float] = 0.5
+    max_dom_nodes_growth: Optional[float] = 0.5
+    max_dom_depth_increase: Optional[int] = 4
+    max_render_blocking_added: Optional[int] = 0
+    max_head_inline_blocks_added: Optional[int] = 1
+    max_inline_css_growth_bytes: Optional[int] = 16384
+    max_unsized_images_added: Optional[int] = 0
+    mode: str = "block"
+
+    def __post_init__(self):
+        if self.mode not in ("block", "flag"):
+            raise ValueError(f"Unknown page budget mode: {self.mode} (expected 'block' or 'flag')")
+
+
+@dataclass
+class BudgetReport:
+    """Result of comparing an enhanced page against the original and a budget"""
+    original: PageMetrics
+    enhanced: PageMetrics
+    violations: List[str] = field(default_factory=list)
+    mode: str = "block"
+
+    @property
+    def blocked(self) -> bool:
+        return bool(self.violations) and self.mode == "block"
+
+    def summary(self) -> str:
+        lines = ["Page budget:"]
+        for name, before in self.original.as_dict().items():
+            after = getattr(self.enhanced, name)
+            lines.append(f"  {name}: {before} -> {after} ({after - before:+d})")
+        if self.violations:
+            verdict = "BLOCKED" if self.blocked else "FLAGGED"
+            lines.append(f"  {verdict}:")
+            lines.extend(f"    - {violation}" for violation in self.violations)
+        else:
+            lines.append("  within budget")
+        return "\n".join(lines)
+
+
+def _is_render_blocking(node: Node) -> bool:
+    """True for external resources in <head> that block first render"""
+    if node.tag == "link":
+        rel = (node.get("rel") or "").lower().split()
+        media = (node.get("media") or "all").strip().lower()
+        return "stylesheet" in rel and media in ("all", "screen", "") and not node.has("disabled")
+    if node.tag == "script" and node.get("src"):
+        script_type = (node.get("type") or "").strip().lower()
+        if script_type == "module" or script_type in _NON_JS_SCRIPT_TYPES:
+            return False
+        return not (node.has("async") or node.has("defer"))
+    return False
+
+
+def measure_nodes(nodes: Iterable[Node], metrics: PageMetrics, in_head: Optional[bool] = None,
+                  depth_offset: int = 0) -> PageMetrics:
+    """
+    Add elements to metrics (everything except total_bytes)
+
+    Args:
+        nodes: Elements to count, e.g. one subtree of a page
+        in_head: Whether they are inside <head>; None looks at each element's ancestors
+        depth_offset: Depth of the nodes' parent in the page, for nodes of a separately parsed fragment
+    """
+    for node in nodes:
+        metrics.dom_nodes += 1
+        metrics.dom_depth = max(metrics.dom_depth, node.depth + depth_offset)
+
+        node_in_head = in_head if in_head is not None else any(ancestor.tag == "head" for ancestor in node.ancestors())
+        if node_in_head and _is_render_blocking(node):
+            metrics.render_blocking_resources += 1
+
+        if node.tag == "style":
+            metrics.inline_css_bytes += len("".join(node.text).encode("utf-8"))
+            if node_in_head:
+                metrics.head_inline_blocks += 1
+        elif node.tag == "script" and node_in_head and not node.get("src"):
+            script_type = (node.get("type") or "").strip().lower()
+            if script_type not in _NON_JS_SCRIPT_TYPES and script_type != "module":
+                metrics.head_inline_blocks += 1
+
+        style_attr = node.get("style")
+        if style_attr:
+            metrics.inline_css_bytes += len(style_attr.encode("utf-8"))
+
+        if node.tag == "img" and not (node.get("width") and node.get("height")):
+            metrics.unsized_images += 1
+
+    return metrics
+
+
+def measure_page(html: str, root: Optional[Node] = None) -> PageMetrics:
+    """
+    Measure an HTML document without rendering it
+
+    Args:
+        html: The document source
+        root: An already parsed tree of html, to skip parsing again
+    """
+    root = root if root is not None else parse_html(html)
+    return measure_nodes(root.iter(), PageMetrics(total_bytes=len(html.encode("utf-8"))))
+
+
+def check_page_budget(original_html: str,
+                      enhanced_html: str,
+                      budget: Optional[PageBudget] = None,
+                      original_metrics: Optional[PageMetrics] = None,
+                      enhanced_metrics: Optional[PageMetrics] = None) -> BudgetReport:
+    """
+    Compare the original and enhanced page against a budget
+
+    Args:
+        original_metrics, enhanced_metrics: Measurements already at hand (e.g. from
+            an element_index.PageIndex), so that page isn't parsed again
+
+    Returns:
+        BudgetReport with both sets of metrics and any violations
+    """
+    budget = budget or PageBudget()
+    before = original_metrics or measure_page(original_html)
+    after = enhanced_metrics or measure_page(enhanced_html)
+    violations = []
+
+    if budget.max_total_bytes is not None and after.total_bytes > budget.max_total_bytes:
+        violations.append(f"page is {after.total_bytes} bytes (limit {budget.max_total_bytes})")
+
+    def growth(limit: Optional[float], old: int, new: int, label: str) -> None:
+        if limit is not None and old and (new - old) / old > limit:
+            violations.append(f"{label} grew {(new - old) / old:.0%} (limit {limit:.0%})")
+
+    def increase(limit: Optional[int], old: int, new: int, label: str) -> None:
+        if limit is not None and new - old > limit:
+            violations.append(f"{label} increased by {new - old} (limit {limit})")
+
+    growth(budget.max_bytes_growth, before.total_bytes, after.total_bytes, "page bytes")
+    growth(budget.max_dom_nodes_growth, before.dom_nodes, after.dom_nodes, "DOM node count")
+    increase(budget.max_dom_depth_increase, before.dom_depth, after.dom_depth, "DOM depth")
+    increase(budget.max_render_blocking_added, before.render_blocking_resources,
+             after.render_blocking_resources, "render-blocking resources")
+    increase(budget.max_head_inline_blocks_added, before.head_inline_blocks,
+             after.head_inline_blocks, "inline <style>/<script> blocks in <head>")
+    increase(budget.max_inline_css_growth_bytes, before.inline_css_bytes,
+             after.inline_css_bytes, "inline CSS bytes")
+    increase(budget.max_unsized_images_added, before.unsized_images,
+             after.unsized_images, "images without width/height")
+
+    return BudgetReport(original=before, enhanced=after, violations=violations, mode=budget.mode)
@@ -0,0 +1,351 @@
+# page_optimizer.py
+
+import os
+import posixpath
+import re
+import struct
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+from css_compactor import IMPLIED_TAGS, DomIndex, RawBlock, Rule, minify_css, parse_stylesheet, serialize_stylesheet
+from html_dom import Node, format_start_tag, parse_html
+from stream_rewriter import apply_splices
+
+
+_MINIFY_TOKEN = re.compile(
+    r"<!--.*?-->"
+    r"|<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>"
+    r"|<[^>\"']*(?:\"[^\"]*\"[^>\"']*|'[^']*'[^>\"']*)*>",
+    re.DOTALL | re.IGNORECASE,
+)
+
+# Tags whose src/href point at subresources the browser fetches during load
+_SUBRESOURCE_TAGS = {"script": "src", "img": "src", "source": "src", "iframe": "src",
+                     "video": "src", "audio": "src", "link": "href"}
+
+
+def source_path_for(file_path: str) -> str:
+    """Where the readable copy of an optimized page lives in the repo (index.html -> index.src.html)"""
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.src{ext or '.html'}"
+
+
+def site_path_for(url: str, from_path: str = "") -> Optional[str]:
+    """
+    Site-relative path of a local URL referenced from the file at from_path
+    (itself site-relative); None for external, data: and out-of-site URLs
+    """
+    if not url or urlparse(url).scheme or url.startswith("//"):
+        return None
+    url = unquote(url.split("?", 1)[0].split("#", 1)[0])
+    if not url:
+        return None
+    if url.startswith("/"):
+        path = url.lstrip("/")
+    else:
+        path = posixpath.join(posixpath.dirname(from_path.replace(os.sep, "/")), url)
+    path = posixpath.normpath(path)
+    return None if path == "." or path.startswith("../") or path == ".." else path
+
+
+@dataclass
+class OptimizationReport:
+    """What one optimizer pass changed"""
+    bytes_before: int = 0
+    bytes_after: int = 0
+    critical_css_inlined: int = 0
+    scripts_deferred: int = 0
+    images_lazy: int = 0
+    images_async: int = 0
+    images_sized: int = 0
+    preconnects_added: int = 0
+
+    def summary(self) -> str:
+        return (f"⚡ Optimizer: {self.bytes_before} -> {self.bytes_after} bytes, "
+                f"{self.critical_css_inlined} stylesheets critical-inlined, "
+                f"{self.scripts_deferred} scripts deferred, "
+                f"{self.images_lazy} images lazy-loaded, {self.images_async} async-decoded, "
+                f"{self.images_sized} sized, {self.preconnects_added} preconnects added")
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """Read width/height from a PNG, GIF, JPEG or WebP header without decoding the image"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(64 * 1024)
+    except OSError:
+        return None
+
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+        return struct.unpack(">II", head[16:24])
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", head[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(head[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    if head[:2] == b"\xff\xd8":
+        index = 2
+        while index + 9 < len(head):
+            if head[index] != 0xFF:
+                index += 1
+                continue
+            marker = head[index + 1]
+            length = struct.unpack(">H", head[index + 2:index + 4])[0]
+            if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                height, width = struct.unpack(">HH", head[index + 5:index + 9])
+                return width, height
+            index += 2 + length
+    return None
+
+
+def _size_from_url(src: str) -> Optional[Tuple[int, int]]:
+    """Dimensions encoded in common image-CDN URLs (/1600/1200, ?w=..&h=.., name-800x600.jpg)"""
+    parsed = urlparse(src)
+    query = parse_qs(parsed.query)
+    if query.get("w") and query.get("h"):
+        try:
+            return int(query["w"][0]), int(query["h"][0])
+        except ValueError:
+            pass
+    match = re.search(r"/(\d{2,5})/(\d{2,5})/?$", parsed.path) or \
+        re.search(r"[-_](\d{2,5})x(\d{2,5})\.\w+$", parsed.path)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def minify_html(html: str) -> str:
+    """
+    Collapse insignificant whitespace and drop comments
+
+    Whitespace runs become a single space (or newline, if they contained one),
+    so inline spacing is preserved. <pre>, <textarea>, <script> and <style>
+    contents are left alone here; conditional comments are kept.
+    """
+    pieces, text, cursor = [], [], 0
+    for match in _MINIFY_TOKEN.finditer(html):
+        text.append(html[cursor:match.start()])
+        cursor = match.end()
+        token = match.group(0)
+        if token.startswith("<!--") and not token.startswith(("<!--[if", "<!--<!")):
+            # Dropped: the text on both sides becomes one whitespace run
+            continue
+        pieces.append(_collapse_text("".join(text)))
+        pieces.append(token)
+        text = []
+    text.append(html[cursor:])
+    pieces.append(_collapse_text("".join(text)))
+    return "".join(pieces).strip() + "\n"
+
+
+def _collapse_text(text: str) -> str:
+    return re.sub(r"\s+", lambda m: "\n" if "\n" in m.group(0) else " ", text)
+
+
+class PageOptimizer:
+    """
+    Deterministic, idempotent front-end optimizer for published pages
+
+    Running it on its own output changes nothing, so repeated runs don't
+    churn the file. The readable page is kept in the repo next to the
+    optimized one (see source_path_for), and each run starts from it.
+    """
+
+    def __init__(self,
+                 site_root: Optional[str] = None,
+                 minify: bool = True,
+                 max_preconnects: int = 4):
+        """
+        Args:
+            site_root: Directory the page's relative URLs resolve against, used to
+                read local stylesheets and image headers (e.g. the cloned repo)
+            minify: Minify HTML and inline CSS
+            max_preconnects: Upper bound on <link rel="preconnect"> hints in <head>
+        """
+        self.site_root = site_root
+        self.minify = minify
+        self.max_preconnects = max_preconnects
+
+    def optimize(self, html: str, page_path: str = "",
+                 site_root: Optional[str] = None) -> Tuple[str, OptimizationReport]:
+        """
+        Optimize one page
+
+        Args:
+            html: The readable page
+            page_path: Path of the page relative to site_root, for resolving relative URLs
+            site_root: Overrides self.site_root for this call (e.g. a fresh working copy)
+
+        Returns:
+            Tuple of (optimized_html, OptimizationReport)
+        """
+        if site_root is not None:
+            return PageOptimizer(site_root, self.minify, self.max_preconnects).optimize(html, page_path)
+
+        report = OptimizationReport(bytes_before=len(html.encode("utf-8")))
+        root = parse_html(html)
+        above_fold = self._above_the_fold(root)
+        splices: List[Tuple[int, int, str]] = []
+
+        self._inline_critical_css(root, above_fold, page_path, splices, report)
+        self._defer_scripts(root, splices, report)
+        self._optimize_images(root, above_fold, page_path, splices, report)
+        self._add_preconnects(html, root, splices, report)
+
+        html = apply_splices(html, splices)
+
+        if self.minify:
+            html = self._minify_styles(html)
+            html = minify_html(html)
+
+        report.bytes_after = len(html.encode("utf-8"))
+        return html, report
+
+    # --- Stages ---
+
+    def _above_the_fold(self, root: Node) -> List[Node]:
+        """Elements in the header and the first content section (the hero, usually)"""
+        body = root.find("body") or root
+        heading = body.find("h1")
+        cutoff_node = None
+        if heading is not None:
+            for ancestor in heading.ancestors():
+                if ancestor.tag in ("section", "header", "article") or ancestor.parent is body:
+                    cutoff_node = ancestor
+                    break
+        if cutoff_node is None:
+            cutoff_node = body.find("section") or body.find("main")
+        elements = list(body.iter())
+        if cutoff_node is None:
+            return elements[:max(1, len(elements) // 4)]
+        return [body] + [node for node in elements if node.start < cutoff_node.end]
+
+    def _local_path(self, url: str, page_path: str) -> Optional[str]:
+        path = site_path_for(url, page_path) if self.site_root is not None else None
+        return os.path.normpath(os.path.join(self.site_root, path)) if path else None
+
+    def _inline_critical_css(self, root: Node, above_fold: List[Node], page_path: str,
+                             splices: List[Tuple[int, int, str]], report: OptimizationReport) -> None:
+        dom = DomIndex(above_fold, IMPLIED_TAGS)
+        for link in root.find_all("link"):
+            rel = (link.get("rel") or "").lower().split()
+            path = self._local_path(link.get("href") or "", page_path)
+            if "stylesheet" not in rel or path is None or link.get("media") not in (None, "all"):
+                continue
+            if any(ancestor.tag == "noscript" for ancestor in link.ancestors()):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    css = f.read()
+            except OSError:
+                continue
+
+            critical = []
+            for item in parse_stylesheet(css):
+                if isinstance(item, Rule):
+                    selectors = [selector for selector in item.selectors if dom.selector_may_match(selector)]
+                    if selectors:
+                        critical.append(Rule(selectors, item.declarations, item.context))
+                elif isinstance(item, RawBlock) and item.text.lower().startswith("@font-face"):
+                    critical.append(item)
+
+            href = link.get("href")
+            preload = dict(link.attrs, rel="preload")
+            preload["as"] = "style"
+            preload["onload"] = "this.onload=null;this.rel='stylesheet'"
+            replacement = (f"<style data-critical>{serialize_stylesheet(critical, minify=True)}</style>"
+                           f"{format_start_tag('link', preload)}"
+                           f"<noscript>{format_start_tag('link', {'rel': 'stylesheet', 'href': href})}</noscript>")
+            splices.append((link.start, link.end, replacement))
+            report.critical_css_inlined += 1
+
+    def _defer_scripts(self, root: Node, splices: List[Tuple[int, int, str]],
+                       report: OptimizationReport) -> None:
+        scripts = root.find_all("script")
+        for index, script in enumerate(scripts):
+            script_type = (script.get("type") or "text/javascript").lower()
+            if not script.get("src") or script.has("async") or script.has("defer") \
+                    or script_type in ("module", "application/ld+json", "application/json"):
+                continue
+            # An inline script after it may rely on it having run already
+            later_inline = any(not later.get("src") and "json" not in (later.get("type") or "")
+                               for later in scripts[index + 1:])
+            if later_inline:
+                continue
+            splices.append((script.start, script.tag_end, format_start_tag("script", dict(script.attrs, defer=None))))
+            report.scripts_deferred += 1
+
+    def _optimize_images(self, root: Node, above_fold: List[Node], page_path: str,
+                         splices: List[Tuple[int, int, str]], report: OptimizationReport) -> None:
+        above = set(id(node) for node in above_fold)
+        for image in root.find_all("img"):
+            attrs = dict(image.attrs)
+            if "decoding" not in attrs:
+                attrs["decoding"] = "async"
+                report.images_async += 1
+            if "loading" not in attrs and id(image) not in above:
+                attrs["loading"] = "lazy"
+                report.images_lazy += 1
+            if not (attrs.get("width") and attrs.get("height")):
+                src = attrs.get("src") or ""
+                local = self._local_path(src, page_path)
+                size = (read_image_size(local) if local else None) or _size_from_url(src)
+                if size:
+                    attrs["width"], attrs["height"] = str(size[0]), str(size[1])
+                    report.images_sized += 1
+            if attrs != image.attrs:
+                splices.append((image.start, image.tag_end, format_start_tag("img", attrs)))
+
+    def _add_preconnects(self, html: str, root: Node, splices: List[Tuple[int, int, str]],
+                         report: OptimizationReport) -> None:
+        head = root.find("head")
+        if head is None:
+            return
+        existing = set()
+        anchor = head.tag_end
+        for link in head.find_all("link", "meta"):
+            if link.tag == "meta" and (link.has("charset") or link.get("name") == "viewport"):
+                anchor = max(anchor, link.end)
+            elif "preconnect" in (link.get("rel") or "").lower().split():
+                existing.add((link.get("href") or "").rstrip("/"))
+                anchor = max(anchor, link.end)
+
+        origins: List[str] = []
+        for node in root.iter():
+            attr = _SUBRESOURCE_TAGS.get(node.tag)
+            url = node.get(attr) if attr else None
+            if node.tag == "link" and "preconnect" in (node.get("rel") or "").lower().split():
+                continue
+            if not url or not url.startswith(("http://", "https://", "//")):
+                continue
+            parsed = urlparse(url if not url.startswith("//") else "https:" + url)
+            origin = f"{parsed.scheme}://{parsed.netloc}"
+            if origin not in existing and origin not in origins:
+                origins.append(origin)
+
+        room = max(0, self.max_preconnects - len(existing))
+        added = origins[:room]
+        if added:
+            indent = "\n  "
+            hints = "".join(f'{indent}<link rel="preconnect" href="{origin}">' for origin in added)
+            splices.append((anchor, anchor, hints))
+            report.preconnects_added = len(added)
+
+    def _minify_styles(self, html: str) -> str:
+        root = parse_html(html)
+        splices = []
+        for style in root.find_all("style"):
+            css = "".join(style.text)
+            minified = minify_css(css)
+            if minified != css:
+                close = html.rfind("</", style.tag_end, style.end)
+                splices.append((style.tag_end, close, minified))
+        return apply_splices(html, splices)
@@ -0,0 +1,68 @@
+# plugins.py
+
+import importlib
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+# kind -> name -> "module:attribute"; a module is imported the first time one
+# of its plugins is used, so SDKs of unused integrations are never loaded
+_REGISTRY: Dict[str, Dict[str, Union[str, Any]]] = {
+    "analyzer": {"anthropic": "llm_providers:AnthropicAnalyzer"},
+    "merger": {"morph": "llm_providers:MorphMerger"},
+    "publisher": {"github": "github_publisher:GitHubPublisher"},
+}
+_loaded: Dict[Tuple[str, str], Any] = {}
+_lock = threading.Lock()
+
+
+class PluginNotFound(LookupError):
+    """No plugin of that kind and name is registered"""
+
+
+def register(kind: str, name: str, target: Union[str, Any]) -> None:
+    """
+    Register (or replace) a plugin
+
+    Args:
+        kind: "analyzer", "merger", "publisher" or a new kind
+        name: The name callers select it by, e.g. HTMLEnhancer(analyzer="my-llm")
+        target: The factory itself, or "module:attribute" to import on first use
+    """
+    with _lock:
+        _REGISTRY.setdefault(kind, {})[name] = target
+        _loaded.pop((kind, name), None)
+
+
+def available(kind: str) -> List[str]:
+    """Names registered for a kind, without loading any of them"""
+    return sorted(_REGISTRY.get(kind, {}))
+
+
+def load(kind: str, name: str) -> Any:
+    """
+    The factory registered as kind/name, importing its module on first use
+
+    Raises:
+        PluginNotFound: When nothing is registered under that name
+        ImportError: When the plugin's module or its SDK is not installed
+    """
+    key = (kind, name)
+    factory = _loaded.get(key)
+    if factory is not None:
+        return factory
+    with _lock:
+        if key in _loaded:
+            return _loaded[key]
+        target = _REGISTRY.get(kind, {}).get(name)
+        if target is None:
+            raise PluginNotFound(f"No {kind} plugin named {name!r} (available: {', '.join(available(kind)) or 'none'})")
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            target = getattr(importlib.import_module(module_name), attribute)
+        _loaded[key] = target
+        return target
+
+
+def create(kind: str, name: str, *args, **kwargs) -> Any:
+    """Load a plugin and instantiate it"""
+    return load(kind, name)(*args, **kwargs)
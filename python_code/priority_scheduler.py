@@ -0,0 +1,283 @@
+# priority_scheduler.py
+#
+# Orders due pages by expected uplift, with per-tenant fairness caps:
+#   python priority_scheduler.py --pages pages.json --budget 10 [--enqueue --db jobs.db]
+
+import argparse
+import csv
+import heapq
+import io
+import itertools
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from version_store import page_key
+
+
+@dataclass
+class EventRow:
+    """One row of a GA "Events: Event name" table"""
+    event_count: float = 0.0
+    total_users: float = 0.0
+    total_revenue: float = 0.0
+
+
+def parse_event_table(csv_content: str) -> Dict[str, EventRow]:
+    """Rows of a GA-style event CSV by event name; comment lines and unknown columns are ignored"""
+    lines = [line for line in csv_content.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    table = {}
+    for record in csv.DictReader(io.StringIO("\n".join(lines))):
+        name = (record.get("Event name") or "").strip()
+        if not name:
+            continue
+
+        def number(column: str) -> float:
+            try:
+                return float((record.get(column) or "0").replace(",", ""))
+            except ValueError:
+                return 0.0
+
+        table[name] = EventRow(number("Event count"), number("Total users"), number("Total revenue"))
+    return table
+
+
+@dataclass
+class PageCandidate:
+    """A page that is due for an enhancement run"""
+    tenant: str
+    repo_owner: str
+    repo_name: str
+    file_path: str
+    csv_content: str
+    last_changed_at: Optional[float] = None  # unix time of the last published change, None if never
+
+    @property
+    def key(self) -> str:
+        return page_key(self.repo_owner, self.repo_name, self.file_path)
+
+
+@dataclass
+class ScoredPage:
+    """A candidate with its score and the numbers behind it"""
+    candidate: PageCandidate
+    score: float
+    traffic: float
+    conversion_rate: float
+    conversion_gap: float
+    value_per_conversion: float
+    staleness: float
+
+    def summary(self) -> str:
+        return (f"{self.candidate.tenant}/{self.candidate.key}: score {self.score:,.2f} "
+                f"(traffic {self.traffic:,.0f} x gap {self.conversion_gap:.3f} x value "
+                f"{self.value_per_conversion:,.2f} x staleness {self.staleness:.2f}; "
+                f"conversion {self.conversion_rate:.2%})")
+
+
+@dataclass
+class UpliftModel:
+    """
+    Expected-uplift score of a page
+
+    score = traffic x conversion gap x value per conversion x staleness
+
+    traffic is the page's users (page_view, else the largest event audience);
+    the conversion gap is how far its purchase conversion falls short of
+    target_conversion, raised by cart friction (remove_from_cart per
+    add_to_cart) and floored at min_gap so pages without purchases still
+    rank by traffic; value per conversion is the average order value, or
+    default_value when there is no revenue. staleness grows from 0 right
+    after a change towards 1 with a time constant of staleness_days; pages
+    changed within cooldown_days are not scheduled at all.
+    """
+    target_conversion: float = 0.03
+    min_gap: float = 0.002
+    default_value: float = 1.0
+    staleness_days: float = 7.0
+    cooldown_days: float = 1.0
+
+    def score(self, candidate: PageCandidate, now: Optional[float] = None) -> Optional[ScoredPage]:
+        now = time.time() if now is None else now
+        staleness = 1.0
+        if candidate.last_changed_at is not None:
+            days = max(now - candidate.last_changed_at, 0.0) / 86400
+            if days < self.cooldown_days:
+                return None
+            staleness = 1.0 - math.exp(-days / self.staleness_days)
+
+        table = parse_event_table(candidate.csv_content)
+        audience = table.get("page_view") or table.get("session_start")
+        traffic = audience.total_users if audience else max((row.total_users for row in table.values()), default=0.0)
+        purchase = table.get("purchase", EventRow())
+        add_to_cart = table.get("add_to_cart", EventRow())
+        remove_from_cart = table.get("remove_from_cart", EventRow())
+
+        conversion_rate = purchase.total_users / traffic if traffic else 0.0
+        friction = min(remove_from_cart.event_count / add_to_cart.event_count, 1.0) if add_to_cart.event_count else 0.0
+        gap = max((self.target_conversion - conversion_rate) * (1.0 + friction), self.min_gap)
+
+        total_revenue = sum(row.total_revenue for row in table.values())
+        if purchase.event_count and purchase.total_revenue:
+            value = purchase.total_revenue / purchase.event_count
+        elif total_revenue:
+            value = total_revenue / max(purchase.event_count, 1.0)
+        else:
+            value = self.default_value
+
+        return ScoredPage(candidate, traffic * gap * value * staleness, traffic, conversion_rate, gap, value, staleness)
+
+
+class PriorityScheduler:
+    """
+    Priority heap of due pages, drained in per-round budgets with tenant caps
+
+    Pages are popped in score order. A tenant that has used its cap for the
+    round (max_per_tenant runs, or max_tenant_share of the round's budget)
+    is skipped and its pages stay queued for the next round, so one large
+    site cannot take the whole LLM and deploy budget. With work_conserving
+    (the default), budget that no uncapped tenant can use goes to capped
+    tenants after all, so a lone tenant still gets the whole round; turn it
+    off to hold budget back even when nobody else is waiting.
+    """
+
+    def __init__(self,
+                 model: Optional[UpliftModel] = None,
+                 max_per_tenant: Optional[int] = None,
+                 max_tenant_share: Optional[float] = 0.5,
+                 work_conserving: bool = True):
+        self.model = model or UpliftModel()
+        self.max_per_tenant = max_per_tenant
+        self.max_tenant_share = max_tenant_share
+        self.work_conserving = work_conserving
+        self._heap: List[tuple] = []
+        self._queued: Dict[str, ScoredPage] = {}
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def add(self, candidate: PageCandidate, now: Optional[float] = None) -> Optional[ScoredPage]:
+        """Score and queue a page, replacing an earlier entry for it; None when it is cooling down"""
+        scored = self.model.score(candidate, now)
+        if scored is None:
+            return None
+        self._queued[candidate.key] = scored
+        heapq.heappush(self._heap, (-scored.score, next(self._sequence), scored))
+        return scored
+
+    def _tenant_cap(self, budget: int) -> int:
+        caps = [budget]
+        if self.max_per_tenant is not None:
+            caps.append(self.max_per_tenant)
+        if self.max_tenant_share is not None:
+            caps.append(max(1, math.floor(budget * self.max_tenant_share)))
+        return min(caps)
+
+    def next_round(self, budget: int) -> List[ScoredPage]:
+        """Take up to budget pages for this round, highest expected uplift first"""
+        cap = self._tenant_cap(budget)
+        used: Dict[str, int] = {}
+        chosen: List[ScoredPage] = []
+        deferred: List[tuple] = []
+        while self._heap and len(chosen) < budget:
+            entry = heapq.heappop(self._heap)
+            scored = entry[2]
+            if self._queued.get(scored.candidate.key) is not scored:
+                continue  # superseded by a later add()
+            tenant = scored.candidate.tenant
+            if used.get(tenant, 0) >= cap:
+                deferred.append(entry)
+                continue
+            used[tenant] = used.get(tenant, 0) + 1
+            chosen.append(scored)
+            del self._queued[scored.candidate.key]
+
+        if self.work_conserving:
+            deferred.sort()
+            while deferred and len(chosen) < budget:
+                scored = deferred.pop(0)[2]
+                chosen.append(scored)
+                del self._queued[scored.candidate.key]
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        return chosen
+
+    def enqueue_round(self, queue, budget: int, round_id: str) -> List[int]:
+        """
+        Take a round and submit it to a job_queue.JobQueue as "enhance" jobs
+
+        Job priorities follow the round's order; the idempotency key is the
+        page and round_id, so submitting a round twice is harmless.
+        """
+        chosen = self.next_round(budget)
+        job_ids = []
+        for rank, scored in enumerate(chosen):
+            candidate = scored.candidate
+            job_ids.append(queue.enqueue(
+                "enhance",
+                {"csv_content": candidate.csv_content,
+                 "target": {"repo_owner": candidate.repo_owner, "repo_name": candidate.repo_name,
+                            "file_path": candidate.file_path}},
+                priority=len(chosen) - rank,
+                idempotency_key=f"{candidate.key}@{round_id}"
+            ))
+        return job_ids
+
+
+def last_changed_at(store, candidate: PageCandidate) -> Optional[float]:
+    """When the page last changed according to a VersionStore"""
+    version = store.latest(candidate.key)
+    return version.created_at if version else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revenue-weighted scheduling of due pages")
+    parser.add_argument("--pages", required=True,
+                        help="JSON list of {tenant, repo_owner, repo_name, file_path, csv} (csv is a file path)")
+    parser.add_argument("--budget", type=int, default=10, help="Runs in this round")
+    parser.add_argument("--max-per-tenant", type=int)
+    parser.add_argument("--max-tenant-share", type=float, default=0.5)
+    parser.add_argument("--no-work-conserving", dest="work_conserving", action="store_false",
+                        help="Leave budget unused rather than give a capped tenant more than its cap")
+    parser.add_argument("--store", help="VersionStore database, for time since last change")
+    parser.add_argument("--enqueue", action="store_true", help="Submit the round to the job queue")
+    parser.add_argument("--db", default="jobs.db")
+    args = parser.parse_args()
+
+    store = None
+    if args.store:
+        from version_store import VersionStore
+
+        store = VersionStore(args.store)
+    scheduler = PriorityScheduler(max_per_tenant=args.max_per_tenant, max_tenant_share=args.max_tenant_share,
+                                  work_conserving=args.work_conserving)
+    with open(args.pages, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        with open(entry["csv"], "r", encoding="utf-8") as f:
+            candidate = PageCandidate(entry.get("tenant", entry["repo_owner"]), entry["repo_owner"],
+                                      entry["repo_name"], entry["file_path"], f.read())
+        if store is not None:
+            candidate.last_changed_at = last_changed_at(store, candidate)
+        if scheduler.add(candidate) is None:
+            print(f"⏸️ {candidate.key} changed recently; skipped")
+
+    if args.enqueue:
+        from job_queue import JobQueue
+
+        queue = JobQueue(args.db)
+        round_id = time.strftime("%Y%m%dT%H%M")
+        job_ids = scheduler.enqueue_round(queue, args.budget, round_id)
+        print(f"📥 Queued {len(job_ids)} jobs for round {round_id}")
+        queue.close()
+    else:
+        for rank, scored in enumerate(scheduler.next_round(args.budget), 1):
+            print(f"{rank:>3}. {scored.summary()}")
+    print(f"{len(scheduler)} page(s) left for later rounds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+# process_pool.py
+#
+# Runs the CPU-bound HTML stages (style compaction, load-speed optimization,
+# page measurement, diff minimization, minification) on a pool of warm
+# worker processes, so pages enhanced on parallel threads don't serialize on
+# the GIL:
+#   python process_pool.py page.html [--workers 1 2 4] [--repeat 40]
+#
+# Documents go to the workers through shared memory blocks, not pickles;
+# the stage's output document comes back the same way. Workers are forked
+# from a server process that has already imported the parsers, so a new
+# worker starts warm.
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from css_compactor import compact_html_styles
+from minimal_diff import minimize_diff
+from page_budget import measure_page
+from page_optimizer import PageOptimizer, minify_html
+
+
+# Imported once by the fork server, inherited by every worker
+_PRELOAD = ["css_compactor", "html_dom", "minimal_diff", "page_budget", "page_optimizer", "process_pool"]
+# Smaller documents run in the calling process; a round trip costs more
+MIN_CHARS = 8192
+# Room for the output document, relative to the first input
+_OUTPUT_SLACK = 1.5
+# Stages that return no document
+_NO_OUTPUT = {"measure"}
+
+
+def _compact_styles(html: str) -> Tuple[str, Any]:
+    return compact_html_styles(html)
+
+
+def _optimize(html: str, optimizer: PageOptimizer, page_path: str = "",
+              site_root: Optional[str] = None) -> Tuple[str, Any]:
+    return optimizer.optimize(html, page_path, site_root)
+
+
+def _measure(html: str) -> Tuple[None, Any]:
+    return None, measure_page(html)
+
+
+def _minimize_diff(original: str, enhanced: str) -> Tuple[str, Any]:
+    return minimize_diff(original, enhanced)
+
+
+def _minify(html: str) -> Tuple[str, None]:
+    return minify_html(html), None
+
+
+# name -> function(*documents, *args) returning (output document or None, other result)
+STAGES: Dict[str, Callable[..., Tuple[Optional[str], Any]]] = {
+    "compact_styles": _compact_styles,
+    "optimize": _optimize,
+    "measure": _measure,
+    "minimize_diff": _minimize_diff,
+    "minify": _minify,
+}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """A block the parent created; the parent alone unlinks it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block again with the
+        # resource tracker workers share with the parent, which is a no-op
+        return shared_memory.SharedMemory(name=name)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _run_stage(stage: str, inputs: List[Tuple[str, int]], output: Optional[Tuple[str, int]],
+               args: tuple) -> Tuple[str, Any, Any]:
+    """
+    Worker side: read the documents, run the stage, write its output document
+
+    Returns:
+        ("shared", output size, other result) when the document was written to
+        the output block, or ("inline", document, other result) when it didn't fit
+    """
+    documents = []
+    for name, size in inputs:
+        block = _attach(name)
+        try:
+            documents.append(bytes(block.buf[:size]).decode("utf-8"))
+        finally:
+            block.close()
+    document, other = STAGES[stage](*documents, *args)
+    if document is None or output is None:
+        return "inline", document, other
+    data = document.encode("utf-8")
+    if len(data) > output[1]:
+        return "inline", document, other
+    block = _attach(output[0])
+    try:
+        block.buf[:len(data)] = data
+    finally:
+        block.close()
+    return "shared", len(data), other
+
+
+def _share(data: bytes) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block
+
+
+def _release(blocks: List[shared_memory.SharedMemory]) -> None:
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+class StagePool:
+    """
+    A pool of warm worker processes for the HTML stages in STAGES
+
+    Safe to share between threads (one per page, as in batch_cli.py); each
+    call blocks its thread only. Documents shorter than min_chars run in the
+    calling thread.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_chars: int = MIN_CHARS,
+                 start_method: Optional[str] = None):
+        """
+        Args:
+            workers: Worker processes (default: one per CPU)
+            start_method: "forkserver" by default where available (warm, and safe
+                to start from a threaded process), else "spawn"
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chars = min_chars
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            context.set_forkserver_preload(_PRELOAD)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def warm(self) -> None:
+        """Start every worker now instead of on first use"""
+        for future in [self._executor.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, stage: str, documents: List[str], *args: Any) -> "Future[Tuple[Optional[str], Any]]":
+        """
+        Run a stage on documents (plus picklable args) in a worker
+
+        Returns:
+            A future of the stage's (output document or None, other result)
+        """
+        result: "Future[Tuple[Optional[str], Any]]" = Future()
+        if sum(len(document) for document in documents) < self.min_chars:
+            try:
+                result.set_result(STAGES[stage](*documents, *args))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+
+        encoded = [document.encode("utf-8") for document in documents]
+        blocks = [_share(data) for data in encoded]
+        inputs = [(block.name, len(data)) for block, data in zip(blocks, encoded)]
+        output = None
+        if stage not in _NO_OUTPUT:
+            output = shared_memory.SharedMemory(create=True, size=int(len(encoded[0]) * _OUTPUT_SLACK) + 4096)
+            blocks.append(output)
+        try:
+            future = self._executor.submit(_run_stage, stage, inputs,
+                                           (output.name, output.size) if output is not None else None, args)
+        except BaseException:
+            _release(blocks)
+            raise
+
+        def done(future: Future) -> None:
+            try:
+                kind, document, other = future.result()
+                if kind == "shared":
+                    document = bytes(output.buf[:document]).decode("utf-8")
+                result.set_result((document, other))
+            except BaseException as e:
+                result.set_exception(e)
+            finally:
+                _release(blocks)
+
+        future.add_done_callback(done)
+        return result
+
+    def run(self, stage: str, *documents: str, args: tuple = ()) -> Tuple[Optional[str], Any]:
+        """submit() and wait for the result"""
+        return self.submit(stage, list(documents), *args).result()
+
+    def compact_styles(self, html: str) -> Tuple[str, Any]:
+        """css_compactor.compact_html_styles in a worker"""
+        return self.run("compact_styles", html)
+
+    def optimize(self, optimizer: PageOptimizer, html: str, page_path: str = "",
+                 site_root: Optional[str] = None) -> Tuple[str, Any]:
+        """optimizer.optimize in a worker"""
+        return self.run("optimize", html, args=(optimizer, page_path, site_root))
+
+    def measure(self, *documents: str) -> List[Any]:
+        """page_budget.measure_page of each document, measured in parallel"""
+        futures = [self.submit("measure", [document]) for document in documents]
+        return [future.result()[1] for future in futures]
+
+    def minimize_diff(self, original: str, enhanced: str) -> Tuple[str, Any]:
+        """minimal_diff.minimize_diff in a worker"""
+        return self.run("minimize_diff", original, enhanced)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "StagePool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the HTML stages of a page on a process pool")
+    parser.add_argument("page", help="HTML file")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        help="Worker process counts to compare (default: 1, 2, 4, ... up to one per CPU)")
+    parser.add_argument("--repeat", type=int, default=40, help="Copies of the page to process")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1 << k for k in range(cpus.bit_length()) if 1 << k <= cpus} | {cpus})
+    with open(args.page, "r", encoding="utf-8") as f:
+        html = f.read()
+    optimizer = PageOptimizer(os.path.dirname(os.path.abspath(args.page)))
+
+    def pipeline(pool: Optional[StagePool]) -> None:
+        if pool is None:
+            compacted, _ = compact_html_styles(html)
+            optimizer.optimize(compacted, os.path.basename(args.page))
+            measure_page(compacted)
+        else:
+            compacted, _ = pool.compact_styles(html)
+            pool.optimize(optimizer, compacted, os.path.basename(args.page))
+            pool.measure(compacted)
+
+    def timed(threads: int, pool: Optional[StagePool]) -> float:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: pipeline(pool), range(args.repeat)))
+        return time.perf_counter() - start
+
+    elapsed = timed(max(workers), None)
+    print(f"⚙️ threads only ({max(workers)} threads): {args.repeat} page(s) in {elapsed:.2f}s "
+          f"({args.repeat / elapsed:.1f} pages/s)")
+    single = None
+    for count in workers:
+        with StagePool(count, min_chars=0) as pool:
+            pool.warm()
+            elapsed = timed(count, pool)
+        single = single or elapsed
+        print(f"⚙️ {count} worker process(es): {args.repeat} page(s) in {elapsed:.2f}s "
+              f"({args.repeat / elapsed:.1f} pages/s, x{single / elapsed:.2f} vs {workers[0]} worker(s))")
+
+
+if __name__ == "__main__":
+    main()
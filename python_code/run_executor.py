@@ -0,0 +1,149 @@
+# run_executor.py
+
+import itertools
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class RunStatus:
+    """Snapshot of a background run; safe to read from any thread"""
+    run_id: str
+    label: str
+    stages: List[str]
+    sequence: int
+    state: str = "queued"  # queued, running, done or failed
+    stage: Optional[str] = None
+    stage_started: Dict[str, float] = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    queue_position: int = 0  # runs waiting ahead of this one, while queued
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def progress(self) -> float:
+        """Fraction of the stages completed, 0.0 to 1.0"""
+        if self.state == "done":
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def stage_seconds(self, stage: str, now: Optional[float] = None) -> Optional[float]:
+        """Time spent in a stage so far, or None if it has not started"""
+        started = self.stage_started.get(stage)
+        if started is None:
+            return None
+        later = [t for t in self.stage_started.values() if t > started]
+        if later:
+            return min(later) - started
+        end = self.finished_at or (time.time() if now is None else now)
+        return max(end - started, 0.0)
+
+
+class RunExecutor:
+    """
+    Runs enhancement jobs on background threads, shared across sessions
+
+    A job is a callable that takes a progress callback as its first argument
+    and calls it with the name of each stage as it starts. Jobs run on a
+    fixed-size pool, so at most max_concurrent_runs run at once however many
+    users submit; the rest wait in FIFO order. Callers keep the run id and
+    poll status(), which returns a copy that is safe to use in the UI while
+    the job keeps going. Finished runs are forgotten after keep_seconds.
+    """
+
+    def __init__(self, max_concurrent_runs: int = 2, keep_seconds: float = 3600.0):
+        self.max_concurrent_runs = max_concurrent_runs
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_runs, thread_name_prefix="enhancer-run")
+        self._lock = threading.Lock()
+        self._runs: Dict[str, RunStatus] = {}
+        self._sequence = itertools.count()
+
+    def submit(self,
+               fn: Callable[..., Any],
+               *args,
+               stages: Sequence[str] = (),
+               label: str = "",
+               **kwargs) -> str:
+        """
+        Queue fn(progress, *args, **kwargs) and return its run id
+
+        Args:
+            fn: The job; progress(stage) marks the start of each stage
+            stages: Stage names in order, for progress display
+            label: Short description shown with the status
+        """
+        run_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._prune()
+            self._runs[run_id] = RunStatus(run_id, label, list(stages), next(self._sequence))
+        self._executor.submit(self._run, run_id, fn, args, kwargs)
+        return run_id
+
+    def _run(self, run_id: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        with self._lock:
+            status = self._runs[run_id]
+            status.state = "running"
+            status.started_at = time.time()
+
+        def progress(stage: str) -> None:
+            with self._lock:
+                status.stage = stage
+                status.stage_started[stage] = time.time()
+
+        try:
+            result = fn(progress, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                status.state = "failed"
+                status.error = str(e) or e.__class__.__name__
+                status.finished_at = time.time()
+            return
+
+        with self._lock:
+            status.state = "done"
+            status.result = result
+            status.finished_at = time.time()
+
+    def status(self, run_id: str) -> Optional[RunStatus]:
+        """A copy of the run's status, or None if it is unknown or was forgotten"""
+        with self._lock:
+            status = self._runs.get(run_id)
+            if status is None:
+                return None
+            snapshot = replace(status, stages=list(status.stages), stage_started=dict(status.stage_started))
+            if status.state == "queued":
+                snapshot.queue_position = sum(
+                    1 for other in self._runs.values()
+                    if other.state == "queued" and other.sequence < status.sequence
+                )
+            return snapshot
+
+    def load(self) -> Tuple[int, int]:
+        """Number of (running, queued) runs across all sessions"""
+        with self._lock:
+            states = [status.state for status in self._runs.values()]
+        return states.count("running"), states.count("queued")
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.keep_seconds
+        for run_id in [run_id for run_id, status in self._runs.items()
+                       if status.finished and status.finished_at < cutoff]:
+            del self._runs[run_id]
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting runs; queued runs are dropped, running ones finish"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
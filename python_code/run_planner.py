@@ -0,0 +1,350 @@
+# run_planner.py
+
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from page_optimizer import source_path_for
+from version_store import page_key
+
+
+class RunCancelled(Exception):
+    """Raised when a step is skipped because an earlier step of the run failed"""
+
+
+class RunPlanner:
+    """
+    Overlaps the network I/O of a single GitHub run
+
+    PAT validation and the repository clone start as soon as the planner is
+    started and run alongside the Claude analysis. The push reuses the working
+    copy cloned for the run, so a run costs roughly max(LLM, git) instead of
+    LLM + 2x clone + push.
+
+    When a step fails, the work that depends on it is cancelled: an invalid
+    PAT cancels the clone, and a failed analysis cancels everything. Work that
+    is already in flight (a running clone or HTTP call) is abandoned and its
+    working copy is removed as soon as it finishes.
+
+    on_stage, when given, is called with "fetch", "analyze", "merge" and
+    "publish" as the run reaches each stage (see run_executor.RunExecutor).
+    """
+
+    def __init__(self,
+                 enhancer,
+                 github_token: str,
+                 github_user: str,
+                 repo_owner: str,
+                 repo_name: str,
+                 file_path: str,
+                 max_workers: int = 3,
+                 on_stage: Optional[Callable[[str], None]] = None):
+        self.enhancer = enhancer
+        self.github_token = github_token
+        self.github_user = github_user
+        self.repo_owner = repo_owner
+        self.repo_name = repo_name
+        self.file_path = file_path
+        self.on_stage = on_stage
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run-planner")
+        self._cancelled = threading.Event()
+        self._temp_dir: Optional[str] = None
+        self._pat_future: Optional[Future] = None
+        self._clone_future: Optional[Future] = None
+        # Built from the working copy when the run routes edits to shared assets
+        self.site_graph = None
+
+    def __enter__(self) -> "RunPlanner":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """Start PAT validation and repository preparation (safe to call more than once)"""
+        if self._clone_future is not None:
+            return
+
+        self._temp_dir = tempfile.mkdtemp(prefix="html-enhancer-")
+        repo_path = os.path.join(self._temp_dir, self.repo_name)
+
+        self._pat_future = self._executor.submit(self.enhancer.validate_github_pat, self.github_token)
+        self._clone_future = self._executor.submit(self._clone, repo_path)
+        self._pat_future.add_done_callback(self._on_pat_checked)
+
+    def _clone(self, repo_path: str):
+        if self._cancelled.is_set():
+            raise RunCancelled("Clone skipped: run was cancelled")
+        return self.enhancer.clone_repository(
+            self.github_token, self.github_user, self.repo_owner, self.repo_name, repo_path
+        )
+
+    def _on_pat_checked(self, future: Future) -> None:
+        if future.cancelled() or future.exception() is not None or not future.result():
+            # Nothing can be pushed without a valid token: cancel the clone,
+            # and mark the run so a clone already under way is abandoned
+            self.cancel()
+
+    def _stage(self, name: str) -> None:
+        if self.on_stage is not None:
+            self.on_stage(name)
+
+    def _working_copy(self):
+        """Wait for PAT validation and the clone; returns the git.Repo"""
+        self.start()
+        try:
+            if not self._pat_future.result():
+                raise Exception("Invalid GitHub Personal Access Token")
+            return self._clone_future.result()
+        except Exception:
+            self.cancel()
+            raise
+
+    def read_current_html(self) -> str:
+        """Wait for the working copy and return the current contents of file_path"""
+        self._stage("fetch")
+        repo = self._working_copy()
+
+        html_file_path = os.path.join(repo.working_tree_dir, self.file_path)
+        source_file_path = os.path.join(repo.working_tree_dir, source_path_for(self.file_path))
+        if self.enhancer.optimizer is not None and os.path.exists(source_file_path):
+            # The published file is minified; analysis and merging work on the readable copy
+            html_file_path = source_file_path
+        elif not os.path.exists(html_file_path):
+            raise FileNotFoundError(f"File {self.file_path} not found in repository")
+
+        with open(html_file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def run(self, csv_content: str, html_content: Optional[str] = None) -> Tuple[str, str, bool]:
+        """
+        Analyze, merge and push, overlapping git work with the LLM calls
+
+        Args:
+            csv_content: CSV data as string
+            html_content: Current HTML; read from the working copy when omitted
+
+        Returns:
+            Tuple of (enhanced_html_content, analysis_instructions, push_success)
+        """
+        self.start()
+        if html_content is None:
+            html_content = self.read_current_html()
+
+        self._stage("analyze")
+        self.enhancer.preview_csv_data(csv_content)
+        page = page_key(self.repo_owner, self.repo_name, self.file_path)
+        analysis = self._executor.submit(
+            self.enhancer.analyze_engagement_with_claude, csv_content, html_content, None, page
+        )
+
+        try:
+            instructions, code_edit = analysis.result()
+        except Exception:
+            self.cancel()
+            raise
+
+        enhanced_html, push_success = self.apply(instructions, code_edit, html_content, csv_content)
+        return enhanced_html, instructions, push_success
+
+    def apply(self, instructions: str, code_edit: str, html_content: Optional[str] = None,
+              metrics: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Merge an analysis' edit into the page, push it and record the version
+
+        Args:
+            html_content: Current HTML; read from the working copy when omitted
+            metrics: Metrics snapshot the edit was based on, for the version store
+
+        Returns:
+            Tuple of (enhanced_html_content, push_success)
+        """
+        self.start()
+        if html_content is None:
+            html_content = self.read_current_html()
+        page = page_key(self.repo_owner, self.repo_name, self.file_path)
+
+        asset_files: Dict[str, str] = {}
+        page_edit = code_edit
+        if self.enhancer.route_assets:
+            route = self.route_edit(code_edit)
+            if route is not None and route.stylesheet is not None:
+                from site_graph import append_css
+
+                stylesheet = self.site_graph.read(route.stylesheet)
+                asset_files[route.stylesheet] = append_css(stylesheet, route.css, instructions)
+                page_edit = route.page_edit
+
+        # The clone keeps going in the background while Morph merges
+        self._stage("merge")
+        if page_edit:
+            enhanced_html = self.enhancer.merge_with_morph(instructions, html_content, page_edit)
+            enhanced_html = self.enhancer.finalize_html(enhanced_html)
+            self.enhancer.record_index_edit(page, html_content, enhanced_html, instructions)
+        else:
+            enhanced_html = html_content
+
+        push_success = self.publish(html_content, enhanced_html, instructions, asset_files)
+
+        if self.enhancer.version_store is not None:
+            self.enhancer.version_store.record_version(
+                page,
+                original_html=html_content,
+                enhanced_html=enhanced_html,
+                instruction=instructions,
+                code_edit=code_edit,
+                metrics=metrics,
+                commit_sha=self.enhancer.last_commit_sha if push_success else None
+            )
+        return enhanced_html, push_success
+
+    def route_edit(self, code_edit: str):
+        """
+        Route the CSS of an edit to the stylesheet the page shares (see site_graph.py)
+
+        Waits for the working copy to build the site graph; returns the
+        site_graph.RoutedEdit, or None when there is no working copy.
+        """
+        from site_graph import SiteGraph
+
+        try:
+            repo = self._working_copy()
+        except Exception as e:
+            print(f"Edit not routed to shared assets: {e}")
+            return None
+        self.site_graph = SiteGraph.build(repo.working_tree_dir)
+        route = self.site_graph.route_edit(self.file_path, code_edit)
+        print(route.summary())
+        return route
+
+    def publish(self, original_html: str, enhanced_html: str, instructions: str,
+                asset_files: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Budget-check, optimize and push an enhanced page from the run's working copy
+
+        asset_files (site-relative path -> content) are pushed in the same commit;
+        with the optimizer on, every page that inlines them is optimized again.
+        """
+        self.start()
+        self._stage("publish")
+        try:
+            report = self.enhancer.check_page_budget(original_html, enhanced_html)
+            if report.blocked:
+                raise Exception(f"Enhanced page exceeds its page budget: {'; '.join(report.violations)}")
+            if not self._pat_future.result():
+                raise Exception("Invalid GitHub Personal Access Token")
+            repo = self._clone_future.result()
+
+            published_html, extra_files = enhanced_html, dict(asset_files or {})
+            if asset_files and self.site_graph is not None:
+                from site_graph import reoptimize_pages
+
+                extra_files.update(reoptimize_pages(self.enhancer, self.site_graph, asset_files,
+                                                    skip=[self.file_path]))
+            if self.enhancer.optimizer is not None:
+                published_html = self.enhancer.optimize_for_publish(
+                    enhanced_html, self.file_path, repo.working_tree_dir
+                )
+                extra_files[source_path_for(self.file_path)] = enhanced_html
+
+            return self.enhancer.push_to_github(
+                enhanced_html=published_html,
+                github_token=self.github_token,
+                github_user=self.github_user,
+                repo_owner=self.repo_owner,
+                repo_name=self.repo_name,
+                file_path=self.file_path,
+                commit_message=f"Enhanced HTML based on engagement analysis: {instructions[:100]}...",
+                repo=repo,
+                extra_files=extra_files
+            )
+        except Exception as e:
+            print(f"GitHub push failed: {e}")
+            return False
+
+    def push_page(self, html: str, commit_message: str) -> bool:
+        """
+        Push a readable page that needs no analysis (e.g. a stored version) from the run's working copy
+
+        With the optimizer on, the page is optimized against the working copy
+        as in publish, so local assets resolve the same way, and its readable
+        source is pushed alongside. Failures raise, as push_to_github does.
+        """
+        self._stage("publish")
+        repo = self._working_copy()
+        published_html, extra_files = html, None
+        if getattr(self.enhancer, "optimizer", None) is not None:
+            published_html = self.enhancer.optimize_for_publish(html, self.file_path, repo.working_tree_dir)
+            extra_files = {source_path_for(self.file_path): html}
+        return self.enhancer.push_to_github(
+            enhanced_html=published_html,
+            github_token=self.github_token,
+            github_user=self.github_user,
+            repo_owner=self.repo_owner,
+            repo_name=self.repo_name,
+            file_path=self.file_path,
+            commit_message=commit_message,
+            repo=repo,
+            extra_files=extra_files
+        )
+
+    def run_site(self, csv_content: str, pages: Optional[List[str]] = None,
+                 templates: bool = False) -> Tuple[object, bool]:
+        """
+        Enhance the repository's pages together and push every changed file in one commit
+
+        Pages sharing a stylesheet (with templates: a page template) get one
+        analysis between them (see site_graph.enhance_site); file_path is not used.
+
+        Returns:
+            Tuple of (site_graph.SiteRun, push_success)
+        """
+        from site_graph import SiteGraph, enhance_site
+
+        self._stage("fetch")
+        repo = self._working_copy()
+        self.site_graph = SiteGraph.build(repo.working_tree_dir)
+        print(self.site_graph.summary())
+
+        self._stage("analyze")
+        self.enhancer.preview_csv_data(csv_content)
+        run = enhance_site(self.enhancer, self.site_graph, csv_content, pages, templates)
+
+        self._stage("publish")
+        if not run.files:
+            print("No changes to commit")
+            return run, True
+        try:
+            self.enhancer.last_commit_sha = self.enhancer.publisher.commit_and_push(
+                repo, run.files, f"Enhanced {run.pages} page(s) based on engagement analysis",
+                self.enhancer.minimal_diff
+            )
+            return run, True
+        except Exception as e:
+            print(f"GitHub push failed: {e}")
+            return run, False
+
+    def cancel(self) -> None:
+        """Cancel any work that has not started and abandon work in flight"""
+        self._cancelled.set()
+        for future in (self._pat_future, self._clone_future):
+            if future is not None:
+                future.cancel()
+
+    def close(self) -> None:
+        """Release the worker threads and remove the working copy"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._temp_dir is None:
+            return
+
+        temp_dir, self._temp_dir = self._temp_dir, None
+        remove = lambda *_: shutil.rmtree(temp_dir, ignore_errors=True)
+        if self._clone_future is None or self._clone_future.done():
+            remove()
+        else:
+            # An abandoned clone is still writing into the directory
+            self._clone_future.add_done_callback(remove)
@@ -0,0 +1,529 @@
+# site_graph.py
+#
+# Dependency graph of a static site's pages, their local stylesheets and
+# scripts, and shared partials; routes the CSS of an edit to the stylesheet
+# the page shares instead of duplicating it into every page:
+#   python site_graph.py SITE_DIR                                    # pages, assets and who shares them
+#   python site_graph.py SITE_DIR --affected css/site.css            # pages a change invalidates
+#   python site_graph.py SITE_DIR --csv metrics.csv --out-dir site2  # enhance the whole site (copy)
+#   python site_graph.py SITE_DIR --csv metrics.csv --templates      # ... one analysis per page template
+#   python site_graph.py --github OWNER/REPO --csv metrics.csv       # ... and push it in one commit
+
+import argparse
+import os
+import re
+import shutil
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from css_compactor import Rule, parse_stylesheet
+from html_dom import parse_html
+from page_optimizer import site_path_for, source_path_for
+from template_clusters import aggregate_metrics, cluster_pages
+
+
+HTML_EXTENSIONS = (".html", ".htm")
+_SKIPPED_DIRS = {"node_modules", "__pycache__", "vendor"}
+
+# Server-side includes and the common client-side include attributes
+_SSI_INCLUDE = re.compile(r"<!--#include\s+(?:file|virtual)\s*=\s*[\"']([^\"']+)[\"']\s*-->", re.IGNORECASE)
+_INCLUDE_ATTRS = ("data-include", "w3-include-html", "include-html")
+_CSS_IMPORT = re.compile(r"@import\s+(?:url\(\s*)?[\"']?([^\"')\s;]+)", re.IGNORECASE)
+
+_STYLE_BLOCK = re.compile(r"<style\b([^>]*)>(.*?)</style\s*>", re.IGNORECASE | re.DOTALL)
+_MEDIA_ATTR = re.compile(r"\bmedia\s*=\s*[\"']([^\"']*)[\"']", re.IGNORECASE)
+# Lazy-edit markers ("// ... existing code ...") carry nothing to apply
+_EDIT_MARKER = re.compile(r"^\s*(?://|/\*|<!--)\s*\.\.\..*$", re.MULTILINE)
+_COMMENTS = re.compile(r"<!--.*?-->|/\*.*?\*/", re.DOTALL)
+
+
+@dataclass
+class Dependency:
+    """A file another file of the site loads; paths are site-relative"""
+    path: str
+    kind: str  # "stylesheet", "script", "partial" or "import" (CSS @import)
+    exists: bool
+
+
+def _is_blank_edit(code_edit: str) -> bool:
+    return not _COMMENTS.sub("", _EDIT_MARKER.sub("", code_edit)).strip()
+
+
+def split_code_edit(code_edit: str) -> Tuple[str, str]:
+    """
+    Split an analysis CODE_EDIT into its CSS and the rest
+
+    A pure-CSS edit is all CSS; otherwise the contents of its <style> blocks
+    are (wrapped in @media when the block has a media attribute).
+
+    Returns:
+        (css, page_edit): page_edit is what still has to be merged into the page
+    """
+    if "<" not in code_edit and "{" in code_edit:
+        css = _EDIT_MARKER.sub("", code_edit).strip()
+        return (css, "") if parse_stylesheet(css) else ("", code_edit)
+    parts = []
+    for attrs, body in _STYLE_BLOCK.findall(code_edit):
+        media = _MEDIA_ATTR.search(attrs)
+        body = _EDIT_MARKER.sub("", body).strip()
+        if body and media and media.group(1).strip() not in ("", "all"):
+            body = f"@media {media.group(1).strip()} {{\n{body}\n}}"
+        if body:
+            parts.append(body)
+    if not parts:
+        return "", code_edit
+    rest = _STYLE_BLOCK.sub("", code_edit)
+    return "\n\n".join(parts), "" if _is_blank_edit(rest) else rest.strip()
+
+
+def append_css(stylesheet: str, css: str, note: str = "") -> str:
+    """The stylesheet with css appended once (a no-op when it is already there)"""
+    css = css.strip()
+    if not css or css in stylesheet:
+        return stylesheet
+    note = " ".join(note.split())[:100].replace("*/", "* /")
+    header = f"/* Enhancement based on CSV analysis{': ' + note if note else ''} */"
+    return (stylesheet.rstrip("\n") + "\n\n" if stylesheet.strip() else "") + f"{header}\n{css}\n"
+
+
+@dataclass
+class RoutedEdit:
+    """Where the parts of one page's edit go"""
+    page_edit: str  # merged into the page
+    stylesheet: Optional[str] = None  # site-relative path the CSS goes to
+    css: str = ""
+    shared_by: int = 0  # pages that load the stylesheet
+    kept_in_page: int = 0  # CSS statements a later rule of the page would override in the stylesheet
+
+    @property
+    def merges_page(self) -> bool:
+        return not _is_blank_edit(self.page_edit)
+
+    def summary(self) -> str:
+        if self.stylesheet is None:
+            kept = f" ({self.kept_in_page} CSS statement(s) would lose to the page's own rules)" \
+                if self.kept_in_page else ""
+            return f"🔗 Edit stays in the page{kept}"
+        rest = "; the rest is merged into the page" if self.merges_page else "; nothing left to merge into the page"
+        if self.kept_in_page:
+            rest = f"; {self.kept_in_page} CSS statement(s) kept in the page, whose own rules would win{rest}"
+        return (f"🔗 {len(parse_stylesheet(self.css))} CSS rule(s) routed to {self.stylesheet} "
+                f"(loaded by {self.shared_by} page(s)){rest}")
+
+
+class SiteGraph:
+    """
+    Pages of a site directory (e.g. a cloned repo) and the files they load
+
+    Pages are the .html files that no other file includes; a page's readable
+    copy (see page_optimizer.source_path_for) is read and scanned in its
+    place. Edges go from a file to the stylesheets, scripts and partials it
+    loads, and from stylesheets to what they @import; dependents() walks
+    them backwards, so affected_pages() finds every page a changed file
+    invalidates. refresh() rescans only the files that changed.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.pages: List[str] = []
+        self.copies: Dict[str, str] = {}  # page -> its readable copy
+        self.deps: Dict[str, List[Dependency]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self._page_counts: Dict[str, int] = {}
+
+    @classmethod
+    def build(cls, root: str) -> "SiteGraph":
+        graph = cls(root)
+        html_files = []
+        for directory, dirs, files in os.walk(root):
+            dirs[:] = sorted(name for name in dirs if not name.startswith(".") and name not in _SKIPPED_DIRS)
+            for name in sorted(files):
+                if name.lower().endswith(HTML_EXTENSIONS):
+                    html_files.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/"))
+        present = set(html_files)
+        graph.copies = {path: source_path_for(path) for path in html_files if source_path_for(path) in present}
+        readable_copies = set(graph.copies.values())
+        for path in html_files:
+            if path not in readable_copies:
+                graph._scan(path)
+        partials = {dependency.path for deps in graph.deps.values() for dependency in deps
+                    if dependency.kind == "partial"}
+        graph.pages = [path for path in html_files if path not in readable_copies and path not in partials]
+        return graph
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split("/"))
+
+    def read(self, path: str) -> str:
+        """A file's contents; for a page with a readable copy, the copy"""
+        with open(self._full_path(self.copies.get(path, path)), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(self._full_path(path))
+
+    def _scan(self, path: str) -> None:
+        """(Re)read one file's dependencies, and those of any newly found local CSS or partial"""
+        for old in self.deps.pop(path, []):
+            self._dependents.get(old.path, set()).discard(path)
+        self._page_counts.clear()
+        if not self.exists(self.copies.get(path, path)):
+            return
+        content = self.read(path)
+        found = []
+        if path.lower().endswith(".css"):
+            found = [(url, "import") for url in _CSS_IMPORT.findall(content)]
+        elif path.lower().endswith(HTML_EXTENSIONS):
+            found = [(url, "partial") for url in _SSI_INCLUDE.findall(content)]
+            for node in parse_html(content).iter():
+                rel = (node.get("rel") or "").lower().split()
+                if node.tag == "link" and ("stylesheet" in rel or (node.get("as") == "style" and "preload" in rel)):
+                    found.append((node.get("href") or "", "stylesheet"))
+                elif node.tag == "script" and node.get("src"):
+                    found.append((node.get("src"), "script"))
+                for name in _INCLUDE_ATTRS:
+                    if node.get(name):
+                        found.append((node.get(name), "partial"))
+        deps, seen = [], set()
+        for url, kind in found:
+            target = site_path_for(url, path)
+            if target is None or target in seen:
+                continue
+            seen.add(target)
+            deps.append(Dependency(target, kind, self.exists(target)))
+            self._dependents.setdefault(target, set()).add(path)
+        self.deps[path] = deps
+        for dependency in deps:
+            if dependency.exists and dependency.kind != "script" and dependency.path not in self.deps:
+                self._scan(dependency.path)
+
+    def refresh(self, paths: Iterable[str]) -> List[str]:
+        """Rescan changed, added or removed files; returns the pages they affect"""
+        paths = list(paths)
+        for path in paths:
+            if path.lower().endswith(HTML_EXTENSIONS) and path not in self.pages and path not in self.deps \
+                    and self.exists(path) and path not in self.copies.values():
+                self.pages.append(path)
+            if path in self.deps or path in self.pages:
+                self._scan(path)
+            # A page's readable copy changing is the page changing
+            for page, copy in self.copies.items():
+                if copy == path:
+                    self._scan(page)
+        self.pages = [page for page in self.pages if self.exists(self.copies.get(page, page))]
+        return self.affected_pages(paths)
+
+    def dependencies(self, path: str) -> List[Dependency]:
+        """Everything a file loads, directly or through partials and @imports, in document order"""
+        result, seen, stack = [], {path}, list(reversed(self.deps.get(path, [])))
+        while stack:
+            dependency = stack.pop()
+            if dependency.path in seen:
+                continue
+            seen.add(dependency.path)
+            result.append(dependency)
+            stack.extend(reversed(self.deps.get(dependency.path, [])))
+        return result
+
+    def dependents(self, path: str) -> List[str]:
+        """Files that load path directly"""
+        return sorted(self._dependents.get(path, ()))
+
+    def affected_pages(self, paths: Iterable[str]) -> List[str]:
+        """Pages that are or load (transitively) any of paths"""
+        pages = set(self.pages)
+        affected, seen = set(), set()
+        stack = [path for path in paths]
+        while stack:
+            path = stack.pop()
+            if path in seen:
+                continue
+            seen.add(path)
+            if path in pages:
+                affected.add(path)
+            stack.extend(self._dependents.get(path, ()))
+        return sorted(affected)
+
+    def page_count(self, path: str) -> int:
+        """Pages that load path"""
+        if path not in self._page_counts:
+            self._page_counts[path] = len(self.affected_pages([path]))
+        return self._page_counts[path]
+
+    def stylesheet_for(self, page: str) -> Optional[str]:
+        """
+        The local stylesheet a page's new CSS belongs in: the one shared by
+        the most pages; among equals a linked one over an @imported one (its
+        rules come later), then the last loaded (it wins the cascade)
+        """
+        best, best_key = None, None
+        for position, dependency in enumerate(self.dependencies(page)):
+            if dependency.kind in ("stylesheet", "import") and dependency.exists:
+                key = (self.page_count(dependency.path), dependency.kind == "stylesheet", position)
+                if best_key is None or key > best_key:
+                    best, best_key = dependency.path, key
+        return best
+
+    def route_edit(self, page: str, code_edit: str) -> RoutedEdit:
+        """
+        Send the CSS of a page's edit to its stylesheet; the rest stays with the page
+
+        A CSS statement stays in the page (as a <style> block in page_edit)
+        when the page loads a rule for one of its selectors after the
+        stylesheet: in the stylesheet it would lose the cascade to that rule.
+        """
+        stylesheet = self.stylesheet_for(page)
+        css, page_edit = split_code_edit(code_edit) if stylesheet else ("", code_edit)
+        if not css:
+            return RoutedEdit(code_edit)
+
+        later = self._selectors_after(page, stylesheet)
+        routed, kept = [], []
+        statements: "OrderedDict[Tuple[int, int], bool]" = OrderedDict()
+        for item in parse_stylesheet(css):
+            overridden = isinstance(item, Rule) and any(" ".join(selector.split()) in later
+                                                        for selector in item.selectors)
+            statements[item.span] = statements.get(item.span, False) or overridden
+        for (start, end), overridden in statements.items():
+            (kept if overridden else routed).append(css[start:end].strip())
+        if not routed:
+            return RoutedEdit(code_edit, kept_in_page=len(kept))
+        if kept:
+            block = "<style>\n" + "\n\n".join(kept) + "\n</style>"
+            page_edit = f"{page_edit}\n\n{block}" if not _is_blank_edit(page_edit) else block
+        return RoutedEdit(page_edit, stylesheet, "\n\n".join(routed), self.page_count(stylesheet), len(kept))
+
+    def _selectors_after(self, page: str, stylesheet: str) -> Set[str]:
+        """
+        Selectors of the rules a page loads after stylesheet: its inline
+        <style> blocks and local stylesheets linked later. When the page
+        doesn't link stylesheet itself (it comes through a partial), every
+        inline rule counts.
+        """
+        carriers, stack = set(), [stylesheet]
+        while stack:
+            path = stack.pop()
+            if path not in carriers:
+                carriers.add(path)
+                stack.extend(self._dependents.get(path, ()))
+
+        after: Set[str] = set()
+        inline: Set[str] = set()
+        passed = False
+        for node in parse_html(self.read(page)).iter():
+            css = None
+            if node.tag == "style":
+                css = "".join(node.text)
+            elif node.tag == "link" and "stylesheet" in (node.get("rel") or "").lower().split():
+                target = site_path_for(node.get("href") or "", page)
+                if not passed and target in carriers:
+                    passed = True
+                    continue
+                if passed and target is not None and self.exists(target):
+                    with open(self._full_path(target), "r", encoding="utf-8") as f:
+                        css = f.read()
+            if css is None:
+                continue
+            selectors = {" ".join(selector.split()) for item in parse_stylesheet(css)
+                         if isinstance(item, Rule) for selector in item.selectors}
+            if node.tag == "style":
+                inline |= selectors
+            if passed:
+                after |= selectors
+        return after if passed else inline
+
+    def shared_assets(self) -> List[Tuple[str, int]]:
+        """(asset, pages loading it) for assets loaded by more than one page, most shared first"""
+        assets = {dependency.path for deps in self.deps.values() for dependency in deps}
+        shared = [(asset, self.page_count(asset)) for asset in assets if asset not in self.pages]
+        return sorted((item for item in shared if item[1] > 1), key=lambda item: (-item[1], item[0]))
+
+    def summary(self) -> str:
+        assets = {dependency.path for deps in self.deps.values() for dependency in deps} - set(self.pages)
+        missing = sorted({dependency.path for deps in self.deps.values() for dependency in deps
+                          if not dependency.exists})
+        lines = [f"🕸️ Site graph: {len(self.pages)} page(s), {len(assets)} asset(s) and partial(s)"]
+        for asset, count in self.shared_assets()[:10]:
+            lines.append(f"  {asset}: loaded by {count} page(s)")
+        if missing:
+            lines.append(f"  ⚠️ referenced but missing: {', '.join(missing[:10])}")
+        return "\n".join(lines)
+
+
+def reoptimize_pages(enhancer, graph: SiteGraph, assets: Dict[str, str], skip: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    Optimized pages to publish again because changed assets are inlined into them
+
+    Only with an optimizer and for pages kept with a readable copy. The
+    assets are written into graph.root first, so the optimizer inlines their
+    new contents (graph.root must be a working copy, not the live site).
+    """
+    if enhancer.optimizer is None or not assets:
+        return {}
+    for path, content in assets.items():
+        with open(graph._full_path(path), "w", encoding="utf-8") as f:
+            f.write(content)
+    skipped = set(skip)
+    files = {}
+    for page in graph.affected_pages(assets):
+        if page in skipped or page not in graph.copies:
+            continue
+        files[page] = enhancer.optimize_for_publish(graph.read(page), page, graph.root)
+    if files:
+        print(f"♻️ Re-optimized {len(files)} page(s) that inline {', '.join(sorted(assets))}")
+    return files
+
+
+@dataclass
+class SiteRun:
+    """What one whole-site enhancement produced"""
+    files: Dict[str, str] = field(default_factory=dict)  # site-relative path -> new content
+    pages: int = 0
+    analyses: int = 0
+    enhanced: List[str] = field(default_factory=list)  # pages whose HTML changed
+    routed: Dict[str, List[str]] = field(default_factory=dict)  # stylesheet -> pages it now covers
+    invalidated: List[str] = field(default_factory=list)  # pages affected by the changed files
+
+    def summary(self) -> str:
+        routed = "; ".join(f"{sheet} covers {len(pages)} page(s)" for sheet, pages in self.routed.items())
+        return (f"🌐 Site run: {self.analyses} analysis/edit(s) for {self.pages} page(s), "
+                f"{len(self.files)} file(s) changed, {len(self.invalidated)} page(s) affected"
+                f"{' (' + routed + ')' if routed else ''}")
+
+
+def enhance_site(enhancer, graph: SiteGraph, csv_content: str, pages: Optional[Iterable[str]] = None,
+                 templates: bool = False, csv_for: Optional[Dict[str, str]] = None) -> SiteRun:
+    """
+    Enhance many pages of a site with as few edits as possible
+
+    Pages sharing a stylesheet are enhanced together: one page of the group
+    is analyzed, its CSS goes into the shared stylesheet once and covers the
+    whole group, and its remaining HTML edit is merged into that page only.
+    Pages without a shared stylesheet are enhanced one by one. With
+    templates, pages are grouped by template instead (template_clusters.py)
+    and the HTML edit is merged into every page of the group. Nothing is
+    pushed or written except stylesheets needed for re-optimizing (see
+    reoptimize_pages); the returned SiteRun.files are the changes.
+
+    Args:
+        csv_for: Per-page metrics; a group is analyzed with the aggregate of
+            its pages' CSVs instead of csv_content
+    """
+    pages = list(pages) if pages is not None else list(graph.pages)
+    groups: "OrderedDict[str, List[str]]" = OrderedDict()
+    if templates:
+        for cluster in cluster_pages({page: graph.read(page) for page in pages}):
+            groups[f"template:{cluster.fingerprint}"] = [cluster.representative] + [
+                page for page in cluster.pages if page != cluster.representative
+            ]
+    else:
+        for page in pages:
+            stylesheet = graph.stylesheet_for(page)
+            if stylesheet is not None and graph.page_count(stylesheet) > 1:
+                groups.setdefault(stylesheet, []).append(page)
+            else:
+                groups.setdefault(f"page:{page}", []).append(page)
+
+    run = SiteRun(pages=len(pages))
+    assets: Dict[str, str] = {}
+    enhanced: Dict[str, str] = {}
+    for group, members in groups.items():
+        page = members[0]
+        metrics = csv_content
+        if csv_for:
+            metrics = aggregate_metrics(csv_for[member] for member in members if member in csv_for) or csv_content
+        instructions, code_edit = enhancer.analyze_engagement_with_claude(metrics, graph.read(page), page=page)
+        run.analyses += 1
+        for target in members if templates else [page]:
+            html = graph.read(target)
+            route = graph.route_edit(target, code_edit)
+            if target == page:
+                print(route.summary())
+            if route.stylesheet is not None:
+                current = assets.get(route.stylesheet)
+                assets[route.stylesheet] = append_css(current if current is not None else graph.read(route.stylesheet),
+                                                      route.css, instructions)
+                run.routed.setdefault(route.stylesheet, []).extend([target] if templates else members)
+            if not route.merges_page:
+                continue
+            merged = enhancer.finalize_html(enhancer.merge_with_morph(instructions, html, route.page_edit))
+            if enhancer.check_page_budget(html, merged).blocked:
+                print(f"⏭️ {target}: enhanced page exceeds its page budget; left unchanged")
+                continue
+            enhancer.record_index_edit(target, html, merged, instructions)
+            enhanced[target] = merged
+
+    run.enhanced = sorted(enhanced)
+    run.invalidated = graph.affected_pages(list(assets) + run.enhanced)
+    run.files.update(assets)
+    for page, html in enhanced.items():
+        if enhancer.optimizer is not None:
+            run.files[graph.copies.get(page, source_path_for(page))] = html
+            run.files[page] = enhancer.optimize_for_publish(html, page, graph.root)
+        else:
+            # Without the optimizer the page itself is published; a readable copy is kept in step
+            run.files[page] = html
+            if page in graph.copies:
+                run.files[graph.copies[page]] = html
+    run.files.update(reoptimize_pages(enhancer, graph, assets, skip=enhanced))
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dependency graph and whole-site enhancement of a static site")
+    parser.add_argument("site", nargs="?", help="Site directory")
+    parser.add_argument("--github", metavar="OWNER/REPO", help="Clone this repository instead (GITHUB_TOKEN, GITHUB_USER)")
+    parser.add_argument("--affected", nargs="+", metavar="PATH", help="List the pages changes to these files affect")
+    parser.add_argument("--csv", help="Engagement CSV: enhance the site's pages")
+    parser.add_argument("--pages", nargs="+", help="Only these pages (default: all)")
+    parser.add_argument("--out-dir", help="Local site: write the enhanced site here (a copy; default: in place)")
+    parser.add_argument("--templates", action="store_true",
+                        help="Group pages by template and merge each analysis into every page of the template")
+    args = parser.parse_args()
+    if bool(args.site) == bool(args.github):
+        parser.error("give either a site directory or --github OWNER/REPO")
+
+    csv_content = None
+    if args.csv:
+        with open(args.csv, "r", encoding="utf-8") as f:
+            csv_content = f.read()
+
+    if args.github:
+        if csv_content is None:
+            parser.error("--github needs --csv")
+        from Claude_Morph_Edit_HTML_GH_or_Upload import create_enhancer_from_env
+        from run_planner import RunPlanner
+
+        owner, _, repo = args.github.partition("/")
+        with RunPlanner(create_enhancer_from_env(), os.getenv("GITHUB_TOKEN", ""), os.getenv("GITHUB_USER", ""),
+                        owner, repo, "") as planner:
+            run, pushed = planner.run_site(csv_content, args.pages, args.templates)
+        print(run.summary())
+        sys.exit(0 if pushed else 1)
+
+    root = args.site
+    if args.out_dir and csv_content is not None:
+        shutil.copytree(args.site, args.out_dir, dirs_exist_ok=True)
+        root = args.out_dir
+    graph = SiteGraph.build(root)
+    print(graph.summary())
+    if args.affected:
+        for page in graph.affected_pages(args.affected):
+            print(f"  {page}")
+    if csv_content is None:
+        return
+
+    from Claude_Morph_Edit_HTML_GH_or_Upload import create_enhancer_from_env
+
+    run = enhance_site(create_enhancer_from_env(), graph, csv_content, args.pages, args.templates)
+    for path, content in run.files.items():
+        with open(graph._full_path(path), "w", encoding="utf-8") as f:
+            f.write(content)
+        print(f"✅ {os.path.join(root, path)}")
+    print(run.summary())
+
+
+if __name__ == "__main__":
+    main()
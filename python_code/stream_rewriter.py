@@ -0,0 +1,263 @@
+# stream_rewriter.py
+#
+# Bounded-memory rewriting of large HTML files: the source is memory-mapped,
+# a small tokenizer finds tags without decoding or parsing the document, and
+# insertions/splices are written to the output in one forward pass:
+#   python stream_rewriter.py page.html --css edit.css -o enhanced.html
+#   python stream_rewriter.py page.html --find-end head
+#
+# The same tokenizer and splicing work on str documents, with character
+# offsets instead of byte offsets (see fallback_merge).
+
+import argparse
+import contextlib
+import mmap
+import os
+import re
+import sys
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+Buffer = Union[str, bytes, mmap.mmap]
+# (start, end, replacement): replace buffer[start:end]; start == end inserts
+Splice = Tuple[int, int, str]
+
+FALLBACK_MARKER = "<!-- Enhancement based on CSV analysis -->"
+CHUNK_BYTES = 1 << 20
+
+# Elements whose content is text up to their end tag, not markup
+_RAW_TEXT = ("script", "style", "textarea", "title", "xmp", "iframe", "noembed", "noframes", "plaintext")
+
+_TAG = r"<(/?)([A-Za-z][^\s/>]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>"
+_PATTERNS = {
+    str: (re.compile(_TAG), "<", "<!--", "-->", ">"),
+    bytes: (re.compile(_TAG.encode()), b"<", b"<!--", b"-->", b">"),
+}
+_RAW_END = {}
+
+
+def _patterns(buffer: Buffer):
+    return _PATTERNS[str if isinstance(buffer, str) else bytes]
+
+
+def _raw_end(name: str, text: bool) -> "re.Pattern":
+    key = (name, text)
+    if key not in _RAW_END:
+        pattern = rf"</{name}[\s/>]"
+        _RAW_END[key] = re.compile(pattern if text else pattern.encode(), re.IGNORECASE)
+    return _RAW_END[key]
+
+
+def iter_tags(buffer: Buffer, start: int = 0) -> Iterator[Tuple[int, int, str, bool]]:
+    """
+    Yield the tags of a document in order, without building a tree
+
+    Comments, doctypes and processing instructions are skipped, and so is
+    the content of raw-text elements (script, style, ...), so a "</head>"
+    inside a comment or a script string is not a tag.
+
+    Yields:
+        (start, end, name, is_end_tag); offsets index into buffer (bytes for
+        bytes and mmap buffers) and name is lowercase
+    """
+    tag, lt, comment_open, comment_close, gt = _patterns(buffer)
+    text = isinstance(buffer, str)
+    position = start
+    size = len(buffer)
+    while position < size:
+        position = buffer.find(lt, position)
+        if position < 0:
+            return
+        if buffer[position:position + 4] == comment_open:
+            close = buffer.find(comment_close, position + 4)
+            position = size if close < 0 else close + 3
+            continue
+        following = buffer[position + 1:position + 2]
+        if following in ("!", "?", b"!", b"?"):
+            close = buffer.find(gt, position)
+            position = size if close < 0 else close + 1
+            continue
+        match = tag.match(buffer, position)
+        if match is None:
+            position += 1
+            continue
+        name = match.group(2)
+        name = (name if text else name.decode("latin-1")).lower()
+        is_end = bool(match.group(1))
+        yield position, match.end(), name, is_end
+        position = match.end()
+        if not is_end and name in _RAW_TEXT:
+            close = _raw_end(name, text).search(buffer, position)
+            position = size if close is None else close.start()
+
+
+def find_tag(buffer: Buffer, name: str, end_tag: bool = False, stop: Iterable[str] = ()) -> Optional[Tuple[int, int]]:
+    """
+    Span of the first <name ...> (or </name> with end_tag) in the document
+
+    Scanning stops early, returning None, at any start tag named in stop
+    (e.g. stop=("body",) when looking for </head>).
+    """
+    stops = set(stop)
+    for start, end, tag, is_end in iter_tags(buffer):
+        if tag == name and is_end == end_tag:
+            return start, end
+        if not is_end and tag in stops:
+            return None
+    return None
+
+
+def fallback_splices(buffer: Buffer, code_edit: str, marker: str = FALLBACK_MARKER) -> List[Splice]:
+    """
+    Splices that add code_edit as a <style> block to the document's <head>
+
+    The block goes before the first real </head>; without one, before the
+    <body> tag, and otherwise at the top. The marker comment is added at the
+    top unless the document already starts with it.
+    """
+    style = f"<style>\n{code_edit}\n</style>\n"
+    spot = find_tag(buffer, "head", end_tag=True, stop=("body",)) or find_tag(buffer, "body")
+    splices: List[Splice] = []
+    head = marker.encode() if not isinstance(buffer, str) else marker
+    if buffer[:len(head)] != head:
+        splices.append((0, 0, f"{marker}\n"))
+    at = spot[0] if spot is not None else 0
+    if at == 0 and splices:
+        splices[0] = (0, 0, f"{marker}\n{style}")
+    else:
+        splices.append((at, at, style))
+    return splices
+
+
+def _ordered(splices: Iterable[Splice], size: int) -> List[Splice]:
+    ordered = sorted(splices, key=lambda splice: (splice[0], splice[1]))
+    cursor = 0
+    for start, end, _ in ordered:
+        if start < cursor or end < start or end > size:
+            raise ValueError(f"Overlapping or out-of-range splice at {start}:{end}")
+        cursor = end
+    return ordered
+
+
+def apply_splices(text: str, splices: Iterable[Splice]) -> str:
+    """text with non-overlapping splices applied, copying it once"""
+    pieces = []
+    cursor = 0
+    for start, end, replacement in _ordered(splices, len(text)):
+        pieces.append(text[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(text[cursor:])
+    return "".join(pieces)
+
+
+@contextlib.contextmanager
+def mapped(path: str) -> Iterator[Buffer]:
+    """A read-only memory map of a file (b"" for an empty file)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+
+def read_prefix(path: str, chars: int) -> str:
+    """The first chars characters of a UTF-8 file, without reading the rest"""
+    with mapped(path) as view:
+        return bytes(view[:chars * 4]).decode("utf-8", errors="ignore")[:chars]
+
+
+def _copy(view: Buffer, start: int, end: int, out: BinaryIO, chunk_bytes: int) -> None:
+    done = start
+    while done < end:
+        stop = min(end, done + chunk_bytes)
+        out.write(view[done:stop])
+        if isinstance(view, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+            # The copied pages aren't needed again; keep the resident set flat
+            aligned = done - done % mmap.PAGESIZE
+            view.madvise(mmap.MADV_DONTNEED, aligned, stop - aligned)
+        done = stop
+
+
+def rewrite_file(source: str, splices: Iterable[Splice], destination: Union[str, BinaryIO],
+                 chunk_bytes: int = CHUNK_BYTES) -> int:
+    """
+    Copy a file with splices applied, in one forward pass
+
+    Splice offsets are byte offsets into the source file; replacements are
+    written as UTF-8. Memory use is bounded by chunk_bytes plus the
+    replacements, whatever the file's size. A destination path is replaced
+    atomically (it may be the source itself).
+
+    Returns:
+        Bytes written
+    """
+    with mapped(source) as view:
+        ordered = _ordered(splices, len(view))
+        if not isinstance(destination, str):
+            return _write(view, ordered, destination, chunk_bytes)
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".rewrite-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                written = _write(view, ordered, out, chunk_bytes)
+            os.replace(temp_path, destination)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
+            raise
+        return written
+
+
+def _write(view: Buffer, splices: List[Splice], out: BinaryIO, chunk_bytes: int) -> int:
+    written = 0
+    cursor = 0
+    for start, end, replacement in splices:
+        _copy(view, cursor, start, out, chunk_bytes)
+        data = replacement.encode("utf-8")
+        out.write(data)
+        written += start - cursor + len(data)
+        cursor = end
+    _copy(view, cursor, len(view), out, chunk_bytes)
+    return written + len(view) - cursor
+
+
+def fallback_merge_file(source: str, destination: Union[str, BinaryIO], code_edit: str) -> int:
+    """fallback_merge of a file, streamed from source to destination; returns bytes written"""
+    with mapped(source) as view:
+        splices = fallback_splices(view, code_edit)
+    return rewrite_file(source, splices, destination)
+
+
+def fallback_merge(html: str, code_edit: str) -> str:
+    """The document with code_edit added as a <style> block to its <head> (see fallback_splices)"""
+    return apply_splices(html, fallback_splices(html, code_edit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a <style> insertion into a large HTML file")
+    parser.add_argument("page", help="HTML file")
+    parser.add_argument("--css", help="CSS file to add in a <style> block before </head>")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--find-end", metavar="TAG", help="Print the byte offset of the first </TAG>")
+    args = parser.parse_args()
+
+    if args.find_end:
+        with mapped(args.page) as view:
+            span = find_tag(view, args.find_end.lower(), end_tag=True)
+        print(span[0] if span is not None else "not found")
+        return
+    if not args.css:
+        parser.error("give --css or --find-end")
+    with open(args.css, "r", encoding="utf-8") as f:
+        css = f.read().strip()
+    if args.output:
+        written = fallback_merge_file(args.page, args.output, css)
+        print(f"✅ {args.output}: {written:,} bytes", file=sys.stderr)
+    else:
+        fallback_merge_file(args.page, sys.stdout.buffer, css)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# template_clusters.py
+#
+# Groups pages generated from the same template by the shape of their DOM
+# (tags and classes, not text) so a cluster needs one analysis, whose edit is
+# then merged into every member:
+#   python template_clusters.py site/*.html                            # list the clusters
+#   python template_clusters.py site/*.html --csv metrics.csv --out-dir enhanced
+#   python template_clusters.py site/*.html --csv-dir metrics --out-dir enhanced
+#
+# With --csv-dir, each page's metrics are read from <csv-dir>/<page name>.csv
+# (e.g. metrics/blog/post-1.csv for blog/post-1.html) and a cluster is
+# analyzed with the totals of its members.
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from cost_estimator import summarize_event_csv
+from html_dom import Node, parse_html
+
+
+# Unclassed elements made only of these are free-form content (an article
+# body, a card's text): their shape varies from page to page of one template
+_PROSE_TAGS = {
+    "p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "dl", "dt", "dd",
+    "blockquote", "pre", "code", "figure", "figcaption", "img", "picture", "source",
+    "table", "thead", "tbody", "tr", "td", "th", "a", "em", "strong", "b", "i", "u",
+    "span", "small", "sub", "sup", "mark", "br", "hr", "abbr", "cite", "q", "time",
+}
+_SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+_DIGITS = re.compile(r"\d+")
+# Distinct classed or structural elements a page needs before its skeleton is
+# told apart from that of any other page made of plain prose
+MIN_SKELETON_LABELS = 4
+_EVENT_COLUMNS = ("Event name", "Event count", "Total users", "Total revenue")
+
+
+def _label(node: Node) -> str:
+    classes = sorted({_DIGITS.sub("#", name) for name in node.classes})
+    return node.tag + "".join(f".{name}" for name in classes)
+
+
+def template_fingerprint(html: str, min_skeleton: int = MIN_SKELETON_LABELS) -> Optional[str]:
+    """
+    Hash of the page's <body> skeleton: element tags and classes, in order
+
+    Text, ids and other attributes are ignored, digits in class names are
+    wildcards, a run of identical siblings counts once (3 cards or 12 cards
+    is the same listing) and unclassed prose (p, h2, ul, img, ...) counts as
+    one "content" child, so the posts of one blog template match however
+    their bodies are written.
+
+    Returns None when the skeleton has fewer than min_skeleton distinct
+    classed or structural elements: an About, a Pricing and a Contact page
+    made of plain prose would otherwise share one fingerprint.
+    """
+    root = parse_html(html)
+    body = root.find("body") or root
+    nodes = [node for node in body.iter()]
+    digests: Dict[int, str] = {}
+    prose: Dict[int, bool] = {}
+    skeleton = set()
+    for node in reversed(nodes):
+        if node.tag in _SKIPPED_TAGS:
+            continue
+        children: List[str] = []
+        free = node.tag in _PROSE_TAGS and not node.classes
+        for child in node.children:
+            if child.tag in _SKIPPED_TAGS:
+                continue
+            part = "~" if prose[id(child)] else digests[id(child)]
+            free = free and prose[id(child)]
+            if not children or children[-1] != part:
+                children.append(part)
+        prose[id(node)] = free
+        if not free:
+            skeleton.add(_label(node))
+        digests[id(node)] = hashlib.sha1(f"{_label(node)}({','.join(children)})".encode()).hexdigest()[:16]
+    if len(skeleton) < min_skeleton:
+        return None
+    top: List[str] = []
+    for child in body.children:
+        if child.tag in _SKIPPED_TAGS:
+            continue
+        part = "~" if prose[id(child)] else digests[id(child)]
+        if not top or top[-1] != part:
+            top.append(part)
+    return hashlib.sha1(f"{body.tag}({','.join(top)})".encode()).hexdigest()[:16]
+
+
+@dataclass
+class TemplateCluster:
+    """Pages with the same template fingerprint"""
+    fingerprint: str
+    pages: List[str] = field(default_factory=list)
+    representative: str = ""  # the member that is analyzed
+
+    def summary(self) -> str:
+        others = f" and {len(self.pages) - 1} more" if len(self.pages) > 1 else ""
+        return f"🧩 Template {self.fingerprint[:8]}: {self.representative}{others}"
+
+
+def cluster_pages(pages: Dict[str, str]) -> List[TemplateCluster]:
+    """
+    Group pages by template fingerprint, largest cluster first
+
+    Args:
+        pages: Page name -> HTML
+
+    Returns:
+        The clusters; each one's representative is its median-sized member.
+        Pages without a fingerprint are clusters of their own.
+    """
+    groups: "OrderedDict[str, List[str]]" = OrderedDict()
+    for page, html in pages.items():
+        fingerprint = template_fingerprint(html)
+        if fingerprint is None:
+            fingerprint = hashlib.sha1(f"page:{page}".encode()).hexdigest()[:16]
+        groups.setdefault(fingerprint, []).append(page)
+    clusters = []
+    for fingerprint, members in groups.items():
+        by_size = sorted(members, key=lambda page: (len(pages[page]), page))
+        clusters.append(TemplateCluster(fingerprint, members, by_size[(len(by_size) - 1) // 2]))
+    return sorted(clusters, key=lambda cluster: -len(cluster.pages))
+
+
+def aggregate_metrics(csv_contents: Iterable[str]) -> str:
+    """
+    One CSV with the metrics of several pages
+
+    GA-style event tables are added up per event name (users are summed, so
+    they are an upper bound when visitors saw several pages); other CSVs are
+    concatenated, keeping one header when they share it.
+    """
+    contents = [content for content in csv_contents if content and content.strip()]
+    if len(contents) <= 1:
+        return contents[0] if contents else ""
+
+    tables = []
+    for content in contents:
+        lines = [line for line in content.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+        tables.append(lines)
+    readers = [csv.DictReader(io.StringIO("\n".join(lines))) for lines in tables]
+    if all("Event name" in (reader.fieldnames or []) for reader in readers):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(_EVENT_COLUMNS)
+        for reader in readers:
+            for record in reader:
+                writer.writerow([record.get(column) or "0" for column in _EVENT_COLUMNS])
+        combined = out.getvalue()
+        return summarize_event_csv(combined) or combined
+
+    headers = {lines[0] if lines else "" for lines in tables}
+    if len(headers) == 1:
+        header = headers.pop()
+        return "\n".join([header] + [line for lines in tables for line in lines[1:]]) + "\n"
+    return "\n\n".join(content.strip() for content in contents) + "\n"
+
+
+@dataclass
+class ClusterEdit:
+    """One cluster's analysis and what merging it into the members produced"""
+    cluster: TemplateCluster
+    instructions: str = ""
+    code_edit: str = ""
+    pages: Dict[str, str] = field(default_factory=dict)  # member -> enhanced HTML
+    skipped: Dict[str, str] = field(default_factory=dict)  # member -> why it was left unchanged
+
+    def summary(self) -> str:
+        skipped = f", {len(self.skipped)} left unchanged" if self.skipped else ""
+        return (f"{self.cluster.summary()}: 1 analysis, {len(self.pages)} of "
+                f"{len(self.cluster.pages)} page(s) enhanced{skipped}")
+
+
+def merge_into_members(enhancer, edit: ClusterEdit, pages: Dict[str, str], members: Iterable[str]) -> None:
+    """
+    Merge edit.code_edit into each member through the enhancer's merge stage
+
+    Each merged page is finalized, checked against the page budget and
+    recorded in the element index; results go into edit.pages/edit.skipped.
+    """
+    for page in members:
+        html = pages[page]
+        try:
+            merged = enhancer.finalize_html(enhancer.merge_with_morph(edit.instructions, html, edit.code_edit))
+        except Exception as e:
+            edit.skipped[page] = f"merge failed: {e}"
+            continue
+        if enhancer.check_page_budget(html, merged).blocked:
+            edit.skipped[page] = "enhanced page exceeds its page budget"
+            continue
+        enhancer.record_index_edit(page, html, merged, edit.instructions)
+        edit.pages[page] = merged
+
+
+def enhance_clusters(enhancer, pages: Dict[str, str], csv_for: Dict[str, str],
+                     clusters: Optional[List[TemplateCluster]] = None) -> List[ClusterEdit]:
+    """
+    Enhance pages with one analysis per template cluster
+
+    Args:
+        pages: Page name -> HTML; names are passed on as element index keys
+        csv_for: Page name -> its metrics CSV; a cluster is analyzed with the
+            aggregate of its members' metrics
+        clusters: Precomputed cluster_pages(pages)
+
+    Returns:
+        A ClusterEdit per cluster, in cluster order
+    """
+    edits = []
+    for cluster in clusters if clusters is not None else cluster_pages(pages):
+        print(cluster.summary())
+        metrics = aggregate_metrics(csv_for[page] for page in cluster.pages if page in csv_for)
+        edit = ClusterEdit(cluster)
+        edit.instructions, edit.code_edit = enhancer.analyze_engagement_with_claude(
+            metrics, pages[cluster.representative], page=cluster.representative
+        )
+        merge_into_members(enhancer, edit, pages, cluster.pages)
+        print(edit.summary())
+        edits.append(edit)
+    return edits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster pages by template and enhance one template at a time")
+    parser.add_argument("pages", nargs="+", help="HTML pages")
+    parser.add_argument("--root", help="Directory page names are relative to (default: the pages' common directory)")
+    parser.add_argument("--csv", help="Engagement CSV used for every page without its own")
+    parser.add_argument("--csv-dir", help="Per-page CSVs: <csv-dir>/<page name without extension>.csv")
+    parser.add_argument("--out-dir", default="enhanced", help="Where enhanced pages are written (default: enhanced)")
+    args = parser.parse_args()
+
+    root = args.root or os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in args.pages])
+    pages: Dict[str, str] = {}
+    for path in args.pages:
+        with open(path, "r", encoding="utf-8") as f:
+            pages[os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")] = f.read()
+
+    clusters = cluster_pages(pages)
+    print(f"🧩 {len(pages)} page(s) in {len(clusters)} template(s)")
+    for cluster in clusters:
+        print(f"  {cluster.fingerprint}  {len(cluster.pages):4d} page(s)  e.g. {cluster.representative}")
+    if not args.csv and not args.csv_dir:
+        return
+
+    default_csv = None
+    if args.csv:
+        with open(args.csv, "r", encoding="utf-8") as f:
+            default_csv = f.read()
+    # One CSV for everything is given to each cluster as is, not added up once per member
+    csv_for = {cluster.representative: default_csv for cluster in clusters if default_csv is not None}
+    if args.csv_dir:
+        csv_for = {}
+        for page in pages:
+            path = os.path.join(args.csv_dir, os.path.splitext(page)[0] + ".csv")
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    csv_for[page] = f.read()
+            elif default_csv is not None:
+                csv_for[page] = default_csv
+
+    from Claude_Morph_Edit_HTML_GH_or_Upload import create_enhancer_from_env
+
+    enhancer = create_enhancer_from_env()
+    edits = enhance_clusters(enhancer, pages, csv_for, clusters)
+    for edit in edits:
+        for page, html in edit.pages.items():
+            output = os.path.join(args.out_dir, page)
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            enhancer.save_enhanced_html(enhancer.optimize_for_publish(html, page), output)
+        for page, reason in edit.skipped.items():
+            print(f"⏭️ {page}: {reason}")
+    enhanced = sum(len(edit.pages) for edit in edits)
+    print(f"🧩 {len(edits)} analysis call(s) for {len(pages)} page(s); {enhanced} page(s) enhanced")
+
+
+if __name__ == "__main__":
+    main()
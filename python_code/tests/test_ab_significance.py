@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from ab_significance import ABTest, ArmCounts, PageDecision, SequentialEngine, sequential_test
+
+
+def counts(rate_a, rate_b, n=20_000):
+    n_a, n_b = np.array([float(n)]), np.array([float(n)])
+    sum_a, sum_b = n_a * rate_a, n_b * rate_b
+    return ArmCounts([("/", "purchase")], n_a, sum_a, sum_a.copy(), n_b, sum_b, sum_b.copy())
+
+
+def test_failed_action_is_reported_and_retried():
+    tests = [ABTest("/a.html", 1, "o", "r", "a.html"), ABTest("/b.html", 2, "o", "r", "b.html")]
+    engine = SequentialEngine()
+    engine.evaluate = lambda views, tests: [PageDecision(test, "promote", "better") for test in tests]
+    acted = []
+
+    def act(decision, *args):
+        if decision.test.url_path == "/a.html":
+            raise RuntimeError("push rejected")
+        acted.append(decision.test.url_path)
+        return True
+
+    engine.act = act
+    decisions = engine.run_once(None, tests, None, None, "", "")
+    assert acted == ["/b.html"]
+    assert [decision.published for decision in decisions] == [False, True]
+
+
+def test_tau_comes_from_the_configured_baseline():
+    engine = SequentialEngine(tau_relative=0.1, baselines={"purchase": 0.02}, metrics=("purchase",))
+    assert engine.tau.tolist() == pytest.approx([0.002])
+    observed = counts(0.050, 0.053)
+    [decision] = engine.evaluate_counts([ABTest("/", 1, "o", "r", "index.html")], observed)
+    assert decision.results[0].p_value == pytest.approx(float(sequential_test(observed, 0.002)["p_value"][0]))
+    # Tuning to the observed 5% level instead would give different evidence
+    assert decision.results[0].p_value != pytest.approx(float(sequential_test(observed, 0.0053)["p_value"][0]))
+
+
+def test_every_metric_needs_a_baseline():
+    with pytest.raises(ValueError):
+        SequentialEngine(metrics=("purchase", "bounce"))
@@ -0,0 +1,68 @@
+from css_compactor import compact_html_styles, compact_rules, parse_stylesheet, serialize_stylesheet
+
+
+def compacted_css(css):
+    return serialize_stylesheet(compact_rules(parse_stylesheet(css)))
+
+
+def test_keeps_tbody_rules_for_tables_without_tbody():
+    html = """<html><head><style>
+tbody tr:nth-child(even) td { background: #eee; }
+.gone { color: red; }
+</style></head><body><table><tr><td>a</td></tr><tr><td>b</td></tr></table></body></html>"""
+    out, report = compact_html_styles(html)
+    assert "tbody tr:nth-child(even) td" in out
+    assert ".gone" not in out
+    assert report.selectors_pruned == 1
+
+
+def test_keeps_html_and_body_rules_without_explicit_tags():
+    html = """<!DOCTYPE html>
+<style>
+html { font-size: 18px; }
+body { margin: 0; }
+body p { color: #333; }
+body.dark { color: white; }
+</style>
+<p>Hello</p>
+"""
+    out, report = compact_html_styles(html)
+    assert "html { font-size: 18px; }" in out
+    assert "body { margin: 0; }" in out
+    assert "body p { color: #333; }" in out
+    # The implied <body> has no classes
+    assert "body.dark" not in out
+
+
+def test_unchanged_page_comes_back_byte_for_byte():
+    html = "<html><head>\n  <style>\n    /* brand */\n    .a { color: red }\n  </style>\n</head><body class=\"a\"></body></html>"
+    out, report = compact_html_styles(html)
+    assert out == html
+    assert report.rules_rewritten == 0
+
+
+def test_merges_duplicate_selector_into_first_occurrence():
+    assert compacted_css(".a { color: red; }\n.b { margin: 0; }\n.a { padding: 0; }") == \
+        ".a { color: red; padding: 0; }\n.b { margin: 0; }"
+
+
+def test_does_not_hoist_past_related_shorthand():
+    for between, later in (("font: 12px serif", "line-height: 3"), ("inset: 0", "top: 1px"),
+                           ("place-items: center", "align-items: start"),
+                           ("border-color: red", "border-top-color: blue"),
+                           ("margin-left: 0", "margin-inline-start: 4px")):
+        css = f".a {{ color: red; }}\n.b {{ {between}; }}\n.a {{ {later}; }}"
+        assert compacted_css(css) == css
+
+
+def test_does_not_hoist_ahead_of_related_declaration_left_behind():
+    css = ".a { color: red; }\n.b { margin-top: 5px; }\n.a { margin: 0; margin-left: 5px; }"
+    assert compacted_css(css).endswith(".a { margin: 0; margin-left: 5px; }")
+
+
+def test_merged_style_block_keeps_closing_indentation():
+    html = "<html>\n  <head>\n    <style>\n      .a { color: red; }\n    </style>\n  </head>\n  <body>\n" \
+           "<style>\n.b { color: blue; }\n</style>\n<p class=\"a b\">x</p></body></html>"
+    out, report = compact_html_styles(html)
+    assert report.style_blocks_merged == 2
+    assert "\n    </style>\n  </head>" in out
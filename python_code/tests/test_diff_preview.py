@@ -0,0 +1,27 @@
+import time
+
+from diff_preview import build_preview
+
+FILLER = "".join(f'<div class="row r{i}"><p class="t{i}">' + "text " * 60 + "</p></div>\n" for i in range(1200))
+
+
+def page(css, extra=""):
+    return f"<html><head><style>{css}</style></head><body><main><div class=\"wrap\">" \
+           f"{FILLER}<div class=\"cta\"><button>Buy{extra}</button></div></div></main></body></html>"
+
+
+def test_change_in_large_container_stays_small():
+    preview = build_preview(page(""), page("", " now"), max_region_chars=5_000)
+    assert len(preview.regions) == 1
+    region = preview.regions[0]
+    assert region.enhanced == '<div class="cta"><button>Buy now</button></div>'
+
+
+def test_many_changed_rules_are_matched_quickly():
+    old_css = "\n".join(f".r{i} .t{i} {{ color: red; }}" for i in range(400))
+    new_css = old_css.replace("red", "blue") + "\np { margin: 0; }"
+    start = time.perf_counter()
+    preview = build_preview(page(old_css), page(new_css), max_regions=500)
+    assert time.perf_counter() - start < 5
+    assert sum(region.kind == "restyled" for region in preview.regions) == 400
+    assert "p" in preview.page_wide_rules
@@ -0,0 +1,38 @@
+from edit_coalescer import PendingEdit, coalesce
+
+
+def test_css_conflict_later_edit_wins():
+    combined = coalesce([PendingEdit("Red buttons", ".btn { color: red; margin: 0; }"),
+                         PendingEdit("Blue buttons", ".btn { color: blue; }")])
+    assert [(c.target, c.kept, c.dropped) for c in combined.conflicts] == [(".btn { color }", 1, 0)]
+    assert "color: blue" in combined.code_edit and "color: red" not in combined.code_edit
+    assert "margin: 0" in combined.code_edit
+    assert combined.superseded == []
+    assert "1. Red buttons\n   (Superseded by a later change for: .btn { color })" in combined.instructions
+    assert "2. Blue buttons" in combined.instructions
+
+
+def test_wholly_overridden_edit_is_left_out_of_the_instructions():
+    combined = coalesce([PendingEdit("Make the CTA green", '<a id="cta" class="btn">Buy now</a>'),
+                         PendingEdit("Bigger heading", "h2 { font-size: 2rem; }"),
+                         PendingEdit("Make the CTA urgent", '<a id="cta" class="btn">Buy today</a>')])
+    assert combined.superseded == [0]
+    assert "CTA green" not in combined.instructions
+    assert combined.instructions.splitlines()[1:] == ["1. Bigger heading", "2. Make the CTA urgent"]
+    assert "Buy now" not in combined.code_edit and "Buy today" in combined.code_edit
+
+
+def test_unclassed_elements_of_two_edits_conflict():
+    combined = coalesce([PendingEdit("Shorter intro", "<section><p>Short intro</p></section>"),
+                         PendingEdit("Friendlier intro", "<section><p>Hi there!</p></section>")])
+    assert [(c.target, c.kept, c.dropped) for c in combined.conflicts] == [("section (no id or class)", 1, 0)]
+    assert "Short intro" not in combined.code_edit and "Hi there!" in combined.code_edit
+
+
+def test_unclassed_elements_of_one_edit_are_all_kept():
+    combined = coalesce([PendingEdit("Two new paragraphs", "<p>One</p>\n<p>Two</p>"),
+                         PendingEdit("Add analytics", '<script src="/a.js"></script>'),
+                         PendingEdit("Add a chat widget", '<script src="/b.js"></script>')])
+    assert combined.conflicts == []
+    for text in ("One", "Two", "/a.js", "/b.js"):
+        assert text in combined.code_edit
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from element_index import _OPEN_BLOCK_CHARS, _full_snapshot, _incremental_snapshot, _page_index
+
+
+def elements(snapshot, html):
+    return [(e.selector, e.kind, e.start, e.end, e.fingerprint)
+            for e in _page_index("", len(html), snapshot, "full").elements]
+
+
+def page(words):
+    cards = "".join(f'<div class="card c{n}"><h2>Card {n}</h2><p>{"word " * count}</p></div>\n'
+                    for n, count in enumerate(words))
+    return f"<html><head><title>Shop</title></head><body><header class=\"site\">Shop</header>" \
+           f"<main>\n{cards}</main><footer>Footer</footer></body></html>"
+
+
+def updated(before, after):
+    result = _incremental_snapshot(_full_snapshot(before), before, after)
+    return result[0] if result is not None else None
+
+
+@pytest.mark.parametrize("before, after", [
+    ([900, 20, 20], [30, 20, 20]),  # an opened <main> shrinks to a closed block
+    ([900, 20, 20], [700, 20, 20]),  # an opened card shrinks to a closed block
+    ([20, 20, 200], [20, 20, 1000]),  # a card grows large enough to be opened
+])
+def test_blocks_crossing_the_open_threshold_are_not_updated_in_place(before, after):
+    old, new = page(before), page(after)
+    snapshot = updated(old, new)
+    assert snapshot is None or elements(snapshot, new) == elements(_full_snapshot(new), new)
+
+
+def test_edits_that_keep_blocks_opened_are_incremental():
+    old, new = page([900, 900, 20, 20]), page([900, 900, 25, 20])
+    assert len(old) > 2 * _OPEN_BLOCK_CHARS
+    snapshot = updated(old, new)
+    assert snapshot is not None
+    assert elements(snapshot, new) == elements(_full_snapshot(new), new)
+
+
+def test_random_edit_sequences_match_a_full_parse():
+    rng = random.Random(3)
+    for _ in range(60):
+        words = [rng.randrange(20, 900) for _ in range(rng.randrange(2, 6))]
+        html = page(words)
+        snapshot = _full_snapshot(html)
+        for _ in range(rng.randrange(1, 5)):
+            words[rng.randrange(len(words))] = rng.randrange(0, 1200)
+            new = page(words)
+            result = _incremental_snapshot(snapshot, html, new)
+            snapshot, html = (result[0] if result else _full_snapshot(new)), new
+        assert elements(snapshot, html) == elements(_full_snapshot(html), html)
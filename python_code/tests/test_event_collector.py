@@ -0,0 +1,68 @@
+import io
+import os
+
+import pytest
+
+from event_collector import EventLog
+
+
+def batch(n, start=0):
+    return [(1_700_000_000_000 + i, "click", f"v{i}", "/", 0.0) for i in range(start, start + n)]
+
+
+def scanned(log):
+    return sum(len(columns["event"]) for _, columns in log.scan())
+
+
+def tear(log_dir, garbage=b"EVB1\x40\x00\x00\x00partial"):
+    path = os.path.join(log_dir, sorted(os.listdir(log_dir))[-1])
+    with open(path, "ab") as f:
+        f.write(garbage)
+    return path
+
+
+def test_writer_truncates_torn_tail_and_keeps_appending(tmp_path):
+    log = EventLog(str(tmp_path), fsync=False)
+    end = log.append(batch(3))
+    log.close()
+    path = tear(str(tmp_path))
+
+    log = EventLog(str(tmp_path), fsync=False)
+    assert os.path.getsize(path) == end[1]
+    log.append(batch(2, start=3))
+    assert scanned(log) == 5
+    log.close()
+
+
+def test_reader_never_modifies_the_log(tmp_path):
+    writer = EventLog(str(tmp_path), fsync=False)
+    end = writer.append(batch(3))
+    path = tear(str(tmp_path))
+    size = os.path.getsize(path)
+
+    reader = EventLog(str(tmp_path), read_only=True)
+    assert os.path.getsize(path) == size
+    assert scanned(reader) == 3
+    assert reader.end_offset() == end
+    with pytest.raises(io.UnsupportedOperation):
+        reader.append(batch(1))
+    reader.close()
+    assert os.path.getsize(path) == size
+    writer.close()
+
+
+def test_reader_follows_rotated_segments(tmp_path):
+    writer = EventLog(str(tmp_path), segment_bytes=256, fsync=False)
+    for n in range(10):
+        writer.append(batch(5, start=5 * n))
+    reader = EventLog(str(tmp_path), read_only=True)
+    assert len(reader.segments()) > 1
+    assert scanned(reader) == 50
+    assert reader.end_offset() == writer.end_offset()
+    writer.close()
+
+
+def test_reader_does_not_create_a_missing_log(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        EventLog(str(tmp_path / "events"), read_only=True)
+    assert not (tmp_path / "events").exists()
@@ -0,0 +1,82 @@
+import pytest
+
+from job_queue import JobQueue, PermanentJobError, Worker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), retry_base_seconds=0.0)
+    yield queue
+    queue.close()
+
+
+def test_claims_by_priority_and_enqueues_a_key_once(queue):
+    low = queue.enqueue("analyze", {"n": 1}, priority=1)
+    high = queue.enqueue("analyze", {"n": 2}, priority=5, idempotency_key="page@round")
+    assert queue.enqueue("analyze", {"n": 3}, idempotency_key="page@round") == high
+    assert [queue.claim("w").id, queue.claim("w").id, queue.claim("w")] == [high, low, None]
+
+
+def test_expired_lease_goes_to_another_worker_and_fences_the_first(queue):
+    job_id = queue.enqueue("analyze", {})
+    stale = queue.claim("worker-1", lease_seconds=-1)
+    fresh = queue.claim("worker-2", lease_seconds=60)
+    assert fresh.id == job_id and fresh.attempts == 2
+
+    # The worker that lost its lease can no longer renew, finish or fail it
+    assert not queue.heartbeat(job_id, "worker-1")
+    assert not queue.complete(job_id, "worker-1", {"from": "worker-1"})
+    assert queue.fail(stale, "worker-1", "late failure") == "lost"
+    assert queue.heartbeat(job_id, "worker-2")
+    assert queue.complete(job_id, "worker-2", {"from": "worker-2"})
+    record = queue.get(job_id)
+    assert record["state"] == "done" and record["result"] == {"from": "worker-2"}
+
+
+def test_expired_lease_of_the_last_attempt_is_dead_lettered(queue):
+    job_id = queue.enqueue("analyze", {}, max_attempts=1)
+    queue.claim("worker-1", lease_seconds=-1)
+    assert queue.claim("worker-2") is None
+    assert queue.get(job_id)["state"] == "dead"
+    assert queue.get(job_id)["last_error"] == "lease expired"
+
+
+def test_failures_retry_then_dead_letter(queue):
+    calls = []
+
+    def flaky(job):
+        calls.append(job.attempts)
+        raise RuntimeError("GitHub is down")
+
+    job_id = queue.enqueue("publish", {}, max_attempts=3)
+    worker = Worker(queue, {"publish": flaky}, worker_id="w", poll_interval=0)
+    assert worker.run(exit_when_idle=True) == 3
+    assert calls == [1, 2, 3]
+    assert queue.get(job_id)["state"] == "dead"
+    assert queue.requeue(job_id) and queue.get(job_id)["state"] == "queued"
+
+
+def test_permanent_error_dead_letters_at_once(queue):
+    def broken(job):
+        raise PermanentJobError("page not found")
+
+    job_id = queue.enqueue("merge", {})
+    Worker(queue, {"merge": broken}, worker_id="w").run_once()
+    record = queue.get(job_id)
+    assert (record["state"], record["attempts"]) == ("dead", 1)
+    assert "page not found" in record["last_error"]
+
+
+def test_worker_discards_a_result_after_losing_its_lease(queue):
+    job_id = queue.enqueue("analyze", {})
+
+    def slow(job):
+        # Another worker takes the job over while this one is still running it
+        queue._write(lambda conn: conn.execute("UPDATE jobs SET lease_expires = 0 WHERE id = ?", (job.id,)))
+        assert queue.claim("worker-2").id == job.id
+        return {"from": "worker-1"}
+
+    Worker(queue, {"analyze": slow}, worker_id="worker-1").run_once()
+    record = queue.get(job_id)
+    assert (record["state"], record["lease_owner"]) == ("running", "worker-2")
+    assert record["result"] is None
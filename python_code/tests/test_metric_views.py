@@ -0,0 +1,61 @@
+import calendar
+
+from metric_views import MetricViews
+
+DAY_MS = 86_400_000
+JAN_1 = calendar.timegm((2024, 1, 1, 0, 0, 0)) * 1000
+
+
+def columns(events):
+    """(day, event, visitor) -> a batch on /shop.html"""
+    return {
+        "ts_ms": [JAN_1 + day * DAY_MS + 3_600_000 for day, _, _ in events],
+        "event": [event for _, event, _ in events],
+        "visitor": [visitor for _, _, visitor in events],
+        "page": ["/shop.html"] * len(events),
+        "revenue": [0.0] * len(events),
+    }
+
+
+def header(csv, name):
+    return next(line.split(": ")[1] for line in csv.splitlines() if line.startswith(f"# {name}:"))
+
+
+def test_csv_dates_cover_the_buckets_with_data():
+    views = MetricViews()
+    views.apply_batch(columns([(0, "page_view", "a"), (2, "page_view", "b")]))
+    csv = views.to_csv()
+    assert header(csv, "Start date") == "20240101"
+    assert header(csv, "End date") == "20240103"
+    assert header(views.to_csv(until_ms=JAN_1 + 2 * DAY_MS), "End date") == "20240102"
+
+
+def test_expire_drops_old_sketches_and_visitors():
+    views = MetricViews(experiments={"/shop.html": ("shop", 0.5)})
+    views.apply_batch(columns([(day, "page_view", f"v{day}") for day in range(100)]))
+    recent = {variant: views.users("/shop.html", variant, "page_view", since_ms=JAN_1 + 80 * DAY_MS)
+              for variant in ("original", "enhanced")}
+
+    assert views.expire() == 0
+    views.retention_days = 30
+    assert views.expire() == 70
+    assert views.first_kept == 70
+    for series in views.series.values():
+        assert min(series.visitors) >= 70
+        assert all(registers is None for entries in series.table for registers in entries[:70])
+    for variant, seen in recent.items():
+        assert views.users("/shop.html", variant, "page_view", since_ms=JAN_1 + 80 * DAY_MS) == seen
+    # Windows reaching further back start at the oldest bucket kept
+    assert views.rows("/shop.html")["page_view"].event_count == 30
+    assert header(views.to_csv(), "Start date") == "20240311"
+    assert views.expire() == 0
+
+
+def test_late_events_land_in_the_oldest_bucket_kept():
+    views = MetricViews(retention_days=10)
+    views.apply_batch(columns([(day, "page_view", f"v{day}") for day in range(20)]))
+    assert views.first_kept == 10
+    views.apply_batch(columns([(1, "purchase", "late")]))
+    assert views.rows()["purchase"].event_count == 1
+    assert all(registers is None for entries in views.series[("/shop.html", "", "purchase")].table
+               for registers in entries[:10])
@@ -0,0 +1,44 @@
+from priority_scheduler import PageCandidate, PriorityScheduler
+
+CSV = "Event name,Event count,Total users,Total revenue\npage_view,{users},{users},0\n"
+
+
+def queue(scheduler, tenant, pages, users=1000):
+    for n in range(pages):
+        scheduler.add(PageCandidate(tenant, tenant, "site", f"page-{n}.html", CSV.format(users=users - n)))
+
+
+def tenants(round_):
+    return [scored.candidate.tenant for scored in round_]
+
+
+def test_single_tenant_gets_the_whole_budget():
+    scheduler = PriorityScheduler(max_tenant_share=0.5)
+    queue(scheduler, "acme", 20)
+    assert len(scheduler.next_round(10)) == 10
+    assert len(scheduler) == 10
+
+
+def test_share_cap_holds_while_others_are_waiting():
+    scheduler = PriorityScheduler(max_tenant_share=0.5)
+    queue(scheduler, "big", 20, users=5000)
+    queue(scheduler, "small", 2)
+    chosen = tenants(scheduler.next_round(10))
+    assert chosen.count("small") == 2
+    assert chosen.count("big") == 8  # its cap of 5, plus what "small" could not use
+
+
+def test_cap_without_work_conservation_leaves_budget_unused():
+    scheduler = PriorityScheduler(max_tenant_share=0.5, work_conserving=False)
+    queue(scheduler, "acme", 20)
+    assert len(scheduler.next_round(10)) == 5
+    assert len(scheduler) == 15
+
+
+def test_rounds_are_in_score_order_and_skip_superseded_entries():
+    scheduler = PriorityScheduler(max_per_tenant=3)
+    queue(scheduler, "acme", 3)
+    scheduler.add(PageCandidate("acme", "acme", "site", "page-2.html", CSV.format(users=9000)))
+    assert [scored.candidate.file_path for scored in scheduler.next_round(3)] == \
+        ["page-2.html", "page-0.html", "page-1.html"]
+    assert len(scheduler) == 0
@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from run_planner import RunPlanner
+
+
+class Enhancer:
+    optimizer = None
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.clones = 0
+
+    def validate_github_pat(self, token):
+        return False
+
+    def clone_repository(self, *args):
+        self.clones += 1
+        self.gate.wait(5)
+        raise RuntimeError("clone of a run with an invalid token")
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_invalid_token_cancels_the_whole_run(workers):
+    enhancer = Enhancer()
+    with RunPlanner(enhancer, "bad", "user", "owner", "repo", "index.html", max_workers=workers) as planner:
+        planner.start()
+        # Done callbacks may run just after result() returns
+        assert planner._cancelled.wait(5)
+        if workers == 1:
+            # The clone was still queued behind the token check, so it never starts
+            wait([planner._clone_future], 5)
+            assert enhancer.clones == 0
+        with pytest.raises(Exception, match="Invalid GitHub Personal Access Token"):
+            planner.read_current_html()
+        enhancer.gate.set()
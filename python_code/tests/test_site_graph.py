@@ -0,0 +1,60 @@
+import types
+
+from site_graph import SiteGraph, enhance_site
+
+PAGE = ('<html><head><link rel="stylesheet" href="css/site.css">{inline}</head>'
+        '<body><a class="btn">Buy</a></body></html>')
+
+
+def make_site(tmp_path, inline=""):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text(".btn { color: red; }\n")
+    for name in ("index.html", "about.html"):
+        (tmp_path / name).write_text(PAGE.format(inline=inline))
+    return SiteGraph.build(str(tmp_path))
+
+
+def test_routes_css_to_the_shared_stylesheet(tmp_path):
+    route = make_site(tmp_path).route_edit("index.html", ".btn { background: orange; }")
+    assert route.stylesheet == "css/site.css"
+    assert route.css == ".btn { background: orange; }"
+    assert not route.merges_page
+
+
+def test_keeps_rules_the_page_overrides_later(tmp_path):
+    graph = make_site(tmp_path, inline="<style>.btn{background:green}</style>")
+    route = graph.route_edit("index.html", ".btn { background: orange; }\n.card { padding: 0; }")
+    assert route.css == ".card { padding: 0; }"
+    assert route.page_edit == "<style>\n.btn { background: orange; }\n</style>"
+    assert route.kept_in_page == 1
+
+    route = graph.route_edit("index.html", ".btn { background: orange; }")
+    assert route.stylesheet is None
+    assert route.page_edit == ".btn { background: orange; }"
+
+
+def test_inline_rules_before_the_stylesheet_do_not_block_routing(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text("")
+    html = '<html><head><style>.btn{background:green}</style><link rel="stylesheet" href="css/site.css"></head></html>'
+    for name in ("index.html", "about.html"):
+        (tmp_path / name).write_text(html)
+    route = SiteGraph.build(str(tmp_path)).route_edit("index.html", ".btn { background: orange; }")
+    assert route.stylesheet == "css/site.css"
+
+
+def test_enhance_site_without_optimizer_writes_the_live_page(tmp_path):
+    (tmp_path / "index.html").write_text("<html><body><p>old</p></body></html>")
+    (tmp_path / "index.src.html").write_text("<html><body><p>old</p></body></html>")
+    enhancer = types.SimpleNamespace(
+        optimizer=None,
+        analyze_engagement_with_claude=lambda metrics, html, page=None: ("Say new", "<p>new</p>"),
+        merge_with_morph=lambda instructions, html, edit: html.replace("old", "new"),
+        finalize_html=lambda html: html,
+        check_page_budget=lambda original, enhanced: types.SimpleNamespace(blocked=False),
+        record_index_edit=lambda *args: [],
+    )
+    graph = SiteGraph.build(str(tmp_path))
+    run = enhance_site(enhancer, graph, "csv")
+    assert run.files["index.html"] == "<html><body><p>new</p></body></html>"
+    assert run.files["index.src.html"] == run.files["index.html"]
@@ -0,0 +1,24 @@
+from template_clusters import cluster_pages, template_fingerprint
+
+PROSE = {
+    "about.html": "<html><body><h1>About</h1><p>We are a small team.</p></body></html>",
+    "pricing.html": "<html><body><h1>Pricing</h1><table><tr><td>$10</td></tr></table></body></html>",
+    "contact.html": "<html><body><h2>Contact</h2><p>Mail <a href=\"mailto:x\">us</a></p></body></html>",
+}
+
+
+def post(title, paragraphs):
+    body = "".join(f"<p>{title} {n}</p>" for n in range(paragraphs))
+    return f'<html><body><header class="site"><nav class="menu"><a href="/">Home</a></nav></header>' \
+           f'<article class="post"><h1>{title}</h1>{body}</article><footer class="site-footer">c</footer></body></html>'
+
+
+def test_posts_of_one_template_share_a_fingerprint():
+    assert template_fingerprint(post("One", 2)) == template_fingerprint(post("Two", 9)) is not None
+
+
+def test_plain_prose_pages_stay_apart():
+    assert all(template_fingerprint(html) is None for html in PROSE.values())
+    pages = dict(PROSE, **{"blog/1.html": post("One", 2), "blog/2.html": post("Two", 5)})
+    assert sorted(cluster.pages for cluster in cluster_pages(pages)) == \
+        [["about.html"], ["blog/1.html", "blog/2.html"], ["contact.html"], ["pricing.html"]]
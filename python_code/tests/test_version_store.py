@@ -0,0 +1,80 @@
+import random
+import time
+import types
+
+import pytest
+
+from version_store import VersionStore, _apply_delta, _encode_delta, page_key
+
+CARD = '<div class="card">\n  <h3>Product</h3>\n  <p class="price">$10</p>\n</div>\n'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VersionStore(str(tmp_path / "versions.db"), max_chain=4, cache_size=2)
+    yield store
+    store.close()
+
+
+def test_delta_round_trips_random_edits():
+    rng = random.Random(7)
+    lines = [f"<p>line {i}</p>\n" for i in range(200)]
+    for _ in range(50):
+        edited = list(lines)
+        for _ in range(rng.randrange(1, 10)):
+            position = rng.randrange(len(edited) + 1)
+            action = rng.choice(("insert", "delete", "replace"))
+            if action == "insert":
+                edited.insert(position, f"<span>{rng.random()}</span>\n")
+            elif edited and position < len(edited):
+                if action == "delete":
+                    del edited[position]
+                else:
+                    edited[position] = f"<em>{rng.random()}</em>\n"
+        base, content = "".join(lines), "".join(edited)
+        assert _apply_delta(base, _encode_delta(base, content)) == content
+        lines = edited
+
+
+def test_delta_handles_missing_final_newline():
+    assert _apply_delta("a\nb", _encode_delta("a\nb", "a\nb\nc")) == "a\nb\nc"
+    assert _apply_delta("a\nb\n", _encode_delta("a\nb\n", "")) == ""
+
+
+def test_delta_is_fast_on_repeated_markup():
+    base = "<main>\n" + CARD * 3000 + "</main>\n"
+    content = base.replace("$10", "$9", 1500)
+    start = time.perf_counter()
+    delta = _encode_delta(base, content)
+    assert time.perf_counter() - start < 5
+    assert _apply_delta(base, delta) == content
+
+
+def test_versions_read_back_through_delta_chains(store):
+    page = page_key("owner", "repo", "index.html")
+    html = "<main>\n" + CARD * 50 + "</main>\n"
+    pages = [html]
+    for n in range(12):
+        enhanced = pages[-1].replace("</main>", f"<p>edit {n}</p>\n</main>")
+        store.record_version(page, pages[-1], enhanced, instruction=f"edit {n}")
+        pages.append(enhanced)
+
+    history = store.history(page, limit=100)
+    assert [version.enhanced_html for version in reversed(history)] == pages[1:]
+    assert [version.original_html for version in reversed(history)] == pages[:-1]
+    chains = [row[0] for row in store._conn.execute("SELECT chain FROM blobs")]
+    assert max(chains) <= store.max_chain
+    assert "delta" in {row[0] for row in store._conn.execute("SELECT encoding FROM blobs")}
+
+
+def test_identical_content_is_stored_once(store):
+    store.record_version("o/r/a.html", "<p>a</p>", "<p>b</p>")
+    store.record_version("o/r/b.html", "<p>a</p>", "<p>b</p>")
+    assert store._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 2
+
+
+def test_rollback_refuses_a_version_of_another_page(store):
+    version_id = store.record_version(page_key("owner", "repo", "index.html"), "<p>a</p>", "<p>b</p>")
+    enhancer = types.SimpleNamespace(optimizer=None)
+    with pytest.raises(ValueError):
+        store.rollback(enhancer, version_id, "token", "user", "owner", "repo", "about.html")
@@ -0,0 +1,164 @@
+# upload_decoding.py
+
+import codecs
+import csv
+import io
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Tuple
+
+SAMPLE_BYTES = 64 * 1024
+DEFAULT_CSV_CHARS = 400_000  # comfortably inside the analysis prompt
+
+# Longest first: the UTF-32 LE BOM starts with the UTF-16 LE one
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes, complete: bool = False) -> str:
+    """
+    Guess the encoding of a file from its first bytes
+
+    A BOM decides outright. Otherwise text with NUL bytes in every other
+    position is taken as BOM-less UTF-16, text that is valid UTF-8 as UTF-8,
+    and anything else as cp1252 (latin-1 when cp1252 can't map a byte).
+
+    Args:
+        sample: The start of the file (SAMPLE_BYTES is plenty)
+        complete: The sample is the whole file, so a multi-byte character
+            cut off at its end is an error rather than a truncation
+
+    Returns:
+        A codec name for bytes.decode / io.TextIOWrapper
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    pairs = len(sample) // 2
+    if pairs >= 2:
+        even_nuls = sample[0:pairs * 2:2].count(0)
+        odd_nuls = sample[1:pairs * 2:2].count(0)
+        if odd_nuls > pairs * 0.3 and even_nuls < pairs * 0.05:
+            return "utf-16-le"
+        if even_nuls > pairs * 0.3 and odd_nuls < pairs * 0.05:
+            return "utf-16-be"
+
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def _sample(fileobj: BinaryIO, sample_bytes: int) -> Tuple[bytes, bool]:
+    fileobj.seek(0)
+    sample = fileobj.read(sample_bytes + 1)
+    fileobj.seek(0)
+    return sample[:sample_bytes], len(sample) <= sample_bytes
+
+
+def decode_upload(fileobj: BinaryIO, sample_bytes: int = SAMPLE_BYTES) -> str:
+    """
+    Decode an uploaded file in a single pass
+
+    Undecodable bytes become U+FFFD instead of triggering another full decode
+    with a different codec. In-memory uploads (Streamlit's UploadedFile is a
+    BytesIO) are decoded from the bytes they already hold; BytesIO.getvalue()
+    shares its buffer instead of copying it.
+    """
+    sample, complete = _sample(fileobj, sample_bytes)
+    encoding = detect_encoding(sample, complete)
+    raw = fileobj.getvalue() if hasattr(fileobj, "getvalue") else fileobj.read()
+    return raw.decode(encoding, "replace")
+
+
+@contextmanager
+def open_upload(fileobj: BinaryIO, sample_bytes: int = SAMPLE_BYTES) -> Iterator[io.TextIOWrapper]:
+    """
+    Stream an upload as text, decoded incrementally with the detected encoding
+
+    The upload itself is left open (and rewound) afterwards, so it can be
+    read again on the next script run.
+    """
+    sample, complete = _sample(fileobj, sample_bytes)
+    text = io.TextIOWrapper(fileobj, encoding=detect_encoding(sample, complete), errors="replace", newline="")
+    try:
+        yield text
+    finally:
+        text.detach()
+        fileobj.seek(0)
+
+
+@dataclass
+class CsvIngest:
+    """A CSV upload reduced to the text handed to the analysis"""
+    text: str
+    encoding: str
+    rows: int
+    kept_rows: int
+
+    @property
+    def truncated(self) -> bool:
+        return self.kept_rows < self.rows
+
+    def summary(self) -> str:
+        if not self.truncated:
+            return f"{self.rows:,} rows ({self.encoding})"
+        return f"{self.kept_rows:,} of {self.rows:,} rows kept for analysis ({self.encoding})"
+
+
+def ingest_csv(fileobj: BinaryIO,
+               max_chars: int = DEFAULT_CSV_CHARS,
+               sample_bytes: int = SAMPLE_BYTES) -> CsvIngest:
+    """
+    Stream a CSV upload row by row into normalized CSV text of bounded size
+
+    The raw text is never held: rows are parsed from an incremental decoder
+    and re-serialized until max_chars is reached, and later rows are only
+    counted (a closing comment line says how many). Comment lines (GA exports
+    start with "# ..." headers) are kept while there is room, and blank lines
+    are dropped.
+
+    Args:
+        fileobj: Binary file object, e.g. a Streamlit UploadedFile
+        max_chars: Size limit of the returned text
+        sample_bytes: Bytes used for charset detection
+    """
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    rows = kept = 0
+    full = False
+    with open_upload(fileobj, sample_bytes) as text:
+        encoding = text.encoding
+        for row in csv.reader(text):
+            if not any(cell.strip() for cell in row):
+                continue
+            rows += 1
+            if full:
+                continue
+            position = out.tell()
+            if row[0].lstrip().startswith("#"):
+                out.write(",".join(row) + "\n")
+            else:
+                writer.writerow(row)
+            if out.tell() > max_chars:
+                # The row straddles the limit: drop it and only count from here on
+                out.seek(position)
+                out.truncate()
+                full = True
+                continue
+            kept += 1
+    if full:
+        out.write(f"# {rows - kept:,} more rows not shown\n")
+    return CsvIngest(out.getvalue(), encoding, rows, kept)
@@ -0,0 +1,277 @@
+# variant_server.py
+#
+# Serves the original and enhanced variants of managed pages for A/B tests:
+#   python variant_server.py --page /index.html original.html enhanced.html --port 8080
+#   python variant_server.py --store html_versions.db --version /index.html owner/repo/index.html
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import secrets
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from async_http import Request, Response, install_fast_event_loop, start_server
+from event_collector import beacon_snippet
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+VARIANTS = ("original", "enhanced")
+
+
+def assign_variant(visitor_id: str, experiment: str, split: float = 0.5) -> str:
+    """
+    Deterministic, sticky bucket for a visitor
+
+    The visitor id and experiment name are hashed to a point in [0, 1); the
+    visitor sees the enhanced variant when that point is below split. The same
+    visitor always lands in the same bucket of an experiment, and buckets of
+    different experiments are independent.
+    """
+    digest = hashlib.blake2b(f"{experiment}:{visitor_id}".encode("utf-8"), digest_size=8).digest()
+    return "enhanced" if int.from_bytes(digest, "big") < split * 2 ** 64 else "original"
+
+
+@dataclass
+class RenderedVariant:
+    """One variant held in memory, with its compressed forms and ETags"""
+    name: str
+    body: bytes
+    gzip_body: bytes
+    brotli_body: Optional[bytes]
+    etag: str
+
+    @classmethod
+    def render(cls, name: str, html: str, compress: bool = True) -> "RenderedVariant":
+        body = html.encode("utf-8")
+        etag = hashlib.sha256(body).hexdigest()[:20]
+        gzip_body = gzip.compress(body, compresslevel=9, mtime=0) if compress else b""
+        brotli_body = brotli.compress(body, quality=11) if compress and brotli is not None else None
+        return cls(name, body, gzip_body, brotli_body, etag)
+
+    def representation(self, encoding: str) -> Tuple[bytes, str]:
+        """Body and ETag for a content coding picked by negotiate_encoding"""
+        if encoding == "br" and self.brotli_body is not None:
+            return self.brotli_body, f'"{self.etag}-br"'
+        if encoding == "gzip" and self.gzip_body:
+            return self.gzip_body, f'"{self.etag}-gz"'
+        return self.body, f'"{self.etag}"'
+
+
+@dataclass
+class ManagedPage:
+    """A page under test: both variants plus the share of visitors who get the enhanced one"""
+    url_path: str
+    experiment: str
+    split: float
+    variants: Dict[str, RenderedVariant] = field(default_factory=dict)
+
+
+def negotiate_encoding(accept_encoding: str, available: Tuple[str, ...] = ("br", "gzip")) -> str:
+    """Pick the first of available the client accepts, else identity"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+    for coding in available:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class VariantServer:
+    """
+    Async HTTP server for A/B variants of managed pages
+
+    Both variants of every page are rendered to bytes (and gzip/brotli) once,
+    when the page is added, so a request costs a cookie lookup, one hash and
+    a dictionary hit. Visitors get a random id cookie on their first request;
+    the variant is derived from that id, so it is sticky without any
+    server-side state. Responses carry X-Variant so collected events can be
+    attributed to a variant.
+    """
+
+    def __init__(self, cookie_name: str = "ab_vid", cookie_max_age: int = 90 * 24 * 3600,
+                 compress: bool = True, beacon_endpoint: Optional[str] = None):
+        self.cookie_name = cookie_name
+        self.beacon_endpoint = beacon_endpoint
+        self.cookie_max_age = cookie_max_age
+        self.compress = compress
+        self.pages: Dict[str, ManagedPage] = {}
+        self.served = {variant: 0 for variant in VARIANTS}
+        self.not_modified = 0
+        self._encodings: Dict[str, str] = {}
+        self._available = ((("br",) if brotli is not None else ()) + ("gzip",)) if compress else ()
+
+    def add_page(self, url_path: str, original_html: str, enhanced_html: str,
+                 split: float = 0.5, experiment: Optional[str] = None) -> ManagedPage:
+        """
+        Serve a page under test; replaces any page already at url_path
+
+        Args:
+            url_path: Path the page is served at, e.g. "/index.html"
+            original_html: Control variant
+            enhanced_html: Enhanced variant
+            split: Share of visitors who get the enhanced variant
+            experiment: Bucketing key; defaults to url_path. Keep it when
+                swapping in a new version so visitors keep their bucket
+
+        Returns:
+            ManagedPage: The rendered page
+        """
+        if not 0.0 <= split <= 1.0:
+            raise ValueError(f"split must be between 0 and 1, not {split}")
+        if self.beacon_endpoint:
+            original_html = self._with_beacon(original_html, url_path)
+            enhanced_html = self._with_beacon(enhanced_html, url_path)
+        page = ManagedPage(url_path, experiment or url_path, split, {
+            "original": RenderedVariant.render("original", original_html, self.compress),
+            "enhanced": RenderedVariant.render("enhanced", enhanced_html, self.compress),
+        })
+        self.pages[url_path] = page
+        if url_path.endswith("/index.html"):
+            self.pages[url_path[:-len("index.html")]] = page
+        return page
+
+    def _with_beacon(self, html: str, url_path: str) -> str:
+        """Add the event collector's beacon, reporting events for url_path, before the last </body>"""
+        snippet = beacon_snippet(self.beacon_endpoint, self.cookie_name, url_path)
+        position = html.lower().rfind("</body>")
+        if position == -1:
+            return html + snippet
+        return html[:position] + snippet + "\n" + html[position:]
+
+    def add_version(self, url_path: str, store, page: str, split: float = 0.5) -> ManagedPage:
+        """Serve the latest version recorded for page in a VersionStore"""
+        version = store.latest(page)
+        if version is None:
+            raise KeyError(f"No versions recorded for {page}")
+        print(f"🔀 {url_path}: version {version.id} of {page}")
+        return self.add_page(url_path, version.original_html, version.enhanced_html,
+                             split=split, experiment=page)
+
+    def _encoding_for(self, accept_encoding: str) -> str:
+        encoding = self._encodings.get(accept_encoding)
+        if encoding is None:
+            encoding = negotiate_encoding(accept_encoding, self._available)
+            if len(self._encodings) < 1024:
+                self._encodings[accept_encoding] = encoding
+        return encoding
+
+    def handle(self, request: Request) -> Response:
+        if request.path == "/__variants":
+            return self._status()
+        page = self.pages.get(request.path)
+        if page is None:
+            return Response(404, b"Not Found", [("Content-Type", "text/plain")])
+        if request.method not in ("GET", "HEAD"):
+            return Response(405, b"Method Not Allowed", [("Allow", "GET, HEAD")])
+
+        headers = []
+        visitor_id = request.cookies().get(self.cookie_name)
+        if not visitor_id:
+            visitor_id = secrets.token_hex(8)
+            headers.append(("Set-Cookie", f"{self.cookie_name}={visitor_id}; Path=/; "
+                                          f"Max-Age={self.cookie_max_age}; SameSite=Lax"))
+
+        variant = page.variants[assign_variant(visitor_id, page.experiment, page.split)]
+        encoding = self._encoding_for(request.headers.get("accept-encoding", ""))
+        body, etag = variant.representation(encoding)
+        headers += [
+            ("ETag", etag),
+            ("Cache-Control", "private, no-cache"),
+            ("Vary", "Accept-Encoding, Cookie"),
+            ("X-Variant", variant.name),
+        ]
+
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            self.not_modified += 1
+            return Response(304, b"", headers)
+        self.served[variant.name] += 1
+        headers.append(("Content-Type", "text/html; charset=utf-8"))
+        if body is not variant.body:
+            headers.append(("Content-Encoding", encoding))
+        return Response(200, body, headers)
+
+    def _status(self) -> Response:
+        status = {
+            "pages": {path: {"experiment": page.experiment, "split": page.split,
+                             "bytes": {name: len(v.body) for name, v in page.variants.items()}}
+                      for path, page in self.pages.items()},
+            "served": self.served,
+            "not_modified": self.not_modified,
+        }
+        return Response(200, json.dumps(status).encode("utf-8"), [("Content-Type", "application/json")])
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """Serve until cancelled"""
+        server = await start_server(self.handle, host, port)
+        print(f"🔀 Serving {len(self.pages)} page path(s) on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve A/B variants of enhanced pages")
+    parser.add_argument("--page", nargs=3, action="append", default=[],
+                        metavar=("URL_PATH", "ORIGINAL", "ENHANCED"),
+                        help="Serve two HTML files as the variants of URL_PATH")
+    parser.add_argument("--store", help="VersionStore database to serve versions from")
+    parser.add_argument("--version", nargs=2, action="append", default=[],
+                        metavar=("URL_PATH", "PAGE_KEY"),
+                        help="Serve the latest version of PAGE_KEY (owner/repo/file) at URL_PATH")
+    parser.add_argument("--split", type=float, default=0.5, help="Share of visitors who get the enhanced page")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-compress", action="store_true", help="Don't pre-compress variants")
+    parser.add_argument("--beacon-endpoint", help="Event collector URL to report events to, "
+                                                  "e.g. http://127.0.0.1:8090/collect")
+    args = parser.parse_args()
+
+    server = VariantServer(compress=not args.no_compress, beacon_endpoint=args.beacon_endpoint)
+    for url_path, original_path, enhanced_path in args.page:
+        with open(original_path, "r", encoding="utf-8") as f:
+            original_html = f.read()
+        with open(enhanced_path, "r", encoding="utf-8") as f:
+            enhanced_html = f.read()
+        server.add_page(url_path, original_html, enhanced_html, split=args.split)
+    if args.version:
+        from version_store import VersionStore
+
+        if not args.store:
+            parser.error("--version needs --store")
+        store = VersionStore(args.store)
+        for url_path, key in args.version:
+            server.add_version(url_path, store, key, split=args.split)
+    if not server.pages:
+        parser.error("nothing to serve; pass --page or --store/--version")
+
+    if install_fast_event_loop():
+        print("Using uvloop")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# version_store.py
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from minimal_diff import align_tokens
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash     TEXT PRIMARY KEY,
+    base     TEXT,
+    encoding TEXT NOT NULL,
+    chain    INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    data     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    page          TEXT NOT NULL,
+    parent_id     INTEGER,
+    original_hash TEXT NOT NULL,
+    enhanced_hash TEXT NOT NULL,
+    instruction   TEXT,
+    code_edit     TEXT,
+    metrics_hash  TEXT,
+    commit_sha    TEXT,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_by_page ON versions (page, id);
+CREATE INDEX IF NOT EXISTS versions_by_commit ON versions (commit_sha);
+CREATE TABLE IF NOT EXISTS deployments (
+    version_id  INTEGER NOT NULL,
+    environment TEXT NOT NULL,
+    commit_sha  TEXT NOT NULL,
+    deployed_at REAL NOT NULL,
+    PRIMARY KEY (version_id, environment)
+);
+"""
+
+
+def page_key(repo_owner: str, repo_name: str, file_path: str) -> str:
+    """Key under which a page's versions are stored"""
+    return f"{repo_owner}/{repo_name}/{file_path}"
+
+
+@dataclass
+class PageVersion:
+    """One recorded enhancement of a page; the HTML bodies are loaded on demand"""
+    id: int
+    page: str
+    parent_id: Optional[int]
+    original_hash: str
+    enhanced_hash: str
+    instruction: str
+    code_edit: str
+    metrics_hash: Optional[str]
+    commit_sha: Optional[str]
+    created_at: float
+    store: "VersionStore" = None
+
+    @property
+    def original_html(self) -> str:
+        return self.store.get_blob(self.original_hash)
+
+    @property
+    def enhanced_html(self) -> str:
+        return self.store.get_blob(self.enhanced_hash)
+
+    @property
+    def metrics(self) -> Optional[str]:
+        return self.store.get_blob(self.metrics_hash) if self.metrics_hash else None
+
+
+def _encode_delta(base: str, content: str) -> bytes:
+    """
+    Line-level delta: copy ranges of base lines, insert new text
+
+    Lines are aligned with minimal_diff.align_tokens, which stays fast on
+    pages of repeated markup.
+    """
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    ops = []
+    for op, base_start, base_end, new_start, new_end in align_tokens(base_lines, new_lines):
+        if op == "equal":
+            ops.append([base_start, base_end])
+        elif new_end > new_start:
+            ops.append("".join(new_lines[new_start:new_end]))
+    return json.dumps(ops, separators=(",", ":")).encode("utf-8")
+
+
+def _apply_delta(base: str, delta: bytes) -> str:
+    base_lines = base.splitlines(keepends=True)
+    out = []
+    for op in json.loads(delta.decode("utf-8")):
+        out.append(op if isinstance(op, str) else "".join(base_lines[op[0]:op[1]]))
+    return "".join(out)
+
+
+class VersionStore:
+    """
+    Local, content-addressed history of every original and enhanced page
+
+    Blobs are keyed by SHA-256, so identical content is stored once. Each
+    blob is zlib-compressed and, when that is smaller, stored as a line delta
+    against the page's previous blob. Delta chains are capped at max_chain,
+    so reading any version costs one primary-key lookup plus at most
+    max_chain delta applications, however long the history gets. Recently
+    read blobs are cached in memory.
+    """
+
+    def __init__(self, path: str = "html_versions.db", max_chain: int = 16, cache_size: int = 64):
+        self.path = path
+        self.max_chain = max_chain
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_size = cache_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # --- Blobs ---
+
+    def put_blob(self, content: str, base_hash: Optional[str] = None) -> str:
+        """Store content (deduplicated) and return its hash"""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+                return digest
+
+            raw = content.encode("utf-8")
+            encoding, data, chain, base = "full", zlib.compress(raw, 9), 0, None
+            if base_hash and base_hash != digest:
+                row = self._conn.execute("SELECT chain FROM blobs WHERE hash = ?", (base_hash,)).fetchone()
+                if row and row[0] < self.max_chain:
+                    delta = zlib.compress(_encode_delta(self.get_blob(base_hash), content), 9)
+                    if len(delta) < len(data):
+                        encoding, data, chain, base = "delta", delta, row[0] + 1, base_hash
+
+            self._conn.execute(
+                "INSERT INTO blobs (hash, base, encoding, chain, size, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, base, encoding, chain, len(raw), data)
+            )
+            self._conn.commit()
+            self._remember(digest, content)
+        return digest
+
+    def get_blob(self, digest: str) -> str:
+        """Reconstruct a blob by hash"""
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+            row = self._conn.execute(
+                "SELECT base, encoding, data FROM blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown blob: {digest}")
+            base, encoding, data = row
+            raw = zlib.decompress(data)
+            content = raw.decode("utf-8") if encoding == "full" else _apply_delta(self.get_blob(base), raw)
+            self._remember(digest, content)
+            return content
+
+    def _remember(self, digest: str, content: str) -> None:
+        self._cache[digest] = content
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    # --- Versions ---
+
+    def record_version(self,
+                       page: str,
+                       original_html: str,
+                       enhanced_html: str,
+                       instruction: str = "",
+                       code_edit: str = "",
+                       metrics: Optional[str] = None,
+                       commit_sha: Optional[str] = None) -> int:
+        """
+        Record one enhancement of a page
+
+        Args:
+            page: Stable page key, e.g. "owner/repo/index.html"
+            original_html: The page before the edit
+            enhanced_html: The readable page after the edit; with the optimizer on,
+                the published file is optimize_for_publish's output for it
+            instruction: Claude's instruction
+            code_edit: Claude's code edit
+            metrics: Metrics snapshot the edit was based on (e.g. the CSV)
+            commit_sha: Commit that published the edit, if any
+
+        Returns:
+            The new version id
+        """
+        with self._lock:
+            parent = self.latest(page)
+            previous_hash = parent.enhanced_hash if parent else None
+            original_hash = self.put_blob(original_html, previous_hash)
+            enhanced_hash = self.put_blob(enhanced_html, original_hash)
+            metrics_hash = self.put_blob(metrics, parent.metrics_hash if parent else None) \
+                if metrics is not None else None
+            cursor = self._conn.execute(
+                "INSERT INTO versions (page, parent_id, original_hash, enhanced_hash, instruction, "
+                "code_edit, metrics_hash, commit_sha, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (page, parent.id if parent else None, original_hash, enhanced_hash, instruction,
+                 code_edit, metrics_hash, commit_sha, time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def set_commit_sha(self, version_id: int, commit_sha: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE versions SET commit_sha = ? WHERE id = ?", (commit_sha, version_id))
+            self._conn.commit()
+
+    def _row_to_version(self, row) -> Optional[PageVersion]:
+        return PageVersion(*row, store=self) if row else None
+
+    def get_version(self, version_id: int) -> PageVersion:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, page, parent_id, original_hash, enhanced_hash, instruction, code_edit, "
+                "metrics_hash, commit_sha, created_at FROM versions WHERE id = ?", (version_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown version: {version_id}")
+        return self._row_to_version(row)
+
+    def latest(self, page: str) -> Optional[PageVersion]:
+        history = self.history(page, limit=1)
+        return history[0] if history else None
+
+    def history(self, page: str, limit: int = 50) -> List[PageVersion]:
+        """Most recent versions of a page first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, page, parent_id, original_hash, enhanced_hash, instruction, code_edit, "
+                "metrics_hash, commit_sha, created_at FROM versions WHERE page = ? "
+                "ORDER BY id DESC LIMIT ?", (page, limit)
+            ).fetchall()
+        return [self._row_to_version(row) for row in rows]
+
+    # --- Deployments ---
+
+    def versions_for_commit(self, commit_sha: str, page_prefix: str = "") -> List[PageVersion]:
+        """
+        Versions published by a commit (a full or abbreviated SHA)
+
+        Args:
+            page_prefix: Only pages whose key starts with this, e.g. "owner/repo/"
+        """
+        prefix = commit_sha.lower()
+        if len(prefix) < 7:
+            return []
+        with self._lock:
+            # A range on the index; "g" sorts after every hex digit
+            rows = self._conn.execute(
+                "SELECT id, page, parent_id, original_hash, enhanced_hash, instruction, code_edit, "
+                "metrics_hash, commit_sha, created_at FROM versions WHERE commit_sha >= ? AND commit_sha < ? "
+                "ORDER BY id", (prefix, prefix + "g")
+            ).fetchall()
+        return [self._row_to_version(row) for row in rows if row[1].startswith(page_prefix)]
+
+    def record_deployment(self, version_id: int, commit_sha: str, environment: str = "production",
+                          deployed_at: Optional[float] = None) -> bool:
+        """
+        Record that a version went live in an environment
+
+        Only the first deploy counts: a redelivered or repeated deploy event
+        doesn't move the start of the version's measurement window.
+
+        Returns:
+            True when this is the version's first deploy to the environment
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO deployments (version_id, environment, commit_sha, deployed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (version_id, environment, commit_sha, deployed_at if deployed_at is not None else time.time())
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def deployed_at(self, version_id: int, environment: Optional[str] = None) -> Optional[float]:
+        """When a version first went live (in environment, or in any), or None"""
+        query = "SELECT MIN(deployed_at) FROM deployments WHERE version_id = ?"
+        params: tuple = (version_id,)
+        if environment is not None:
+            query += " AND environment = ?"
+            params += (environment,)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    # --- Rollback ---
+
+    def rollback(self,
+                 enhancer,
+                 version_id: int,
+                 github_token: str,
+                 github_user: str,
+                 repo_owner: str,
+                 repo_name: str,
+                 file_path: str,
+                 restore: str = "original") -> bool:
+        """
+        Publish a stored version through push_to_github, without calling any LLM
+
+        The page is pushed from a fresh working copy (RunPlanner.push_page), so
+        the optimizer resolves local assets as the original publish did.
+
+        Args:
+            enhancer: HTMLEnhancer used to publish
+            version_id: Version to roll back
+            restore: "original" puts back the page as it was before that version's
+                edit; "enhanced" puts back the page as that version published it
+
+        Returns:
+            bool: push_to_github's result
+
+        Raises:
+            ValueError: When version_id is not a version of that repo file
+        """
+        if restore not in ("original", "enhanced"):
+            raise ValueError(f"restore must be 'original' or 'enhanced', not {restore!r}")
+        version = self.get_version(version_id)
+        target = page_key(repo_owner, repo_name, file_path)
+        if version.page != target:
+            raise ValueError(f"Version {version_id} is a version of {version.page}, not {target}")
+        html = version.original_html if restore == "original" else version.enhanced_html
+
+        from run_planner import RunPlanner
+
+        print(f"⏪ Rolling back {version.page} to the {restore} page of version {version_id}")
+        with RunPlanner(enhancer, github_token, github_user, repo_owner, repo_name, file_path) as planner:
+            success = planner.push_page(html, f"Rollback to {restore} page of version {version_id}")
+
+        current = self.latest(version.page)
+        self.record_version(
+            version.page,
+            original_html=current.enhanced_html if current else version.enhanced_html,
+            enhanced_html=html,
+            instruction=f"Rollback to {restore} page of version {version_id}",
+            commit_sha=getattr(enhancer, "last_commit_sha", None) if success else None
+        )
+        return success
@@ -0,0 +1,446 @@
+# webhook_receiver.py
+#
+# Event-driven runs for the managed pages of a batch manifest, instead of
+# polling:
+#   GITHUB_WEBHOOK_SECRET=... python webhook_receiver.py serve sites.yaml --port 8091 --store html_versions.db
+#   python webhook_receiver.py send push --repo acme/shop --file index.html     # local stand-in for GitHub
+#   python webhook_receiver.py send deploy --repo acme/shop --sha 3f2c1d9
+#
+# A push that edits a managed page by hand drops what is cached for the page
+# (its element index entry and its queued pipeline jobs, which carry the old
+# content) and runs the page again, on any batch_cli.py backend. A deploy
+# that ships a stored version starts that version's measurement window,
+# which ab_significance.py measures from.
+#
+# Point the repository's webhook (content type application/json, events
+# "push" and "deployment_status") at /github; hosting providers without
+# GitHub deployments can post {"repository", "sha", "environment"} to /deploy.
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from async_http import Request, Response, install_fast_event_loop, start_server
+from batch_cli import BACKENDS, EXIT_USAGE, BatchRunner, ManifestError, PageResult, PageSpec, load_manifest
+from page_optimizer import source_path_for
+
+
+# Messages of the commits the pipeline pushes itself; their pushes are not hand edits
+OWN_COMMIT_PREFIXES = ("Enhanced HTML based on engagement analysis", "Rollback to ", "Promote A/B winner")
+# Deploy states that mean the version is live ("ready" is what hosting providers send)
+DEPLOYED_STATES = ("success", "ready")
+# Delivery ids (and pushed SHAs) remembered to drop redeliveries
+_SEEN_DELIVERIES = 1024
+
+# Called with (page key, commit SHA) for every page a push invalidates
+InvalidationHook = Callable[[str, str], Any]
+
+
+def sign(secret: str, body: bytes) -> str:
+    """The X-Hub-Signature-256 header GitHub sends with a delivery body"""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, header: str) -> bool:
+    return hmac.compare_digest(sign(secret, body), header or "")
+
+
+@dataclass
+class PushOutcome:
+    """What a push event invalidated and ran"""
+    repository: str
+    sha: str
+    changed: List[str] = field(default_factory=list)  # files edited by hand, not by the pipeline
+    pages: List[str] = field(default_factory=list)  # managed pages invalidated, by page key
+    runs: List[str] = field(default_factory=list)  # pages run again (pages not removed by the push)
+    forgotten: int = 0  # element index entries dropped
+    superseded: int = 0  # queued pipeline jobs dropped
+    ignored: Optional[str] = None  # why the push changed nothing
+
+
+@dataclass
+class DeployOutcome:
+    """Which versions a deploy event started measuring"""
+    repository: str
+    sha: str
+    environment: str
+    versions: List[int] = field(default_factory=list)
+    ignored: Optional[str] = None
+
+
+def _json_response(status: int, document: Dict[str, Any]) -> Response:
+    return Response(status, json.dumps(document).encode("utf-8"), [("Content-Type", "application/json")])
+
+
+class WebhookReceiver:
+    """
+    Webhook endpoint for the pages of a manifest
+
+    POST /github takes GitHub "push", "deployment_status" and "ping" events;
+    POST /deploy takes a plain deploy notification. With a secret, every
+    delivery must carry a valid X-Hub-Signature-256. Events are answered
+    right away; the runs they trigger go through the runner (a
+    batch_cli.BatchRunner) one push at a time, in the order they came in.
+    """
+
+    def __init__(self, pages: List[PageSpec], runner: Optional[BatchRunner] = None, store=None,
+                 element_index=None, queue=None, secret: str = "",
+                 on_invalidate: Optional[List[InvalidationHook]] = None):
+        """
+        Args:
+            pages: Managed pages; pushes and deploys of other repositories are ignored
+            runner: Runs the pages a push changed (None: only invalidate)
+            store: version_store.VersionStore with the pipeline's commits, to tell its
+                pushes from hand edits and to record deploys
+            element_index: element_index.ElementIndex whose entries pushes invalidate
+            queue: job_queue.JobQueue whose queued jobs for a changed page are superseded
+            secret: The webhook secret shared with GitHub
+            on_invalidate: More caches to invalidate, called per (page key, commit SHA)
+        """
+        self.repositories: Dict[str, List[PageSpec]] = {}
+        for spec in pages:
+            self.repositories.setdefault(f"{spec.repo_owner}/{spec.repo_name}".lower(), []).append(spec)
+        self.runner = runner
+        self.store = store
+        self.element_index = element_index
+        self.queue = queue
+        self.secret = secret
+        self.on_invalidate = list(on_invalidate or [])
+        self.received = 0
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._runs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-run")
+        self._pending: List[Future] = []
+
+    # --- Push ---
+
+    def _own_commit(self, commit: Dict[str, Any], prefix: str) -> bool:
+        if (commit.get("message") or "").startswith(OWN_COMMIT_PREFIXES):
+            return True
+        return bool(self.store is not None and commit.get("id")
+                    and self.store.versions_for_commit(commit["id"], prefix))
+
+    def handle_push(self, payload: Dict[str, Any]) -> PushOutcome:
+        """Invalidate and run again the managed pages a push edited by hand"""
+        repository = payload.get("repository") or {}
+        outcome = PushOutcome(repository.get("full_name", ""), payload.get("after") or "")
+        specs = self.repositories.get(outcome.repository.lower())
+        branch = repository.get("default_branch")
+        if not specs:
+            outcome.ignored = "not a managed repository"
+            return outcome
+        if payload.get("deleted"):
+            outcome.ignored = "branch deleted"
+            return outcome
+        if branch and payload.get("ref") != f"refs/heads/{branch}":
+            outcome.ignored = f"not the default branch ({payload.get('ref')})"
+            return outcome
+
+        prefix = f"{specs[0].repo_owner}/{specs[0].repo_name}/"
+        commits = payload.get("commits") or []
+        removed: Dict[str, bool] = {}
+        for commit in commits:
+            if self._own_commit(commit, prefix):
+                continue
+            for kind in ("added", "modified", "removed"):
+                for path in commit.get(kind) or []:
+                    removed[path] = kind == "removed"
+        outcome.changed = sorted(removed)
+        if commits and not removed:
+            outcome.ignored = "no file changed by hand"
+            return outcome
+
+        if commits:
+            affected = [spec for spec in specs
+                        if spec.file_path in removed or source_path_for(spec.file_path) in removed]
+        else:
+            # e.g. a force push: which files changed is unknown
+            affected = specs
+        if not affected:
+            outcome.ignored = "no managed page changed"
+            return outcome
+
+        for spec in affected:
+            self._invalidate(spec, outcome)
+        outcome.pages = [spec.key for spec in affected]
+        runs = [spec for spec in affected if not removed.get(spec.file_path)]
+        if self.runner is not None and runs:
+            outcome.runs = [spec.key for spec in runs]
+            self._run(runs, outcome.sha)
+        return outcome
+
+    def _invalidate(self, spec: PageSpec, outcome: PushOutcome) -> None:
+        if self.element_index is not None and self.element_index.forget(spec.key):
+            outcome.forgotten += 1
+        if self.queue is not None:
+            target = {"repo_owner": spec.repo_owner, "repo_name": spec.repo_name, "file_path": spec.file_path}
+            outcome.superseded += self.queue.supersede(target, f"push {outcome.sha[:12]} edited the page")
+        for hook in self.on_invalidate:
+            hook(spec.key, outcome.sha)
+
+    def _run(self, specs: List[PageSpec], sha: str) -> None:
+        runner = copy.copy(self.runner)
+        # One queued run per page and push, however often the push is delivered
+        runner.idempotency_suffix = f"push-{sha[:12]}"
+        if len(self._pending) > _SEEN_DELIVERIES:
+            self._pending = [future for future in self._pending if not future.done()]
+        self._pending.append(self._runs.submit(runner.run, specs, _report))
+
+    # --- Deploy ---
+
+    def handle_deploy(self, repository: str, sha: str, environment: str = "production",
+                      state: str = "success") -> DeployOutcome:
+        """Start the measurement window of the stored versions a successful deploy shipped"""
+        outcome = DeployOutcome(repository, sha, environment)
+        specs = self.repositories.get(repository.lower())
+        if not specs:
+            outcome.ignored = "not a managed repository"
+        elif state not in DEPLOYED_STATES:
+            outcome.ignored = f"deploy {state or 'without a state'}"
+        elif self.store is None:
+            outcome.ignored = "no version store"
+        if outcome.ignored:
+            return outcome
+
+        deployed_at = time.time()
+        prefix = f"{specs[0].repo_owner}/{specs[0].repo_name}/"
+        for version in self.store.versions_for_commit(sha, prefix):
+            if self.store.record_deployment(version.id, version.commit_sha, environment, deployed_at):
+                outcome.versions.append(version.id)
+        if not outcome.versions:
+            outcome.ignored = "no stored version newly deployed"
+        return outcome
+
+    # --- HTTP ---
+
+    def _duplicate(self, delivery: str) -> bool:
+        if delivery in self._seen:
+            return True
+        self._seen[delivery] = None
+        while len(self._seen) > _SEEN_DELIVERIES:
+            self._seen.popitem(last=False)
+        return False
+
+    async def handle(self, request: Request) -> Response:
+        if request.path not in ("/github", "/deploy"):
+            return Response(404, b"Not Found")
+        if request.method != "POST":
+            return Response(405, b"Method Not Allowed", [("Allow", "POST")])
+        if self.secret and not verify_signature(self.secret, request.body,
+                                                request.headers.get("x-hub-signature-256", "")):
+            return Response(401, b"Bad signature")
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return Response(400, b"Expected a JSON body")
+        if not isinstance(payload, dict):
+            return Response(400, b"Expected a JSON object")
+        delivery = request.headers.get("x-github-delivery")
+        if delivery and self._duplicate(delivery):
+            return _json_response(200, {"duplicate": delivery})
+        self.received += 1
+
+        event = "deploy" if request.path == "/deploy" else request.headers.get("x-github-event", "")
+        if event == "ping":
+            return _json_response(200, {"zen": "pong"})
+        if event == "push":
+            if self._duplicate(f"push:{payload.get('after')}"):
+                return _json_response(200, {"duplicate": payload.get("after")})
+            outcome = await asyncio.to_thread(self.handle_push, payload)
+        elif event == "deployment_status":
+            deployment = payload.get("deployment") or {}
+            outcome = await asyncio.to_thread(
+                self.handle_deploy, (payload.get("repository") or {}).get("full_name", ""),
+                str(deployment.get("sha") or ""), str(deployment.get("environment") or "production"),
+                str((payload.get("deployment_status") or {}).get("state") or "")
+            )
+        elif event == "deploy":
+            repository = payload.get("repository") or ""
+            if isinstance(repository, dict):
+                repository = repository.get("full_name", "")
+            outcome = await asyncio.to_thread(
+                self.handle_deploy, str(repository), str(payload.get("sha") or ""),
+                str(payload.get("environment") or "production"), str(payload.get("state") or "success")
+            )
+        else:
+            return _json_response(202, {"ignored": f"event {event or 'without a type'}"})
+        _log(event, outcome)
+        return _json_response(202, asdict(outcome))
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8091) -> None:
+        """Serve until cancelled, then wait for the runs already triggered"""
+        server = await start_server(self.handle, host, port)
+        print(f"🪝 Receiving webhooks on http://{host}:{port}/github and /deploy for "
+              f"{sum(len(specs) for specs in self.repositories.values())} page(s)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await asyncio.to_thread(self.close)
+
+    def wait(self) -> List[PageResult]:
+        """Wait for the runs triggered so far; their results in trigger order"""
+        pending, self._pending = self._pending, []
+        return [result for future in pending for result in future.result()]
+
+    def close(self) -> None:
+        self._runs.shutdown(wait=True)
+
+
+def _log(event: str, outcome) -> None:
+    name = f"{outcome.repository}@{outcome.sha[:7]}"
+    if outcome.ignored:
+        print(f"⏭️ {event} {name}: {outcome.ignored}")
+    elif isinstance(outcome, PushOutcome):
+        print(f"📥 push {name}: {len(outcome.pages)} page(s) invalidated "
+              f"({outcome.forgotten} index entries, {outcome.superseded} queued jobs), "
+              f"{len(outcome.runs)} run(s) triggered")
+    else:
+        print(f"🚀 deploy {name} to {outcome.environment}: measuring version(s) "
+              f"{', '.join(map(str, outcome.versions))} from now")
+
+
+def _report(result: PageResult) -> None:
+    icon = "✅" if result.ok else "❌"
+    print(f"{icon} {result.page} ({result.elapsed_seconds:.1f}s): {result.error or result.output or result.status}")
+
+
+# --- local stand-in for GitHub ---
+
+def push_payload(repository: str, files: List[str], sha: Optional[str] = None, message: str = "Edit by hand",
+                 branch: str = "main", removed: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """A GitHub push event with one commit to the default branch"""
+    sha = sha or uuid.uuid4().hex + uuid.uuid4().hex[:8]
+    commit = {"id": sha, "message": message, "added": [], "modified": list(files), "removed": list(removed)}
+    return {
+        "ref": f"refs/heads/{branch}",
+        "before": "0" * 40,
+        "after": sha,
+        "deleted": False,
+        "repository": {"full_name": repository, "default_branch": branch},
+        "commits": [commit],
+        "head_commit": commit,
+    }
+
+
+def deployment_status_payload(repository: str, sha: str, environment: str = "production",
+                              state: str = "success") -> Dict[str, Any]:
+    """A GitHub deployment_status event"""
+    return {
+        "deployment_status": {"state": state, "environment": environment},
+        "deployment": {"sha": sha, "environment": environment},
+        "repository": {"full_name": repository},
+    }
+
+
+def send(url: str, event: str, payload: Dict[str, Any], secret: str = "") -> Tuple[int, str]:
+    """POST an event the way GitHub delivers it; returns (status, response body)"""
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json", "X-GitHub-Event": event,
+               "X-GitHub-Delivery": str(uuid.uuid4())}
+    if secret:
+        headers["X-Hub-Signature-256"] = sign(secret, body)
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8", errors="replace")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GitHub push and deploy webhooks for the pages of a manifest")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Receive webhooks")
+    serve.add_argument("manifest", help="batch_cli.py manifest of the managed pages")
+    serve.add_argument("--backend", choices=BACKENDS, help="Runs pushes trigger (default: the manifest's, or github)")
+    serve.add_argument("--no-runs", action="store_true", help="Only invalidate and record deploys")
+    serve.add_argument("--concurrency", type=int, default=4, help="Pages of one push run at once")
+    serve.add_argument("--out-dir", default="enhanced", help="Output directory of the local backend")
+    serve.add_argument("--db", default="jobs.db", help="Job queue whose queued jobs of an edited page are "
+                                                       "superseded (and the queue backend's queue)")
+    serve.add_argument("--store", default="html_versions.db", help="VersionStore of published versions")
+    serve.add_argument("--index-db", help="ElementIndex whose entries of an edited page are dropped")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8091)
+    sender = commands.add_parser("send", help="Send a GitHub-shaped event (local stand-in for GitHub)")
+    sender.add_argument("event", choices=("push", "deploy", "ping"))
+    sender.add_argument("--repo", default="", help="owner/repo")
+    sender.add_argument("--file", action="append", default=[], help="push: a file the commit modifies")
+    sender.add_argument("--removed", action="append", default=[], help="push: a file the commit removes")
+    sender.add_argument("--message", default="Edit by hand", help="push: commit message")
+    sender.add_argument("--branch", default="main")
+    sender.add_argument("--sha", help="Commit SHA (push: default random)")
+    sender.add_argument("--environment", default="production", help="deploy: environment")
+    sender.add_argument("--state", default="success", help="deploy: deployment state")
+    sender.add_argument("--url", default="http://127.0.0.1:8091/github")
+    args = parser.parse_args()
+    secret = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+    if args.command == "send":
+        if args.event == "push":
+            payload = push_payload(args.repo, args.file, args.sha, args.message, args.branch, tuple(args.removed))
+        elif args.event == "deploy":
+            if not args.sha:
+                parser.error("deploy needs --sha")
+            payload = deployment_status_payload(args.repo, args.sha, args.environment, args.state)
+        else:
+            payload = {"zen": "Keep it logically awesome."}
+        status, body = send(args.url, "deployment_status" if args.event == "deploy" else args.event, payload, secret)
+        print(f"{status} {body}")
+        sys.exit(0 if status < 300 else 1)
+
+    try:
+        manifest = load_manifest(args.manifest)
+    except ManifestError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(EXIT_USAGE)
+    backend = args.backend or manifest.backend or "github"
+    if not secret:
+        print("⚠️ GITHUB_WEBHOOK_SECRET is not set; accepting unsigned deliveries", file=sys.stderr)
+
+    from job_queue import JobQueue
+    from version_store import VersionStore
+
+    store = VersionStore(args.store)
+    queue = JobQueue(args.db) if backend == "queue" or os.path.exists(args.db) else None
+    element_index = None
+    if args.index_db:
+        from element_index import ElementIndex
+
+        element_index = ElementIndex(args.index_db)
+    runner = None
+    if not args.no_runs:
+        runner = BatchRunner(backend, args.concurrency, out_dir=args.out_dir, queue=queue,
+                             element_index=element_index, version_store=store)
+        missing = runner.check_credentials()
+        if missing:
+            print(f"❌ Missing environment variables: {', '.join(missing)} (or use --no-runs)", file=sys.stderr)
+            sys.exit(EXIT_USAGE)
+    receiver = WebhookReceiver(manifest.pages, runner, store, element_index, queue, secret)
+
+    install_fast_event_loop()
+    try:
+        asyncio.run(receiver.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if queue is not None:
+            queue.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()